@@ -0,0 +1,550 @@
+import mimetypes
+import os
+import re
+import time
+import uuid
+
+from markupsafe import escape
+from quart import (
+    Quart,
+    Response,
+    abort,
+    g,
+    jsonify,
+    render_template,
+    request,
+    send_file,
+    url_for
+)
+from werkzeug.security import safe_join
+
+from ash_aed import metrics
+from ash_aed.assets import AssetManifest
+from ash_aed.async_db import AsyncDB
+from ash_aed.async_services import AsyncAEDInstallationLocationService
+from ash_aed.autocomplete import MAX_LIMIT, AutocompleteIndexStore
+from ash_aed.bundle import OfflineBundle
+from ash_aed.cache import LRUCache
+from ash_aed.compression import etag_matches
+from ash_aed.config import Config
+from ash_aed.dataset import dataset_version
+from ash_aed.errors import LocationError, ServiceError
+from ash_aed.export import FIELDS, DatasetExport
+from ash_aed.listener import DatasetVersionListener
+from ash_aed.logs import correlation_id
+from ash_aed.models import CurrentLocation
+from ash_aed.profiling import RequestProfiler
+from ash_aed.services import (
+    coverage_grid_store,
+    near_locations_cache,
+    shared_cache
+)
+from ash_aed.tiles import MapTile
+
+# views.pyと同じルートとテンプレートをasyncioで提供するASGIアプリケーション。
+app = Quart(__name__)
+REQUEST_ID_PATTERN = re.compile(r"^[0-9A-Za-z._-]{1,128}$")
+CONTENT_SECURITY_POLICY = (
+    "default-src 'self'; style-src 'self' 'unsafe-inline' "
+    + "stackpath.bootstrapcdn.com unpkg.com kit.fontawesome.com; "
+    + "script-src 'self' code.jquery.com cdnjs.cloudflare.com "
+    + "stackpath.bootstrapcdn.com unpkg.com kit.fontawesome.com; "
+    + "img-src 'self' *.tile.openstreetmap.org unpkg.com data:; "
+    + "connect-src 'self' ka-f.fontawesome.com; "
+    + "font-src ka-f.fontawesome.com;"
+)
+PROFILE_HEADER = "X-Profile-Token"
+tile_cache = LRUCache(Config.TILE_CACHE_SIZE)
+coverage_cache = LRUCache(64)
+autocomplete_index_store = AutocompleteIndexStore()
+# 複数のリクエストを1つのスレッドで並行に処理するので、cProfileではリクエスト
+# ごとに分けて計測できない。ここでは計測せず、WSGIのワーカーの結果を集計する。
+request_profiler = RequestProfiler(Config.PROFILE_DIR, token=Config.PROFILE_TOKEN)
+asset_manifest = AssetManifest.load(app.static_folder)
+db_pool_connections = metrics.registry.gauge(
+    "ash_aed_db_pool_connections", "接続プールが保持している接続の数"
+)
+
+
+def switch_dataset(version):
+    # 古いバージョンのキャッシュを破棄し、新しいバージョンの格子データを読み込む。
+    tile_cache.clear()
+    coverage_cache.clear()
+    coverage_grid_store.get(version)
+
+
+dataset_version.subscribe(switch_dataset)
+# インポートが通知するデータセットのバージョンを待ち受ける。
+dataset_listener = DatasetVersionListener(
+    Config.DATABASE_URL,
+    Config.DATASET_CHANNEL,
+    Config.DATASET_LISTENER_RECONNECT_INTERVAL,
+)
+metrics.register_cache("tiles", tile_cache)
+metrics.register_cache("coverage", coverage_cache)
+metrics.register_cache("near_locations", near_locations_cache)
+metrics.register_cache("shared", shared_cache)
+
+
+def collect_pool_metrics():
+    db = app.config.get("ASH_AED_DB")
+    if db is not None:
+        db_pool_connections.set(db.size - db.idle_size, state="busy")
+        db_pool_connections.set(db.idle_size, state="idle")
+
+
+metrics.registry.add_collector(collect_pool_metrics)
+
+
+@app.before_serving
+async def create_pool():
+    app.config["ASH_AED_DB"] = await AsyncDB.create()
+    if Config.DATASET_LISTENER:
+        dataset_listener.start()
+    metrics.registry.start()
+
+
+@app.after_serving
+async def close_pool():
+    dataset_listener.stop()
+    metrics.registry.stop()
+    await app.config["ASH_AED_DB"].close()
+
+
+def get_service():
+    return AsyncAEDInstallationLocationService(app.config["ASH_AED_DB"])
+
+
+@app.before_request
+async def start_request():
+    g.request_started = time.perf_counter()
+    request_id = request.headers.get("X-Request-ID", "")
+    if REQUEST_ID_PATTERN.match(request_id) is None:
+        request_id = uuid.uuid4().hex
+    g.correlation_id = request_id
+    # asyncioのタスクごとにコンテキストが分かれるので、リセットは不要。
+    correlation_id.set(request_id)
+
+
+@app.after_request
+async def finish_request(response):
+    if hasattr(g, "request_started"):
+        metrics.request_duration.observe(
+            time.perf_counter() - g.request_started,
+            endpoint=request.endpoint or "unknown",
+            method=request.method,
+            status=str(response.status_code),
+        )
+    if hasattr(g, "correlation_id"):
+        response.headers["X-Request-ID"] = g.correlation_id
+    response.headers["Content-Security-Policy"] = CONTENT_SECURITY_POLICY
+    response.headers["X-Content-Type-Options"] = "nosniff"
+    response.headers["X-Frame-Options"] = "DENY"
+    response.headers["X-XSS-Protection"] = "1;mode=block"
+    return response
+
+
+@app.context_processor
+async def override_url_for():
+    return dict(url_for=dated_url_for)
+
+
+def dated_url_for(endpoint, **values):
+    if endpoint == "static":
+        filename = values.get("filename", None)
+        if filename:
+            asset = asset_manifest.get(filename)
+            if asset is not None:
+                values["filename"] = asset
+            else:
+                file_path = os.path.join(app.root_path, endpoint, filename)
+                values["q"] = int(os.stat(file_path).st_mtime)
+    return url_for(endpoint, **values)
+
+
+@app.route("/static/" + AssetManifest.DIST_DIRECTORY + "/<path:filename>")
+async def static_asset(filename):
+    dist_folder = os.path.join(app.static_folder, AssetManifest.DIST_DIRECTORY)
+    path = safe_join(dist_folder, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    path, encoding = AssetManifest.select_encoding(path, request.accept_encodings)
+    response = await send_file(
+        path, mimetype=mimetypes.guess_type(filename)[0], cache_timeout=31536000
+    )
+    response.content_encoding = encoding
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+async def get_area_names():
+    if not hasattr(g, "area_names"):
+        g.area_names = await get_service().get_area_names()
+    return g.area_names
+
+
+async def get_dataset_version():
+    if not hasattr(g, "dataset_version"):
+        version = dataset_version.version
+        if version is None or not dataset_listener.listening:
+            # 通知を待ち受けていない間は、リクエストごとに問い合わせる。
+            version = await get_service().get_dataset_version()
+            dataset_version.publish(version)
+        g.dataset_version = version
+    return g.dataset_version
+
+
+async def render_error(error_message):
+    return (
+        await render_template(
+            "error.html",
+            title="検索条件に誤りがあります",
+            area_names=await get_area_names(),
+            error_message=error_message,
+        ),
+        400,
+    )
+
+
+@app.route("/")
+async def index():
+    last_updated = (await get_service().get_last_updated()).strftime("%Y/%m/%d %H:%M")
+    return await render_template(
+        "index.html",
+        title="トップページ",
+        area_names=await get_area_names(),
+        last_updated=last_updated,
+    )
+
+
+@app.route("/search_by_gps", methods=["GET", "POST"])
+async def search_by_gps():
+    if request.method == "GET":
+        return await render_template(
+            "index.html", title="トップページ", area_names=await get_area_names()
+        )
+
+    form = await request.form
+    try:
+        current_latitude = float(escape(form["current_latitude"]))
+        current_longitude = float(escape(form["current_longitude"]))
+        current_location = CurrentLocation(
+            latitude=current_latitude, longitude=current_longitude
+        )
+    except (KeyError, LocationError, ValueError):
+        return await render_error("緯度経度が正しくありません。")
+
+    near_locations = await get_service().get_near_locations(
+        current_location, await get_dataset_version()
+    )
+    return await render_template(
+        "search_by_gps.html",
+        title="現在地から近いAED設置場所の検索結果",
+        area_names=await get_area_names(),
+        search_results=near_locations,
+        current_latitude=current_latitude,
+        current_longitude=current_longitude,
+        results_length=len(near_locations),
+    )
+
+
+@app.route("/location/<location_id>")
+async def location(location_id):
+    try:
+        location_id = int(escape(location_id))
+    except ValueError:
+        return await render_error("AED設置場所の連番が正しくありません。")
+
+    result = await get_service().find_by_location_id(location_id)
+    if len(result) == 0:
+        return await render_error("そのようなAED設置場所連番はありません。")
+
+    neighbors = await get_service().find_neighbors(
+        location_id, await get_dataset_version()
+    )
+    return await render_template(
+        "location.html",
+        title="AED設置場所「" + result[0].location_name + "」の情報",
+        area_names=await get_area_names(),
+        result=result[0],
+        neighbors=neighbors,
+    )
+
+
+@app.route("/area/<area_name>")
+async def area(area_name):
+    area_name = escape(area_name)
+    search_results = await get_service().find_by_area_name(area_name)
+    if len(search_results) == 0:
+        return await render_error("地域の名称が正しくありません。")
+
+    return await render_template(
+        "area.html",
+        title="「" + area_name + "」のAED設置場所",
+        area_names=await get_area_names(),
+        area_name=area_name,
+        search_results=search_results,
+        results_length=len(search_results),
+    )
+
+
+@app.route("/find_by_location_name")
+async def find_by_location_name():
+    location_name = escape(request.args.get("location_name", ""))
+    try:
+        page = int(escape(request.args.get("page", 1)))
+    except ValueError:
+        return await render_error("ページ数指定が正しくありません。")
+
+    try:
+        search_results = await get_service().find_by_location_name(location_name, page)
+    except ServiceError as e:
+        return await render_error(e.message)
+
+    title = "名称に「" + location_name + "」を含むのAED設置場所の検索結果"
+    if 1 < page:
+        title += "（" + str(page) + "ページ）"
+    return await render_template(
+        "find_by_location_name.html",
+        title=title,
+        area_names=await get_area_names(),
+        location_name=location_name,
+        results_body=search_results["pagenated_results_body"],
+        results_number=search_results["all_results_number"],
+        page=page,
+        max_page=search_results["max_page"],
+    )
+
+
+@app.route("/tiles/<int:zoom>/<int:x>/<int:y>.json")
+async def tiles(zoom, x, y):
+    try:
+        tile = MapTile(zoom=zoom, x=x, y=y)
+    except LocationError:
+        abort(404)
+
+    version = await get_dataset_version()
+    cache_key = (version, tile.zoom, tile.x, tile.y)
+    feature_collection = tile_cache.get(cache_key)
+    if feature_collection is None:
+        locations = await get_service().find_by_bounding_box(*tile.bounding_box)
+        feature_collection = tile.cluster(locations)
+        tile_cache.set(cache_key, feature_collection)
+    response = jsonify(feature_collection)
+    response.headers["X-Dataset-Version"] = str(version)
+    return response
+
+
+@app.route("/coverage.json")
+async def coverage():
+    try:
+        distance = float(request.args.get("distance", 500))
+    except ValueError:
+        abort(400)
+
+    version = await get_dataset_version()
+    grid = coverage_grid_store.get(version)
+    if grid is None:
+        abort(404)
+
+    cache_key = (version, distance)
+    result = coverage_cache.get(cache_key)
+    if result is None:
+        result = {
+            "version": grid.version,
+            "resolution": grid.resolution,
+            "distance": distance,
+            "cells": grid.get_uncovered_cells(distance),
+        }
+        coverage_cache.set(cache_key, result)
+    return jsonify(result)
+
+
+@app.route("/export.<format>")
+async def export(format):
+    if format not in DatasetExport.FORMATS:
+        abort(404)
+    try:
+        dataset_export = DatasetExport(
+            format,
+            area=request.args.get("area"),
+            bounding_box=request.args.get("bbox"),
+        )
+    except ServiceError:
+        abort(400)
+
+    encoding = "gzip" if "gzip" in request.accept_encodings else None
+    etag = dataset_export.get_etag(await get_dataset_version(), encoding)
+    if request.if_none_match.contains(etag):
+        response = Response("", status=304)
+    else:
+        # asyncpgはサーバー側のカーソルを接続の外へ持ち出せないので、条件に合う
+        # AED設置場所を読み込んでから少しずつ書き出す。
+        chunks = dataset_export.generate(
+            await dataset_export.find_locations(get_service())
+        )
+        if encoding is not None:
+            chunks = DatasetExport.compress(chunks)
+        else:
+            chunks = (chunk.encode("utf-8") for chunk in chunks)
+        response = Response(chunks, content_type=dataset_export.mimetype)
+        response.content_encoding = encoding
+        response.headers["Content-Disposition"] = (
+            "attachment; filename=" + dataset_export.filename
+        )
+    response.set_etag(etag)
+    response.vary.add("Accept-Encoding")
+    response.cache_control.no_cache = True
+    return response
+
+
+@app.route("/api/changes")
+async def changes():
+    try:
+        since = int(request.args.get("since", 0))
+    except ValueError:
+        abort(400)
+
+    version = await get_dataset_version()
+    etag = "changes-" + str(since) + "-" + str(version)
+    if etag_matches(request.if_none_match, etag):
+        response = Response("", status=304)
+    else:
+        service = get_service()
+        result = await service.get_changes(since, version=version)
+        full = result is None
+        if full:
+            result = {
+                "version": version,
+                "upserts": await service.get_all(),
+                "deletes": [],
+            }
+        response = jsonify(
+            {
+                "version": result["version"],
+                "since": since,
+                "full": full,
+                "fields": FIELDS,
+                "upserts": [
+                    [getattr(location, field) for field in FIELDS]
+                    for location in result["upserts"]
+                ],
+                "deletes": result["deletes"],
+            }
+        )
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+
+@app.route("/api/autocomplete")
+async def autocomplete():
+    try:
+        limit = int(request.args.get("limit", Config.AUTOCOMPLETE_LIMIT))
+    except ValueError:
+        abort(400)
+    limit = max(1, min(limit, MAX_LIMIT))
+    query = request.args.get("q", "")
+
+    version = await get_dataset_version()
+    index = await autocomplete_index_store.get_async(version, get_service().get_all)
+    suggestions = index.search(query, limit)
+    for suggestion in suggestions:
+        if suggestion["kind"] == "area":
+            suggestion["url"] = url_for("area", area_name=suggestion["text"])
+        else:
+            suggestion["url"] = url_for(
+                "location", location_id=suggestion["location_id"]
+            )
+    response = jsonify({"query": query, "version": version, "suggestions": suggestions})
+    response.cache_control.public = True
+    response.cache_control.max_age = 60
+    return response
+
+
+@app.route("/offline/manifest.json")
+async def offline_manifest():
+    path = os.path.join(Config.OFFLINE_BUNDLE_DIR, OfflineBundle.MANIFEST_NAME)
+    if not os.path.exists(path):
+        abort(404)
+    response = await send_file(path, mimetype="application/json", cache_timeout=0)
+    response.cache_control.no_cache = True
+    return response
+
+
+@app.route("/offline/bundle.<int:version>.json")
+async def offline_bundle(version):
+    path = None
+    if "gzip" in request.accept_encodings:
+        path = OfflineBundle.get_path(Config.OFFLINE_BUNDLE_DIR, version, True)
+    encoding = "gzip" if path is not None else None
+    if path is None:
+        path = OfflineBundle.get_path(Config.OFFLINE_BUNDLE_DIR, version)
+    if path is None:
+        abort(404)
+    response = await send_file(
+        path, mimetype="application/json", cache_timeout=31536000
+    )
+    response.content_encoding = encoding
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+@app.route("/service_worker.js")
+async def service_worker():
+    response = await send_file(
+        os.path.join(app.static_folder, "js", "service_worker.js"),
+        mimetype="application/javascript",
+        cache_timeout=0,
+    )
+    response.cache_control.no_cache = True
+    return response
+
+
+@app.route("/cache_stats.json")
+async def cache_stats():
+    return jsonify(
+        {
+            "tiles": tile_cache.stats,
+            "coverage": coverage_cache.stats,
+            "near_locations": near_locations_cache.stats,
+            "shared": shared_cache.stats,
+        }
+    )
+
+
+@app.route("/profile_summary.json")
+async def profile_summary():
+    if not request_profiler.enabled or not Config.PROFILE_TOKEN:
+        abort(404)
+    if not request_profiler.is_authorized(request.headers.get(PROFILE_HEADER)):
+        abort(403)
+    try:
+        limit = int(request.args.get("limit", 20))
+    except ValueError:
+        abort(400)
+    sort = request.args.get("sort", "cumulative")
+    if sort not in ("cumulative", "tottime"):
+        abort(400)
+    response = jsonify(request_profiler.summarize(max(1, min(limit, 200)), sort))
+    response.cache_control.no_store = True
+    return response
+
+
+@app.route("/metrics")
+async def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.errorhandler(404)
+async def not_found(error):
+    return (
+        await render_template(
+            "404.html", title="404 Page Not Found.", area_names=await get_area_names()
+        ),
+        404,
+    )
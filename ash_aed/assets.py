@@ -0,0 +1,173 @@
+import gzip
+import hashlib
+import json
+import os
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 内容のハッシュをファイル名に含めて配信するファイルの拡張子
+ASSET_EXTENSIONS = (".css", ".js")
+# 圧縮したファイルの拡張子と、対応するContent-Encodingの値。優先する順に並べる。
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+class AssetManifest:
+    """
+    静的ファイルのパスと、内容のハッシュを含むファイル名の対応表。
+
+    ビルド時に静的ファイルをハッシュを含むファイル名で複製し、gzipとbrotliで
+    圧縮したファイルも書き出しておく。内容が変わればファイル名も変わるので、
+    ブラウザに1年間キャッシュさせることができ、テンプレートの描画時にファイルの
+    更新日時を調べる必要もない。
+
+    Attributes:
+        assets (dict): 静的ファイルのパスをキー、ハッシュを含むファイル名の
+            パスを値とする辞書（いずれもstaticディレクトリからの相対パス）
+
+    """
+
+    DIST_DIRECTORY = "dist"
+    MANIFEST_NAME = "manifest.json"
+    HASH_LENGTH = 12
+
+    def __init__(self, assets: dict):
+        """
+        Args:
+            assets (dict): 静的ファイルのパスと、ハッシュを含むファイル名の
+                パスの対応表
+
+        """
+        self.__assets = assets
+
+    @property
+    def assets(self) -> dict:
+        return self.__assets
+
+    def get(self, filename: str) -> Optional[str]:
+        """ハッシュを含むファイル名のパスを返す。
+
+        Args:
+            filename (str): staticディレクトリからの静的ファイルのパス
+
+        Returns:
+            filename (str): ハッシュを含むファイル名のパス。対応表にない場合は
+                Noneを返す。
+
+        """
+        return self.__assets.get(filename)
+
+    @classmethod
+    def get_manifest_path(cls, static_folder: str) -> str:
+        return os.path.join(static_folder, cls.DIST_DIRECTORY, cls.MANIFEST_NAME)
+
+    @classmethod
+    def load(cls, static_folder: str) -> "AssetManifest":
+        """書き出した対応表を読み込む。
+
+        Args:
+            static_folder (str): staticディレクトリのパス
+
+        Returns:
+            manifest (obj:`AssetManifest`): 対応表。書き出していない場合は
+                空の対応表を返す。
+
+        """
+        try:
+            with open(cls.get_manifest_path(static_folder), encoding="utf-8") as f:
+                return cls(json.load(f))
+        except (OSError, ValueError):
+            return cls(dict())
+
+    @classmethod
+    def build(cls, static_folder: str) -> "AssetManifest":
+        """
+        静的ファイルをハッシュを含むファイル名で書き出し、圧縮したファイルと
+        対応表も書き出す。対応表にないファイルは削除する。
+
+        Args:
+            static_folder (str): staticディレクトリのパス
+
+        Returns:
+            manifest (obj:`AssetManifest`): 書き出したファイルの対応表
+
+        """
+        dist_folder = os.path.join(static_folder, cls.DIST_DIRECTORY)
+        assets = dict()
+        written = set()
+        for directory, directories, filenames in os.walk(static_folder):
+            if os.path.abspath(directory) == os.path.abspath(static_folder):
+                directories[:] = [d for d in directories if d != cls.DIST_DIRECTORY]
+            for filename in sorted(filenames):
+                stem, extension = os.path.splitext(filename)
+                if extension not in ASSET_EXTENSIONS:
+                    continue
+                path = os.path.join(directory, filename)
+                with open(path, "rb") as f:
+                    content = f.read()
+                digest = hashlib.sha256(content).hexdigest()[: cls.HASH_LENGTH]
+                relative_directory = os.path.relpath(directory, static_folder)
+                asset = os.path.normpath(
+                    os.path.join(relative_directory, stem + "." + digest + extension)
+                )
+                cls._write_variants(os.path.join(dist_folder, asset), content)
+                key = os.path.normpath(os.path.join(relative_directory, filename))
+                assets[key.replace(os.sep, "/")] = "/".join(
+                    (cls.DIST_DIRECTORY, asset.replace(os.sep, "/"))
+                )
+                written.add(asset)
+        cls._remove_stale_files(dist_folder, written)
+        manifest_path = cls.get_manifest_path(static_folder)
+        with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(assets, f, indent=2, sort_keys=True)
+        os.replace(manifest_path + ".tmp", manifest_path)
+        return cls(assets)
+
+    @staticmethod
+    def _write_variants(path: str, content: bytes) -> None:
+        """ファイルと、gzipとbrotliで圧縮したファイルを書き出す。"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        variants = [("", content), (".gz", gzip.compress(content, 9, mtime=0))]
+        if brotli is not None:
+            variants.append((".br", brotli.compress(content, quality=11)))
+        for suffix, data in variants:
+            with open(path + suffix + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(path + suffix + ".tmp", path + suffix)
+
+    @classmethod
+    def _remove_stale_files(cls, dist_folder: str, written: set) -> None:
+        """内容が変わって使われなくなったファイルを削除する。"""
+        for directory, _, filenames in os.walk(dist_folder):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                asset = os.path.relpath(path, dist_folder)
+                for _, suffix in ENCODINGS:
+                    if asset.endswith(suffix):
+                        asset = asset[: -len(suffix)]
+                        break
+                if asset in written or filename in (cls.MANIFEST_NAME, ".gitignore"):
+                    continue
+                os.remove(path)
+
+    @staticmethod
+    def select_encoding(path: str, accept_encodings) -> tuple:
+        """クライアントが受け付ける圧縮形式のファイルを選ぶ。
+
+        Args:
+            path (str): 圧縮していないファイルのパス
+            accept_encodings (obj:`werkzeug.datastructures.Accept`): リクエストの
+                Accept-Encoding
+
+        Returns:
+            path (str): 送るファイルのパス
+            encoding (str): Content-Encodingの値。圧縮しない場合はNone
+
+        """
+        for encoding, suffix in ENCODINGS:
+            if encoding in accept_encodings and os.path.exists(path + suffix):
+                return path + suffix, encoding
+        return path, None
@@ -0,0 +1,69 @@
+import asyncpg
+
+from ash_aed.config import Config
+from ash_aed.errors import DatabaseError
+
+
+class AsyncDB:
+    """asyncpgの接続プールでPostgreSQLデータベースへ接続するクラス。
+
+    Attributes:
+        pool (:obj:`asyncpg.Pool`): asyncpgの接続プール
+
+    """
+
+    def __init__(self, pool: asyncpg.Pool):
+        """
+        Args:
+            pool (:obj:`asyncpg.Pool`): asyncpgの接続プール。createメソッドで
+                作成する。
+
+        """
+        self.__pool = pool
+
+    @classmethod
+    async def create(
+        cls, dsn: str = None, min_size: int = None, max_size: int = None
+    ) -> "AsyncDB":
+        """接続プールを作成する。
+
+        Args:
+            dsn (str): 接続先のURL。省略時はConfig.DATABASE_URL
+            min_size (int): プールが保持する接続数の下限
+            max_size (int): プールが保持する接続数の上限
+
+        Returns:
+            db (obj:`AsyncDB`): 接続プールを持つオブジェクト
+
+        """
+        try:
+            pool = await asyncpg.create_pool(
+                dsn or Config.DATABASE_URL,
+                min_size=Config.ASYNC_POOL_MIN_SIZE if min_size is None else min_size,
+                max_size=Config.ASYNC_POOL_MAX_SIZE if max_size is None else max_size,
+            )
+        except (asyncpg.PostgresError, OSError) as e:
+            raise DatabaseError(str(e))
+        return cls(pool)
+
+    @property
+    def pool(self) -> asyncpg.Pool:
+        return self.__pool
+
+    @property
+    def size(self) -> int:
+        """プールが保持している接続数"""
+        return self.__pool.get_size()
+
+    @property
+    def idle_size(self) -> int:
+        """プールが保持している接続のうち使用されていない数"""
+        return self.__pool.get_idle_size()
+
+    def acquire(self):
+        """プールから接続を1つ借りる非同期コンテキストマネージャーを返す。"""
+        return self.__pool.acquire()
+
+    async def close(self) -> None:
+        """プールの全ての接続を閉じる"""
+        await self.__pool.close()
@@ -0,0 +1,392 @@
+import time
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional
+
+import asyncpg
+
+from ash_aed.async_db import AsyncDB
+from ash_aed.config import Config
+from ash_aed.errors import DataError, ServiceError
+from ash_aed.metrics import (
+    get_statement_kind,
+    sql_duration,
+    sql_errors,
+    sql_rows_fetched
+)
+from ash_aed.models import (
+    AEDInstallationLocation,
+    AEDInstallationLocationFactory,
+    CurrentLocation
+)
+from ash_aed.services import (
+    SELECT_STATEMENTS,
+    AEDInstallationLocationService,
+    coverage_grid_store,
+    near_locations_cache,
+    rank_near_locations,
+    select_near_location_candidates,
+    shared_cache,
+    to_kilometers,
+    to_numbered_placeholders,
+    trace_versions
+)
+
+
+class AsyncAEDInstallationLocationService:
+    """
+    AED設置場所を検索するメソッドをasyncioで提供する。
+
+    AEDInstallationLocationServiceのうち、Webアプリケーションが使う検索系の
+    メソッドだけを持つ。SQL文、検索候補のキャッシュと格子データは同期版と共有する。
+    asyncpgは接続ごとにSQL文を自動で準備して使い回す。
+
+    """
+
+    TABLE_NAME = AEDInstallationLocationService.TABLE_NAME
+
+    def __init__(self, db: AsyncDB, table_name: str = TABLE_NAME):
+        """
+        Args:
+            db (obj:`AsyncDB`): asyncpgの接続プールを持つオブジェクト
+            table_name (str): 操作対象のテーブル名
+
+        """
+        self.__db = db
+        self.__table_name = table_name
+
+    async def _fetch(self, sql: str, parameters: tuple = None) -> list:
+        """接続プールから接続を借りてSQLを実行し、全ての行を返す。
+
+        Args:
+            sql (str): psycopg2形式のプレースホルダを使ったSQL文
+            parameters (tuple): SQLにプレースホルダを使用する場合の値を格納したリスト
+
+        Returns:
+            results (list of :obj:`asyncpg.Record`): 検索結果のリスト
+
+        """
+        kind = get_statement_kind(sql)
+        start = time.perf_counter()
+        try:
+            async with self.__db.acquire() as connection:
+                rows = await connection.fetch(
+                    to_numbered_placeholders(sql), *(parameters or ())
+                )
+        except (asyncpg.DataError, asyncpg.IntegrityConstraintViolationError) as e:
+            sql_errors.inc(kind=kind)
+            raise DataError(str(e))
+        finally:
+            sql_duration.observe(time.perf_counter() - start, kind=kind)
+        sql_rows_fetched.inc(len(rows))
+        return rows
+
+    async def _fetch_statement(self, name: str, parameters: tuple = None) -> list:
+        """固定のSELECT文を実行し、全ての行を返す。
+
+        Args:
+            name (str): SELECT_STATEMENTSのキー
+            parameters (tuple): SQLにプレースホルダを使用する場合の値を格納したリスト
+
+        """
+        sql = SELECT_STATEMENTS[name][1].format(table=self.__table_name)
+        return await self._fetch(sql, parameters)
+
+    async def _fetchone(self, name: str, parameters: tuple = None):
+        """固定のSELECT文を実行し、最初の行を返す。行がない場合はNoneを返す。"""
+        rows = await self._fetch_statement(name, parameters)
+        return rows[0] if rows else None
+
+    async def _get_objects(self, name: str, parameters: tuple = None) -> list:
+        """固定のSELECT文の検索結果からAED設置場所データのリストを作成する。"""
+        factory = AEDInstallationLocationFactory()
+        for row in await self._fetch_statement(name, parameters):
+            factory.create(**dict(row))
+        return factory.items
+
+    async def get_all(self) -> list:
+        """全てのAED設置場所データのリストを返す。"""
+        return await self._get_objects("get_all")
+
+    async def find_by_location_id(self, location_id) -> list:
+        """AED設置場所連番から該当するAED設置場所データを返す。
+
+        Args:
+            location_id (int): AED設置場所連番
+
+        Returns
+            aed_installation_location (list of obj:`AEDInstallationLocation`):
+                AED設置場所データ
+
+        """
+        return await self._get_objects("find_by_location_id", (int(location_id),))
+
+    async def find_by_location_ids(self, location_ids: list) -> list:
+        """複数のAED設置場所連番から該当するAED設置場所データを返す。
+
+        Args:
+            location_ids (list of int): AED設置場所連番のリスト
+
+        Returns
+            locations (list of obj:`AEDInstallationLocation`): AED設置場所
+                オブジェクトのリスト
+
+        """
+        return await self._get_objects(
+            "find_by_location_ids",
+            ([int(location_id) for location_id in location_ids],),
+        )
+
+    async def find_by_location_name(self, location_name, page: int = 1) -> dict:
+        """指定したAED設置場所名を含むAED設置場所を検索する。
+
+        Args:
+            location_name (int): AED設置場所名（キーワード）
+            page (int): 検索結果のページ数
+
+        Returns
+            results (dict): 検索結果の総件数と検索条件に合致するAED設置場所データ
+                オブジェクトのリスト、ページ分割した際の最大ページ数を要素に持つ辞書
+
+        """
+        location_name = "%" + location_name + "%"
+        row = await self._fetchone("count_by_location_name", (location_name,))
+        results_number = row["count"]
+
+        max_view_results_number = 10
+        max_page = max(1, -(-results_number // max_view_results_number))
+        try:
+            page = int(page)
+        except (TypeError, ValueError):
+            raise ServiceError("検索結果のページ指定に誤りがあります。")
+        if max_page < page:
+            raise ServiceError("指定したページ数が上限を超えています。")
+        results = await self._get_objects(
+            "find_by_location_name",
+            (
+                location_name,
+                max_view_results_number,
+                (page - 1) * max_view_results_number,
+            ),
+        )
+        return {
+            "all_results_number": results_number,
+            "max_page": max_page,
+            "pagenated_results_body": results,
+        }
+
+    async def get_area_names(self) -> list:
+        """AED設置場所の住所の町域一覧を返す。"""
+        rows = await self._fetch_statement("get_area_names")
+        return [row["area"] for row in rows]
+
+    async def find_by_area_name(self, area_name) -> list:
+        """町域名からAED設置場所を検索する。
+
+        Args:
+            area_name (str): 町域名
+
+        Returns:
+            area_locations (list of obj:`AEDInstallationLocation`): 指定した町域の
+                AED設置場所オブジェクトのリスト
+
+        """
+        return await self._get_objects("find_by_area_name", (str(area_name),))
+
+    async def find_by_bounding_box(
+        self, south: float, west: float, north: float, east: float
+    ) -> list:
+        """緯度経度で指定した矩形の範囲内にあるAED設置場所を検索する。
+
+        Args:
+            south (float): 南端の緯度
+            west (float): 西端の経度
+            north (float): 北端の緯度
+            east (float): 東端の経度
+
+        Returns:
+            locations (list of obj:`AEDInstallationLocation`): 範囲内のAED設置場所
+                オブジェクトのリスト
+
+        """
+        return await self._get_objects(
+            "find_by_bounding_box",
+            tuple(Decimal(str(value)) for value in (south, north, west, east)),
+        )
+
+    async def _get_near_location_candidates(
+        self,
+        version: int,
+        current_location: CurrentLocation,
+        cell: tuple,
+        cell_bounding_box: tuple,
+    ) -> list:
+        """現在地から近いAED設置場所の検索候補を取得し、可能であればキャッシュする。
+
+        手順はAEDInstallationLocationService._get_near_location_candidatesと同じ。
+
+        """
+        candidates = shared_cache.get(version, "near_locations", cell)
+        if candidates is not None:
+            near_locations_cache.set(version, cell, candidates)
+            return candidates
+
+        grid = coverage_grid_store.get(version)
+        if grid is not None:
+            location_ids = grid.lookup_area(*cell_bounding_box)
+            if location_ids is not None:
+                candidates = await self.find_by_location_ids(location_ids)
+                near_locations_cache.set(version, cell, candidates)
+                shared_cache.set(version, "near_locations", cell, candidates)
+                return candidates
+            location_ids = grid.lookup(
+                current_location.latitude, current_location.longitude
+            )
+            if location_ids is not None:
+                return await self.find_by_location_ids(location_ids)
+
+        candidates = select_near_location_candidates(
+            await self.get_all(), cell_bounding_box
+        )
+        near_locations_cache.set(version, cell, candidates)
+        shared_cache.set(version, "near_locations", cell, candidates)
+        return candidates
+
+    async def get_near_locations(
+        self, current_location: CurrentLocation, version: Optional[int] = None
+    ) -> list:
+        """現在地から直線距離で最も近いAED設置場所上位5件を返す。
+
+        Args:
+            current_location (obj:`CurrentLocation`): 現在地の緯度経度情報を持つ
+                オブジェクト
+            version (int): データセットのバージョン。省略時はデータベースに
+                問い合わせる。
+
+        Returns:
+            near_locations (list of dicts): AED設置場所オブジェクトと順位、
+                現在地までの距離（キロメートル）を要素に持つ辞書のリスト
+
+        """
+        if version is None:
+            version = await self.get_dataset_version()
+        cell, cell_bounding_box = near_locations_cache.get_cell(
+            current_location.latitude, current_location.longitude
+        )
+        candidates = near_locations_cache.get(version, cell)
+        if candidates is None:
+            # 同じ区画の検索候補は1つのタスクだけが求め、他はその結果を待つ。
+            candidates, shared = await near_locations_cache.coalesce_async(
+                version,
+                cell,
+                lambda: self._get_near_location_candidates(
+                    version, current_location, cell, cell_bounding_box
+                ),
+            )
+            if shared and near_locations_cache.get(version, cell) is None:
+                # 区画全体には使えない、他の地点のための候補だったので求め直す。
+                candidates = await self._get_near_location_candidates(
+                    version, current_location, cell, cell_bounding_box
+                )
+        return rank_near_locations(current_location, candidates)
+
+    async def find_neighbors(
+        self, location_id: int, version: Optional[int] = None
+    ) -> list:
+        """AED設置場所から近い他のAED設置場所を返す。
+
+        インポート時に求めた結果を読むだけで、距離の計算はしない。
+
+        Args:
+            location_id (int): AED設置場所連番
+            version (int): データセットのバージョン。省略時は現在のバージョン
+
+        Returns:
+            neighbors (list of dicts): 近い順のAED設置場所オブジェクトと順位、
+                距離（キロメートル）を要素に持つ辞書のリスト
+
+        """
+        if version is None:
+            version = await self.get_dataset_version()
+        neighbors = list()
+        rows = await self._fetch_statement(
+            "find_neighbors", (int(version), int(location_id))
+        )
+        for i, row in enumerate(rows):
+            row = dict(row)
+            distance = row.pop("distance")
+            neighbors.append(
+                {
+                    "order": i + 1,
+                    "location": AEDInstallationLocation(**row),
+                    "distance": to_kilometers(distance),
+                }
+            )
+        return neighbors
+
+    async def get_version_history(self) -> dict:
+        """データセットのバージョンごとに、変更履歴の比較元のバージョンを返す。"""
+        rows = await self._fetch(
+            "SELECT version, base_version FROM dataset_versions"
+            + " WHERE base_version IS NOT NULL;"
+        )
+        return {row["version"]: row["base_version"] for row in rows}
+
+    async def get_changed_location_ids(self, versions: list) -> list:
+        """指定したバージョンで追加、更新、削除されたAED設置場所連番を返す。"""
+        rows = await self._fetch(
+            "SELECT DISTINCT location_id FROM dataset_changes"
+            + " WHERE version = ANY(%s) ORDER BY location_id;",
+            ([int(version) for version in versions],),
+        )
+        return [row["location_id"] for row in rows]
+
+    async def get_changes(
+        self,
+        since: int,
+        max_versions: int = Config.CHANGES_MAX_VERSIONS,
+        version: Optional[int] = None,
+    ) -> Optional[dict]:
+        """指定したバージョンから現在のバージョンまでの差分を返す。
+
+        手順はAEDInstallationLocationService.get_changesと同じ。
+
+        Args:
+            since (int): クライアントが持っているデータセットのバージョン
+            max_versions (int): たどるバージョンの数の上限
+            version (int): 現在のデータセットのバージョン。省略時はデータベースに
+                問い合わせる。
+
+        Returns:
+            changes (dict): 現在のバージョン、追加または更新されたAED設置場所
+                オブジェクトのリスト、削除されたAED設置場所連番のリストを要素に持つ
+                辞書。指定したバージョンまでたどれない場合はNoneを返す。
+
+        """
+        if version is None:
+            version = await self.get_dataset_version()
+        history = await self.get_version_history() if since != version else dict()
+        versions = trace_versions(history, since, version, max_versions)
+        if versions is None:
+            return None
+        location_ids = await self.get_changed_location_ids(versions)
+        upserts = await self.find_by_location_ids(location_ids) if location_ids else []
+        found = set(location.location_id for location in upserts)
+        return {
+            "version": version,
+            "upserts": upserts,
+            "deletes": sorted(set(location_ids) - found),
+        }
+
+    async def get_last_updated(self) -> Optional[datetime]:
+        """テーブルの最終更新日を返す。"""
+        row = await self._fetchone("get_last_updated")
+        return row["max"]
+
+    async def get_dataset_version(self) -> int:
+        """データセットのバージョンを返す。データがない場合は0を返す。"""
+        last_updated = await self.get_last_updated()
+        if last_updated is None:
+            return 0
+        else:
+            return int(last_updated.timestamp())
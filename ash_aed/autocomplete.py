@@ -0,0 +1,240 @@
+import bisect
+import threading
+import unicodedata
+from typing import Awaitable, Callable, Optional
+
+import numpy as np
+
+# 候補の種類と、同じ一致の仕方の中で並べる順
+KINDS = ("area", "location", "address")
+# 途中から一致する候補を探す時に調べる索引の要素数の上限。短い入力で一致が
+# 多すぎる場合に打ち切る。先頭から一致する候補は打ち切らない。
+SCAN_LIMIT = 500
+# 前方一致の範囲の終わりを二分探索で求めるための、どの文字よりも大きい文字
+MAX_CHARACTER = chr(0x10FFFF)
+# 1回に返す入力候補の件数の上限
+MAX_LIMIT = 50
+
+
+def normalize(text: str) -> str:
+    """入力の揺れを吸収するため、検索語と候補を同じ形にそろえる。
+
+    全角英数字を半角に、英字を小文字に、カタカナをひらがなにし、空白を除く。
+
+    Args:
+        text (str): そろえる文字列
+
+    Returns:
+        text (str): そろえた文字列
+
+    """
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    return "".join(
+        chr(ord(character) - 0x60) if "ァ" <= character <= "ヶ" else character
+        for character in text
+        if not character.isspace()
+    )
+
+
+class AutocompleteIndex:
+    """
+    AED設置場所名、住所、町域名の入力候補を返す前方一致の索引。
+
+    そろえた候補の文字列の全ての接尾辞をソートした配列を持ち、二分探索で
+    検索語から始まる接尾辞を探すので、名称の途中の語からも候補を返せる。
+    先頭から一致する候補は、接尾辞の配列の打ち切りで漏れないよう、種類ごとに
+    候補の文字列全体をソートした配列から探す。データセットのバージョンごとに
+    作り直す。
+
+    Attributes:
+        version (int): 索引を作成したデータセットのバージョン
+
+    """
+
+    def __init__(self, version: int, suggestions: list):
+        """
+        Args:
+            version (int): データセットのバージョン
+            suggestions (list of dicts): 候補の文字列、種類、AED設置場所連番を
+                要素に持つ辞書のリスト
+
+        """
+        self.__version = int(version)
+        self.__suggestions = suggestions
+        entries = list()
+        for number, suggestion in enumerate(suggestions):
+            key = normalize(suggestion["text"])
+            for position in range(len(key)):
+                entries.append((key[position:], position, number))
+        entries.sort()
+        self.__keys = [entry[0] for entry in entries]
+        self.__entries = [(entry[1], entry[2]) for entry in entries]
+        self.__lengths = [len(suggestion["text"]) for suggestion in suggestions]
+        # 種類ごとに、そろえた候補の文字列と、短いもの、番号の小さいものほど
+        # 小さくなる順位の配列を持つ。一致した範囲から順位の小さいものを選ぶ。
+        self.__prefixes = dict()
+        for kind in KINDS:
+            prefixes = sorted(
+                (normalize(suggestion["text"]), number)
+                for number, suggestion in enumerate(suggestions)
+                if suggestion["kind"] == kind
+            )
+            self.__prefixes[kind] = (
+                [prefix[0] for prefix in prefixes],
+                np.array(
+                    [
+                        self.__lengths[number] * len(suggestions) + number
+                        for _, number in prefixes
+                    ],
+                    dtype=np.int64,
+                ),
+            )
+
+    @property
+    def version(self) -> int:
+        return self.__version
+
+    def __len__(self) -> int:
+        return len(self.__keys)
+
+    @classmethod
+    def build(cls, version: int, locations: list) -> "AutocompleteIndex":
+        """AED設置場所データから索引を作成する。
+
+        Args:
+            version (int): データセットのバージョン
+            locations (list of obj:`AEDInstallationLocation`): AED設置場所データの
+                オブジェクトのリスト
+
+        Returns:
+            index (obj:`AutocompleteIndex`): 入力候補の索引
+
+        """
+        suggestions = list()
+        seen = set()
+
+        def add(text, kind, location_id):
+            if not text or (kind, text) in seen:
+                return
+            seen.add((kind, text))
+            suggestions.append({"text": text, "kind": kind, "location_id": location_id})
+
+        for location in sorted(locations, key=lambda location: location.location_id):
+            add(location.area, "area", None)
+            add(location.location_name, "location", location.location_id)
+            add(location.address, "address", location.location_id)
+        return cls(version, suggestions)
+
+    def search(self, query: str, limit: int = 10) -> list:
+        """検索語に一致する入力候補を返す。
+
+        候補の先頭から一致するものを途中から一致するものより先に、同じ一致の
+        仕方の中では町域名、AED設置場所名、住所の順に、短いものから並べる。
+
+        Args:
+            query (str): 入力中の検索語
+            limit (int): 返す候補の件数の上限
+
+        Returns:
+            suggestions (list of dicts): 候補の文字列、種類、AED設置場所連番を
+                要素に持つ辞書のリスト
+
+        """
+        key = normalize(query)
+        if not key or limit < 1:
+            return list()
+
+        # 先頭から一致する候補を種類の順に、全ての一致の中から短いものを選ぶ。
+        found = list()
+        for kind in KINDS:
+            keys, ranks = self.__prefixes[kind]
+            start = bisect.bisect_left(keys, key)
+            end = bisect.bisect_left(keys, key + MAX_CHARACTER, start)
+            ranks = ranks[start:end]
+            count = limit - len(found)
+            if count < len(ranks):
+                ranks = np.partition(ranks, count - 1)[:count]
+            found.extend(int(rank) % len(self.__suggestions) for rank in np.sort(ranks))
+            if limit <= len(found):
+                return [dict(self.__suggestions[number]) for number in found]
+
+        # 足りない分を途中から一致する候補で補う。
+        matches = set()
+        start = bisect.bisect_left(self.__keys, key)
+        for i in range(start, min(start + SCAN_LIMIT, len(self.__keys))):
+            if not self.__keys[i].startswith(key):
+                break
+            position, number = self.__entries[i]
+            if 0 < position:
+                matches.add(number)
+        matches.difference_update(found)
+        found.extend(
+            sorted(
+                matches,
+                key=lambda number: (
+                    KINDS.index(self.__suggestions[number]["kind"]),
+                    self.__lengths[number],
+                    number,
+                ),
+            )[: limit - len(found)]
+        )
+        return [dict(self.__suggestions[number]) for number in found]
+
+
+class AutocompleteIndexStore:
+    """
+    現在のデータセットのバージョンの入力候補の索引を1つだけ保持する。
+
+    """
+
+    def __init__(self):
+        self.__index = None
+        self.__lock = threading.Lock()
+
+    def get(
+        self, version: int, loader: Callable[[], list]
+    ) -> Optional[AutocompleteIndex]:
+        """指定したバージョンの索引を返す。保持していない場合は作成する。
+
+        Args:
+            version (int): データセットのバージョン
+            loader (callable): AED設置場所データのリストを返す関数
+
+        Returns:
+            index (obj:`AutocompleteIndex`): 入力候補の索引
+
+        """
+        index = self.__index
+        if index is not None and index.version == version:
+            return index
+        with self.__lock:
+            # 待っている間に他のスレッドが作成していればそれを使う。
+            index = self.__index
+            if index is None or index.version != version:
+                index = AutocompleteIndex.build(version, loader())
+                self.__index = index
+        return index
+
+    async def get_async(
+        self, version: int, loader: Callable[[], Awaitable]
+    ) -> Optional[AutocompleteIndex]:
+        """getのasyncio版。保持していない場合だけAED設置場所データを読み込む。
+
+        Args:
+            version (int): データセットのバージョン
+            loader (callable): AED設置場所データのリストを返すコルーチン関数
+
+        Returns:
+            index (obj:`AutocompleteIndex`): 入力候補の索引
+
+        """
+        index = self.__index
+        if index is not None and index.version == version:
+            return index
+        locations = await loader()
+        return self.get(version, lambda: locations)
+
+    def clear(self) -> None:
+        """保持している索引を破棄する。"""
+        with self.__lock:
+            self.__index = None
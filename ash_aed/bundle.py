@@ -0,0 +1,247 @@
+import glob
+import gzip
+import json
+import os
+import re
+from typing import Optional
+
+# 緯度経度を整数にするときの倍率。1e7倍で約1cmの精度になる。
+COORDINATE_SCALE = 10**7
+# 文字列の重複を除いて番号で参照する項目
+STRING_FIELDS = (
+    "area",
+    "location_name",
+    "postal_code",
+    "address",
+    "phone_number",
+    "available_time",
+    "installation_floor",
+)
+BUNDLE_FILE_PATTERN = re.compile(r"^bundle\.(\d+)\.json(\.gz)?$")
+
+
+def encode_deltas(values: list) -> list:
+    """整数のリストを先頭からの差分のリストにする。"""
+    previous = 0
+    deltas = list()
+    for value in values:
+        deltas.append(value - previous)
+        previous = value
+    return deltas
+
+
+def decode_deltas(deltas: list) -> list:
+    """encode_deltasで差分にしたリストを元に戻す。"""
+    value = 0
+    values = list()
+    for delta in deltas:
+        value += delta
+        values.append(value)
+    return values
+
+
+class OfflineBundle:
+    """
+    ブラウザが手元で最寄りのAED設置場所を検索するための、小さく符号化した
+    データセット。
+
+    緯度経度は整数にして直前の地点との差分で、文字列は重複を除いた一覧への
+    番号で表す。ファイル名にデータセットのバージョンを含め、gzipで圧縮した
+    ファイルも書き出しておくことで、配信時に圧縮せずに長期間キャッシュできる。
+
+    Attributes:
+        version (int): データセットのバージョン
+        data (dict): 符号化したデータセット
+
+    """
+
+    MANIFEST_NAME = "manifest.json"
+    # 書き出した後も残しておく古いバージョンの数
+    KEEP_VERSIONS = 2
+
+    def __init__(self, version: int, data: dict):
+        """
+        Args:
+            version (int): データセットのバージョン
+            data (dict): 符号化したデータセット
+
+        """
+        self.__version = int(version)
+        self.__data = data
+
+    @property
+    def version(self) -> int:
+        return self.__version
+
+    @property
+    def data(self) -> dict:
+        return self.__data
+
+    @property
+    def filename(self) -> str:
+        return "bundle." + str(self.__version) + ".json"
+
+    @classmethod
+    def build(cls, version: int, locations: list) -> "OfflineBundle":
+        """AED設置場所データを符号化する。
+
+        Args:
+            version (int): データセットのバージョン
+            locations (list of obj:`AEDInstallationLocation`): AED設置場所データの
+                オブジェクトのリスト
+
+        Returns:
+            bundle (obj:`OfflineBundle`): 符号化したデータセット
+
+        """
+        locations = sorted(locations, key=lambda location: location.location_id)
+        strings = list()
+        string_numbers = dict()
+        fields = dict()
+        for field in STRING_FIELDS:
+            numbers = list()
+            for location in locations:
+                value = getattr(location, field)
+                if value not in string_numbers:
+                    string_numbers[value] = len(strings)
+                    strings.append(value)
+                numbers.append(string_numbers[value])
+            fields[field] = numbers
+        return cls(
+            version,
+            {
+                "version": int(version),
+                "scale": COORDINATE_SCALE,
+                "count": len(locations),
+                "location_ids": encode_deltas(
+                    [location.location_id for location in locations]
+                ),
+                "latitudes": encode_deltas(
+                    [
+                        round(location.latitude * COORDINATE_SCALE)
+                        for location in locations
+                    ]
+                ),
+                "longitudes": encode_deltas(
+                    [
+                        round(location.longitude * COORDINATE_SCALE)
+                        for location in locations
+                    ]
+                ),
+                "strings": strings,
+                "fields": fields,
+            },
+        )
+
+    @staticmethod
+    def decode(data: dict) -> list:
+        """符号化したデータセットをAED設置場所ごとの辞書のリストに戻す。
+
+        static/js/offline_search.jsの復号と同じ手順で、確認に使う。
+
+        Args:
+            data (dict): 符号化したデータセット
+
+        Returns:
+            rows (list of dicts): AED設置場所の項目を要素に持つ辞書のリスト
+
+        """
+        scale = data["scale"]
+        rows = list()
+        for i, (location_id, latitude, longitude) in enumerate(
+            zip(
+                decode_deltas(data["location_ids"]),
+                decode_deltas(data["latitudes"]),
+                decode_deltas(data["longitudes"]),
+            )
+        ):
+            row = {
+                "location_id": location_id,
+                "latitude": latitude / scale,
+                "longitude": longitude / scale,
+            }
+            for field, numbers in data["fields"].items():
+                row[field] = data["strings"][numbers[i]]
+            rows.append(row)
+        return rows
+
+    def to_json(self) -> bytes:
+        """符号化したデータセットを空白を省いたJSONにする。"""
+        return json.dumps(
+            self.__data, ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
+
+    @staticmethod
+    def _write(path: str, content: bytes) -> None:
+        """一時ファイルへ書き込んでから置き換える。"""
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(content)
+        os.replace(temp_path, path)
+
+    def save(self, directory: str) -> str:
+        """
+        データセットとgzipで圧縮したもの、現在のバージョンを示すマニフェストを
+        書き出し、古いバージョンのファイルを削除する。
+
+        Args:
+            directory (str): 書き出すディレクトリ
+
+        Returns:
+            path (str): 書き出したデータセットのパス
+
+        """
+        os.makedirs(directory, exist_ok=True)
+        content = self.to_json()
+        path = os.path.join(directory, self.filename)
+        self._write(path + ".gz", gzip.compress(content, compresslevel=9, mtime=0))
+        self._write(path, content)
+        # データセットを書き出してからマニフェストを置き換える。
+        self._write(
+            os.path.join(directory, self.MANIFEST_NAME),
+            json.dumps(
+                {
+                    "version": self.__version,
+                    "count": self.__data["count"],
+                    "path": "/offline/" + self.filename,
+                }
+            ).encode("utf-8"),
+        )
+        self.remove_old_versions(directory)
+        return path
+
+    def remove_old_versions(self, directory: str) -> None:
+        """新しい方からKEEP_VERSIONS個より古いバージョンのファイルを削除する。"""
+        versions = set()
+        for path in glob.glob(os.path.join(directory, "bundle.*.json*")):
+            match = BUNDLE_FILE_PATTERN.match(os.path.basename(path))
+            if match:
+                versions.add(int(match.group(1)))
+        keep = sorted(versions, reverse=True)[: self.KEEP_VERSIONS]
+        keep.append(self.__version)
+        for version in versions - set(keep):
+            for suffix in ("", ".gz"):
+                path = os.path.join(
+                    directory, "bundle." + str(version) + ".json" + suffix
+                )
+                if os.path.exists(path):
+                    os.remove(path)
+
+    @staticmethod
+    def get_path(directory: str, version: int, gzipped: bool = False) -> Optional[str]:
+        """書き出したデータセットのパスを返す。
+
+        Args:
+            directory (str): 書き出したディレクトリ
+            version (int): データセットのバージョン
+            gzipped (bool): gzipで圧縮したファイルのパスを返す場合は真
+
+        Returns:
+            path (str): ファイルのパス。ファイルがない場合はNoneを返す。
+
+        """
+        path = os.path.join(
+            directory,
+            "bundle." + str(int(version)) + ".json" + (".gz" if gzipped else ""),
+        )
+        return path if os.path.exists(path) else None
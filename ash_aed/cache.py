@@ -0,0 +1,303 @@
+import math
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+from ash_aed.coverage import EARTH_RADIUS
+from ash_aed.singleflight import AsyncSingleFlight, SingleFlight
+
+# キャッシュにキーがないことを表す値。Noneを値として保存できるよう区別する。
+_MISSING = object()
+
+
+class LRUCache:
+    """件数に上限を持つLRU方式のインメモリキャッシュ。
+
+    複数のスレッドから同時に参照されてもよいようにロックで保護している。
+    get_or_setでは、同じキーを同時に外した場合に値を1回だけ求める。
+
+    Attributes:
+        max_size (int): キャッシュに保持する要素数の上限
+        stats (dict): ヒット数、ミス数、上限超過による削除数、他のスレッドが
+            求めた値を待って使った数を要素に持つ辞書
+
+    """
+
+    def __init__(self, max_size: int = 1024, timeout: Optional[float] = None):
+        """
+        Args:
+            max_size (int): キャッシュに保持する要素数の上限
+            timeout (float): 他のスレッドが値を求めるのを待つ秒数の上限
+
+        """
+        max_size = int(max_size)
+        if max_size < 1:
+            raise ValueError("キャッシュの上限件数は1以上を指定してください。")
+        self.__max_size = max_size
+        self.__items = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+        self.__flights = SingleFlight(timeout)
+        self.__async_flights = AsyncSingleFlight(timeout)
+
+    @property
+    def max_size(self) -> int:
+        return self.__max_size
+
+    @property
+    def stats(self) -> dict:
+        with self.__lock:
+            return {
+                "size": len(self.__items),
+                "max_size": self.__max_size,
+                "hits": self.__hits,
+                "misses": self.__misses,
+                "evictions": self.__evictions,
+                "coalesced": self.__flights.stats["shared"]
+                + self.__async_flights.stats["shared"],
+            }
+
+    def __len__(self) -> int:
+        with self.__lock:
+            return len(self.__items)
+
+    def get(self, key, default=None):
+        """キーに対応する値を返し、その要素を最も新しく使用したものとする。
+
+        Args:
+            key (hashable): キャッシュのキー
+            default (object): キーが存在しない場合に返す値
+
+        Returns:
+            value (object): キャッシュされた値
+
+        """
+        with self.__lock:
+            if key not in self.__items:
+                self.__misses += 1
+                return default
+            self.__hits += 1
+            self.__items.move_to_end(key)
+            return self.__items[key]
+
+    def set(self, key, value) -> None:
+        """キーと値を保存し、上限を超えた場合は最も古い要素を削除する。
+
+        Args:
+            key (hashable): キャッシュのキー
+            value (object): キャッシュする値
+
+        """
+        with self.__lock:
+            self.__items[key] = value
+            self.__items.move_to_end(key)
+            while self.__max_size < len(self.__items):
+                self.__items.popitem(last=False)
+                self.__evictions += 1
+
+    def coalesce(self, key, function: Callable[[], object]) -> tuple:
+        """
+        キーの値を求める処理を実行するか、他のスレッドが実行中であればその結果を
+        待つ。結果はキャッシュに保存しない。
+
+        Args:
+            key (hashable): キャッシュのキー
+            function (callable): 引数を取らず値を返す関数
+
+        Returns:
+            value (object): 求めた値
+            shared (bool): 他のスレッドが求めた値の場合は真
+
+        """
+        return self.__flights.do(key, function)
+
+    async def coalesce_async(self, key, function: Callable[[], Awaitable]) -> tuple:
+        """
+        coalesceのasyncio版。キーの値を求める処理を実行するか、他のタスクが
+        実行中であればその結果を待つ。結果はキャッシュに保存しない。
+
+        Args:
+            key (hashable): キャッシュのキー
+            function (callable): 引数を取らずawaitできるオブジェクトを返す関数
+
+        Returns:
+            value (object): 求めた値
+            shared (bool): 他のタスクが求めた値の場合は真
+
+        """
+        return await self.__async_flights.do(key, function)
+
+    def get_or_set(self, key, function: Callable[[], object]):
+        """
+        キーに対応する値を返し、キャッシュにない場合は関数で求めて保存する。
+
+        同じキーを同時に求める場合は1つのスレッドだけが関数を呼び出し、他の
+        スレッドはその結果を使う。関数で発生した例外は待っていたスレッドでも
+        発生し、Noneを返した場合は保存しない。
+
+        Args:
+            key (hashable): キャッシュのキー
+            function (callable): 引数を取らず値を返す関数
+
+        Returns:
+            value (object): キャッシュされた値または求めた値
+
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        def load():
+            # 待っている間に他のスレッドが保存していればそれを使う。
+            with self.__lock:
+                if key in self.__items:
+                    return self.__items[key]
+            value = function()
+            if value is not None:
+                self.set(key, value)
+            return value
+
+        value, _ = self.coalesce(key, load)
+        return value
+
+    def clear(self) -> None:
+        """キャッシュを全て削除する。"""
+        with self.__lock:
+            self.__items.clear()
+
+
+class NearLocationsCache:
+    """
+    現在地から近いAED設置場所の検索候補を、座標を一定の精度で量子化した区画ごとに
+    保持するキャッシュ。
+
+    区画内のどの地点から検索しても上位の検索結果が候補に含まれるようにしておき、
+    ヒットした場合は候補だけを正確な現在地で並べ替えれば正しい検索結果になる。
+
+    Attributes:
+        precision (float): 区画の一辺の長さ（メートル）
+        stats (dict): キャッシュの統計情報
+
+    """
+
+    def __init__(
+        self, max_size: int, precision: float, timeout: Optional[float] = None
+    ):
+        """
+        Args:
+            max_size (int): キャッシュに保持する区画数の上限
+            precision (float): 区画の一辺の長さ（メートル）
+            timeout (float): 他のスレッドが検索候補を求めるのを待つ秒数の上限
+
+        """
+        precision = float(precision)
+        if precision <= 0:
+            raise ValueError("区画の大きさは正の数で指定してください。")
+        self.__precision = precision
+        self.__latitude_step = math.degrees(precision / EARTH_RADIUS)
+        self.__cache = LRUCache(max_size, timeout)
+
+    @property
+    def precision(self) -> float:
+        return self.__precision
+
+    @property
+    def stats(self) -> dict:
+        return self.__cache.stats
+
+    @property
+    def half_diagonal(self) -> float:
+        """区画内の任意の地点と区画の中心との距離の上限（メートル）を返す。"""
+        # 投影の誤差を見込んで少し広げる。
+        return self.__precision * math.sqrt(2) / 2 * 1.01
+
+    def get_cell(self, latitude: float, longitude: float) -> tuple:
+        """緯度経度を含む区画の番号と範囲を返す。
+
+        Args:
+            latitude (float): 緯度
+            longitude (float): 経度
+
+        Returns:
+            cell (tuple): 区画の番号のタプルと、区画の南端の緯度、西端の経度、
+                北端の緯度、東端の経度のタプル
+
+        """
+        row = math.floor(latitude / self.__latitude_step)
+        south = row * self.__latitude_step
+        north = south + self.__latitude_step
+        # 経度方向の幅は区画の中心の緯度で決めるので、同じ区画は常に同じ範囲になる。
+        longitude_step = self.__latitude_step / math.cos(
+            math.radians((south + north) / 2)
+        )
+        col = math.floor(longitude / longitude_step)
+        west = col * longitude_step
+        east = west + longitude_step
+        return ((row, col), (south, west, north, east))
+
+    def get(self, version: int, cell: tuple) -> Optional[list]:
+        """区画の検索候補を返す。
+
+        Args:
+            version (int): データセットのバージョン
+            cell (tuple): get_cellで取得した区画の番号
+
+        Returns:
+            candidates (list of obj:`AEDInstallationLocation`): 検索候補のリスト。
+                キャッシュにない場合はNoneを返す。
+
+        """
+        return self.__cache.get((version, cell))
+
+    def set(self, version: int, cell: tuple, candidates: list) -> None:
+        """区画の検索候補を保存する。
+
+        Args:
+            version (int): データセットのバージョン
+            cell (tuple): get_cellで取得した区画の番号
+            candidates (list of obj:`AEDInstallationLocation`): 検索候補のリスト
+
+        """
+        self.__cache.set((version, cell), candidates)
+
+    def clear(self) -> None:
+        """キャッシュを全て削除する。"""
+        self.__cache.clear()
+
+    def coalesce(self, version: int, cell: tuple, function: Callable[[], object]):
+        """
+        区画の検索候補を求める処理を実行するか、他のスレッドが実行中であれば
+        その結果を待つ。
+
+        Args:
+            version (int): データセットのバージョン
+            cell (tuple): get_cellで取得した区画の番号
+            function (callable): 引数を取らず結果を返す関数
+
+        Returns:
+            value (object): 関数の結果
+            shared (bool): 他のスレッドが求めた結果の場合は真
+
+        """
+        return self.__cache.coalesce((version, cell), function)
+
+    async def coalesce_async(
+        self, version: int, cell: tuple, function: Callable[[], Awaitable]
+    ):
+        """
+        coalesceのasyncio版。区画の検索候補を求める処理を実行するか、他の
+        タスクが実行中であればその結果を待つ。
+
+        Args:
+            version (int): データセットのバージョン
+            cell (tuple): get_cellで取得した区画の番号
+            function (callable): 引数を取らずawaitできるオブジェクトを返す関数
+
+        Returns:
+            value (object): 関数の結果
+            shared (bool): 他のタスクが求めた結果の場合は真
+
+        """
+        return await self.__cache.coalesce_async((version, cell), function)
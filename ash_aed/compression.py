@@ -0,0 +1,203 @@
+import zlib
+from typing import Iterable, Iterator, Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 圧縮して送るレスポンスのMIMEタイプ
+COMPRESSIBLE_MIMETYPES = ("text/html", "application/json")
+
+
+def get_encodings() -> list:
+    """使える圧縮形式を優先する順に返す。"""
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def negotiate_encoding(accept_encodings) -> Optional[str]:
+    """クライアントが受け付ける圧縮形式のうち、最も優先するものを返す。
+
+    Args:
+        accept_encodings (obj:`werkzeug.datastructures.Accept`): リクエストの
+            Accept-Encoding
+
+    Returns:
+        encoding (str): 圧縮形式。圧縮しない場合はNone
+
+    """
+    return accept_encodings.best_match(get_encodings())
+
+
+def get_variant_etag(etag: str, encoding: Optional[str]) -> str:
+    """圧縮したレスポンスのETagを返す。
+
+    圧縮形式ごとに内容が異なるので、圧縮していないレスポンスのETagに圧縮形式を
+    付けて区別する。
+
+    Args:
+        etag (str): 圧縮していないレスポンスのETag
+        encoding (str): 圧縮形式
+
+    Returns:
+        etag (str): 圧縮したレスポンスのETag
+
+    """
+    if encoding is None:
+        return etag
+    return etag + "-" + encoding
+
+
+def etag_matches(if_none_match, etag: str) -> bool:
+    """If-None-Matchが、いずれかの圧縮形式のETagに一致するかを返す。
+
+    Args:
+        if_none_match (obj:`werkzeug.datastructures.ETags`): リクエストの
+            If-None-Match
+        etag (str): 圧縮していないレスポンスのETag
+
+    Returns:
+        matches (bool): 一致する場合は真
+
+    """
+    return any(
+        if_none_match.contains(get_variant_etag(etag, encoding))
+        for encoding in [None] + get_encodings()
+    )
+
+
+class ResponseCompressor:
+    """
+    HTMLとJSONのレスポンスをgzipまたはbrotliで圧縮する。
+
+    既に圧縮されているレスポンスやファイルを送るレスポンス、小さなレスポンスは
+    そのまま送る。少しずつ送るレスポンスは、送る断片ごとに圧縮して送る。
+
+    Attributes:
+        level (int): gzipの圧縮レベル（1〜9）
+        brotli_quality (int): brotliの圧縮品質（0〜11）
+        min_size (int): 圧縮するレスポンスの最小のバイト数
+
+    """
+
+    def __init__(self, level: int = 6, brotli_quality: int = 5, min_size: int = 500):
+        """
+        Args:
+            level (int): gzipの圧縮レベル（1〜9）
+            brotli_quality (int): brotliの圧縮品質（0〜11）
+            min_size (int): 圧縮するレスポンスの最小のバイト数
+
+        """
+        self.__level = int(level)
+        self.__brotli_quality = int(brotli_quality)
+        self.__min_size = int(min_size)
+
+    @property
+    def level(self) -> int:
+        return self.__level
+
+    @property
+    def brotli_quality(self) -> int:
+        return self.__brotli_quality
+
+    @property
+    def min_size(self) -> int:
+        return self.__min_size
+
+    def compress(self, data: bytes, encoding: str) -> bytes:
+        """データを圧縮する。
+
+        Args:
+            data (bytes): 圧縮するデータ
+            encoding (str): 圧縮形式（brまたはgzip）
+
+        Returns:
+            data (bytes): 圧縮したデータ
+
+        """
+        if encoding == "br":
+            return brotli.compress(data, quality=self.__brotli_quality)
+        compressor = zlib.compressobj(self.__level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress(data) + compressor.flush()
+
+    def compress_stream(self, chunks: Iterable, encoding: str) -> Iterator[bytes]:
+        """少しずつ送るデータを、断片ごとに送り出せるよう圧縮する。
+
+        Args:
+            chunks (iterable of bytes): 圧縮するデータ
+            encoding (str): 圧縮形式（brまたはgzip）
+
+        Yields:
+            chunk (bytes): 圧縮したデータ
+
+        """
+        if encoding == "br":
+            compressor = brotli.Compressor(quality=self.__brotli_quality)
+            for chunk in chunks:
+                data = compressor.process(chunk) + compressor.flush()
+                if data:
+                    yield data
+            yield compressor.finish()
+        else:
+            compressor = zlib.compressobj(
+                self.__level, zlib.DEFLATED, 16 + zlib.MAX_WBITS
+            )
+            for chunk in chunks:
+                data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+                if data:
+                    yield data
+            yield compressor.flush()
+
+    def is_compressible(self, response) -> bool:
+        """レスポンスを圧縮するかを返す。
+
+        Args:
+            response (obj:`flask.Response`): レスポンス
+
+        Returns:
+            compressible (bool): 圧縮する場合は真
+
+        """
+        if response.status_code != 200 or response.direct_passthrough:
+            return False
+        if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+            return False
+        if "Content-Encoding" in response.headers:
+            return False
+        if response.is_streamed:
+            return True
+        return self.__min_size <= response.content_length
+
+    def compress_response(self, response, encoding: Optional[str]) -> bool:
+        """レスポンスを圧縮し、圧縮形式ごとのETagを付ける。
+
+        一度に送るレスポンスには圧縮前の内容からETagを付ける。
+
+        Args:
+            response (obj:`flask.Response`): 圧縮するレスポンス
+            encoding (str): 圧縮形式。圧縮しない場合はNone
+
+        Returns:
+            compressed (bool): 圧縮した場合は真
+
+        """
+        if not self.is_compressible(response):
+            return False
+        response.vary.add("Accept-Encoding")
+        if response.is_streamed:
+            if encoding is None:
+                return False
+            response.response = self.compress_stream(response.iter_encoded(), encoding)
+            response.headers.pop("Content-Length", None)
+            response.content_encoding = encoding
+            return True
+        etag, _ = response.get_etag()
+        if etag is None:
+            response.add_etag()
+            etag, _ = response.get_etag()
+        if encoding is None:
+            return False
+        response.set_data(self.compress(response.get_data(), encoding))
+        response.content_encoding = encoding
+        response.set_etag(get_variant_etag(etag, encoding))
+        return True
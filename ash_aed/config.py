@@ -7,3 +7,142 @@ class Config:
         "https://www.city.asahikawa.hokkaido.jp/kurashi/311/316/d053328_d/fil/"
         + "012041_aed_location.csv"
     )
+    # オープンデータのダウンロードで、接続と応答をそれぞれ待つ秒数の上限
+    OPENDATA_TIMEOUT = float(os.environ.get("ASH_AED_OPENDATA_TIMEOUT", 30))
+    # 地図タイルごとのクラスタリング結果を保持するキャッシュの件数上限
+    TILE_CACHE_SIZE = int(os.environ.get("ASH_AED_TILE_CACHE_SIZE", 4096))
+    # 最寄りのAED設置場所を事前計算する格子データの設定
+    COVERAGE_GRID_PATH = os.environ.get(
+        "ASH_AED_COVERAGE_GRID_PATH",
+        os.path.join(
+            os.path.dirname(os.path.dirname(__file__)), "data", "coverage_grid.npz"
+        ),
+    )
+    # 旭川市域を含む矩形（南端の緯度,西端の経度,北端の緯度,東端の経度）
+    COVERAGE_GRID_BOUNDING_BOX = tuple(
+        float(value)
+        for value in os.environ.get(
+            "ASH_AED_COVERAGE_GRID_BOUNDING_BOX", "43.58,142.08,43.96,142.72"
+        ).split(",")
+    )
+    # 格子の一辺の長さ（メートル）
+    COVERAGE_GRID_RESOLUTION = float(
+        os.environ.get("ASH_AED_COVERAGE_GRID_RESOLUTION", 100)
+    )
+    COVERAGE_GRID_CANDIDATES = int(
+        os.environ.get("ASH_AED_COVERAGE_GRID_CANDIDATES", 16)
+    )
+    COVERAGE_GRID_WORKERS = int(os.environ.get("ASH_AED_COVERAGE_GRID_WORKERS", 4))
+    # オープンデータの更新を確認する間隔（秒）。0の場合はアプリ内で確認しない。
+    REFRESH_INTERVAL = float(os.environ.get("ASH_AED_REFRESH_INTERVAL", 0))
+    # 更新を確認する間隔をばらつかせる割合
+    REFRESH_JITTER = float(os.environ.get("ASH_AED_REFRESH_JITTER", 0.1))
+    # テーブルを入れ替える時に、ロックの取得を待つ時間の上限（ミリ秒）。待って
+    # いる間は検索も待たされるので短くし、取得できない場合は繰り返す。
+    SWAP_LOCK_TIMEOUT = int(os.environ.get("ASH_AED_SWAP_LOCK_TIMEOUT", 50))
+    # ロックを取得できない場合に、テーブルの入れ替えを試みる回数
+    SWAP_LOCK_RETRIES = int(os.environ.get("ASH_AED_SWAP_LOCK_RETRIES", 20))
+    # インポート後に新しいデータセットのバージョンを通知するチャンネル
+    DATASET_CHANNEL = os.environ.get("ASH_AED_DATASET_CHANNEL", "ash_aed_dataset")
+    # 各ワーカーで通知を待ち受けるか（1で有効、0で無効）。待ち受けている間は
+    # リクエストごとにデータセットのバージョンを問い合わせない。
+    DATASET_LISTENER = os.environ.get("ASH_AED_DATASET_LISTENER", "1") == "1"
+    # 通知の待ち受けが切断された場合に接続し直すまでの秒数
+    DATASET_LISTENER_RECONNECT_INTERVAL = float(
+        os.environ.get("ASH_AED_DATASET_LISTENER_RECONNECT_INTERVAL", 5)
+    )
+    # 現在地から近いAED設置場所の検索候補を保持するキャッシュの区画数の上限と
+    # 区画の一辺の長さ（メートル）
+    NEAR_LOCATIONS_CACHE_SIZE = int(
+        os.environ.get("ASH_AED_NEAR_LOCATIONS_CACHE_SIZE", 4096)
+    )
+    NEAR_LOCATIONS_CACHE_PRECISION = float(
+        os.environ.get("ASH_AED_NEAR_LOCATIONS_CACHE_PRECISION", 10)
+    )
+    # gunicornの各ワーカーのメトリクスを書き出すディレクトリ。指定しない場合は
+    # /metricsにリクエストを受けたプロセスの値だけを出力する。
+    METRICS_DIR = os.environ.get("ASH_AED_METRICS_DIR")
+    # メトリクスをディレクトリへ書き出す最小の間隔（秒）
+    METRICS_FLUSH_INTERVAL = float(
+        os.environ.get("ASH_AED_METRICS_FLUSH_INTERVAL", 1.0)
+    )
+    # 実行時間が閾値（秒）を超えたSQL文を実行計画とともに記録する設定。
+    # 閾値が0の場合は記録しない。
+    SLOW_QUERY_THRESHOLD = float(os.environ.get("ASH_AED_SLOW_QUERY_THRESHOLD", 0.5))
+    SLOW_QUERY_SAMPLE_RATE = float(
+        os.environ.get("ASH_AED_SLOW_QUERY_SAMPLE_RATE", 0.1)
+    )
+    SLOW_QUERY_LOG_PATH = os.environ.get(
+        "ASH_AED_SLOW_QUERY_LOG_PATH",
+        os.path.join(
+            os.path.dirname(os.path.dirname(__file__)), "data", "slow_queries.log"
+        ),
+    )
+    # 真の場合はパラメータの値を型名に置き換えて記録する
+    SLOW_QUERY_REDACT = os.environ.get("ASH_AED_SLOW_QUERY_REDACT", "1") != "0"
+    # ログを出力するレベル
+    LOG_LEVEL = os.environ.get("ASH_AED_LOG_LEVEL", "DEBUG").upper()
+    # ASGIアプリケーションが使うasyncpgの接続プールの接続数の下限と上限
+    ASYNC_POOL_MIN_SIZE = int(os.environ.get("ASH_AED_ASYNC_POOL_MIN_SIZE", 2))
+    ASYNC_POOL_MAX_SIZE = int(os.environ.get("ASH_AED_ASYNC_POOL_MAX_SIZE", 10))
+    # psycopg2の接続プールがプロセスごとに保持する接続数の下限と上限
+    DB_POOL_MIN_SIZE = int(os.environ.get("ASH_AED_DB_POOL_MIN_SIZE", 1))
+    DB_POOL_MAX_SIZE = int(os.environ.get("ASH_AED_DB_POOL_MAX_SIZE", 10))
+    # 検索用のSELECT文をサーバー側で準備して使い回す場合は真
+    PREPARED_STATEMENTS = os.environ.get("ASH_AED_PREPARED_STATEMENTS", "1") != "0"
+    # Webアプリケーションが検索に使うストレージ。"postgresql"か"sqlite"を指定する。
+    STORAGE_BACKEND = os.environ.get("ASH_AED_STORAGE_BACKEND", "postgresql")
+    # インポート時に書き出す読み取り専用のSQLiteファイルのパス
+    SQLITE_PATH = os.environ.get(
+        "ASH_AED_SQLITE_PATH",
+        os.path.join(
+            os.path.dirname(os.path.dirname(__file__)),
+            "data",
+            "aed_installation_locations.sqlite3",
+        ),
+    )
+    # 検索結果を逐次読み出す場合に、サーバー側のカーソルから一度に取得する行数
+    STREAM_ITERSIZE = int(os.environ.get("ASH_AED_STREAM_ITERSIZE", 500))
+    # 差分を返すためにたどるデータセットのバージョンの数の上限。これより古い
+    # バージョンからの同期には全件を返す。
+    CHANGES_MAX_VERSIONS = int(os.environ.get("ASH_AED_CHANGES_MAX_VERSIONS", 30))
+    # ブラウザが手元で検索するためのデータセットを書き出すディレクトリ
+    OFFLINE_BUNDLE_DIR = os.environ.get(
+        "ASH_AED_OFFLINE_BUNDLE_DIR",
+        os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "offline"),
+    )
+    # HTMLとJSONのレスポンスの圧縮の設定。gzipの圧縮レベル（1〜9）、brotliの
+    # 圧縮品質（0〜11）、圧縮するレスポンスの最小のバイト数
+    COMPRESSION_LEVEL = int(os.environ.get("ASH_AED_COMPRESSION_LEVEL", 6))
+    COMPRESSION_BROTLI_QUALITY = int(
+        os.environ.get("ASH_AED_COMPRESSION_BROTLI_QUALITY", 5)
+    )
+    COMPRESSION_MIN_SIZE = int(os.environ.get("ASH_AED_COMPRESSION_MIN_SIZE", 500))
+    # 描画して圧縮したページを保持するキャッシュの件数上限
+    PAGE_CACHE_SIZE = int(os.environ.get("ASH_AED_PAGE_CACHE_SIZE", 256))
+    # AED設置場所のページに表示する、インポート時に求めておく近いAED設置場所の件数
+    NEIGHBORS_COUNT = int(os.environ.get("ASH_AED_NEIGHBORS_COUNT", 5))
+    # 同じキャッシュのキーを同時に外したときに、他のスレッドが値を求めるのを
+    # 待つ秒数の上限。超えた場合は待たずに自分で求める。
+    SINGLE_FLIGHT_TIMEOUT = float(os.environ.get("ASH_AED_SINGLE_FLIGHT_TIMEOUT", 10))
+    # ワーカー間で共有するキャッシュの保存先。空の場合は共有しない。localの場合は
+    # 同じホストのワーカーで、redis://ホスト:ポート/DB番号の場合はRedis互換の
+    # サーバーで共有する。
+    SHARED_CACHE = os.environ.get("ASH_AED_SHARED_CACHE", "")
+    # 共有するキャッシュに保存したデータの有効期間（秒）
+    SHARED_CACHE_TTL = float(os.environ.get("ASH_AED_SHARED_CACHE_TTL", 3600))
+    # 名称の入力候補を返す件数の既定値
+    AUTOCOMPLETE_LIMIT = int(os.environ.get("ASH_AED_AUTOCOMPLETE_LIMIT", 10))
+    # リクエストごとのプロファイル結果を書き出すディレクトリ。指定しない場合は
+    # 計測しない。
+    PROFILE_DIR = os.environ.get("ASH_AED_PROFILE_DIR")
+    # 計測するリクエストの割合（0〜1）
+    PROFILE_SAMPLE_RATE = float(os.environ.get("ASH_AED_PROFILE_SAMPLE_RATE", 0))
+    # X-Profile-Tokenヘッダーに付けるとそのリクエストを計測し、集計結果も
+    # 取得できるトークン
+    PROFILE_TOKEN = os.environ.get("ASH_AED_PROFILE_TOKEN")
+    # 残すプロファイル結果の数
+    PROFILE_MAX_FILES = int(os.environ.get("ASH_AED_PROFILE_MAX_FILES", 200))
+    # pstats形式に加えて、フレームグラフ用の折りたたんだスタック形式でも
+    # 書き出すか（1で有効、0で無効）
+    PROFILE_COLLAPSED = os.environ.get("ASH_AED_PROFILE_COLLAPSED", "0") == "1"
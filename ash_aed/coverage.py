@@ -0,0 +1,437 @@
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import numpy as np
+
+from ash_aed.errors import LocationError
+
+# CurrentLocation.get_distance_toと同じ地球の半径（メートル）
+EARTH_RADIUS = 6378137.00
+
+
+def get_distances(
+    latitudes: np.ndarray,
+    longitudes: np.ndarray,
+    end_latitudes: np.ndarray,
+    end_longitudes: np.ndarray,
+) -> np.ndarray:
+    """
+    複数の地点から複数のAED設置場所までの距離をまとめて計算する。
+
+    CurrentLocation.get_distance_toと同じ球面三角法の式をベクトル化したもの。
+
+    Args:
+        latitudes (:obj:`numpy.ndarray`): 始点の緯度の1次元配列
+        longitudes (:obj:`numpy.ndarray`): 始点の経度の1次元配列
+        end_latitudes (:obj:`numpy.ndarray`): 終点の緯度の1次元配列
+        end_longitudes (:obj:`numpy.ndarray`): 終点の経度の1次元配列
+
+    Returns:
+        distances (:obj:`numpy.ndarray`): 始点の数×終点の数の距離（メートル）の
+            2次元配列
+
+    """
+    start_latitudes = np.radians(latitudes)[:, np.newaxis]
+    start_longitudes = np.radians(longitudes)[:, np.newaxis]
+    end_latitudes = np.radians(end_latitudes)[np.newaxis, :]
+    end_longitudes = np.radians(end_longitudes)[np.newaxis, :]
+    cosine = np.sin(start_latitudes) * np.sin(end_latitudes) + np.cos(
+        start_latitudes
+    ) * np.cos(end_latitudes) * np.cos(end_longitudes - start_longitudes)
+    return EARTH_RADIUS * np.arccos(np.clip(cosine, -1.0, 1.0))
+
+
+class CoverageGrid:
+    """
+    市域の矩形を格子に分割し、格子ごとに最も近いAED設置場所と距離、近傍の候補を
+    事前に計算したラスタデータ。
+
+    Attributes:
+        version (int): 計算に使用したデータセットのバージョン
+        bounding_box (tuple): 南端の緯度、西端の経度、北端の緯度、東端の経度
+        resolution (float): 格子の一辺の長さ（メートル）
+        location_ids (:obj:`numpy.ndarray`): AED設置場所連番の配列
+        nearest_distances (:obj:`numpy.ndarray`): 格子の中心から最も近い
+            AED設置場所までの距離（メートル）の2次元配列
+        candidates (:obj:`numpy.ndarray`): 格子の中心から近い順のAED設置場所の
+            インデックスの3次元配列
+        exact (:obj:`numpy.ndarray`): 格子内のどの地点でも上位の検索結果が候補に
+            含まれることが保証されているかを表す2次元配列
+
+    """
+
+    def __init__(
+        self,
+        version: int,
+        bounding_box: tuple,
+        resolution: float,
+        location_ids: np.ndarray,
+        nearest_distances: np.ndarray,
+        candidates: np.ndarray,
+        exact: np.ndarray,
+    ):
+        """
+        Args:
+            version (int): 計算に使用したデータセットのバージョン
+            bounding_box (tuple): 南端の緯度、西端の経度、北端の緯度、東端の経度
+            resolution (float): 格子の一辺の長さ（メートル）
+            location_ids (:obj:`numpy.ndarray`): AED設置場所連番の配列
+            nearest_distances (:obj:`numpy.ndarray`): 格子ごとの最も近い
+                AED設置場所までの距離の2次元配列
+            candidates (:obj:`numpy.ndarray`): 格子ごとの近傍のAED設置場所の
+                インデックスの3次元配列
+            exact (:obj:`numpy.ndarray`): 格子ごとに候補が厳密かを表す2次元配列
+
+        """
+        self.__version = int(version)
+        self.__bounding_box = tuple(float(value) for value in bounding_box)
+        self.__resolution = float(resolution)
+        self.__location_ids = location_ids
+        self.__nearest_distances = nearest_distances
+        self.__candidates = candidates
+        self.__exact = exact
+        self.__latitude_step, self.__longitude_step = self._get_steps(
+            self.__bounding_box, self.__resolution
+        )
+
+    @property
+    def version(self) -> int:
+        return self.__version
+
+    @property
+    def bounding_box(self) -> tuple:
+        return self.__bounding_box
+
+    @property
+    def resolution(self) -> float:
+        return self.__resolution
+
+    @property
+    def location_ids(self) -> np.ndarray:
+        return self.__location_ids
+
+    @property
+    def nearest_distances(self) -> np.ndarray:
+        return self.__nearest_distances
+
+    @property
+    def candidates(self) -> np.ndarray:
+        return self.__candidates
+
+    @property
+    def exact(self) -> np.ndarray:
+        return self.__exact
+
+    @staticmethod
+    def _get_steps(bounding_box: tuple, resolution: float) -> tuple:
+        """格子の一辺の長さを緯度と経度の幅に換算する。
+
+        Args:
+            bounding_box (tuple): 南端の緯度、西端の経度、北端の緯度、東端の経度
+            resolution (float): 格子の一辺の長さ（メートル）
+
+        Returns:
+            steps (tuple): 格子の緯度方向の幅と経度方向の幅（度）のタプル
+
+        """
+        south, west, north, east = bounding_box
+        latitude_step = math.degrees(resolution / EARTH_RADIUS)
+        center_latitude = math.radians((south + north) / 2)
+        longitude_step = latitude_step / math.cos(center_latitude)
+        return (latitude_step, longitude_step)
+
+    @classmethod
+    def build(
+        cls,
+        version: int,
+        locations: list,
+        bounding_box: tuple,
+        resolution: float,
+        candidates_number: int = 16,
+        results_number: int = 5,
+        workers: int = None,
+    ):
+        """
+        AED設置場所のリストから格子ごとの最近傍を並列に計算する。
+
+        Args:
+            version (int): データセットのバージョン
+            locations (list of obj:`AEDInstallationLocation`): AED設置場所
+                オブジェクトのリスト
+            bounding_box (tuple): 南端の緯度、西端の経度、北端の緯度、東端の経度
+            resolution (float): 格子の一辺の長さ（メートル）
+            candidates_number (int): 格子ごとに保持する候補の数
+            results_number (int): 検索結果として返す件数。候補がこの件数の
+                上位を必ず含むかどうかを判定するのに使う。
+            workers (int): 並列に計算するスレッドの数
+
+        Returns:
+            coverage_grid (obj:`CoverageGrid`): 計算結果
+
+        """
+        if len(locations) == 0:
+            raise LocationError("AED設置場所のデータがありません。")
+        resolution = float(resolution)
+        if resolution <= 0:
+            raise LocationError("格子の大きさは正の数で指定してください。")
+        south, west, north, east = bounding_box
+        latitude_step, longitude_step = cls._get_steps(bounding_box, resolution)
+        rows = max(1, math.ceil((north - south) / latitude_step))
+        cols = max(1, math.ceil((east - west) / longitude_step))
+        center_latitudes = south + (np.arange(rows) + 0.5) * latitude_step
+        center_longitudes = west + (np.arange(cols) + 0.5) * longitude_step
+
+        location_ids = np.array(
+            [location.location_id for location in locations], dtype=np.int64
+        )
+        end_latitudes = np.array([location.latitude for location in locations])
+        end_longitudes = np.array([location.longitude for location in locations])
+        candidates_number = min(int(candidates_number), len(locations))
+        results_number = min(int(results_number), candidates_number)
+
+        nearest_distances = np.empty((rows, cols), dtype=np.float32)
+        candidates = np.empty((rows, cols, candidates_number), dtype=np.int32)
+        exact = np.empty((rows, cols), dtype=bool)
+        # 格子内の任意の地点と格子の中心との距離の上限（投影の誤差を見込んで少し広げる）
+        half_diagonal = resolution * math.sqrt(2) / 2 * 1.01
+
+        def compute_row(row: int) -> None:
+            distances = get_distances(
+                np.full(cols, center_latitudes[row]),
+                center_longitudes,
+                end_latitudes,
+                end_longitudes,
+            )
+            if candidates_number < distances.shape[1]:
+                nearest = np.argpartition(distances, candidates_number - 1, axis=1)
+                nearest = nearest[:, :candidates_number]
+            else:
+                nearest = np.tile(np.arange(distances.shape[1]), (cols, 1))
+            nearest_distances_row = np.take_along_axis(distances, nearest, axis=1)
+            order = np.argsort(nearest_distances_row, axis=1)
+            nearest = np.take_along_axis(nearest, order, axis=1)
+            nearest_distances_row = np.take_along_axis(
+                nearest_distances_row, order, axis=1
+            )
+            candidates[row] = nearest
+            nearest_distances[row] = nearest_distances_row[:, 0]
+            if candidates_number == len(locations):
+                exact[row] = True
+            else:
+                # 格子内の地点から上位results_number件の地点は、中心から
+                # 「中心での上位results_number件目の距離＋対角線の長さ」以内にある。
+                # 候補の最遠の地点がそれより遠ければ、候補に上位が必ず含まれる。
+                exact[row] = (
+                    nearest_distances_row[:, results_number - 1] + 2 * half_diagonal
+                    < nearest_distances_row[:, -1]
+                )
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(compute_row, range(rows)))
+
+        return cls(
+            version=version,
+            bounding_box=(south, west, north, east),
+            resolution=resolution,
+            location_ids=location_ids,
+            nearest_distances=nearest_distances,
+            candidates=candidates,
+            exact=exact,
+        )
+
+    def _get_cell(self, latitude: float, longitude: float) -> Optional[tuple]:
+        """緯度経度が含まれる格子の行と列を返す。
+
+        Args:
+            latitude (float): 緯度
+            longitude (float): 経度
+
+        Returns:
+            cell (tuple): 行と列のタプル。範囲外の場合はNoneを返す。
+
+        """
+        south, west, north, east = self.__bounding_box
+        row = math.floor((latitude - south) / self.__latitude_step)
+        col = math.floor((longitude - west) / self.__longitude_step)
+        rows, cols = self.__exact.shape
+        if row < 0 or rows <= row or col < 0 or cols <= col:
+            return None
+        return (row, col)
+
+    def lookup(self, latitude: float, longitude: float) -> Optional[list]:
+        """
+        地点を含む格子の近傍候補のAED設置場所連番を返す。
+
+        Args:
+            latitude (float): 緯度
+            longitude (float): 経度
+
+        Returns:
+            location_ids (list of int): 候補のAED設置場所連番のリスト。格子の
+                範囲外か、候補に上位の検索結果が含まれる保証がない場合はNoneを返す。
+
+        """
+        return self.lookup_area(latitude, longitude, latitude, longitude)
+
+    def lookup_area(
+        self, south: float, west: float, north: float, east: float
+    ) -> Optional[list]:
+        """
+        矩形の範囲内のどの地点から検索しても上位の検索結果が含まれる候補の
+        AED設置場所連番を返す。
+
+        Args:
+            south (float): 南端の緯度
+            west (float): 西端の経度
+            north (float): 北端の緯度
+            east (float): 東端の経度
+
+        Returns:
+            location_ids (list of int): 候補のAED設置場所連番のリスト。矩形が
+                1つの格子に収まらないか、候補に上位の検索結果が含まれる保証がない
+                場合はNoneを返す。
+
+        """
+        cell = self._get_cell(south, west)
+        if cell is None or cell != self._get_cell(north, east):
+            return None
+        if not self.__exact[cell]:
+            return None
+        return [int(self.__location_ids[i]) for i in self.__candidates[cell]]
+
+    def get_uncovered_cells(self, distance: float) -> list:
+        """
+        最も近いAED設置場所までの距離が指定した距離より遠い格子の一覧を返す。
+
+        Args:
+            distance (float): 距離（メートル）
+
+        Returns:
+            cells (list of lists): 格子の中心の緯度、経度、最も近いAED設置場所までの
+                距離（メートル）を要素に持つリストのリスト
+
+        """
+        south, west, north, east = self.__bounding_box
+        rows, cols = np.nonzero(self.__nearest_distances > distance)
+        cells = list()
+        for row, col in zip(rows.tolist(), cols.tolist()):
+            cells.append(
+                [
+                    round(south + (row + 0.5) * self.__latitude_step, 6),
+                    round(west + (col + 0.5) * self.__longitude_step, 6),
+                    int(self.__nearest_distances[row, col]),
+                ]
+            )
+        return cells
+
+    def save(self, path: str) -> None:
+        """計算結果をファイルへ保存する。
+
+        一時ファイルに書き込んでから置き換えるので、読み込み中のプロセスが
+        書きかけのファイルを読むことはない。
+
+        Args:
+            path (str): 保存先のファイルパス
+
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            np.savez_compressed(
+                f,
+                version=np.array(self.__version),
+                bounding_box=np.array(self.__bounding_box),
+                resolution=np.array(self.__resolution),
+                location_ids=self.__location_ids,
+                nearest_distances=self.__nearest_distances,
+                candidates=self.__candidates,
+                exact=self.__exact,
+            )
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str):
+        """ファイルから計算結果を読み込む。
+
+        Args:
+            path (str): 保存先のファイルパス
+
+        Returns:
+            coverage_grid (obj:`CoverageGrid`): 計算結果
+
+        """
+        with np.load(path) as data:
+            return cls(
+                version=int(data["version"]),
+                bounding_box=tuple(data["bounding_box"].tolist()),
+                resolution=float(data["resolution"]),
+                location_ids=data["location_ids"],
+                nearest_distances=data["nearest_distances"],
+                candidates=data["candidates"],
+                exact=data["exact"],
+            )
+
+
+class CoverageGridStore:
+    """
+    保存済みの格子データをデータセットのバージョンごとに一度だけ読み込んで保持する。
+
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): 格子データのファイルパス
+
+        """
+        self.__path = path
+        self.__grid = None
+        self.__checked = None
+        self.__lock = threading.Lock()
+
+    def get(self, version: int) -> Optional[CoverageGrid]:
+        """指定したバージョンの格子データを返す。
+
+        Args:
+            version (int): データセットのバージョン
+
+        Returns:
+            coverage_grid (obj:`CoverageGrid`): 格子データ。指定したバージョンの
+                ものがない場合はNoneを返す。
+
+        """
+        grid = self.__grid
+        if grid is not None and grid.version == version:
+            return grid
+        with self.__lock:
+            # 同じバージョンで同じファイルを読み込み直さない。インポートの途中で
+            # 古い格子データしかなかった場合も、書き出された後に読み込めるよう
+            # ファイルの更新日時が変わったら確認し直す。
+            try:
+                mtime = os.stat(self.__path).st_mtime_ns
+            except OSError:
+                mtime = None
+            if self.__checked != (version, mtime):
+                self.__checked = (version, mtime)
+                try:
+                    self.__grid = CoverageGrid.load(self.__path)
+                except (OSError, KeyError, ValueError):
+                    self.__grid = None
+            grid = self.__grid
+        if grid is not None and grid.version == version:
+            return grid
+        return None
+
+    def set(self, grid: CoverageGrid) -> None:
+        """計算した格子データを保持する。
+
+        Args:
+            grid (obj:`CoverageGrid`): 格子データ
+
+        """
+        with self.__lock:
+            self.__grid = grid
@@ -0,0 +1,66 @@
+import threading
+from typing import Callable, Optional
+
+from ash_aed.logs import AppLog
+
+
+class DatasetVersion:
+    """
+    プロセス内で認識しているデータセットのバージョンを保持し、バージョンが
+    変わったときに登録された処理を呼び出す。
+
+    キャッシュや事前計算したデータなど、データセットから作ったメモリ上のデータを
+    新しいバージョンへ切り替えるために使う。
+
+    Attributes:
+        version (int): 最後に公開されたデータセットのバージョン
+
+    """
+
+    def __init__(self):
+        self.__version = None
+        self.__subscribers = list()
+        self.__lock = threading.Lock()
+        self.__logger = AppLog()
+
+    @property
+    def version(self) -> Optional[int]:
+        return self.__version
+
+    def subscribe(self, callback: Callable[[int], None]) -> None:
+        """バージョンが変わったときに呼び出す処理を登録する。
+
+        Args:
+            callback (callable): 新しいバージョンを引数に取る関数
+
+        """
+        with self.__lock:
+            self.__subscribers.append(callback)
+
+    def publish(self, version: int) -> bool:
+        """新しいバージョンを公開し、登録された処理を呼び出す。
+
+        Args:
+            version (int): データセットのバージョン
+
+        Returns:
+            bool: バージョンが変わった場合に真を返す
+
+        """
+        with self.__lock:
+            if self.__version == version:
+                return False
+            self.__version = version
+            subscribers = list(self.__subscribers)
+        for callback in subscribers:
+            try:
+                callback(version)
+            except Exception as e:
+                # 1つの処理の失敗で他の切り替えが止まらないようにする。
+                self.__logger.error(
+                    "データセットの切り替え処理でエラーが発生しました。" + str(e)
+                )
+        return True
+
+
+dataset_version = DatasetVersion()
@@ -1,13 +1,76 @@
+import os
+import threading
+
 import psycopg2
+from psycopg2.extensions import connection
 from psycopg2.extras import DictCursor
+from psycopg2.pool import PoolError, ThreadedConnectionPool
 
 from ash_aed.config import Config
-from ash_aed.errors import DatabaseError
+from ash_aed.errors import DatabaseError, DataError
+from ash_aed.metrics import db_connections, db_connections_open
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+class PooledConnection(connection):
+    """準備済みのSQL文の名前を記録するPostgreSQL接続クラス。
+
+    準備済みのSQL文はセッションが続く限り残るため、接続プールに戻した後も
+    同じ接続で使い回せる。
+
+    Attributes:
+        prepared_statements (set of str): この接続で準備済みのSQL文の名前
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        connection.__init__(self, *args, **kwargs)
+        self.prepared_statements = set()
+
+
+def get_pool() -> ThreadedConnectionPool:
+    """プロセスごとの接続プールを返す。
+
+    gunicornの--preloadのようにforkした場合、親プロセスの接続は子プロセスで
+    使えないため、プロセスごとに作成する。
+
+    Returns:
+        pool (:obj:`ThreadedConnectionPool`): 接続プール
+
+    """
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool_pid != pid:
+        with _pool_lock:
+            if _pool_pid != pid:
+                _pool = ThreadedConnectionPool(
+                    Config.DB_POOL_MIN_SIZE,
+                    Config.DB_POOL_MAX_SIZE,
+                    Config.DATABASE_URL,
+                    connection_factory=PooledConnection,
+                )
+                _pool_pid = pid
+    return _pool
+
+
+def close_pool() -> None:
+    """接続プールの全ての接続を閉じる"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.closeall()
+        _pool = None
+        _pool_pid = None
 
 
 class DB:
     """PostgreSQLデータベースへの接続をラップしたクラス。
 
+    接続はプロセスごとの接続プールから借り、closeメソッドで返却する。
+
     Attributes:
         conn (:obj:`psycopg2.connection`): PostgreSQL接続クラス。
 
@@ -15,9 +78,19 @@ class DB:
 
     def __init__(self):
         try:
-            self.__conn = psycopg2.connect(Config.DATABASE_URL)
+            self.__pool = get_pool()
+            self.__conn = self.__pool.getconn()
+            if self.__conn.closed:
+                # サーバーの再起動などで切断された接続は破棄して接続し直す。
+                self.__pool.putconn(self.__conn, close=True)
+                self.__conn = self.__pool.getconn()
+        except PoolError as e:
+            raise DatabaseError(e.args[0])
         except (psycopg2.DatabaseError, psycopg2.OperationalError) as e:
             raise DatabaseError(e.args[0])
+        self.__locks = 0
+        db_connections.inc()
+        db_connections_open.inc()
 
     def cursor(self) -> DictCursor:
         """
@@ -29,6 +102,27 @@ class DB:
         """
         return self.__conn.cursor(cursor_factory=DictCursor)
 
+    def named_cursor(self, name: str, itersize: int = None) -> DictCursor:
+        """
+        サーバー側のカーソルを使うcursorオブジェクトを返す。
+
+        検索結果はitersize行ずつサーバーから取得するので、結果の行数によらず
+        一定のメモリで読み進められる。カーソルはトランザクションの中でだけ
+        使えるため、読み終えるまでコミットしないこと。
+
+        Args:
+            name (str): 接続内で重複しないカーソルの名前
+            itersize (int): 一度にサーバーから取得する行数。省略時は
+                Config.STREAM_ITERSIZE
+
+        Returns:
+            cursor (:obj:`DictCursor`): cursorオブジェクト
+
+        """
+        cursor = self.__conn.cursor(name, cursor_factory=DictCursor)
+        cursor.itersize = Config.STREAM_ITERSIZE if itersize is None else itersize
+        return cursor
+
     def commit(self) -> None:
         """PostgreSQLデータベースにクエリをコミット"""
         return self.__conn.commit()
@@ -37,6 +131,88 @@ class DB:
         """PostgreSQLデータベースのクエリをロールバック"""
         return self.__conn.rollback()
 
+    def try_advisory_lock(self, key: int) -> bool:
+        """セッション単位のアドバイザリロックの取得を試みる。
+
+        Args:
+            key (int): ロックのキー
+
+        Returns:
+            bool: ロックを取得できた場合に真を返す
+
+        """
+        cursor = self.cursor()
+        cursor.execute("SELECT pg_try_advisory_lock(%s) AS locked;", (key,))
+        locked = cursor.fetchone()["locked"]
+        if locked:
+            self.__locks += 1
+        # ロックはセッション単位なので、トランザクションを閉じても保持される。
+        self.__conn.commit()
+        return locked
+
+    def advisory_unlock(self, key: int) -> None:
+        """セッション単位のアドバイザリロックを解放する。
+
+        Args:
+            key (int): ロックのキー
+
+        """
+        cursor = self.cursor()
+        cursor.execute("SELECT pg_advisory_unlock(%s);", (key,))
+        self.__conn.commit()
+        self.__locks = max(self.__locks - 1, 0)
+
+    def prepare(self, name: str, types: str, sql: str) -> None:
+        """この接続でまだ準備していなければSQL文を名前付きで準備する。
+
+        Args:
+            name (str): SQL文の名前
+            types (str): カンマ区切りのパラメータの型。パラメータがない場合は空文字
+            sql (str): $1, $2, ...のプレースホルダを使ったSQL文
+
+        Raises:
+            DataError: SQL文を準備できない場合
+            DatabaseError: データベースのエラーの場合
+
+        """
+        if name in self.__conn.prepared_statements:
+            return
+        state = "PREPARE " + name
+        if types:
+            state += " (" + types + ")"
+        cursor = self.__conn.cursor()
+        try:
+            cursor.execute(state + " AS " + sql)
+        except (
+            psycopg2.DataError,
+            psycopg2.IntegrityError,
+            psycopg2.InternalError,
+            psycopg2.ProgrammingError,
+        ) as e:
+            raise DataError(e.args[0])
+        except (psycopg2.DatabaseError, psycopg2.OperationalError) as e:
+            raise DatabaseError(e.args[0])
+        self.__conn.prepared_statements.add(name)
+
     def close(self) -> None:
-        """PostgreSQLデータベースへの接続を閉じる"""
-        return self.__conn.close()
+        """PostgreSQLデータベースへの接続を接続プールへ返却する。
+
+        コミットしていない変更はロールバックされる。
+
+        """
+        if self.__conn is None:
+            return
+        conn = self.__conn
+        self.__conn = None
+        db_connections_open.dec()
+        if self.__locks and not conn.closed:
+            # 解放し忘れたアドバイザリロックを他の利用者に引き継がない。
+            try:
+                conn.rollback()
+                conn.cursor().execute("SELECT pg_advisory_unlock_all();")
+                conn.commit()
+            except psycopg2.Error:
+                conn.close()
+        # 切断された接続は破棄し、それ以外は未完了のトランザクションを
+        # ロールバックしてから返却される。
+        self.__pool.putconn(conn, close=bool(conn.closed))
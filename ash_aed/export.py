@@ -0,0 +1,266 @@
+import csv
+import hashlib
+import io
+import json
+import zlib
+from typing import Iterable, Iterator, Optional
+
+from ash_aed.errors import ServiceError
+from ash_aed.models import AEDInstallationLocation
+
+# 書き出す項目。CSVの見出しとGeoJSONのpropertiesのキーに使う。
+FIELDS = (
+    "location_id",
+    "area",
+    "location_name",
+    "postal_code",
+    "address",
+    "phone_number",
+    "available_time",
+    "installation_floor",
+    "latitude",
+    "longitude",
+)
+
+
+class DatasetExport:
+    """
+    AED設置場所データをGeoJSON、CSV、NDJSONで書き出す。
+
+    検索結果を1件ずつ受け取り、一定の件数ごとに文字列にして返すので、
+    データ全体の文書をメモリ上に作らずにレスポンスとして送れる。
+
+    Attributes:
+        format (str): 書き出す形式（geojson、csv、ndjson）
+        area (str): 絞り込む町域名。指定しない場合はNone
+        bounding_box (tuple): 絞り込む範囲（南端の緯度、西端の経度、北端の緯度、
+            東端の経度）。指定しない場合はNone
+        mimetype (str): 書き出す形式のMIMEタイプ
+        filename (str): ダウンロードするファイル名
+
+    """
+
+    FORMATS = {
+        "geojson": "application/geo+json",
+        "csv": "text/csv; charset=utf-8",
+        "ndjson": "application/x-ndjson",
+    }
+    FILENAME = "aed_installation_locations"
+    # 1回に返す件数
+    CHUNK_ROWS = 100
+
+    def __init__(
+        self, format: str, area: Optional[str] = None, bounding_box: str = None
+    ):
+        """
+        Args:
+            format (str): 書き出す形式（geojson、csv、ndjson）
+            area (str): 絞り込む町域名
+            bounding_box (str): 絞り込む範囲を「南端の緯度,西端の経度,北端の緯度,
+                東端の経度」の形式で表した文字列
+
+        Raises:
+            ServiceError: 形式や範囲の指定に誤りがある場合
+
+        """
+        if format not in self.FORMATS:
+            raise ServiceError("書き出す形式の指定に誤りがあります。")
+        self.__format = format
+        self.__area = area or None
+        self.__bounding_box = None
+        if bounding_box:
+            try:
+                south, west, north, east = (
+                    float(value) for value in bounding_box.split(",")
+                )
+            except ValueError:
+                raise ServiceError("範囲の指定に誤りがあります。")
+            if north < south or east < west:
+                raise ServiceError("範囲の指定に誤りがあります。")
+            self.__bounding_box = (south, west, north, east)
+
+    @property
+    def format(self) -> str:
+        return self.__format
+
+    @property
+    def area(self) -> Optional[str]:
+        return self.__area
+
+    @property
+    def bounding_box(self) -> Optional[tuple]:
+        return self.__bounding_box
+
+    @property
+    def mimetype(self) -> str:
+        return self.FORMATS[self.__format]
+
+    @property
+    def filename(self) -> str:
+        return self.FILENAME + "." + self.__format
+
+    def get_etag(self, version: int, encoding: Optional[str] = None) -> str:
+        """データセットのバージョンと書き出す条件から決まるETagを返す。
+
+        Args:
+            version (int): データセットのバージョン
+            encoding (str): gzipなどレスポンスの圧縮形式
+
+        Returns:
+            etag (str): 引用符を除いたETagの値
+
+        """
+        conditions = json.dumps(
+            [self.__format, self.__area, self.__bounding_box, encoding],
+            ensure_ascii=False,
+        )
+        digest = hashlib.sha1(conditions.encode("utf-8")).hexdigest()[:16]
+        return "export-" + str(version) + "-" + digest
+
+    def iter_locations(self, service) -> Iterator[AEDInstallationLocation]:
+        """条件に合うAED設置場所をストレージから1件ずつ取得する。
+
+        Args:
+            service (obj:`StorageBackend`): 検索に使うストレージ
+
+        Yields:
+            aed_installation_location (obj:`AEDInstallationLocation`): AED設置場所
+                オブジェクト
+
+        """
+        if self.__area is not None:
+            return self._filter_bounding_box(service.iter_by_area_name(self.__area))
+        if self.__bounding_box is not None:
+            return service.iter_by_bounding_box(*self.__bounding_box)
+        return service.iter_all()
+
+    async def find_locations(self, service) -> list:
+        """iter_locationsのasyncio版。条件に合うAED設置場所のリストを返す。
+
+        Args:
+            service (obj:`AsyncAEDInstallationLocationService`): 検索に使う
+                ストレージ
+
+        Returns:
+            locations (list of obj:`AEDInstallationLocation`): AED設置場所
+                オブジェクトのリスト
+
+        """
+        if self.__area is not None:
+            return list(
+                self._filter_bounding_box(
+                    await service.find_by_area_name(self.__area)
+                )
+            )
+        if self.__bounding_box is not None:
+            return await service.find_by_bounding_box(*self.__bounding_box)
+        return await service.get_all()
+
+    def _filter_bounding_box(self, locations: Iterable) -> Iterable:
+        """町域で検索したAED設置場所を、範囲を指定した場合は範囲内に絞る。"""
+        if self.__bounding_box is None:
+            return locations
+        south, west, north, east = self.__bounding_box
+        return (
+            location
+            for location in locations
+            if south <= location.latitude <= north
+            and west <= location.longitude <= east
+        )
+
+    @staticmethod
+    def to_properties(location: AEDInstallationLocation) -> dict:
+        """AED設置場所オブジェクトを書き出す項目の辞書にする。"""
+        return {field: getattr(location, field) for field in FIELDS}
+
+    def _chunk(self, locations: Iterable) -> Iterator[list]:
+        """AED設置場所をCHUNK_ROWS件ずつのリストにまとめる。"""
+        chunk = list()
+        for location in locations:
+            chunk.append(location)
+            if self.CHUNK_ROWS <= len(chunk):
+                yield chunk
+                chunk = list()
+        if chunk:
+            yield chunk
+
+    def _generate_geojson(self, locations: Iterable) -> Iterator[str]:
+        yield '{"type":"FeatureCollection","features":['
+        separator = ""
+        for chunk in self._chunk(locations):
+            features = list()
+            for location in chunk:
+                features.append(
+                    json.dumps(
+                        {
+                            "type": "Feature",
+                            "geometry": {
+                                "type": "Point",
+                                "coordinates": [location.longitude, location.latitude],
+                            },
+                            "properties": self.to_properties(location),
+                        },
+                        ensure_ascii=False,
+                        separators=(",", ":"),
+                    )
+                )
+            yield separator + ",".join(features)
+            separator = ","
+        yield "]}\n"
+
+    def _generate_csv(self, locations: Iterable) -> Iterator[str]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\r\n")
+        writer.writerow(FIELDS)
+        for chunk in self._chunk(locations):
+            for location in chunk:
+                writer.writerow([getattr(location, field) for field in FIELDS])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    def _generate_ndjson(self, locations: Iterable) -> Iterator[str]:
+        for chunk in self._chunk(locations):
+            yield "".join(
+                json.dumps(
+                    self.to_properties(location),
+                    ensure_ascii=False,
+                    separators=(",", ":"),
+                )
+                + "\n"
+                for location in chunk
+            )
+
+    def generate(self, locations: Iterable) -> Iterator[str]:
+        """AED設置場所を指定した形式の文字列にして少しずつ返す。
+
+        Args:
+            locations (iterable of obj:`AEDInstallationLocation`): 書き出す
+                AED設置場所オブジェクト
+
+        Yields:
+            chunk (str): 書き出す文書の一部
+
+        """
+        return getattr(self, "_generate_" + self.__format)(locations)
+
+    @staticmethod
+    def compress(chunks: Iterable, level: int = 6) -> Iterator[bytes]:
+        """文字列を少しずつgzip形式に圧縮して返す。
+
+        Args:
+            chunks (iterable of str): 圧縮する文字列
+            level (int): 圧縮レベル（1〜9）
+
+        Yields:
+            chunk (bytes): 圧縮したデータ
+
+        """
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            data = compressor.compress(chunk.encode("utf-8"))
+            if data:
+                yield data
+        yield compressor.flush()
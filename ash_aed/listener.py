@@ -0,0 +1,164 @@
+import os
+import select
+import threading
+from typing import Optional
+
+import psycopg2
+from psycopg2 import sql
+
+from ash_aed.dataset import dataset_version
+from ash_aed.db import DB
+from ash_aed.errors import DatabaseError, DataError
+from ash_aed.logs import AppLog
+from ash_aed.services import AEDInstallationLocationService
+
+
+class DatasetVersionListener:
+    """
+    インポートが送るデータセットのバージョンの通知をPostgreSQLのLISTENで
+    待ち受け、プロセス内のバージョンを切り替える。
+
+    待ち受けている間はプロセス内のバージョンが最新なので、リクエストごとに
+    データベースへ問い合わせる必要がない。接続し直した時は、切断されている間の
+    通知を取りこぼしていないよう現在のバージョンを問い合わせる。
+
+    Attributes:
+        channel (str): 待ち受けるチャンネル
+        listening (bool): 通知を待ち受けている間は真
+
+    """
+
+    # 停止の指示を確認する間隔（秒）
+    POLL_INTERVAL = 1.0
+
+    def __init__(self, dsn: str, channel: str, reconnect_interval: float = 5.0):
+        """
+        Args:
+            dsn (str): 待ち受けに使う接続のデータベースURL
+            channel (str): 待ち受けるチャンネル
+            reconnect_interval (float): 切断された場合に接続し直すまでの秒数
+
+        """
+        self.__dsn = dsn
+        self.__channel = channel
+        self.__reconnect_interval = float(reconnect_interval)
+        self.__thread = None
+        self.__pid = None
+        self.__listening = False
+        self.__stop = threading.Event()
+        self.__lock = threading.Lock()
+        self.__logger = AppLog()
+
+    @property
+    def channel(self) -> str:
+        return self.__channel
+
+    @property
+    def listening(self) -> bool:
+        # forkした子プロセスには待ち受けるスレッドが引き継がれない。
+        return self.__listening and self.__pid == os.getpid()
+
+    def handle(self, payload: str) -> Optional[int]:
+        """通知の内容のバージョンを公開する。
+
+        Args:
+            payload (str): 通知の内容
+
+        Returns:
+            version (int): 公開したバージョン。内容が正しくない場合はNoneを返す。
+
+        """
+        try:
+            version = int(payload)
+        except ValueError:
+            self.__logger.warning(
+                "データセットのバージョンの通知が正しくありません。" + repr(payload)
+            )
+            return None
+        dataset_version.publish(version)
+        return version
+
+    def _get_current_version(self) -> int:
+        """データベースから現在のデータセットのバージョンを取得する。"""
+        db = DB()
+        try:
+            return AEDInstallationLocationService(db).get_dataset_version()
+        finally:
+            db.close()
+
+    def _listen(self) -> None:
+        """接続して通知を待ち受け、切断されるか停止するまで処理する。"""
+        # 通知がない間も切断に気付けるよう、TCPのキープアライブを使う。
+        conn = psycopg2.connect(
+            self.__dsn,
+            keepalives=1,
+            keepalives_idle=30,
+            keepalives_interval=10,
+            keepalives_count=3,
+        )
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    sql.SQL("LISTEN {};").format(sql.Identifier(self.__channel))
+                )
+            # 待ち受けを始めてから問い合わせるので、この間の更新も取りこぼさない。
+            dataset_version.publish(self._get_current_version())
+            self.__listening = True
+            self.__logger.info(
+                "データセットのバージョンの通知を待ち受けています。（"
+                + self.__channel
+                + "）"
+            )
+            while not self.__stop.is_set():
+                if not select.select([conn], [], [], self.POLL_INTERVAL)[0]:
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    self.handle(conn.notifies.pop(0).payload)
+        finally:
+            self.__listening = False
+            conn.close()
+
+    def _run(self) -> None:
+        """停止するまで通知を待ち受け、切断された場合は接続し直す。"""
+        while not self.__stop.is_set():
+            try:
+                self._listen()
+            except (psycopg2.Error, OSError) as e:
+                self.__logger.error(
+                    "データセットのバージョンの通知を待ち受けられません。" + str(e)
+                )
+            except (DatabaseError, DataError) as e:
+                self.__logger.error(e.message)
+            self.__stop.wait(self.__reconnect_interval)
+
+    def start(self) -> None:
+        """バックグラウンドで待ち受けを開始する。
+
+        gunicornの--preloadのようにforkした後のプロセスではスレッドが引き継がれない
+        ため、プロセスごとに一度だけ起動する。何度呼び出しても構わない。
+
+        """
+        pid = os.getpid()
+        if self.__pid == pid:
+            return
+        with self.__lock:
+            if self.__pid == pid:
+                return
+            self.__listening = False
+            self.__stop = threading.Event()
+            self.__thread = threading.Thread(
+                target=self._run, name="ash_aed_dataset_listener", daemon=True
+            )
+            self.__thread.start()
+            self.__pid = pid
+
+    def stop(self) -> None:
+        """待ち受けを停止する。"""
+        with self.__lock:
+            self.__stop.set()
+            if self.__thread is not None:
+                self.__thread.join()
+            self.__thread = None
+            self.__pid = None
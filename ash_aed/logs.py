@@ -1,22 +1,132 @@
+import atexit
+import json
 import logging
+import os
+import queue
+import sys
+import threading
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+from ash_aed.config import Config
+
+LOGGER_NAME = "ash_aed_log"
+
+# リクエストごとの相関ID。ログとレスポンスヘッダーに含める。
+correlation_id = ContextVar("ash_aed_correlation_id", default=None)
+
+_lock = threading.Lock()
+_pid = None
+_listener = None
+_handler = None
+_stream = None
+
+
+class CorrelationIdFilter(logging.Filter):
+    """ログを出力したスレッドの相関IDをログレコードに付与する。"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.correlation_id = correlation_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """ログレコードを1行のJSONにする。"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        log = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "correlation_id": getattr(record, "correlation_id", None),
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            log["exception"] = self.formatException(record.exc_info)
+        return json.dumps(log, ensure_ascii=False)
+
+
+def configure_logging(stream=None) -> None:
+    """
+    プロセスごとに一度だけログの出力先を設定する。
+
+    ログはリクエストを処理するスレッドでJSONに整形してキューへ入れ、
+    バックグラウンドのスレッドがキューから取り出して出力するため、
+    リクエストを処理するスレッドは出力の完了を待たない。
+
+    Args:
+        stream (file-like object): 出力先。省略時は標準エラー出力
+
+    """
+    global _pid, _listener, _handler, _stream
+    if _pid == os.getpid():
+        return
+    with _lock:
+        if _pid == os.getpid():
+            return
+        logger = logging.getLogger(LOGGER_NAME)
+        logger.setLevel(Config.LOG_LEVEL)
+        logger.propagate = False
+        for exist_handler in list(logger.handlers):
+            logger.removeHandler(exist_handler)
+
+        _stream = stream
+        log_queue = queue.SimpleQueue()
+        _handler = QueueHandler(log_queue)
+        _handler.setFormatter(JsonFormatter())
+        _handler.addFilter(CorrelationIdFilter())
+        output_handler = logging.StreamHandler(stream or sys.stderr)
+        output_handler.setFormatter(logging.Formatter("%(message)s"))
+        _listener = QueueListener(log_queue, output_handler)
+        _listener.start()
+        logger.addHandler(_handler)
+        _pid = os.getpid()
+
+
+def shutdown_logging() -> None:
+    """キューに残ったログを出力してからバックグラウンドのスレッドを止める。"""
+    global _pid, _listener, _handler
+    with _lock:
+        if _listener is not None and _pid == os.getpid():
+            _listener.stop()
+        if _handler is not None:
+            logging.getLogger(LOGGER_NAME).removeHandler(_handler)
+        _pid = None
+        _listener = None
+        _handler = None
+
+
+def _reconfigure_after_fork() -> None:
+    """fork後の子プロセスではスレッドが引き継がれないため設定し直す。"""
+    global _lock, _pid, _listener
+    # fork時に親プロセスの他のスレッドが保持していたロックは解放されない。
+    _lock = threading.Lock()
+    if _pid is None:
+        return
+    _pid = None
+    _listener = None
+    configure_logging(_stream)
+
+
+def get_correlation_id() -> Optional[str]:
+    """現在のリクエストの相関IDを返す。"""
+    return correlation_id.get()
+
+
+atexit.register(shutdown_logging)
+os.register_at_fork(after_in_child=_reconfigure_after_fork)
 
 
 class AppLog:
-    """ログをコンソールへ出力する"""
+    """ログをJSON形式でコンソールへ出力する"""
 
     def __init__(self):
-        logger = logging.getLogger("ash_aed_log")
-        logger.setLevel(logging.DEBUG)
-        if not logger.handlers == []:
-            for exist_handler in logger.handlers:
-                logger.removeHandler(exist_handler)
-        console_handler = logging.StreamHandler()
-        formatter = logging.Formatter(
-            "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-        )
-        console_handler.setFormatter(formatter)
-        self.__logger = logger
-        self.__logger.addHandler(console_handler)
+        configure_logging()
+        self.__logger = logging.getLogger(LOGGER_NAME)
 
     def debug(self, message) -> None:
         """logging.debugのラッパー
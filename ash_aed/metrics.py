@@ -0,0 +1,588 @@
+import glob
+import json
+import math
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+from ash_aed.config import Config
+
+# リクエストの応答時間のヒストグラムの区切り（秒）
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# SQLの実行時間のヒストグラムの区切り（秒）
+SQL_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+def _to_key(labels: dict) -> str:
+    """ラベルの辞書を集計用のキー文字列にする。"""
+    return json.dumps(sorted(labels.items()), ensure_ascii=False)
+
+
+def _from_key(key: str) -> list:
+    """集計用のキー文字列をラベル名と値のリストに戻す。"""
+    return [tuple(item) for item in json.loads(key)]
+
+
+def _escape(value: str) -> str:
+    """Prometheusのテキスト形式のラベル値をエスケープする。"""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: list) -> str:
+    """ラベル名と値のリストをPrometheusのテキスト形式にする。"""
+    if len(labels) == 0:
+        return ""
+    return (
+        "{"
+        + ",".join(name + '="' + _escape(value) + '"' for name, value in labels)
+        + "}"
+    )
+
+
+def _format_value(value: float) -> str:
+    """数値をPrometheusのテキスト形式にする。"""
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """
+    ラベルごとの値を保持するメトリクスの基底クラス。
+
+    Attributes:
+        name (str): メトリクス名
+        help (str): メトリクスの説明
+        type (str): メトリクスの種類
+
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str):
+        """
+        Args:
+            name (str): メトリクス名
+            help (str): メトリクスの説明
+
+        """
+        self.__name = name
+        self.__help = help
+        self._values = dict()
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        return self.__name
+
+    @property
+    def help(self) -> str:
+        return self.__help
+
+    def snapshot(self) -> dict:
+        """現在の値をJSONに変換できる辞書で返す。"""
+        with self._lock:
+            return {
+                "type": self.type,
+                "help": self.__help,
+                "samples": json.loads(json.dumps(self._values)),
+            }
+
+
+class Counter(Metric):
+    """増加し続ける値を表すメトリクス。"""
+
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        """値を増やす。
+
+        Args:
+            amount (float): 増やす量
+            labels (dict): ラベル名と値
+
+        """
+        key = _to_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_total(self, value: float, **labels) -> None:
+        """別の場所で数えている累計値をそのまま設定する。
+
+        Args:
+            value (float): 累計値
+            labels (dict): ラベル名と値
+
+        """
+        with self._lock:
+            self._values[_to_key(labels)] = value
+
+
+class Gauge(Metric):
+    """増減する値を表すメトリクス。"""
+
+    type = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        """値を設定する。
+
+        Args:
+            value (float): 値
+            labels (dict): ラベル名と値
+
+        """
+        with self._lock:
+            self._values[_to_key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        """値を増やす。
+
+        Args:
+            amount (float): 増やす量
+            labels (dict): ラベル名と値
+
+        """
+        key = _to_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        """値を減らす。
+
+        Args:
+            amount (float): 減らす量
+            labels (dict): ラベル名と値
+
+        """
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """値の分布を区切りごとの件数で表すメトリクス。"""
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: tuple):
+        """
+        Args:
+            name (str): メトリクス名
+            help (str): メトリクスの説明
+            buckets (tuple of float): 区切りの上限値のタプル
+
+        """
+        Metric.__init__(self, name, help)
+        self.__buckets = tuple(sorted(buckets))
+
+    @property
+    def buckets(self) -> tuple:
+        return self.__buckets
+
+    def observe(self, value: float, **labels) -> None:
+        """値を1件記録する。
+
+        Args:
+            value (float): 記録する値
+            labels (dict): ラベル名と値
+
+        """
+        key = _to_key(labels)
+        with self._lock:
+            sample = self._values.get(key)
+            if sample is None:
+                sample = {
+                    "buckets": [0] * (len(self.__buckets) + 1),
+                    "sum": 0.0,
+                    "count": 0,
+                }
+                self._values[key] = sample
+            index = len(self.__buckets)
+            for i, upper in enumerate(self.__buckets):
+                if value <= upper:
+                    index = i
+                    break
+            sample["buckets"][index] += 1
+            sample["sum"] += value
+            sample["count"] += 1
+
+    def snapshot(self) -> dict:
+        snapshot = Metric.snapshot(self)
+        snapshot["bucket_bounds"] = list(self.__buckets)
+        return snapshot
+
+
+class Registry:
+    """
+    メトリクスを登録し、Prometheusのテキスト形式で出力する。
+
+    gunicornのようにワーカープロセスが複数ある場合は、各プロセスが自分の値を
+    共有ディレクトリのファイルへ定期的に書き出し、出力時に全プロセス分を合算する。
+
+    Attributes:
+        directory (str): プロセスごとの値を書き出すディレクトリ。Noneの場合は
+            自プロセスの値だけを出力する。
+
+    """
+
+    def __init__(self, directory: Optional[str] = None, flush_interval: float = 1.0):
+        """
+        Args:
+            directory (str): プロセスごとの値を書き出すディレクトリ
+            flush_interval (float): ファイルへ書き出す最小の間隔（秒）
+
+        """
+        self.__directory = directory
+        self.__flush_interval = float(flush_interval)
+        self.__last_flush = 0.0
+        self.__metrics = dict()
+        self.__collectors = list()
+        self.__lock = threading.Lock()
+        self.__thread = None
+        self.__pid = None
+        self.__stop = threading.Event()
+        self.__thread_lock = threading.Lock()
+
+    @property
+    def directory(self) -> Optional[str]:
+        return self.__directory
+
+    def _register(self, metric: Metric) -> Metric:
+        with self.__lock:
+            if metric.name in self.__metrics:
+                return self.__metrics[metric.name]
+            self.__metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        """カウンターを登録して返す。同じ名前が登録済みならそれを返す。"""
+        return self._register(Counter(name, help))
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        """ゲージを登録して返す。同じ名前が登録済みならそれを返す。"""
+        return self._register(Gauge(name, help))
+
+    def histogram(self, name: str, help: str, buckets: tuple) -> Histogram:
+        """ヒストグラムを登録して返す。同じ名前が登録済みならそれを返す。"""
+        return self._register(Histogram(name, help, buckets))
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        """出力の直前に値を更新する関数を登録する。
+
+        キャッシュの統計情報のように、別の場所で数えている値をメトリクスへ
+        反映するために使う。
+
+        Args:
+            collector (callable): 引数を取らない関数
+
+        """
+        with self.__lock:
+            self.__collectors.append(collector)
+
+    def snapshot(self) -> dict:
+        """自プロセスの全メトリクスの値を辞書で返す。"""
+        with self.__lock:
+            collectors = list(self.__collectors)
+            metrics = list(self.__metrics.values())
+        for collector in collectors:
+            collector()
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def _get_path(self, pid: int) -> str:
+        return os.path.join(self.__directory, "metrics_" + str(pid) + ".json")
+
+    def flush(self, force: bool = False) -> None:
+        """自プロセスの値を共有ディレクトリへ書き出す。
+
+        前回の書き出しからflush_interval秒経っていない場合は何もしない。
+
+        Args:
+            force (bool): 間隔にかかわらず書き出す場合は真
+
+        """
+        if self.__directory is None:
+            return
+        now = time.monotonic()
+        if not force and now - self.__last_flush < self.__flush_interval:
+            return
+        self.__last_flush = now
+        pid = os.getpid()
+        path = self._get_path(pid)
+        temp_path = path + ".tmp"
+        try:
+            os.makedirs(self.__directory, exist_ok=True)
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({"pid": pid, "metrics": self.snapshot()}, f)
+            os.replace(temp_path, path)
+        except OSError:
+            # メトリクスの書き出しに失敗してもリクエストの処理は続ける。
+            pass
+
+    def _run(self) -> None:
+        """停止するまで一定間隔で自プロセスの値を書き出す。"""
+        while not self.__stop.wait(self.__flush_interval):
+            self.flush(force=True)
+
+    def start(self) -> None:
+        """バックグラウンドで定期的な書き出しを開始する。
+
+        書き出しでリクエストの応答を遅らせないよう、リクエストの処理とは別の
+        スレッドで書き出す。gunicornの--preloadのようにforkした後のプロセスでは
+        スレッドが引き継がれないため、プロセスごとに一度だけ起動する。何度
+        呼び出しても構わない。ディレクトリを指定していない場合は何もしない。
+
+        """
+        if self.__directory is None:
+            return
+        pid = os.getpid()
+        if self.__pid == pid:
+            return
+        with self.__thread_lock:
+            if self.__pid == pid:
+                return
+            self.__stop = threading.Event()
+            self.__thread = threading.Thread(
+                target=self._run, name="ash_aed_metrics_flusher", daemon=True
+            )
+            self.__thread.start()
+            self.__pid = pid
+
+    def stop(self) -> None:
+        """定期的な書き出しを停止し、最後の値を書き出す。"""
+        with self.__thread_lock:
+            self.__stop.set()
+            if self.__thread is not None:
+                self.__thread.join()
+            self.__thread = None
+            self.__pid = None
+        self.flush(force=True)
+
+    @staticmethod
+    def _is_alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+            return True
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+
+    def _collect(self) -> list:
+        """全プロセスの値を読み込む。"""
+        own_pid = os.getpid()
+        snapshots = [{"pid": own_pid, "metrics": self.snapshot(), "alive": True}]
+        if self.__directory is None:
+            return snapshots
+        self.flush(force=True)
+        for path in glob.glob(os.path.join(self.__directory, "metrics_*.json")):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if data.get("pid") == own_pid:
+                continue
+            data["alive"] = self._is_alive(data["pid"])
+            snapshots.append(data)
+        return snapshots
+
+    def merge(self) -> dict:
+        """全プロセスの値を合算する。
+
+        カウンターとヒストグラムは終了したプロセスの分も含めて合算し、ゲージは
+        動作中のプロセスの分だけを合算する。
+
+        Returns:
+            metrics (dict): メトリクス名をキー、合算した値を値に持つ辞書
+
+        """
+        merged = dict()
+        for data in self._collect():
+            for name, metric in data["metrics"].items():
+                if metric["type"] == "gauge" and not data["alive"]:
+                    continue
+                target = merged.setdefault(
+                    name,
+                    {
+                        "type": metric["type"],
+                        "help": metric["help"],
+                        "bucket_bounds": metric.get("bucket_bounds"),
+                        "samples": dict(),
+                    },
+                )
+                for key, value in metric["samples"].items():
+                    if metric["type"] == "histogram":
+                        sample = target["samples"].setdefault(
+                            key,
+                            {
+                                "buckets": [0] * len(value["buckets"]),
+                                "sum": 0.0,
+                                "count": 0,
+                            },
+                        )
+                        for i, count in enumerate(value["buckets"]):
+                            sample["buckets"][i] += count
+                        sample["sum"] += value["sum"]
+                        sample["count"] += value["count"]
+                    else:
+                        target["samples"][key] = target["samples"].get(key, 0) + value
+        return merged
+
+    def clear(self) -> None:
+        """共有ディレクトリに書き出した全プロセスの値を削除する。
+
+        サーバーの起動時に、前回起動した時のプロセスの値を消すために使う。
+
+        """
+        if self.__directory is None:
+            return
+        for path in glob.glob(os.path.join(self.__directory, "metrics_*.json*")):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def format(merged: dict) -> str:
+        """合算した値をPrometheusのテキスト形式にする。
+
+        Args:
+            merged (dict): mergeメソッドの戻り値
+
+        Returns:
+            text (str): Prometheusのテキスト形式の文字列
+
+        """
+        lines = list()
+        for name, metric in sorted(merged.items()):
+            lines.append("# HELP " + name + " " + metric["help"])
+            lines.append("# TYPE " + name + " " + metric["type"])
+            for key, value in sorted(metric["samples"].items()):
+                labels = _from_key(key)
+                if metric["type"] == "histogram":
+                    cumulative = 0
+                    bounds = metric["bucket_bounds"] + [math.inf]
+                    for upper, count in zip(bounds, value["buckets"]):
+                        cumulative += count
+                        lines.append(
+                            name
+                            + "_bucket"
+                            + _format_labels(labels + [("le", _format_value(upper))])
+                            + " "
+                            + _format_value(cumulative)
+                        )
+                    lines.append(
+                        name
+                        + "_sum"
+                        + _format_labels(labels)
+                        + " "
+                        + _format_value(value["sum"])
+                    )
+                    lines.append(
+                        name
+                        + "_count"
+                        + _format_labels(labels)
+                        + " "
+                        + _format_value(value["count"])
+                    )
+                else:
+                    lines.append(
+                        name + _format_labels(labels) + " " + _format_value(value)
+                    )
+        return "\n".join(lines) + "\n"
+
+    def render(self) -> str:
+        """全プロセスの値を合算してPrometheusのテキスト形式で返す。"""
+        return self.format(self.merge())
+
+
+registry = Registry(Config.METRICS_DIR, Config.METRICS_FLUSH_INTERVAL)
+request_duration = registry.histogram(
+    "ash_aed_http_request_duration_seconds",
+    "Flaskのエンドポイントごとの応答時間（秒）",
+    REQUEST_BUCKETS,
+)
+sql_duration = registry.histogram(
+    "ash_aed_sql_duration_seconds", "SQL文の種類ごとの実行時間（秒）", SQL_BUCKETS
+)
+sql_errors = registry.counter(
+    "ash_aed_sql_errors_total", "SQL文の種類ごとの実行に失敗した件数"
+)
+sql_rows_fetched = registry.counter(
+    "ash_aed_sql_rows_fetched_total", "検索結果から取得した行数"
+)
+db_connections = registry.counter(
+    "ash_aed_db_connections_total", "接続プールからデータベース接続を借りた回数"
+)
+db_connections_open = registry.gauge(
+    "ash_aed_db_connections_open", "接続プールから借りて使用中のデータベース接続の数"
+)
+cache_hits = registry.counter("ash_aed_cache_hits_total", "キャッシュのヒット数")
+cache_misses = registry.counter("ash_aed_cache_misses_total", "キャッシュのミス数")
+cache_evictions = registry.counter(
+    "ash_aed_cache_evictions_total", "キャッシュから追い出した件数"
+)
+cache_size = registry.gauge("ash_aed_cache_entries", "キャッシュに保持している件数")
+cache_coalesced = registry.counter(
+    "ash_aed_cache_coalesced_total",
+    "キャッシュにない値を他のリクエストが求め終わるのを待って使った件数",
+)
+
+
+def get_statement_kind(sql: str) -> str:
+    """SQL文の最初のキーワードを種類として返す。
+
+    Args:
+        sql (str): SQL文
+
+    Returns:
+        kind (str): SELECT、INSERTなどの大文字のキーワード
+
+    """
+    words = sql.split(None, 1)
+    if len(words) == 0:
+        return "UNKNOWN"
+    return words[0].rstrip(";").upper()
+
+
+def register_cache(name: str, cache) -> None:
+    """キャッシュの統計情報をメトリクスとして出力するよう登録する。
+
+    Args:
+        name (str): メトリクスのラベルに使うキャッシュの名前
+        cache (obj:`LRUCache` or obj:`NearLocationsCache` or obj:`SharedCache`):
+            statsプロパティを持つキャッシュオブジェクト。statsに件数（size）が
+            ない場合は件数を出力しない。
+
+    """
+
+    def collect():
+        stats = cache.stats
+        cache_hits.set_total(stats["hits"], cache=name)
+        cache_misses.set_total(stats["misses"], cache=name)
+        cache_evictions.set_total(stats["evictions"], cache=name)
+        if "size" in stats:
+            cache_size.set(stats["size"], cache=name)
+        cache_coalesced.set_total(stats.get("coalesced", 0), cache=name)
+
+    registry.add_collector(collect)
+
+
+def render() -> str:
+    """全プロセスの値を合算し、キャッシュのヒット率を加えてテキスト形式で返す。"""
+    merged = registry.merge()
+    hits = merged.get(cache_hits.name, {"samples": dict()})["samples"]
+    misses = merged.get(cache_misses.name, {"samples": dict()})["samples"]
+    ratios = dict()
+    for key in set(hits) | set(misses):
+        total = hits.get(key, 0) + misses.get(key, 0)
+        if 0 < total:
+            ratios[key] = hits.get(key, 0) / total
+    merged["ash_aed_cache_hit_ratio"] = {
+        "type": "gauge",
+        "help": "全プロセスを合算したキャッシュのヒット率",
+        "bucket_bounds": None,
+        "samples": ratios,
+    }
+    return registry.format(merged)
@@ -0,0 +1,76 @@
+from typing import Optional
+
+import numpy as np
+
+from ash_aed.coverage import EARTH_RADIUS
+
+# 一度に比べる組み合わせの数の上限。8バイトの浮動小数点数で約32MBになる。
+CHUNK_ELEMENTS = 4000000
+
+
+def get_nearest_neighbors(
+    locations: list, k: int = 5, chunk_size: Optional[int] = None
+) -> list:
+    """
+    AED設置場所ごとに、他のAED設置場所のうち近い順にk件を求める。
+
+    全ての組み合わせをchunk_size件の行ずつまとめて比べるので、メモリの使用量は
+    chunk_size×件数に収まる。省略時は組み合わせの数がCHUNK_ELEMENTSを超えない
+    行数にする。
+
+    Args:
+        locations (list of obj:`AEDInstallationLocation`): AED設置場所データの
+            オブジェクトのリスト
+        k (int): 求める近いAED設置場所の件数
+        chunk_size (int): まとめて比べる行数
+
+    Returns:
+        neighbors (list of tuples): AED設置場所連番、近い順の順位（1から）、近い
+            AED設置場所連番、距離（メートル）のタプルのリスト
+
+    """
+    locations = sorted(locations, key=lambda location: location.location_id)
+    count = min(int(k), len(locations) - 1)
+    if count < 1:
+        return list()
+    if chunk_size is None:
+        chunk_size = max(1, CHUNK_ELEMENTS // len(locations))
+    location_ids = np.array([location.location_id for location in locations])
+    latitudes = np.radians([location.latitude for location in locations])
+    longitudes = np.radians([location.longitude for location in locations])
+    # 球面三角法の余弦定理の余弦は、地点を単位球面上のベクトルにしたときの
+    # 内積と等しい。内積の大きい順が距離の近い順になるので、行列の積で
+    # まとめて求め、選んだk件だけ距離に換算する。
+    vectors = np.column_stack(
+        (
+            np.cos(latitudes) * np.cos(longitudes),
+            np.cos(latitudes) * np.sin(longitudes),
+            np.sin(latitudes),
+        )
+    )
+
+    neighbors = list()
+    for start in range(0, len(locations), chunk_size):
+        rows = np.arange(start, min(start + chunk_size, len(locations)))
+        cosines = vectors[rows] @ vectors.T
+        # 自分自身は除く。
+        cosines[np.arange(len(rows)), rows] = -np.inf
+        candidates = np.argpartition(-cosines, count - 1, axis=1)[:, :count]
+        candidate_cosines = np.take_along_axis(cosines, candidates, axis=1)
+        # 距離が同じ場合はAED設置場所連番の小さい順に並べる。
+        order = np.lexsort((candidates, -candidate_cosines), axis=1)
+        candidates = np.take_along_axis(candidates, order, axis=1)
+        candidate_distances = EARTH_RADIUS * np.arccos(
+            np.clip(np.take_along_axis(candidate_cosines, order, axis=1), -1.0, 1.0)
+        )
+        for row, indexes, row_distances in zip(rows, candidates, candidate_distances):
+            for rank, (index, distance) in enumerate(zip(indexes, row_distances)):
+                neighbors.append(
+                    (
+                        int(location_ids[row]),
+                        rank + 1,
+                        int(location_ids[index]),
+                        float(distance),
+                    )
+                )
+    return neighbors
@@ -0,0 +1,275 @@
+import cProfile
+import glob
+import hmac
+import os
+import pstats
+import random
+import re
+import time
+import uuid
+from typing import Optional
+
+# ファイル名に使えない文字
+UNSAFE_CHARACTERS = re.compile(r"[^0-9A-Za-z._-]")
+# 折りたたんだスタックをたどる深さの上限
+MAX_STACK_DEPTH = 64
+# 折りたたんだスタックで、これより短い時間（秒）の経路はたどらない
+MIN_STACK_TIME = 0.000001
+
+
+def get_function_name(function: tuple) -> str:
+    """pstatsの関数のキーを「ファイル名:行番号(関数名)」の形にする。"""
+    return pstats.func_std_string(function)
+
+
+def get_collapsed_stacks(stats: pstats.Stats) -> list:
+    """
+    プロファイル結果を、フレームグラフの作成に使う折りたたんだスタック形式の行に
+    する。
+
+    cProfileは呼び出し元と呼び出し先の組ごとの時間しか記録しないので、呼び出し
+    元から辿った経路ごとの時間は、呼び出し先の累積時間をその呼び出し元からの
+    累積時間の割合で按分して求める。
+
+    Args:
+        stats (obj:`pstats.Stats`): プロファイル結果
+
+    Returns:
+        lines (list of str): 「関数;関数;…関数 マイクロ秒」の形の行のリスト
+
+    """
+    callees = dict()
+    for function, (_, _, _, _, callers) in stats.stats.items():
+        for caller, (_, _, _, cumulative_time) in callers.items():
+            callees.setdefault(caller, list()).append((function, cumulative_time))
+    roots = [
+        function
+        for function, (_, _, _, _, callers) in stats.stats.items()
+        if not callers
+    ]
+
+    totals = dict()
+
+    def walk(function, path, factor):
+        _, _, total_time, cumulative_time, _ = stats.stats[function]
+        path = path + (function,)
+        totals[path] = totals.get(path, 0.0) + total_time * factor
+        if MAX_STACK_DEPTH <= len(path):
+            return
+        for callee, edge_time in callees.get(function, list()):
+            # 再帰呼び出しは同じ経路に重ねない。
+            if callee in path or stats.stats[callee][3] <= 0:
+                continue
+            if factor * edge_time < MIN_STACK_TIME:
+                continue
+            walk(callee, path, factor * edge_time / stats.stats[callee][3])
+
+    for root in roots:
+        walk(root, tuple(), 1.0)
+    lines = list()
+    for path, seconds in totals.items():
+        microseconds = int(round(seconds * 1000000))
+        if 0 < microseconds:
+            names = [get_function_name(function) for function in path]
+            lines.append(";".join(names) + " " + str(microseconds))
+    return sorted(lines)
+
+
+class RequestProfiler:
+    """
+    リクエストごとにcProfileで処理を計測し、結果をファイルへ書き出す。
+
+    計測するのは、保護用のトークンをヘッダーに付けたリクエストと、sample_rateの
+    割合で選んだリクエストだけ。書き出すディレクトリを指定しない場合は計測せず、
+    リクエストごとの負担は属性を1つ調べるだけになる。
+
+    Attributes:
+        directory (str): 結果を書き出すディレクトリ。Noneの場合は計測しない。
+        sample_rate (float): 計測するリクエストの割合（0〜1）
+        enabled (bool): 計測する場合は真
+        collapsed (bool): pstats形式に加えて折りたたんだスタック形式でも
+            書き出す場合は真
+
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str],
+        sample_rate: float = 0.0,
+        token: Optional[str] = None,
+        max_files: int = 200,
+        collapsed: bool = False,
+    ):
+        """
+        Args:
+            directory (str): 結果を書き出すディレクトリ
+            sample_rate (float): 計測するリクエストの割合（0〜1）
+            token (str): ヘッダーに付けると計測する、保護用のトークン
+            max_files (int): 残す結果の数。超えた分は古いものから削除する。
+            collapsed (bool): 折りたたんだスタック形式でも書き出す場合は真
+
+        """
+        self.__directory = directory or None
+        self.__sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+        self.__token = token or None
+        self.__max_files = max(1, int(max_files))
+        self.__collapsed = collapsed
+
+    @property
+    def directory(self) -> Optional[str]:
+        return self.__directory
+
+    @property
+    def sample_rate(self) -> float:
+        return self.__sample_rate
+
+    @property
+    def enabled(self) -> bool:
+        return self.__directory is not None
+
+    @property
+    def collapsed(self) -> bool:
+        return self.__collapsed
+
+    def is_authorized(self, token: Optional[str]) -> bool:
+        """ヘッダーの値が保護用のトークンと一致するかを返す。
+
+        Args:
+            token (str): リクエストヘッダーの値
+
+        Returns:
+            authorized (bool): 一致する場合は真。トークンを設定していない場合は偽
+
+        """
+        if self.__token is None or not token:
+            return False
+        return hmac.compare_digest(token.encode("utf-8"), self.__token.encode("utf-8"))
+
+    def should_profile(self, token: Optional[str]) -> bool:
+        """リクエストを計測するかを返す。
+
+        Args:
+            token (str): リクエストヘッダーの保護用のトークンの値
+
+        Returns:
+            profile (bool): 計測する場合は真
+
+        """
+        if self.__directory is None:
+            return False
+        if self.is_authorized(token):
+            return True
+        return 0 < self.__sample_rate and random.random() < self.__sample_rate
+
+    def start(self) -> cProfile.Profile:
+        """計測を開始する。
+
+        Returns:
+            profile (obj:`cProfile.Profile`): 計測中のプロファイラ
+
+        """
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def stop(self, profile: cProfile.Profile, name: str) -> Optional[str]:
+        """計測を終了し、結果を書き出す。
+
+        Args:
+            profile (obj:`cProfile.Profile`): startで開始したプロファイラ
+            name (str): ファイル名に含める、エンドポイントなどの名前
+
+        Returns:
+            path (str): 書き出したpstats形式のファイルのパス。書き出せなかった
+                場合はNoneを返す。
+
+        """
+        profile.disable()
+        try:
+            os.makedirs(self.__directory, exist_ok=True)
+            path = os.path.join(
+                self.__directory,
+                time.strftime("%Y%m%d%H%M%S")
+                + "-"
+                + str(os.getpid())
+                + "-"
+                + UNSAFE_CHARACTERS.sub("_", name)[:64]
+                + "-"
+                + uuid.uuid4().hex[:8]
+                + ".prof",
+            )
+            profile.dump_stats(path)
+            if self.__collapsed:
+                lines = get_collapsed_stacks(pstats.Stats(profile))
+                with open(path[: -len(".prof")] + ".collapsed", "w") as f:
+                    f.write("\n".join(lines) + "\n")
+            self.remove_old_files()
+        except OSError:
+            return None
+        return path
+
+    def get_files(self) -> list:
+        """書き出したpstats形式のファイルのパスを古い順に返す。"""
+        if self.__directory is None:
+            return list()
+        paths = glob.glob(os.path.join(self.__directory, "*.prof"))
+        return sorted(paths, key=lambda path: (os.path.getmtime(path), path))
+
+    def remove_old_files(self) -> None:
+        """max_filesを超えた古い結果を削除する。"""
+        paths = self.get_files()
+        for path in paths[: max(0, len(paths) - self.__max_files)]:
+            for remove_path in (path, path[: -len(".prof")] + ".collapsed"):
+                try:
+                    os.remove(remove_path)
+                except FileNotFoundError:
+                    pass
+
+    def summarize(self, limit: int = 20, sort: str = "cumulative") -> dict:
+        """書き出した全ての結果を合算し、時間のかかった関数を返す。
+
+        Args:
+            limit (int): 返す関数の数
+            sort (str): 並べる基準。cumulative（累積時間）またはtottime
+                （関数自体の時間）
+
+        Returns:
+            summary (dict): 合算したリクエスト数と、関数ごとの呼び出し回数、
+                関数自体の時間、累積時間（秒）を要素に持つ辞書
+
+        """
+        stats = None
+        count = 0
+        for path in self.get_files():
+            try:
+                if stats is None:
+                    stats = pstats.Stats(path)
+                else:
+                    stats.add(path)
+                count += 1
+            except (OSError, EOFError, TypeError, ValueError):
+                # 書き込み中や削除されたファイルは飛ばす。
+                continue
+        functions = list()
+        if stats is not None:
+            index = 3 if sort == "cumulative" else 2
+            ranked = sorted(
+                stats.stats.items(), key=lambda item: item[1][index], reverse=True
+            )
+            for function, (
+                primitive_calls,
+                calls,
+                total_time,
+                cumulative_time,
+                _,
+            ) in ranked[:limit]:
+                functions.append(
+                    {
+                        "function": get_function_name(function),
+                        "calls": calls,
+                        "primitive_calls": primitive_calls,
+                        "tottime": total_time,
+                        "cumtime": cumulative_time,
+                    }
+                )
+        return {"requests": count, "sort": sort, "functions": functions}
@@ -0,0 +1,170 @@
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from ash_aed.dataset import dataset_version
+from ash_aed.db import DB
+from ash_aed.errors import DatabaseError, DataError, ScrapeError
+from ash_aed.logs import AppLog
+from ash_aed.scraper import OpenData
+from ash_aed.services import AEDInstallationLocationService
+
+
+class RefreshScheduler:
+    """
+    オープンデータの更新を定期的に確認し、更新があればインポートする。
+
+    複数のプロセスやdynoで動かしても同時にインポートしないよう、PostgreSQLの
+    アドバイザリロックを取得できたプロセスだけがインポートを行う。
+
+    Attributes:
+        interval (float): 更新を確認する間隔（秒）
+        jitter (float): 確認する間隔をばらつかせる割合（0以上1未満）
+
+    """
+
+    # アドバイザリロックのキー（"ash_aed"をASCIIコードで並べたもの）
+    LOCK_KEY = 0x6173685F616564
+
+    def __init__(
+        self,
+        import_function: Callable[[OpenData], Optional[int]],
+        interval: float,
+        jitter: float = 0.1,
+    ):
+        """
+        Args:
+            import_function (callable): ダウンロード済みのオープンデータを引数に取り、
+                インポートしたデータセットのバージョンを返す関数
+            interval (float): 更新を確認する間隔（秒）
+            jitter (float): 確認する間隔をばらつかせる割合（0以上1未満）
+
+        """
+        self.__import_function = import_function
+        self.__interval = float(interval)
+        self.__jitter = min(max(float(jitter), 0.0), 0.99)
+        self.__executor = None
+        self.__thread = None
+        self.__pid = None
+        self.__stop = threading.Event()
+        self.__lock = threading.Lock()
+        self.__logger = AppLog()
+
+    @property
+    def interval(self) -> float:
+        return self.__interval
+
+    @property
+    def jitter(self) -> float:
+        return self.__jitter
+
+    def _get_wait_seconds(self) -> float:
+        """次に更新を確認するまでの秒数をばらつかせて返す。
+
+        Returns:
+            seconds (float): 待機する秒数
+
+        """
+        return self.__interval * (1 + random.uniform(-self.__jitter, self.__jitter))
+
+    def refresh(self) -> Optional[int]:
+        """
+        オープンデータの更新を確認し、更新があればインポートして新しい
+        データセットのバージョンを公開する。
+
+        Returns:
+            version (int): 確認後のデータセットのバージョン。確認できなかった
+                場合はNoneを返す。
+
+        """
+        try:
+            db = DB()
+        except DatabaseError as e:
+            self.__logger.error(e.message)
+            return None
+
+        version = None
+        try:
+            service = AEDInstallationLocationService(db)
+            if db.try_advisory_lock(self.LOCK_KEY):
+                try:
+                    open_data = OpenData()
+                    if open_data.checksum == service.get_last_checksum():
+                        self.__logger.info("オープンデータに更新はありません。")
+                    else:
+                        self.__import_function(open_data)
+                finally:
+                    db.advisory_unlock(self.LOCK_KEY)
+            else:
+                self.__logger.info("他のプロセスがインポート中のため確認を省略します。")
+            version = service.get_dataset_version()
+            db.commit()
+        except (DatabaseError, DataError, ScrapeError) as e:
+            self.__logger.error(e.message)
+        except Exception as e:
+            # 想定外の例外でも定期的な確認を止めないよう、記録して次回に任せる。
+            self.__logger.error("オープンデータの更新の確認に失敗しました。" + repr(e))
+        finally:
+            db.close()
+
+        if version is not None:
+            dataset_version.publish(version)
+        return version
+
+    def _run(self) -> None:
+        """停止するまで一定間隔で更新の確認をスレッドプールへ投入する。"""
+        future = None
+        while not self.__stop.wait(self._get_wait_seconds()):
+            # 前回の確認が終わっていない場合は重ねて実行しない。
+            if future is None or future.done():
+                future = self.__executor.submit(self.refresh)
+                future.add_done_callback(self._log_failure)
+
+    def _log_failure(self, future) -> None:
+        """スレッドプールで実行した確認の例外を記録する。"""
+        error = future.exception()
+        if error is not None:
+            self.__logger.error(
+                "オープンデータの更新の確認に失敗しました。" + repr(error)
+            )
+
+    def start(self) -> None:
+        """バックグラウンドで定期的な確認を開始する。
+
+        gunicornの--preloadのようにforkした後のプロセスではスレッドが引き継がれない
+        ため、プロセスごとに一度だけ起動する。何度呼び出しても構わない。
+
+        """
+        pid = os.getpid()
+        if self.__pid == pid:
+            return
+        with self.__lock:
+            if self.__pid == pid:
+                return
+            self.__stop = threading.Event()
+            self.__executor = ThreadPoolExecutor(max_workers=1)
+            self.__thread = threading.Thread(
+                target=self._run, name="ash_aed_refresh_scheduler", daemon=True
+            )
+            self.__thread.start()
+            self.__pid = pid
+
+    def stop(self) -> None:
+        """定期的な確認を停止する。"""
+        with self.__lock:
+            self.__stop.set()
+            if self.__thread is not None:
+                self.__thread.join()
+            if self.__executor is not None:
+                self.__executor.shutdown(wait=True)
+            self.__thread = None
+            self.__executor = None
+            self.__pid = None
+
+    def run_forever(self) -> None:
+        """起動直後に一度確認し、その後は停止するまで定期的に確認する。"""
+        self.refresh()
+        while not self.__stop.wait(self._get_wait_seconds()):
+            self.refresh()
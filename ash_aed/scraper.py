@@ -1,3 +1,4 @@
+import hashlib
 import io
 
 import numpy as np
@@ -15,6 +16,7 @@ class OpenData:
 
     Attributes:
         lists(list of dicts): CSVの各行を辞書にしてリストに格納したデータ
+        checksum(str): ダウンロードしたCSVのSHA-256ハッシュ値
 
     """
 
@@ -24,32 +26,45 @@ class OpenData:
         # 旭川市ホームページのTLS証明書のDH鍵長に問題があるためセキュリティを下げて回避する
         requests.packages.urllib3.util.ssl_.DEFAULT_CIPHERS += "HIGH:!DH"
         try:
-            response = requests.get(Config.OPENDATA_URL)
+            # 応答がないまま待ち続けて更新の確認が止まらないよう、上限を設ける。
+            response = requests.get(Config.OPENDATA_URL, timeout=Config.OPENDATA_TIMEOUT)
+            response.raise_for_status()
             logger.info("オープンデータのダウンロードに成功しました。")
         except RequestException as e:
             message = e.args[0]
             logger.error(message)
             raise ScrapeError(message)
 
-        csv_content = io.BytesIO(response.content)
-        df = pd.read_csv(csv_content, encoding="cp932", header=0, dtype=str)
-        df.replace(np.nan, "", inplace=True)
-        for row in df.values.tolist():
-            self.__lists.append(
-                {
-                    "area": row[0],
-                    "location_id": int(row[1]),
-                    "location_name": row[2],
-                    "postal_code": row[3],
-                    "address": row[4],
-                    "phone_number": row[5],
-                    "available_time": row[6],
-                    "installation_floor": row[7],
-                    "latitude": float(row[8]),
-                    "longitude": float(row[9]),
-                }
-            )
+        self.__checksum = hashlib.sha256(response.content).hexdigest()
+        try:
+            csv_content = io.BytesIO(response.content)
+            df = pd.read_csv(csv_content, encoding="cp932", header=0, dtype=str)
+            df.replace(np.nan, "", inplace=True)
+            for row in df.values.tolist():
+                self.__lists.append(
+                    {
+                        "area": row[0],
+                        "location_id": int(row[1]),
+                        "location_name": row[2],
+                        "postal_code": row[3],
+                        "address": row[4],
+                        "phone_number": row[5],
+                        "available_time": row[6],
+                        "installation_floor": row[7],
+                        "latitude": float(row[8]),
+                        "longitude": float(row[9]),
+                    }
+                )
+        except (ValueError, IndexError, UnicodeDecodeError) as e:
+            # pandasのParserErrorや数値に変換できない値もValueErrorに含まれる。
+            message = "オープンデータのCSVを読み込めません。" + str(e)
+            logger.error(message)
+            raise ScrapeError(message)
 
     @property
     def lists(self) -> list:
         return self.__lists
+
+    @property
+    def checksum(self) -> str:
+        return self.__checksum
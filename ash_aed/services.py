@@ -1,57 +1,679 @@
+import hashlib
+import itertools
+import random
+import re
+import time
+from abc import ABCMeta, abstractmethod
 from datetime import datetime, timedelta, timezone
 from decimal import ROUND_HALF_UP, Decimal
-from typing import Optional
+from typing import Iterator, Optional
 
+import numpy as np
 import psycopg2
-from psycopg2.extras import DictCursor
+from psycopg2.extras import DictCursor, execute_values
 
+from ash_aed.cache import NearLocationsCache
+from ash_aed.config import Config
+from ash_aed.coverage import CoverageGridStore, get_distances
+from ash_aed.dataset import dataset_version
 from ash_aed.db import DB
 from ash_aed.errors import DatabaseError, DataError, ServiceError
 from ash_aed.logs import AppLog
+from ash_aed.metrics import (
+    get_statement_kind,
+    sql_duration,
+    sql_errors,
+    sql_rows_fetched
+)
 from ash_aed.models import (
     AEDInstallationLocation,
     AEDInstallationLocationFactory,
     CurrentLocation
 )
+from ash_aed.shared_cache import create_shared_cache
+from ash_aed.slow_query import slow_query_log
+
+# インポート時に事前計算した最寄りのAED設置場所の格子データ
+coverage_grid_store = CoverageGridStore(Config.COVERAGE_GRID_PATH)
+# 現在地を量子化した区画ごとの近いAED設置場所の検索候補
+near_locations_cache = NearLocationsCache(
+    Config.NEAR_LOCATIONS_CACHE_SIZE,
+    Config.NEAR_LOCATIONS_CACHE_PRECISION,
+    Config.SINGLE_FLIGHT_TIMEOUT,
+)
+# データセットが切り替わったら古い検索候補を破棄する。
+dataset_version.subscribe(lambda version: near_locations_cache.clear())
+# ワーカーやホストの間で共有するキャッシュ。キーにデータセットのバージョンを
+# 含めるので、切り替えても破棄する必要はない。
+shared_cache = create_shared_cache(Config.SHARED_CACHE, Config.SHARED_CACHE_TTL)
+
+
+COLUMNS = (
+    "area,location_id,location_name,postal_code,address,phone_number,"
+    + "available_time,installation_floor,latitude,longitude"
+)
+# 検索に使う固定のSELECT文。名前をキーに、パラメータの型とSQL文のタプルを値に持つ。
+# {table}は操作対象のテーブル名に置き換える。
+SELECT_STATEMENTS = {
+    "get_all": ("", "SELECT " + COLUMNS + " FROM {table} ORDER BY location_id;"),
+    "find_by_location_id": (
+        "integer",
+        "SELECT " + COLUMNS + " FROM {table} WHERE location_id=%s;",
+    ),
+    "count_by_location_name": (
+        "text",
+        "SELECT count(location_name) FROM {table} WHERE location_name LIKE %s;",
+    ),
+    "find_by_location_name": (
+        "text,bigint,bigint",
+        "SELECT "
+        + COLUMNS
+        + " FROM {table} WHERE location_name LIKE %s ORDER BY location_id"
+        + " LIMIT %s OFFSET %s;",
+    ),
+    "find_by_location_ids": (
+        "integer[]",
+        "SELECT "
+        + COLUMNS
+        + " FROM {table} WHERE location_id = ANY(%s) ORDER BY location_id;",
+    ),
+    "get_area_names": ("", "SELECT DISTINCT ON (area) area FROM {table};"),
+    "count_by_area_name": (
+        "text",
+        "SELECT count(*) FROM {table} WHERE area=%s;",
+    ),
+    "find_by_area_name": (
+        "text",
+        "SELECT " + COLUMNS + " FROM {table} WHERE area=%s ORDER BY location_id;",
+    ),
+    "find_by_bounding_box": (
+        "numeric,numeric,numeric,numeric",
+        "SELECT "
+        + COLUMNS
+        + " FROM {table} WHERE latitude BETWEEN %s AND %s"
+        + " AND longitude BETWEEN %s AND %s ORDER BY location_id;",
+    ),
+    "get_last_updated": ("", "SELECT max(updated_at) FROM {table};"),
+    "find_neighbors": (
+        "bigint,integer",
+        "SELECT "
+        + ",".join("t." + column for column in COLUMNS.split(","))
+        + ",n.distance FROM location_neighbors n"
+        + " JOIN {table} t ON t.location_id = n.neighbor_id"
+        + " WHERE n.version=%s AND n.location_id=%s ORDER BY n.rank;",
+    ),
+}
+
+
+def to_numbered_placeholders(sql: str) -> str:
+    """psycopg2形式のプレースホルダ（%s）を番号付き（$1, $2, ...）に変換する。
+
+    Args:
+        sql (str): psycopg2形式のSQL文
+
+    Returns:
+        sql (str): PREPAREやasyncpgで使う番号付きのプレースホルダのSQL文
+
+    """
+    numbers = itertools.count(1)
+    return re.sub(
+        r"%%|%s",
+        lambda match: "%" if match.group(0) == "%%" else "$" + str(next(numbers)),
+        sql,
+    )
+
+
+def select_near_location_candidates(locations: list, cell_bounding_box: tuple) -> list:
+    """
+    全件から、区画内のどの地点から見ても上位5件に入り得るAED設置場所を選ぶ。
+
+    区画の中心から上位5件目までの距離に区画の対角線の長さを加えた範囲内に
+    あるものを候補とする。区画内のどの地点から見ても上位5件はこの範囲に含まれる。
+
+    Args:
+        locations (list of obj:`AEDInstallationLocation`): 全てのAED設置場所
+        cell_bounding_box (tuple): 現在地を含むキャッシュの区画の範囲
+
+    Returns:
+        candidates (list of obj:`AEDInstallationLocation`): 検索候補のリスト
+
+    """
+    if len(locations) == 0:
+        return locations
+    south, west, north, east = cell_bounding_box
+    distances = get_distances(
+        np.array([(south + north) / 2]),
+        np.array([(west + east) / 2]),
+        np.array([location.latitude for location in locations]),
+        np.array([location.longitude for location in locations]),
+    )[0]
+    results_number = min(5, len(locations))
+    threshold = (
+        np.partition(distances, results_number - 1)[results_number - 1]
+        + 2 * near_locations_cache.half_diagonal
+    )
+    return [
+        location
+        for location, distance in zip(locations, distances)
+        if distance <= threshold
+    ]
+
+
+def rank_near_locations(current_location: CurrentLocation, candidates: list) -> list:
+    """
+    検索候補から現在地に近い上位5件を選び、順位と距離を付与する。
+
+    Args:
+        current_location (obj:`CurrentLocation`): 現在地の緯度経度情報を持つ
+            オブジェクト
+        candidates (list of obj:`AEDInstallationLocation`): 検索候補のリスト
+
+    Returns:
+        near_locations (list of dicts): AED設置場所オブジェクトと順位、現在地までの
+            距離（キロメートルに換算し小数点第3位を四捨五入）を要素に持つ辞書のリスト
 
+    """
+    locations = list()
+    for location in candidates:
+        locations.append(
+            {
+                "order": None,
+                "location": location,
+                "distance": current_location.get_distance_to(location),
+            }
+        )
+    near_locations = sorted(locations, key=lambda x: x["distance"])[:5]
+    for i in range(len(near_locations)):
+        # 現在地から近い順で連番を付与する。
+        near_locations[i]["order"] = i + 1
+        near_locations[i]["distance"] = to_kilometers(near_locations[i]["distance"])
+    return near_locations
+
+
+def to_kilometers(distance: float) -> float:
+    """距離を分かりやすくするためキロメートルに変換する。
+
+    Args:
+        distance (float): 距離（メートル）
+
+    Returns:
+        distance (float): 距離（キロメートル、小数点第3位を四捨五入）
 
-class AEDInstallationLocationService:
+    """
+    return float(
+        Decimal(str(distance / 1000)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    )
+
+
+def trace_versions(
+    history: dict, since: int, version: int, max_versions: int
+) -> Optional[list]:
+    """現在のバージョンから指定したバージョンまで、比較元のバージョンをたどる。
+
+    Args:
+        history (dict): バージョンをキー、比較元のバージョンを値に持つ辞書
+        since (int): クライアントが持っているデータセットのバージョン
+        version (int): 現在のデータセットのバージョン
+        max_versions (int): たどるバージョンの数の上限
+
+    Returns:
+        versions (list of int): sinceより後の、変更履歴を集めるバージョンのリスト。
+            指定したバージョンまでたどれない場合はNoneを返す。
+
+    """
+    versions = list()
+    current = version
+    while current != since:
+        if max_versions <= len(versions) or history.get(current) is None:
+            return None
+        versions.append(current)
+        current = history[current]
+    return versions
+
+
+class StorageBackend(metaclass=ABCMeta):
+    """
+    AED設置場所を検索するメソッドを提供するストレージの共通インターフェース。
+
+    PostgreSQLを使うAEDInstallationLocationServiceのほか、読み取り専用の
+    SQLiteファイルを使うSQLiteAEDInstallationLocationServiceがある。
+    現在地から近いAED設置場所の検索とデータセットのバージョンは、各ストレージの
+    検索メソッドを組み合わせて共通の手順で求める。
+
+    """
+
+    @abstractmethod
+    def get_all(self) -> list:
+        """AED設置場所全件データのリストを返す。"""
+        pass
+
+    @abstractmethod
+    def find_by_location_id(self, location_id) -> list:
+        """AED設置場所連番から該当するAED設置場所データを返す。"""
+        pass
+
+    @abstractmethod
+    def find_by_location_name(self, location_name, page: int = 1) -> dict:
+        """指定したAED設置場所名を含むAED設置場所を検索する。"""
+        pass
+
+    @abstractmethod
+    def find_by_location_ids(self, location_ids: list) -> list:
+        """複数のAED設置場所連番から該当するAED設置場所データを返す。"""
+        pass
+
+    @abstractmethod
+    def get_area_names(self) -> list:
+        """AED設置場所の住所の町域一覧を返す。"""
+        pass
+
+    @abstractmethod
+    def find_by_area_name(self, area_name) -> list:
+        """町域名からAED設置場所を検索する。"""
+        pass
+
+    @abstractmethod
+    def find_by_bounding_box(
+        self, south: float, west: float, north: float, east: float
+    ) -> list:
+        """緯度経度で指定した矩形の範囲内にあるAED設置場所を検索する。"""
+        pass
+
+    def iter_all(self) -> Iterator[AEDInstallationLocation]:
+        """AED設置場所全件データを1件ずつ返す。
+
+        検索結果を一度にメモリへ読み込まないストレージは上書きする。
+
+        """
+        yield from self.get_all()
+
+    def iter_by_area_name(self, area_name) -> Iterator[AEDInstallationLocation]:
+        """町域名から検索したAED設置場所データを1件ずつ返す。"""
+        yield from self.find_by_area_name(area_name)
+
+    def count_by_area_name(self, area_name) -> int:
+        """指定した町域のAED設置場所の件数を返す。"""
+        return len(self.find_by_area_name(area_name))
+
+    def get_version_history(self) -> dict:
+        """データセットのバージョンごとに、変更履歴の比較元のバージョンを返す。
+
+        変更履歴を持たないストレージは空の辞書を返し、get_changesは常にNoneになる。
+
+        Returns:
+            history (dict): バージョンをキー、比較元のバージョンを値に持つ辞書
+
+        """
+        return dict()
+
+    def get_changed_location_ids(self, versions: list) -> list:
+        """指定したバージョンで追加、更新、削除されたAED設置場所連番を返す。
+
+        Args:
+            versions (list of int): データセットのバージョンのリスト
+
+        Returns:
+            location_ids (list of int): AED設置場所連番のリスト
+
+        """
+        return list()
+
+    def get_changes(
+        self,
+        since: int,
+        max_versions: int = Config.CHANGES_MAX_VERSIONS,
+        version: Optional[int] = None,
+    ) -> Optional[dict]:
+        """指定したバージョンから現在のバージョンまでの差分を返す。
+
+        現在のバージョンから比較元のバージョンを順にたどり、途中のバージョンで
+        変更されたAED設置場所を集める。現在も存在するものは最新のデータを、
+        存在しないものは連番だけを返す。
+
+        Args:
+            since (int): クライアントが持っているデータセットのバージョン
+            max_versions (int): たどるバージョンの数の上限
+            version (int): 現在のデータセットのバージョン。省略時はデータベースに
+                問い合わせる。
+
+        Returns:
+            changes (dict): 現在のバージョン、追加または更新されたAED設置場所
+                オブジェクトのリスト、削除されたAED設置場所連番のリストを要素に持つ
+                辞書。指定したバージョンまでたどれない場合はNoneを返す。
+
+        """
+        if version is None:
+            version = self.get_dataset_version()
+        history = self.get_version_history() if since != version else dict()
+        versions = trace_versions(history, since, version, max_versions)
+        if versions is None:
+            return None
+        location_ids = self.get_changed_location_ids(versions)
+        upserts = self.find_by_location_ids(location_ids) if location_ids else []
+        found = set(location.location_id for location in upserts)
+        return {
+            "version": version,
+            "upserts": upserts,
+            "deletes": sorted(set(location_ids) - found),
+        }
+
+    def iter_by_bounding_box(
+        self, south: float, west: float, north: float, east: float
+    ) -> Iterator[AEDInstallationLocation]:
+        """緯度経度で指定した矩形の範囲内にあるAED設置場所を1件ずつ返す。"""
+        yield from self.find_by_bounding_box(south, west, north, east)
+
+    def get_neighbors(self, version: int, location_id: int) -> list:
+        """インポート時に求めた、AED設置場所から近い他のAED設置場所を返す。
+
+        事前に計算した結果を持たないストレージは空のリストを返す。
+
+        Args:
+            version (int): データセットのバージョン
+            location_id (int): AED設置場所連番
+
+        Returns:
+            neighbors (list of tuples): 近い順のAED設置場所オブジェクトと距離
+                （メートル）のタプルのリスト
+
+        """
+        return list()
+
+    def find_neighbors(self, location_id: int, version: Optional[int] = None) -> list:
+        """AED設置場所から近い他のAED設置場所を返す。
+
+        インポート時に求めた結果を読むだけで、距離の計算はしない。
+
+        Args:
+            location_id (int): AED設置場所連番
+            version (int): データセットのバージョン。省略時は現在のバージョン
+
+        Returns:
+            neighbors (list of dicts): 近い順のAED設置場所オブジェクトと順位、
+                距離（キロメートル）を要素に持つ辞書のリスト
+
+        """
+        if version is None:
+            version = self.get_dataset_version()
+        return [
+            {"order": i + 1, "location": location, "distance": to_kilometers(distance)}
+            for i, (location, distance) in enumerate(
+                self.get_neighbors(version, location_id)
+            )
+        ]
+
+    @abstractmethod
+    def get_last_updated(self) -> Optional[datetime]:
+        """AED設置場所データの最終更新日時を返す。"""
+        pass
+
+    def _get_near_location_candidates(
+        self,
+        version: int,
+        current_location: CurrentLocation,
+        cell: tuple,
+        cell_bounding_box: tuple,
+    ) -> list:
+        """
+        現在地から近いAED設置場所の検索候補を取得し、可能であれば区画ごとの
+        キャッシュに保存する。
+
+        Args:
+            version (int): データセットのバージョン
+            current_location (obj:`CurrentLocation`): 現在地の緯度経度情報を持つ
+                オブジェクト
+            cell (tuple): 現在地を含むキャッシュの区画の番号
+            cell_bounding_box (tuple): 現在地を含むキャッシュの区画の範囲
+
+        Returns:
+            candidates (list of obj:`AEDInstallationLocation`): 検索候補のリスト
+
+        """
+        # 他のワーカーが求めた区画の検索候補があればそれを使う。
+        candidates = shared_cache.get(version, "near_locations", cell)
+        if candidates is not None:
+            near_locations_cache.set(version, cell, candidates)
+            return candidates
+
+        # 事前計算した格子データがあれば候補のAED設置場所だけを取得する。
+        grid = coverage_grid_store.get(version)
+        if grid is not None:
+            location_ids = grid.lookup_area(*cell_bounding_box)
+            if location_ids is not None:
+                # 区画全体が1つの格子に収まるので、候補は区画内のどの地点でも使える。
+                candidates = self.find_by_location_ids(location_ids)
+                near_locations_cache.set(version, cell, candidates)
+                shared_cache.set(version, "near_locations", cell, candidates)
+                return candidates
+            location_ids = grid.lookup(
+                current_location.latitude, current_location.longitude
+            )
+            if location_ids is not None:
+                return self.find_by_location_ids(location_ids)
+
+        # 格子データで決まらない場合は全件から候補を選ぶ。
+        candidates = select_near_location_candidates(self.get_all(), cell_bounding_box)
+        near_locations_cache.set(version, cell, candidates)
+        shared_cache.set(version, "near_locations", cell, candidates)
+        return candidates
+
+    def get_near_locations(
+        self, current_location: CurrentLocation, version: Optional[int] = None
+    ) -> list:
+        """
+        現在地から直線距離で最も近いAED設置場所上位5件のAED設置場所データのリストを返す。
+
+        Args:
+            current_location (obj:`CurrentLocation`): 現在地の緯度経度情報を持つ
+                オブジェクト
+            version (int): データセットのバージョン。省略時はデータベースに
+                問い合わせる。
+
+        Returns:
+            near_locations (list of dicts): 現在地から最も近いAED設置場所上位5件の
+                AED設置場所オブジェクトと順位、現在地までの距離（キロメートルに換算し
+                小数点第3位を切り上げ）を要素に持つ辞書のリスト
+
+        """
+        if version is None:
+            version = self.get_dataset_version()
+        cell, cell_bounding_box = near_locations_cache.get_cell(
+            current_location.latitude, current_location.longitude
+        )
+        candidates = near_locations_cache.get(version, cell)
+        if candidates is None:
+            # 同じ区画の検索候補は1つのリクエストだけが求め、他はその結果を待つ。
+            candidates, shared = near_locations_cache.coalesce(
+                version,
+                cell,
+                lambda: self._get_near_location_candidates(
+                    version, current_location, cell, cell_bounding_box
+                ),
+            )
+            if shared and near_locations_cache.get(version, cell) is None:
+                # 区画全体には使えない、他の地点のための候補だったので求め直す。
+                candidates = self._get_near_location_candidates(
+                    version, current_location, cell, cell_bounding_box
+                )
+        return rank_near_locations(current_location, candidates)
+
+    def get_dataset_version(self) -> int:
+        """データセットのバージョンを返す。
+
+        データの最終更新日時をUNIX時間（秒）に変換したものをバージョンとし、
+        インポートのたびに値が変わるのでキャッシュのキーなどに使用する。
+
+        Returns:
+            version (int): データセットのバージョン。データがない場合は0を返す。
+
+        """
+        last_updated = self.get_last_updated()
+        if last_updated is None:
+            return 0
+        else:
+            return int(last_updated.timestamp())
+
+
+class AEDInstallationLocationService(StorageBackend):
     """
     AED設置場所をデータベースに登録し、検索するメソッドを提供する。
 
     """
 
-    def __init__(self, db: DB):
+    TABLE_NAME = "aed_installation_locations"
+    # テーブル名と名前ごとに組み立て済みのSQL文
+    _statements = dict()
+    # サーバー側のカーソルの名前に付ける連番
+    _cursor_numbers = itertools.count(1)
+
+    def __init__(
+        self,
+        db: DB,
+        table_name: str = TABLE_NAME,
+        prepared: bool = Config.PREPARED_STATEMENTS,
+    ):
         """
         Args:
             db (obj:`DB`): psycopg2.extrasのDictCursorオブジェクトを返すメソッドを
                 ラップしたメソッドを持つオブジェクト
+            table_name (str): 操作対象のテーブル名。インポート時にステージング
+                テーブルへデータを登録する場合に指定する。
+            prepared (bool): 検索用のSELECT文をサーバー側で準備して使い回す場合は真
 
         """
+        self.__db = db
         self.__cursor = db.cursor()
-        self.__table_name = "aed_installation_locations"
+        self.__prepared = prepared
+        self.__table_name = table_name
+        self.__versions_table_name = "dataset_versions"
+        self.__changes_table_name = "dataset_changes"
+        self.__neighbors_table_name = "location_neighbors"
         self.__logger = AppLog()
 
-    def _execute(self, sql: str, parameters: tuple = None) -> bool:
+    def _execute(self, sql: str, parameters: tuple = None, kind: str = None) -> bool:
         """DictCursorオブジェクトのexecuteメソッドのラッパー。
 
         Args:
             sql (str): SQL文
             parameters (tuple): SQLにプレースホルダを使用する場合の値を格納したリスト
+            kind (str): メトリクスに記録するSQL文の種類。省略時はSQL文から判定する。
 
         """
+        if kind is None:
+            kind = get_statement_kind(sql)
+        start = time.perf_counter()
         try:
             if parameters:
                 self.__cursor.execute(sql, parameters)
             else:
                 self.__cursor.execute(sql)
-            return True
         except (
             psycopg2.DataError,
             psycopg2.IntegrityError,
             psycopg2.InternalError,
         ) as e:
+            sql_errors.inc(kind=kind)
             raise DataError(e.args[0])
+        finally:
+            duration = time.perf_counter() - start
+            sql_duration.observe(duration, kind=kind)
+        if slow_query_log.should_capture(duration):
+            slow_query_log.capture(
+                self.__cursor.connection, kind, sql, parameters, duration
+            )
+        return True
+
+    def _get_statement(self, name: str) -> tuple:
+        """固定のSELECT文を初回だけ組み立てて返す。
+
+        Args:
+            name (str): SELECT_STATEMENTSのキー
+
+        Returns:
+            statement (tuple): そのまま実行するSQL文、準備するSQL文の名前、
+                パラメータの型、準備するSQL文、準備したSQL文を実行するSQL文のタプル
+
+        """
+        key = (self.__table_name, name)
+        statement = self._statements.get(key)
+        if statement is None:
+            types, template = SELECT_STATEMENTS[name]
+            sql = template.format(table=self.__table_name)
+            prepared_name = self.__table_name + "_" + name
+            execute_sql = "EXECUTE " + prepared_name
+            if types:
+                execute_sql += " (" + ",".join(["%s"] * len(types.split(","))) + ")"
+            statement = (
+                sql,
+                prepared_name,
+                types,
+                to_numbered_placeholders(sql).rstrip(";"),
+                execute_sql + ";",
+            )
+            self._statements[key] = statement
+        return statement
+
+    def _execute_statement(self, name: str, parameters: tuple = None) -> bool:
+        """固定のSELECT文を実行する。
+
+        準備済みのSQL文を使う設定の場合は、接続ごとに初回だけPREPAREし、
+        以降は名前を指定してEXECUTEするため、SQL文の解析と実行計画の作成を
+        省略できる。
+
+        Args:
+            name (str): SELECT_STATEMENTSのキー
+            parameters (tuple): SQLにプレースホルダを使用する場合の値を格納したリスト
+
+        """
+        sql, prepared_name, types, prepare_sql, execute_sql = self._get_statement(name)
+        if not self.__prepared:
+            return self._execute(sql, parameters)
+        self.__db.prepare(prepared_name, types, prepare_sql)
+        return self._execute(execute_sql, parameters, kind="SELECT")
+
+    def _iter_statement(
+        self, name: str, parameters: tuple = None
+    ) -> Iterator[AEDInstallationLocation]:
+        """固定のSELECT文をサーバー側のカーソルで実行し、AED設置場所データを
+        1件ずつ返す。
+
+        DECLAREには準備済みのSQL文を指定できないため、SQL文をそのまま送る。
+        検索結果はConfig.STREAM_ITERSIZE行ずつ取得してオブジェクトにするので、
+        呼び出し元が読み終えたものから破棄できる。
+
+        Args:
+            name (str): SELECT_STATEMENTSのキー
+            parameters (tuple): SQLにプレースホルダを使用する場合の値を格納したリスト
+
+        Yields:
+            aed_installation_location (obj:`AEDInstallationLocation`): AED設置場所
+                オブジェクト
+
+        """
+        sql = self._get_statement(name)[0]
+        cursor = self.__db.named_cursor(
+            "ash_aed_" + name + "_" + str(next(self._cursor_numbers))
+        )
+        rows = 0
+        try:
+            start = time.perf_counter()
+            try:
+                cursor.execute(sql, parameters)
+            except (psycopg2.DataError, psycopg2.InternalError) as e:
+                sql_errors.inc(kind="SELECT")
+                raise DataError(e.args[0])
+            finally:
+                sql_duration.observe(time.perf_counter() - start, kind="SELECT")
+            for row in cursor:
+                rows += 1
+                yield AEDInstallationLocation(**row)
+        finally:
+            sql_rows_fetched.inc(rows)
+            try:
+                cursor.close()
+            except psycopg2.Error:
+                # トランザクションが先に終わっていればカーソルも閉じている。
+                pass
 
     def _fetchall(self) -> list:
         """DictCursorオブジェクトのfetchallメソッドのラッパー。
@@ -60,7 +682,9 @@ class AEDInstallationLocationService:
             results (list of :obj:`DictCursor`): 検索結果のリスト
 
         """
-        return self.__cursor.fetchall()
+        results = self.__cursor.fetchall()
+        sql_rows_fetched.inc(len(results))
+        return results
 
     def _fetchone(self) -> DictCursor:
         """DictCursorオブジェクトのfetchoneメソッドのラッパー。
@@ -69,7 +693,10 @@ class AEDInstallationLocationService:
             results (:obj:`DictCursor`): 検索結果
 
         """
-        return self.__cursor.fetchone()
+        result = self.__cursor.fetchone()
+        if result is not None:
+            sql_rows_fetched.inc()
+        return result
 
     def _get_objects(self) -> list:
         """検索結果からAED設置場所データのリストを作成する。
@@ -108,6 +735,229 @@ class AEDInstallationLocationService:
         self._execute(state)
         self._info_log(self.__table_name + "テーブルを初期化しました。")
 
+    @property
+    def staging_table_name(self) -> str:
+        return self.__table_name + "_staging"
+
+    @property
+    def previous_table_name(self) -> str:
+        return self.__table_name + "_previous"
+
+    def create_staging_table(self) -> None:
+        """インポート用のステージングテーブルを作成する。
+
+        稼働中のテーブルには触れずにデータを登録できるよう、db/schema.sqlと
+        同じ定義の空のテーブルを作成する。主キー以外のインデックスはデータ登録後に
+        build_staging_indexesで作成する。
+
+        """
+        staging_table_name = self.staging_table_name
+        self._execute("DROP TABLE IF EXISTS " + staging_table_name + ";")
+        self._execute(
+            "CREATE TABLE "
+            + staging_table_name
+            + "("
+            + "id SERIAL NOT NULL,"
+            + "area VARCHAR(32) NOT NULL,"
+            + "location_id integer NOT NULL PRIMARY KEY,"
+            + "location_name TEXT NOT NULL,"
+            + "postal_code CHAR(8),"
+            + "address TEXT NOT NULL,"
+            + "phone_number TEXT,"
+            + "available_time TEXT,"
+            + "installation_floor TEXT,"
+            + "latitude decimal NOT NULL,"
+            + "longitude decimal NOT NULL,"
+            + "updated_at TIMESTAMPTZ NOT NULL"
+            + ");"
+        )
+        self._info_log(staging_table_name + "テーブルを作成しました。")
+
+    def build_staging_indexes(self) -> None:
+        """ステージングテーブルにインデックスを作成し、統計情報を更新する。"""
+        staging_table_name = self.staging_table_name
+        self._execute("CREATE INDEX ON " + staging_table_name + " (area);")
+        self._execute(
+            "CREATE INDEX ON " + staging_table_name + " (latitude, longitude);"
+        )
+        self._execute("ANALYZE " + staging_table_name + ";")
+
+    @staticmethod
+    def _get_checksum_source(aed_installation_location: AEDInstallationLocation) -> str:
+        """チェックサムを計算するためにAED設置場所データを1行の文字列にする。
+
+        validate_stagingのSQLと同じ順序、同じ区切り文字で連結する。
+
+        Args:
+            aed_installation_location (obj:`AEDInstallationLocation`): AED設置場所
+                データのオブジェクト
+
+        Returns:
+            source (str): チェックサムの計算対象の文字列
+
+        """
+        return "\t".join(
+            [
+                str(aed_installation_location.location_id),
+                aed_installation_location.area,
+                aed_installation_location.location_name,
+                aed_installation_location.postal_code,
+                aed_installation_location.address,
+                aed_installation_location.phone_number,
+                aed_installation_location.available_time,
+                aed_installation_location.installation_floor,
+                repr(aed_installation_location.latitude),
+                repr(aed_installation_location.longitude),
+            ]
+        )
+
+    def validate_staging(self, aed_installation_locations: list) -> None:
+        """
+        ステージングテーブルの件数とチェックサムが登録したデータと一致するか検証する。
+
+        Args:
+            aed_installation_locations (list of obj:`AEDInstallationLocation`):
+                登録したAED設置場所データのオブジェクトのリスト
+
+        Raises:
+            DataError: 件数かチェックサムが一致しない場合
+
+        """
+        # 同じ連番のデータは後から登録したもので上書きされる。
+        expect_items = dict()
+        for aed_installation_location in aed_installation_locations:
+            expect_items[aed_installation_location.location_id] = (
+                aed_installation_location
+            )
+        expect_count = len(expect_items)
+        expect_checksum = hashlib.md5(
+            "\n".join(
+                [
+                    self._get_checksum_source(expect_items[location_id])
+                    for location_id in sorted(expect_items.keys())
+                ]
+            ).encode("utf-8")
+        ).hexdigest()
+
+        separator = " || E'\\t' || "
+        state = (
+            "SELECT count(*) AS count, md5(coalesce(string_agg("
+            + "location_id::text"
+            + separator
+            + "area"
+            + separator
+            + "location_name"
+            + separator
+            + "coalesce(postal_code::text, '')"
+            + separator
+            + "address"
+            + separator
+            + "coalesce(phone_number, '')"
+            + separator
+            + "coalesce(available_time, '')"
+            + separator
+            + "coalesce(installation_floor, '')"
+            + separator
+            + "latitude::text"
+            + separator
+            + "longitude::text"
+            + ", E'\\n' ORDER BY location_id), '')) AS checksum FROM "
+            + self.staging_table_name
+            + ";"
+        )
+        self._execute(state)
+        row = self._fetchone()
+        if row["count"] != expect_count:
+            raise DataError(
+                "ステージングテーブルの件数が一致しません。（"
+                + str(row["count"])
+                + "件／"
+                + str(expect_count)
+                + "件）"
+            )
+        if row["checksum"] != expect_checksum:
+            raise DataError("ステージングテーブルのチェックサムが一致しません。")
+
+    def _rename_tables(self, renames: list) -> None:
+        """ロック待ちの上限を短く設定し、取得できるまで繰り返してテーブル名を変更する。
+
+        ALTER TABLEがACCESS EXCLUSIVEロックの取得を待っている間は、後から来た
+        検索もその後ろで待たされる。検索を待たせる時間がConfig.SWAP_LOCK_TIMEOUT
+        ミリ秒を超えないよう、取得できない場合はセーブポイントまで戻し、間隔を
+        空けてやり直す。
+
+        Args:
+            renames (list of tuples): 変更前と変更後のテーブル名のタプルのリスト
+
+        Raises:
+            DataError: 繰り返してもロックを取得できない場合などテーブル名を変更
+                できない場合
+
+        """
+        attempts = max(1, Config.SWAP_LOCK_RETRIES)
+        try:
+            for attempt in range(attempts):
+                self.__cursor.execute("SAVEPOINT rename_tables;")
+                try:
+                    self.__cursor.execute(
+                        "SET LOCAL lock_timeout = %s;",
+                        (str(Config.SWAP_LOCK_TIMEOUT) + "ms",),
+                    )
+                    for old_name, new_name in renames:
+                        self.__cursor.execute(
+                            "ALTER TABLE " + old_name + " RENAME TO " + new_name + ";"
+                        )
+                except psycopg2.errors.LockNotAvailable as e:
+                    self.__cursor.execute("ROLLBACK TO SAVEPOINT rename_tables;")
+                    if attempt + 1 == attempts:
+                        raise DataError(e.args[0])
+                    # 他のプロセスと同時にやり直さないよう、待つ時間をばらつかせる。
+                    time.sleep(
+                        min(0.05 * 2**attempt, 1.0) * random.uniform(0.5, 1.5)
+                    )
+                    continue
+                self.__cursor.execute("RELEASE SAVEPOINT rename_tables;")
+                # コミットまでの処理には短いロック待ちの上限を使わない。
+                self.__cursor.execute("SET LOCAL lock_timeout = DEFAULT;")
+                return
+        except (psycopg2.OperationalError, psycopg2.ProgrammingError) as e:
+            raise DataError(e.args[0])
+
+    def swap_staging(self) -> None:
+        """
+        ステージングテーブルを稼働中のテーブルと入れ替える。
+
+        入れ替え前のテーブルはrollback_importで戻せるように残しておく。
+        テーブル名の変更だけを行うので、呼び出し元は直後にコミットしてロックを
+        保持する時間を短くすること。
+
+        """
+        self._execute("DROP TABLE IF EXISTS " + self.previous_table_name + ";")
+        self._rename_tables(
+            [
+                (self.__table_name, self.previous_table_name),
+                (self.staging_table_name, self.__table_name),
+            ]
+        )
+        self._info_log(
+            self.staging_table_name
+            + "テーブルを"
+            + self.__table_name
+            + "テーブルと入れ替えました。"
+        )
+
+    def rollback_import(self) -> None:
+        """稼働中のテーブルを直前のインポート前のテーブルと入れ替える。"""
+        rollback_table_name = self.__table_name + "_rollback"
+        self._rename_tables(
+            [
+                (self.__table_name, rollback_table_name),
+                (self.previous_table_name, self.__table_name),
+                (rollback_table_name, self.previous_table_name),
+            ]
+        )
+        self._info_log(self.__table_name + "テーブルを直前のデータに戻しました。")
+
     def create(self, aed_installation_location: AEDInstallationLocation) -> bool:
         """データベースへAED設置場所データを保存
 
@@ -189,13 +1039,7 @@ class AEDInstallationLocationService:
                 全件のリスト
 
         """
-        state = (
-            "SELECT area,location_id,location_name,postal_code,address,phone_number,"
-            + "available_time,installation_floor,latitude,longitude FROM "
-            + self.__table_name
-            + " ORDER BY location_id;"
-        )
-        self._execute(state)
+        self._execute_statement("get_all")
         return self._get_objects()
 
     def find_by_location_id(self, location_id) -> list:
@@ -210,13 +1054,7 @@ class AEDInstallationLocationService:
                 AED設置場所データ
 
         """
-        state = (
-            "SELECT area,location_id,location_name,postal_code,address,phone_number,"
-            + "available_time,installation_floor,latitude,longitude FROM "
-            + self.__table_name
-            + " WHERE location_id=%s;"
-        )
-        self._execute(state, (str(location_id),))
+        self._execute_statement("find_by_location_id", (str(location_id),))
         return self._get_objects()
 
     def find_by_location_name(self, location_name, page: int = 1) -> dict:
@@ -233,12 +1071,7 @@ class AEDInstallationLocationService:
 
         """
         location_name = "%" + location_name + "%"
-        count_state = (
-            "SELECT count(location_name) FROM "
-            + self.__table_name
-            + " WHERE location_name LIKE %s;"
-        )
-        self._execute(count_state, (location_name,))
+        self._execute_statement("count_by_location_name", (location_name,))
         row = self._fetchone()
         results_number = row["count"]
 
@@ -262,25 +1095,35 @@ class AEDInstallationLocationService:
         except (TypeError, ValueError):
             raise ServiceError("検索結果のページ指定に誤りがあります。")
 
-        pagenation_option = " LIMIT " + str(max_view_results_number)
-        if 1 < page:
-            pagenation_option += " OFFSET " + str(skip_record_number)
-        pagenation_option += ";"
-
         # 指定した範囲で検索クエリを実施。
-        select_state = (
-            "SELECT area,location_id,location_name,postal_code,address,phone_number,"
-            + "available_time,installation_floor,latitude,longitude FROM "
-            + self.__table_name
-            + " WHERE location_name LIKE %s ORDER BY location_id"
+        self._execute_statement(
+            "find_by_location_name",
+            (location_name, max_view_results_number, skip_record_number),
         )
-        self._execute(select_state + pagenation_option, (location_name,))
         return {
             "all_results_number": results_number,
             "max_page": max_page,
             "pagenated_results_body": self._get_objects(),
         }
 
+    def find_by_location_ids(self, location_ids: list) -> list:
+        """
+        複数のAED設置場所連番から該当するAED設置場所データを返す。
+
+        Args:
+            location_ids (list of int): AED設置場所連番のリスト
+
+        Returns
+            locations (list of obj:`AEDInstallationLocation`): AED設置場所
+                オブジェクトのリスト
+
+        """
+        self._execute_statement(
+            "find_by_location_ids",
+            ([int(location_id) for location_id in location_ids],),
+        )
+        return self._get_objects()
+
     def get_area_names(self) -> list:
         """
         AED設置場所の住所の町域一覧を返す。
@@ -289,9 +1132,8 @@ class AEDInstallationLocationService:
             area_names (list): AED設置場所の住所の町域のリスト
 
         """
-        state = "SELECT DISTINCT ON (area) area FROM " + self.__table_name + ";"
         area_names = list()
-        self._execute(state)
+        self._execute_statement("get_area_names")
         for row in self._fetchall():
             area_names.append(row["area"])
         return area_names
@@ -308,49 +1150,74 @@ class AEDInstallationLocationService:
                 AED設置場所オブジェクトのリスト
 
         """
-        state = (
-            "SELECT area,location_id,location_name,postal_code,address,phone_number,"
-            + "available_time,installation_floor,latitude,longitude FROM "
-            + self.__table_name
-            + " WHERE area=%s ORDER BY location_id;"
-        )
-        self._execute(state, (area_name,))
+        self._execute_statement("find_by_area_name", (area_name,))
         return self._get_objects()
 
-    def get_near_locations(self, current_location: CurrentLocation) -> list:
+    def iter_all(self) -> Iterator[AEDInstallationLocation]:
+        """AED設置場所全件データをサーバー側のカーソルで1件ずつ返す。"""
+        return self._iter_statement("get_all")
+
+    def iter_by_area_name(self, area_name) -> Iterator[AEDInstallationLocation]:
         """
-        現在地から直線距離で最も近いAED設置場所上位5件のAED設置場所データのリストを返す。
+        町域名から検索したAED設置場所データをサーバー側のカーソルで1件ずつ返す。
 
         Args:
-            current_location (obj:`CurrentLocation`): 現在地の緯度経度情報を持つ
-                オブジェクト
+            area_name (str): 町域名
+
+        """
+        return self._iter_statement("find_by_area_name", (str(area_name),))
+
+    def count_by_area_name(self, area_name) -> int:
+        """
+        指定した町域のAED設置場所の件数を返す。
+
+        Args:
+            area_name (str): 町域名
 
         Returns:
-            near_locations (list of dicts): 現在地から最も近いAED設置場所上位5件の
-                AED設置場所オブジェクトと順位、現在地までの距離（キロメートルに換算し
-                小数点第3位を切り上げ）を要素に持つ辞書のリスト
+            count (int): AED設置場所の件数
 
         """
-        locations = list()
-        for location in self.get_all():
-            locations.append(
-                {
-                    "order": None,
-                    "location": location,
-                    "distance": current_location.get_distance_to(location),
-                }
-            )
-        near_locations = sorted(locations, key=lambda x: x["distance"])[:5]
-        for i in range(len(near_locations)):
-            # 現在地から近い順で連番を付与する。
-            near_locations[i]["order"] = i + 1
-            # 距離を分かりやすくするためキロメートルに変換する。
-            near_locations[i]["distance"] = float(
-                Decimal(str(near_locations[i]["distance"] / 1000)).quantize(
-                    Decimal("0.01"), rounding=ROUND_HALF_UP
-                )
-            )
-        return near_locations
+        self._execute_statement("count_by_area_name", (str(area_name),))
+        return self._fetchone()["count"]
+
+    def find_by_bounding_box(
+        self, south: float, west: float, north: float, east: float
+    ) -> list:
+        """
+        緯度経度で指定した矩形の範囲内にあるAED設置場所を検索する。
+
+        Args:
+            south (float): 南端の緯度
+            west (float): 西端の経度
+            north (float): 北端の緯度
+            east (float): 東端の経度
+
+        Returns:
+            locations (list of obj:`AEDInstallationLocation`): 範囲内のAED設置場所
+                オブジェクトのリスト
+
+        """
+        self._execute_statement("find_by_bounding_box", (south, north, west, east))
+        return self._get_objects()
+
+    def iter_by_bounding_box(
+        self, south: float, west: float, north: float, east: float
+    ) -> Iterator[AEDInstallationLocation]:
+        """
+        緯度経度で指定した矩形の範囲内にあるAED設置場所をサーバー側のカーソルで
+        1件ずつ返す。
+
+        Args:
+            south (float): 南端の緯度
+            west (float): 西端の経度
+            north (float): 北端の緯度
+            east (float): 東端の経度
+
+        """
+        return self._iter_statement(
+            "find_by_bounding_box", (south, north, west, east)
+        )
 
     def get_last_updated(self) -> Optional[datetime]:
         """テーブルの最終更新日を返す。
@@ -359,9 +1226,280 @@ class AEDInstallationLocationService:
             last_updated (:obj:`datetime'): テーブルのupdatedカラムで一番最新の
                 値を返す。
         """
-        self._execute("SELECT max(updated_at) FROM " + self.__table_name + ";")
+        self._execute_statement("get_last_updated")
         row = self._fetchone()
         if row["max"] is None:
             return None
         else:
             return row["max"]
+
+    def create_dataset_version(self, checksum: str) -> int:
+        """現在のデータセットのバージョンを取り込み元のチェックサムと共に記録する。
+
+        Args:
+            checksum (str): 取り込んだオープンデータのCSVのSHA-256ハッシュ値
+
+        Returns:
+            version (int): 記録したデータセットのバージョン
+
+        """
+        version = self.get_dataset_version()
+        state = (
+            "INSERT INTO "
+            + self.__versions_table_name
+            + " (version,checksum,imported_at) VALUES (%s,%s,%s)"
+            + " ON CONFLICT(version) DO UPDATE SET checksum=%s,imported_at=%s;"
+        )
+        imported_at = datetime.now(timezone(timedelta(hours=+9)))
+        self._execute(state, (version, checksum, imported_at, checksum, imported_at))
+        return version
+
+    def record_changes(self, version: int) -> int:
+        """
+        入れ替え前のテーブルと比べて追加、更新、削除されたAED設置場所連番を
+        変更履歴に記録する。
+
+        swap_stagingをコミットしてロックを解放した後に、create_dataset_versionと
+        同じ別のトランザクションで呼び出す。入れ替え前のテーブルのバージョンを
+        比較元として記録し、古いバージョンの変更履歴は削除する。
+
+        Args:
+            version (int): 記録するデータセットのバージョン
+
+        Returns:
+            count (int): 記録した変更の件数
+
+        """
+        base_version = self.get_previous_version()
+        columns = [
+            "area",
+            "location_name",
+            "postal_code",
+            "address",
+            "phone_number",
+            "available_time",
+            "installation_floor",
+            "latitude",
+            "longitude",
+        ]
+        self._execute(
+            "INSERT INTO "
+            + self.__changes_table_name
+            + " (version,location_id,operation)"
+            + " SELECT %s, coalesce(c.location_id, p.location_id),"
+            + " CASE WHEN p.location_id IS NULL THEN 'I'"
+            + " WHEN c.location_id IS NULL THEN 'D' ELSE 'U' END"
+            + " FROM "
+            + self.__table_name
+            + " c FULL OUTER JOIN "
+            + self.previous_table_name
+            + " p ON c.location_id = p.location_id"
+            + " WHERE p.location_id IS NULL OR c.location_id IS NULL OR ("
+            + ",".join("c." + column for column in columns)
+            + ") IS DISTINCT FROM ("
+            + ",".join("p." + column for column in columns)
+            + ") ON CONFLICT DO NOTHING;",
+            (version,),
+        )
+        count = self.__cursor.rowcount
+        self._execute(
+            "UPDATE "
+            + self.__versions_table_name
+            + " SET base_version=%s WHERE version=%s;",
+            (base_version, version),
+        )
+        self._execute(
+            "DELETE FROM "
+            + self.__changes_table_name
+            + " WHERE version NOT IN (SELECT version FROM "
+            + self.__versions_table_name
+            + " ORDER BY imported_at DESC LIMIT %s);",
+            (Config.CHANGES_MAX_VERSIONS,),
+        )
+        self._info_log(
+            "データセットの変更履歴を記録しました。（" + str(count) + "件）"
+        )
+        return count
+
+    def get_previous_version(self) -> int:
+        """入れ替え前のテーブルのデータセットのバージョンを返す。
+
+        Returns:
+            version (int): データセットのバージョン。データがない場合は0を返す。
+
+        """
+        self._execute(
+            "SELECT max(updated_at) FROM " + self.previous_table_name + ";"
+        )
+        previous_updated = self._fetchone()["max"]
+        return 0 if previous_updated is None else int(previous_updated.timestamp())
+
+    def store_neighbors(
+        self, version: int, neighbors: list, keep_version: Optional[int] = None
+    ) -> int:
+        """
+        AED設置場所ごとに近い他のAED設置場所を記録し、記録したバージョンと
+        keep_version以外のバージョンの記録を削除する。
+
+        Args:
+            version (int): データセットのバージョン
+            neighbors (list of tuples): AED設置場所連番、順位、近いAED設置場所
+                連番、距離（メートル）のタプルのリスト
+            keep_version (int): 残すもう一つのバージョン。省略時は入れ替え前の
+                テーブルのバージョンを残す。入れ替える前のステージングテーブルの
+                分を記録する場合は、稼働中のテーブルのバージョンを指定する。
+
+        Returns:
+            count (int): 記録した件数
+
+        """
+        self._execute(
+            "DELETE FROM " + self.__neighbors_table_name + " WHERE version=%s;",
+            (version,),
+        )
+        try:
+            execute_values(
+                self.__cursor,
+                "INSERT INTO "
+                + self.__neighbors_table_name
+                + " (version,location_id,rank,neighbor_id,distance) VALUES %s;",
+                [(version,) + tuple(neighbor) for neighbor in neighbors],
+                page_size=1000,
+            )
+        except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+            raise DataError(e.args[0])
+        # ロールバックで戻せるよう、入れ替え前のテーブルのバージョンは残す。
+        if keep_version is None:
+            keep_version = self.get_previous_version()
+        self._execute(
+            "DELETE FROM "
+            + self.__neighbors_table_name
+            + " WHERE version NOT IN (%s,%s);",
+            (version, keep_version),
+        )
+        self._info_log(
+            "近いAED設置場所を記録しました。（" + str(len(neighbors)) + "件）"
+        )
+        return len(neighbors)
+
+    def notify_dataset_version(self, version: int, channel: str) -> None:
+        """データセットのバージョンを待ち受けているワーカーへ通知する。
+
+        通知はコミットした時に送られる。
+
+        Args:
+            version (int): データセットのバージョン
+            channel (str): 通知するチャンネル
+
+        """
+        self._execute("SELECT pg_notify(%s, %s);", (channel, str(version)))
+        self._info_log(
+            "データセットのバージョン" + str(version) + "を通知しました。"
+        )
+
+    def get_neighbors(self, version: int, location_id: int) -> list:
+        """インポート時に求めた、AED設置場所から近い他のAED設置場所を返す。
+
+        Args:
+            version (int): データセットのバージョン
+            location_id (int): AED設置場所連番
+
+        Returns:
+            neighbors (list of tuples): 近い順のAED設置場所オブジェクトと距離
+                （メートル）のタプルのリスト
+
+        """
+        self._execute_statement("find_neighbors", (version, location_id))
+        neighbors = list()
+        for row in self._fetchall():
+            row = dict(row)
+            distance = row.pop("distance")
+            neighbors.append((AEDInstallationLocation(**row), distance))
+        return neighbors
+
+    def get_neighbor_rows(self, version: int) -> list:
+        """記録している近いAED設置場所を全て返す。
+
+        Args:
+            version (int): データセットのバージョン
+
+        Returns:
+            neighbors (list of tuples): AED設置場所連番、順位、近いAED設置場所
+                連番、距離（メートル）のタプルのリスト
+
+        """
+        self._execute(
+            "SELECT location_id, rank, neighbor_id, distance FROM "
+            + self.__neighbors_table_name
+            + " WHERE version=%s ORDER BY location_id, rank;",
+            (version,),
+        )
+        return [tuple(row) for row in self._fetchall()]
+
+    def get_version_history(self) -> dict:
+        """データセットのバージョンごとに、変更履歴の比較元のバージョンを返す。
+
+        Returns:
+            history (dict): バージョンをキー、比較元のバージョンを値に持つ辞書
+
+        """
+        self._execute(
+            "SELECT version, base_version FROM "
+            + self.__versions_table_name
+            + " WHERE base_version IS NOT NULL;"
+        )
+        return {row["version"]: row["base_version"] for row in self._fetchall()}
+
+    def get_changed_location_ids(self, versions: list) -> list:
+        """指定したバージョンで追加、更新、削除されたAED設置場所連番を返す。
+
+        Args:
+            versions (list of int): データセットのバージョンのリスト
+
+        Returns:
+            location_ids (list of int): AED設置場所連番のリスト
+
+        """
+        self._execute(
+            "SELECT DISTINCT location_id FROM "
+            + self.__changes_table_name
+            + " WHERE version = ANY(%s) ORDER BY location_id;",
+            ([int(version) for version in versions],),
+        )
+        return [row["location_id"] for row in self._fetchall()]
+
+    def get_change_log(self) -> list:
+        """記録している全ての変更履歴を返す。
+
+        Returns:
+            changes (list of tuples): バージョン、AED設置場所連番、変更の種類
+                （I：追加、U：更新、D：削除）のタプルのリスト
+
+        """
+        self._execute(
+            "SELECT version, location_id, operation FROM "
+            + self.__changes_table_name
+            + " ORDER BY version, location_id;"
+        )
+        return [
+            (row["version"], row["location_id"], row["operation"])
+            for row in self._fetchall()
+        ]
+
+    def get_last_checksum(self) -> Optional[str]:
+        """最後に取り込んだオープンデータのチェックサムを返す。
+
+        Returns:
+            checksum (str): CSVのSHA-256ハッシュ値。記録がない場合はNoneを返す。
+
+        """
+        self._execute(
+            "SELECT checksum FROM "
+            + self.__versions_table_name
+            + " ORDER BY imported_at DESC LIMIT 1;"
+        )
+        row = self._fetchone()
+        if row is None:
+            return None
+        else:
+            return row["checksum"]
@@ -0,0 +1,563 @@
+import hashlib
+import os
+import socket
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from abc import ABCMeta, abstractmethod
+from typing import Callable, Optional
+from urllib.parse import unquote, urlparse
+
+from ash_aed.export import FIELDS
+from ash_aed.logs import AppLog
+from ash_aed.models import AEDInstallationLocation
+
+# 符号化したデータをzlibで圧縮するバイト数の下限
+COMPRESS_MIN_SIZE = 1024
+# 符号化したデータの先頭に付ける、圧縮の有無を表す値
+PLAIN = b"\x00"
+COMPRESSED = b"\x01"
+
+
+def _encode(value, chunks: list) -> None:
+    """値を型を表す1バイトと内容のバイト列にしてchunksへ追加する。"""
+    if value is None:
+        chunks.append(b"N")
+    elif value is True:
+        chunks.append(b"T")
+    elif value is False:
+        chunks.append(b"F")
+    elif isinstance(value, int):
+        chunks.append(b"i" + struct.pack(">q", value))
+    elif isinstance(value, float):
+        chunks.append(b"f" + struct.pack(">d", value))
+    elif isinstance(value, str):
+        data = value.encode("utf-8")
+        chunks.append(b"s" + struct.pack(">I", len(data)) + data)
+    elif isinstance(value, (bytes, bytearray)):
+        chunks.append(b"b" + struct.pack(">I", len(value)) + bytes(value))
+    elif isinstance(value, AEDInstallationLocation):
+        # 項目名を持たず、書き出す項目の順に値だけを並べる。
+        chunks.append(b"A")
+        for field in FIELDS:
+            _encode(getattr(value, field), chunks)
+    elif isinstance(value, (list, tuple)):
+        chunks.append(
+            (b"l" if isinstance(value, list) else b"t") + struct.pack(">I", len(value))
+        )
+        for item in value:
+            _encode(item, chunks)
+    elif isinstance(value, dict):
+        chunks.append(b"d" + struct.pack(">I", len(value)))
+        for key, item in value.items():
+            _encode(key, chunks)
+            _encode(item, chunks)
+    else:
+        raise TypeError("共有キャッシュに保存できない型です。" + type(value).__name__)
+
+
+def _decode(data: memoryview, offset: int) -> tuple:
+    """_encodeで符号化した値を1つ読み、値と次の位置を返す。"""
+    tag = bytes(data[offset : offset + 1])
+    offset += 1
+    if tag == b"N":
+        return None, offset
+    if tag == b"T":
+        return True, offset
+    if tag == b"F":
+        return False, offset
+    if tag == b"i":
+        return struct.unpack_from(">q", data, offset)[0], offset + 8
+    if tag == b"f":
+        return struct.unpack_from(">d", data, offset)[0], offset + 8
+    if tag in (b"s", b"b"):
+        (length,) = struct.unpack_from(">I", data, offset)
+        offset += 4
+        value = bytes(data[offset : offset + length])
+        return (value.decode("utf-8") if tag == b"s" else value), offset + length
+    if tag == b"A":
+        row = dict()
+        for field in FIELDS:
+            row[field], offset = _decode(data, offset)
+        return AEDInstallationLocation(**row), offset
+    if tag in (b"l", b"t", b"d"):
+        (length,) = struct.unpack_from(">I", data, offset)
+        offset += 4
+        if tag == b"d":
+            items = dict()
+            for _ in range(length):
+                key, offset = _decode(data, offset)
+                items[key], offset = _decode(data, offset)
+            return items, offset
+        items = list()
+        for _ in range(length):
+            item, offset = _decode(data, offset)
+            items.append(item)
+        return (items if tag == b"l" else tuple(items)), offset
+    raise ValueError("共有キャッシュのデータが正しくありません。")
+
+
+def dumps(value) -> bytes:
+    """
+    値を共有キャッシュに保存するバイト列にする。
+
+    None、真偽値、整数、浮動小数点数、文字列、バイト列、リスト、タプル、辞書と
+    AED設置場所データを扱える。大きなデータはzlibで圧縮する。
+
+    Args:
+        value (object): 保存する値
+
+    Returns:
+        data (bytes): 符号化したデータ
+
+    """
+    chunks = list()
+    _encode(value, chunks)
+    data = b"".join(chunks)
+    if COMPRESS_MIN_SIZE <= len(data):
+        compressed = zlib.compress(data, 6)
+        if len(compressed) < len(data):
+            return COMPRESSED + compressed
+    return PLAIN + data
+
+
+def loads(data: bytes):
+    """dumpsで符号化したデータを値に戻す。
+
+    Args:
+        data (bytes): 符号化したデータ
+
+    Returns:
+        value (object): 保存した値
+
+    """
+    if data[:1] == COMPRESSED:
+        data = zlib.decompress(data[1:])
+    else:
+        data = data[1:]
+    value, offset = _decode(memoryview(data), 0)
+    if offset != len(data):
+        raise ValueError("共有キャッシュのデータが正しくありません。")
+    return value
+
+
+class CacheBackend(metaclass=ABCMeta):
+    """共有キャッシュの保存先の抽象クラス。"""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        """キーのデータを返す。ない場合や期限切れの場合はNoneを返す。"""
+        pass
+
+    @abstractmethod
+    def set(self, key: str, data: bytes, ttl: float) -> None:
+        """キーのデータをttl秒の期限付きで保存する。"""
+        pass
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """キーのデータを削除する。"""
+        pass
+
+    @abstractmethod
+    def count(self) -> int:
+        """保存している件数を返す。"""
+        pass
+
+
+class LocalCacheBackend(CacheBackend):
+    """
+    同じホストのワーカーで共有する、メモリ上のファイルシステムに置いたSQLite
+    データベースの保存先。
+
+    プロセス間の排他はSQLiteに任せる。接続はスレッドごとに開き、forkした
+    子プロセスでは開き直す。
+
+    Attributes:
+        path (str): データベースファイルのパス
+
+    """
+
+    # 期限切れのデータを削除する間隔（保存の回数）
+    PURGE_INTERVAL = 256
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 100000):
+        """
+        Args:
+            path (str): データベースファイルのパス。省略時は/dev/shm（ない場合は
+                一時ディレクトリ）に置く。
+            max_entries (int): 保存する件数の上限。超えた分は期限の近いものから
+                削除する。
+
+        """
+        if path is None:
+            directory = (
+                "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+            )
+            path = os.path.join(directory, "ash_aed_cache.sqlite3")
+        self.__path = path
+        self.__max_entries = int(max_entries)
+        self.__local = threading.local()
+        self.__sets = 0
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """このスレッドの接続を返す。"""
+        pid = os.getpid()
+        if getattr(self.__local, "pid", None) != pid:
+            connection = sqlite3.connect(self.__path, timeout=1.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL;")
+            connection.execute("PRAGMA synchronous=OFF;")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                + "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL"
+                + ") WITHOUT ROWID;"
+            )
+            self.__local.connection = connection
+            self.__local.pid = pid
+        return self.__local.connection
+
+    def get(self, key: str) -> Optional[bytes]:
+        cursor = self._get_connection().execute(
+            "SELECT value FROM cache WHERE key=? AND ?<expires;", (key, time.time())
+        )
+        row = cursor.fetchone()
+        return None if row is None else row[0]
+
+    def set(self, key: str, data: bytes, ttl: float) -> None:
+        connection = self._get_connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO cache (key,value,expires) VALUES (?,?,?);",
+            (key, data, time.time() + ttl),
+        )
+        self.__sets += 1
+        if self.__sets % self.PURGE_INTERVAL == 0:
+            self.purge()
+
+    def delete(self, key: str) -> None:
+        self._get_connection().execute("DELETE FROM cache WHERE key=?;", (key,))
+
+    def count(self) -> int:
+        row = self._get_connection().execute("SELECT count(*) FROM cache;").fetchone()
+        return row[0]
+
+    def purge(self) -> None:
+        """期限切れのデータと、上限を超えた分のデータを削除する。"""
+        connection = self._get_connection()
+        connection.execute("DELETE FROM cache WHERE expires<=?;", (time.time(),))
+        connection.execute(
+            "DELETE FROM cache WHERE key IN ("
+            + "SELECT key FROM cache ORDER BY expires DESC LIMIT -1 OFFSET ?);",
+            (self.__max_entries,),
+        )
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    複数のホストで共有する、Redis互換のキーバリューストアの保存先。
+
+    RESPプロトコルで通信する最小限のクライアントで、GET、SET（PX）、DEL、
+    DBSIZEだけを使う。接続はスレッドごとに開き、forkした子プロセスでは
+    開き直す。
+
+    Attributes:
+        url (str): 接続先のURL（redis://[:パスワード@]ホスト:ポート/DB番号）
+
+    """
+
+    def __init__(self, url: str, timeout: float = 0.5):
+        """
+        Args:
+            url (str): 接続先のURL
+            timeout (float): 接続と応答を待つ秒数の上限
+
+        """
+        parsed = urlparse(url)
+        if parsed.scheme != "redis" or not parsed.hostname:
+            raise ValueError("共有キャッシュの接続先が正しくありません。" + url)
+        self.__url = url
+        self.__address = (parsed.hostname, parsed.port or 6379)
+        self.__password = unquote(parsed.password) if parsed.password else None
+        self.__database = int(parsed.path.lstrip("/") or 0)
+        self.__timeout = float(timeout)
+        self.__local = threading.local()
+
+    @property
+    def url(self) -> str:
+        return self.__url
+
+    def _connect(self) -> tuple:
+        """接続し、必要ならば認証とデータベースの選択を行う。"""
+        sock = socket.create_connection(self.__address, self.__timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.__local.pid = os.getpid()
+        self.__local.sock = sock
+        self.__local.reader = sock.makefile("rb")
+        if self.__password is not None:
+            self._command(b"AUTH", self.__password)
+        if self.__database:
+            self._command(b"SELECT", str(self.__database))
+        return sock, self.__local.reader
+
+    def _close(self) -> None:
+        """このスレッドの接続を閉じる。"""
+        sock = getattr(self.__local, "sock", None)
+        if sock is not None:
+            self.__local.reader.close()
+            sock.close()
+        self.__local.sock = None
+        self.__local.pid = None
+
+    def _command(self, *arguments):
+        """コマンドを送り、応答を返す。
+
+        Raises:
+            ConnectionError: 通信できない場合やエラーが返された場合
+
+        """
+        chunks = [b"*" + str(len(arguments)).encode() + b"\r\n"]
+        for argument in arguments:
+            if isinstance(argument, str):
+                argument = argument.encode("utf-8")
+            chunks.append(
+                b"$" + str(len(argument)).encode() + b"\r\n" + argument + b"\r\n"
+            )
+        try:
+            if getattr(self.__local, "pid", None) != os.getpid() or not getattr(
+                self.__local, "sock", None
+            ):
+                self._connect()
+            self.__local.sock.sendall(b"".join(chunks))
+            return self._read_reply()
+        except (OSError, ValueError) as e:
+            # 応答の途中で失敗した接続は使い回さない。
+            self._close()
+            raise ConnectionError(str(e))
+
+    def _read_reply(self):
+        """応答を1つ読む。"""
+        line = self.__local.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("共有キャッシュの接続が切断されました。")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body
+        if kind == b"-":
+            raise ValueError(body.decode("utf-8", "replace"))
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            data = self.__local.reader.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError("共有キャッシュの接続が切断されました。")
+            return data[:-2]
+        if kind == b"*":
+            length = int(body)
+            return None if length < 0 else [self._read_reply() for _ in range(length)]
+        raise ValueError("共有キャッシュの応答が正しくありません。")
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._command(b"GET", key)
+
+    def set(self, key: str, data: bytes, ttl: float) -> None:
+        self._command(b"SET", key, data, b"PX", str(max(1, int(ttl * 1000))))
+
+    def delete(self, key: str) -> None:
+        self._command(b"DEL", key)
+
+    def count(self) -> int:
+        # DBSIZEは名前空間にかかわらず、データベースの全てのキーを数える。
+        return self._command(b"DBSIZE")
+
+
+class SharedCache:
+    """
+    複数のワーカーやホストで共有するキャッシュ。
+
+    キーにはデータセットのバージョンを含めるので、データセットが切り替わると
+    古いバージョンのデータは使われなくなり、期限が来れば削除される。保存先に
+    接続できない場合はキャッシュにないものとして扱い、検索や描画を止めない。
+
+    Attributes:
+        backend (obj:`CacheBackend`): 保存先。Noneの場合は何も保存しない。
+        namespace (str): キーの先頭に付ける名前
+        ttl (float): 保存したデータの有効期間（秒）
+        stats (dict): このプロセスのヒット数、ミス数、保存先のエラー数を要素に
+            持つ辞書。保存している件数は全てのワーカーで共通なので含めない。
+
+    """
+
+    def __init__(
+        self,
+        backend: Optional[CacheBackend],
+        namespace: str = "ash_aed",
+        ttl: float = 3600,
+    ):
+        """
+        Args:
+            backend (obj:`CacheBackend`): 保存先。Noneの場合は何も保存しない。
+            namespace (str): キーの先頭に付ける名前
+            ttl (float): 保存したデータの有効期間（秒）
+
+        """
+        self.__backend = backend
+        self.__namespace = namespace
+        self.__ttl = float(ttl)
+        self.__lock = threading.Lock()
+        self.__hits = 0
+        self.__misses = 0
+        self.__errors = 0
+        self.__logger = AppLog()
+
+    @property
+    def backend(self) -> Optional[CacheBackend]:
+        return self.__backend
+
+    @property
+    def namespace(self) -> str:
+        return self.__namespace
+
+    @property
+    def ttl(self) -> float:
+        return self.__ttl
+
+    @property
+    def enabled(self) -> bool:
+        return self.__backend is not None
+
+    @property
+    def stats(self) -> dict:
+        # メトリクスの出力ごとに保存先へ問い合わせないよう、件数は数えない。
+        with self.__lock:
+            return {
+                "hits": self.__hits,
+                "misses": self.__misses,
+                "evictions": 0,
+                "errors": self.__errors,
+            }
+
+    def get_key(self, version: int, name: str, key) -> str:
+        """保存先のキーを返す。
+
+        Args:
+            version (int): データセットのバージョン
+            name (str): キャッシュの種類の名前
+            key (hashable): 種類の中でデータを区別するキー
+
+        Returns:
+            key (str): 名前空間、バージョン、種類とキーのハッシュ値をつないだ文字列
+
+        """
+        digest = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()[:32]
+        return ":".join((self.__namespace, str(version), name, digest))
+
+    def _on_error(self, error: Exception) -> None:
+        with self.__lock:
+            self.__errors += 1
+        self.__logger.warning("共有キャッシュを使用できません。" + str(error))
+
+    def get(self, version: int, name: str, key):
+        """データを返す。
+
+        Args:
+            version (int): データセットのバージョン
+            name (str): キャッシュの種類の名前
+            key (hashable): 種類の中でデータを区別するキー
+
+        Returns:
+            value (object): 保存した値。ない場合はNoneを返す。
+
+        """
+        if self.__backend is None:
+            return None
+        try:
+            data = self.__backend.get(self.get_key(version, name, key))
+            value = None if data is None else loads(data)
+        except (
+            ConnectionError,
+            sqlite3.Error,
+            ValueError,
+            struct.error,
+            zlib.error,
+        ) as e:
+            self._on_error(e)
+            value = None
+        with self.__lock:
+            if value is None:
+                self.__misses += 1
+            else:
+                self.__hits += 1
+        return value
+
+    def set(self, version: int, name: str, key, value, ttl: Optional[float] = None):
+        """データを保存する。
+
+        Args:
+            version (int): データセットのバージョン
+            name (str): キャッシュの種類の名前
+            key (hashable): 種類の中でデータを区別するキー
+            value (object): 保存する値
+            ttl (float): 有効期間（秒）。省略時はttl属性の値
+
+        """
+        if self.__backend is None or value is None:
+            return
+        try:
+            self.__backend.set(
+                self.get_key(version, name, key),
+                dumps(value),
+                self.__ttl if ttl is None else ttl,
+            )
+        except (ConnectionError, sqlite3.Error) as e:
+            self._on_error(e)
+
+    def get_or_set(self, version: int, name: str, key, function: Callable[[], object]):
+        """データを返し、ない場合は関数で求めて保存する。
+
+        Args:
+            version (int): データセットのバージョン
+            name (str): キャッシュの種類の名前
+            key (hashable): 種類の中でデータを区別するキー
+            function (callable): 引数を取らず値を返す関数
+
+        Returns:
+            value (object): 保存した値または求めた値
+
+        """
+        value = self.get(version, name, key)
+        if value is None:
+            value = function()
+            self.set(version, name, key, value)
+        return value
+
+
+def create_shared_cache(url: str, ttl: float = 3600) -> SharedCache:
+    """設定から共有キャッシュを作成する。
+
+    Args:
+        url (str): 保存先。空の場合は共有しない。localの場合は同じホストの
+            ワーカーで、redis://で始まる場合はRedis互換のサーバーで共有する。
+        ttl (float): 保存したデータの有効期間（秒）
+
+    Returns:
+        shared_cache (obj:`SharedCache`): 共有キャッシュ
+
+    """
+    if not url:
+        backend = None
+    elif url == "local":
+        backend = LocalCacheBackend()
+    elif url.startswith("local:"):
+        backend = LocalCacheBackend(url[len("local:") :])
+    else:
+        backend = RedisCacheBackend(url)
+    return SharedCache(backend, ttl=ttl)
@@ -0,0 +1,211 @@
+import asyncio
+import threading
+from typing import Awaitable, Callable, Hashable, Optional
+
+from ash_aed.logs import AppLog
+
+
+class _Call:
+    """実行中の処理1つ分の結果を、待っているスレッドへ渡す。"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    同じキーの処理が同時に要求されたときに、最初の1つだけを実行し、他の
+    スレッドはその結果を待って共有する。
+
+    データセットの切り替え直後に全てのリクエストが同時にキャッシュを外しても、
+    データベースへの問い合わせや描画はキーごとに1回で済む。実行した処理で
+    例外が発生した場合は、待っていたスレッドでも同じ例外を発生させる。結果は
+    保持しないので、次の要求では改めて実行する。
+
+    Attributes:
+        timeout (float): 他のスレッドの処理を待つ秒数の上限。Noneの場合は
+            終わるまで待つ。
+        stats (dict): 要求数、結果を共有した数、待ちきれずに自分で実行した数を
+            要素に持つ辞書
+
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        """
+        Args:
+            timeout (float): 他のスレッドの処理を待つ秒数の上限
+
+        """
+        self.__timeout = timeout
+        self.__calls = dict()
+        self.__lock = threading.Lock()
+        self.__requests = 0
+        self.__shared = 0
+        self.__timeouts = 0
+        self.__logger = AppLog()
+
+    @property
+    def timeout(self) -> Optional[float]:
+        return self.__timeout
+
+    @property
+    def stats(self) -> dict:
+        with self.__lock:
+            return {
+                "requests": self.__requests,
+                "shared": self.__shared,
+                "timeouts": self.__timeouts,
+                "in_flight": len(self.__calls),
+            }
+
+    def do(self, key: Hashable, function: Callable[[], object]) -> tuple:
+        """キーの処理を実行するか、実行中の処理の結果を待つ。
+
+        待つ時間が上限を超えた場合は、実行中の処理とは別に自分で実行する。
+
+        Args:
+            key (hashable): 処理を区別するキー
+            function (callable): 引数を取らず結果を返す関数
+
+        Returns:
+            value (object): 処理の結果
+            shared (bool): 他のスレッドが実行した結果の場合は真
+
+        Raises:
+            Exception: 処理で発生した例外
+
+        """
+        with self.__lock:
+            self.__requests += 1
+            call = self.__calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self.__calls[key] = call
+
+        if not leader:
+            if call.event.wait(self.__timeout):
+                with self.__lock:
+                    self.__shared += 1
+                if call.error is not None:
+                    raise call.error
+                return call.value, True
+            with self.__lock:
+                self.__timeouts += 1
+            self.__logger.warning(
+                "実行中の処理が" + str(self.__timeout) + "秒で終わらないため、"
+                "結果を待たずに実行します。" + repr(key)
+            )
+            return function(), False
+
+        try:
+            call.value = function()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.__lock:
+                del self.__calls[key]
+            call.event.set()
+        return call.value, False
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlightのasyncio版。同じキーの処理が同時に要求されたときに、最初の
+    1つだけを実行し、他のタスクはその結果を待って共有する。
+
+    イベントループを止めないよう、待つ側はスレッドではなくFutureを待つ。
+    Futureはイベントループごとに作られるので、1つのイベントループから使う。
+
+    Attributes:
+        timeout (float): 他のタスクの処理を待つ秒数の上限。Noneの場合は
+            終わるまで待つ。
+        stats (dict): 要求数、結果を共有した数、待ちきれずに自分で実行した数を
+            要素に持つ辞書
+
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        """
+        Args:
+            timeout (float): 他のタスクの処理を待つ秒数の上限
+
+        """
+        self.__timeout = timeout
+        self.__calls = dict()
+        self.__requests = 0
+        self.__shared = 0
+        self.__timeouts = 0
+        self.__logger = AppLog()
+
+    @property
+    def timeout(self) -> Optional[float]:
+        return self.__timeout
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "requests": self.__requests,
+            "shared": self.__shared,
+            "timeouts": self.__timeouts,
+            "in_flight": len(self.__calls),
+        }
+
+    async def do(self, key: Hashable, function: Callable[[], Awaitable]) -> tuple:
+        """キーの処理を実行するか、実行中の処理の結果を待つ。
+
+        待つ時間が上限を超えた場合は、実行中の処理とは別に自分で実行する。
+
+        Args:
+            key (hashable): 処理を区別するキー
+            function (callable): 引数を取らずawaitできるオブジェクトを返す関数
+
+        Returns:
+            value (object): 処理の結果
+            shared (bool): 他のタスクが実行した結果の場合は真
+
+        Raises:
+            Exception: 処理で発生した例外
+
+        """
+        self.__requests += 1
+        future = self.__calls.get(key)
+        if future is not None:
+            try:
+                # 待っているタスクが取り消されても、実行中の処理は取り消さない。
+                value = await asyncio.wait_for(asyncio.shield(future), self.__timeout)
+            except asyncio.TimeoutError:
+                self.__timeouts += 1
+                self.__logger.warning(
+                    "実行中の処理が" + str(self.__timeout) + "秒で終わらないため、"
+                    "結果を待たずに実行します。" + repr(key)
+                )
+                return await function(), False
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # 実行していたタスクが取り消された場合は自分で実行する。
+                return await function(), False
+            self.__shared += 1
+            return value, True
+
+        future = asyncio.get_running_loop().create_future()
+        self.__calls[key] = future
+        try:
+            value = await function()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # 待っているタスクがない場合に、取り出されない例外の警告を出さない。
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+        finally:
+            del self.__calls[key]
+        return value, False
@@ -0,0 +1,225 @@
+import json
+import logging
+import os
+import random
+import re
+import threading
+from datetime import datetime, timezone
+from decimal import Decimal
+from logging.handlers import RotatingFileHandler
+from typing import Optional
+
+import psycopg2
+
+from ash_aed.config import Config
+from ash_aed.logs import get_correlation_id
+from ash_aed.metrics import registry
+
+slow_queries = registry.counter(
+    "ash_aed_slow_queries_total", "実行時間が閾値を超えたSQL文の件数"
+)
+
+# EXPLAIN ANALYZEで再実行しても副作用のないSQL文の種類
+EXPLAINABLE_KINDS = ("SELECT", "WITH")
+
+
+class SlowQueryLog:
+    """
+    実行時間が閾値を超えたSQL文を、実行計画とともにローテーションするログファイルへ
+    JSON形式で記録する。
+
+    実行計画の取得にはSQL文を再実行するEXPLAIN (ANALYZE, BUFFERS)を使うため、
+    閾値を超えたSQL文のうちsample_rateの割合だけを記録し、副作用のない
+    SELECT文以外は実行計画を取得しない。
+
+    Attributes:
+        threshold (float): 記録するSQL文の実行時間の閾値（秒）。0以下の場合は記録しない。
+        sample_rate (float): 閾値を超えたSQL文を記録する割合（0〜1）
+        path (str): ログファイルのパス
+        redact (bool): パラメータの値を伏せる場合は真
+
+    """
+
+    def __init__(
+        self,
+        threshold: float,
+        sample_rate: float = 1.0,
+        path: Optional[str] = None,
+        max_bytes: int = 10 * 1024 * 1024,
+        backup_count: int = 5,
+        redact: bool = True,
+    ):
+        """
+        Args:
+            threshold (float): 記録するSQL文の実行時間の閾値（秒）
+            sample_rate (float): 閾値を超えたSQL文を記録する割合（0〜1）
+            path (str): ログファイルのパス
+            max_bytes (int): ローテーションするログファイルの大きさ（バイト）
+            backup_count (int): 残す古いログファイルの数
+            redact (bool): パラメータの値を伏せる場合は真
+
+        """
+        self.__threshold = float(threshold)
+        self.__sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+        self.__path = path
+        self.__max_bytes = max_bytes
+        self.__backup_count = backup_count
+        self.__redact = redact
+        self.__logger = None
+        self.__lock = threading.Lock()
+
+    @property
+    def threshold(self) -> float:
+        return self.__threshold
+
+    @property
+    def sample_rate(self) -> float:
+        return self.__sample_rate
+
+    @property
+    def path(self) -> Optional[str]:
+        return self.__path
+
+    @property
+    def redact(self) -> bool:
+        return self.__redact
+
+    def _get_logger(self) -> logging.Logger:
+        """ログファイルへ書き出すロガーを初回だけ作成して返す。"""
+        if self.__logger is None:
+            with self.__lock:
+                if self.__logger is None:
+                    logger = logging.getLogger("ash_aed_slow_query." + str(id(self)))
+                    logger.setLevel(logging.INFO)
+                    logger.propagate = False
+                    directory = os.path.dirname(self.__path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    handler = RotatingFileHandler(
+                        self.__path,
+                        maxBytes=self.__max_bytes,
+                        backupCount=self.__backup_count,
+                        encoding="utf-8",
+                    )
+                    handler.setFormatter(logging.Formatter("%(message)s"))
+                    logger.addHandler(handler)
+                    self.__logger = logger
+        return self.__logger
+
+    def should_capture(self, duration: float) -> bool:
+        """SQL文を記録するかどうかを判定する。
+
+        Args:
+            duration (float): SQL文の実行時間（秒）
+
+        Returns:
+            bool: 記録する場合に真を返す
+
+        """
+        if self.__path is None or self.__threshold <= 0:
+            return False
+        if duration < self.__threshold:
+            return False
+        return random.random() < self.__sample_rate
+
+    def _redact_value(self, value):
+        """パラメータの値を、伏せる設定の場合は型名に置き換える。"""
+        if isinstance(value, (list, tuple)):
+            return [self._redact_value(item) for item in value]
+        if self.__redact and value is not None:
+            return "<" + type(value).__name__ + ">"
+        if isinstance(value, Decimal):
+            return str(value)
+        if isinstance(value, (str, int, float, bool)) or value is None:
+            return value
+        return str(value)
+
+    def redact_parameters(self, parameters) -> Optional[list]:
+        """ログに記録するパラメータを返す。
+
+        Args:
+            parameters (tuple): SQLのプレースホルダに渡した値
+
+        Returns:
+            parameters (list): 記録する値のリスト
+
+        """
+        if parameters is None:
+            return None
+        return [self._redact_value(value) for value in parameters]
+
+    @staticmethod
+    def explain(connection, sql: str, parameters) -> Optional[list]:
+        """EXPLAIN (ANALYZE, BUFFERS)で実行計画を取得する。
+
+        元のSQL文と同じトランザクションの中で、別のカーソルとセーブポイントを
+        使って実行するため、失敗しても元のトランザクションには影響しない。
+
+        Args:
+            connection (:obj:`psycopg2.connection`): 元のSQL文を実行した接続
+            sql (str): SQL文
+            parameters (tuple): SQLのプレースホルダに渡した値
+
+        Returns:
+            plan (list of str): 実行計画の各行のリスト。取得できなかった場合は
+                Noneを返す。
+
+        """
+        cursor = connection.cursor()
+        try:
+            cursor.execute("SAVEPOINT ash_aed_explain;")
+            try:
+                cursor.execute(
+                    "EXPLAIN (ANALYZE, BUFFERS) " + sql.strip().rstrip(";"),
+                    parameters or None,
+                )
+                plan = [row[0] for row in cursor.fetchall()]
+                cursor.execute("RELEASE SAVEPOINT ash_aed_explain;")
+                return plan
+            except psycopg2.Error:
+                cursor.execute("ROLLBACK TO SAVEPOINT ash_aed_explain;")
+                return None
+        except psycopg2.Error:
+            return None
+        finally:
+            cursor.close()
+
+    def capture(
+        self, connection, kind: str, sql: str, parameters, duration: float
+    ) -> dict:
+        """SQL文と実行計画をログファイルへ記録する。
+
+        Args:
+            connection (:obj:`psycopg2.connection`): SQL文を実行した接続
+            kind (str): SQL文の種類
+            sql (str): SQL文
+            parameters (tuple): SQLのプレースホルダに渡した値
+            duration (float): SQL文の実行時間（秒）
+
+        Returns:
+            record (dict): 記録した内容
+
+        """
+        slow_queries.inc(kind=kind)
+        plan = None
+        if kind in EXPLAINABLE_KINDS:
+            plan = self.explain(connection, sql, parameters)
+        record = {
+            "time": datetime.now(timezone.utc).isoformat(),
+            "correlation_id": get_correlation_id(),
+            "kind": kind,
+            "duration_ms": round(duration * 1000, 3),
+            "statement": re.sub(r"\s+", " ", sql).strip(),
+            "parameters": self.redact_parameters(parameters),
+            "plan": plan,
+        }
+        self._get_logger().info(json.dumps(record, ensure_ascii=False))
+        return record
+
+
+slow_query_log = SlowQueryLog(
+    threshold=Config.SLOW_QUERY_THRESHOLD,
+    sample_rate=Config.SLOW_QUERY_SAMPLE_RATE,
+    path=Config.SLOW_QUERY_LOG_PATH,
+    redact=Config.SLOW_QUERY_REDACT,
+)
@@ -0,0 +1,507 @@
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import urllib.parse
+from datetime import datetime
+from typing import Iterator, Optional
+
+from ash_aed.config import Config
+from ash_aed.errors import DatabaseError, DataError, ServiceError
+from ash_aed.metrics import (
+    get_statement_kind,
+    sql_duration,
+    sql_errors,
+    sql_rows_fetched
+)
+from ash_aed.models import (
+    AEDInstallationLocation,
+    AEDInstallationLocationFactory
+)
+from ash_aed.services import COLUMNS, StorageBackend
+
+# SQLiteファイルのテーブル定義。R*Treeは緯度経度の範囲検索に、FTS5は名称の
+# 部分一致検索に使う。
+SCHEMA = (
+    "CREATE TABLE locations ("
+    + "location_id INTEGER PRIMARY KEY,"
+    + "area TEXT NOT NULL,"
+    + "location_name TEXT NOT NULL,"
+    + "postal_code TEXT,"
+    + "address TEXT NOT NULL,"
+    + "phone_number TEXT,"
+    + "available_time TEXT,"
+    + "installation_floor TEXT,"
+    + "latitude REAL NOT NULL,"
+    + "longitude REAL NOT NULL"
+    + ");",
+    "CREATE INDEX locations_area ON locations (area);",
+    "CREATE VIRTUAL TABLE location_rtree USING rtree("
+    + "id, min_latitude, max_latitude, min_longitude, max_longitude);",
+    "CREATE VIRTUAL TABLE location_names USING fts5("
+    + "location_name, content='locations', content_rowid='location_id',"
+    + " tokenize='trigram case_sensitive 1');",
+    "CREATE TABLE dataset (key TEXT PRIMARY KEY, value TEXT NOT NULL);",
+    "CREATE TABLE dataset_versions ("
+    + "version INTEGER PRIMARY KEY, base_version INTEGER NOT NULL);",
+    "CREATE TABLE dataset_changes ("
+    + "version INTEGER NOT NULL, location_id INTEGER NOT NULL,"
+    + " operation TEXT NOT NULL, PRIMARY KEY (version, location_id));",
+    "CREATE TABLE location_neighbors ("
+    + "location_id INTEGER NOT NULL, rank INTEGER NOT NULL,"
+    + " neighbor_id INTEGER NOT NULL, distance REAL NOT NULL,"
+    + " PRIMARY KEY (location_id, rank)) WITHOUT ROWID;",
+)
+# R*Treeは座標を単精度で外側に丸めて保持するので、R*Treeで絞り込んだ後に
+# 元の緯度経度で範囲を確かめる。
+BOUNDING_BOX_SQL = (
+    "SELECT "
+    + COLUMNS
+    + " FROM locations WHERE location_id IN ("
+    + "SELECT id FROM location_rtree WHERE max_latitude >= ?"
+    + " AND min_latitude <= ? AND max_longitude >= ? AND min_longitude <= ?)"
+    + " AND latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?"
+    + " ORDER BY location_id;"
+)
+# FTS5のtrigramトークナイザーが索引を使える検索語の最小の文字数
+TRIGRAM_LENGTH = 3
+
+
+def to_glob_pattern(keyword: str) -> str:
+    """キーワードを部分一致で検索するGLOBのパターンに変換する。
+
+    Args:
+        keyword (str): 検索するキーワード
+
+    Returns:
+        pattern (str): GLOBの特殊文字をエスケープし、前後に*を付けたパターン
+
+    """
+    escaped = "".join(
+        "[" + character + "]" if character in "*?[" else character
+        for character in keyword
+    )
+    return "*" + escaped + "*"
+
+
+class SQLiteAEDInstallationLocationService(StorageBackend):
+    """
+    import_opendataが書き出した読み取り専用のSQLiteファイルからAED設置場所を
+    検索するメソッドを提供する。
+
+    Webサーバーごとにファイルを置けばPostgreSQLのサーバーなしで検索できる。
+    ファイルは書き出し後に置き換えるだけで中身を変更しないため、immutableで開いて
+    ロックを省略する。
+
+    Attributes:
+        path (str): SQLiteファイルのパス
+
+    """
+
+    def __init__(self, path: str = Config.SQLITE_PATH):
+        """
+        Args:
+            path (str): SQLiteファイルのパス
+
+        Raises:
+            DatabaseError: ファイルを開けない場合
+
+        """
+        self.__path = path
+        uri = (
+            "file:" + urllib.parse.quote(os.path.abspath(path)) + "?mode=ro&immutable=1"
+        )
+        try:
+            self.__connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        except sqlite3.Error as e:
+            raise DatabaseError(path + "を開けません。（" + str(e) + "）")
+        self.__connection.row_factory = sqlite3.Row
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    def close(self) -> None:
+        """SQLiteファイルへの接続を閉じる"""
+        self.__connection.close()
+
+    @classmethod
+    def build(
+        cls,
+        path: str,
+        locations: list,
+        last_updated: Optional[datetime],
+        versions: Optional[dict] = None,
+        changes: Optional[list] = None,
+        neighbors: Optional[list] = None,
+    ) -> str:
+        """AED設置場所データからSQLiteファイルを作成する。
+
+        同じディレクトリの一時ファイルに書き出してから置き換えるので、検索中の
+        プロセスは古いファイルを最後まで読み、次に開いたときから新しいファイルを読む。
+
+        Args:
+            path (str): 書き出すSQLiteファイルのパス
+            locations (list of obj:`AEDInstallationLocation`): AED設置場所データの
+                オブジェクトのリスト
+            last_updated (:obj:`datetime`): データの最終更新日時。データがない場合は
+                None
+            versions (dict): バージョンをキー、変更履歴の比較元のバージョンを値に
+                持つ辞書
+            changes (list of tuples): バージョン、AED設置場所連番、変更の種類の
+                タプルのリスト
+            neighbors (list of tuples): AED設置場所連番、順位、近いAED設置場所
+                連番、距離（メートル）のタプルのリスト
+
+        Returns:
+            path (str): 書き出したSQLiteファイルのパス
+
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=directory)
+        os.close(fd)
+        try:
+            connection = sqlite3.connect(temp_path)
+            try:
+                connection.execute("PRAGMA journal_mode=OFF;")
+                for state in SCHEMA:
+                    connection.execute(state)
+                connection.executemany(
+                    "INSERT OR REPLACE INTO locations ("
+                    + COLUMNS
+                    + ") VALUES (?,?,?,?,?,?,?,?,?,?);",
+                    [
+                        (
+                            location.area,
+                            location.location_id,
+                            location.location_name,
+                            location.postal_code,
+                            location.address,
+                            location.phone_number,
+                            location.available_time,
+                            location.installation_floor,
+                            location.latitude,
+                            location.longitude,
+                        )
+                        for location in locations
+                    ],
+                )
+                connection.execute(
+                    "INSERT INTO location_rtree SELECT location_id, latitude, latitude,"
+                    + " longitude, longitude FROM locations;"
+                )
+                connection.execute(
+                    "INSERT INTO location_names (location_names) VALUES ('rebuild');"
+                )
+                if last_updated is not None:
+                    connection.execute(
+                        "INSERT INTO dataset (key, value) VALUES ('last_updated', ?);",
+                        (last_updated.isoformat(),),
+                    )
+                connection.executemany(
+                    "INSERT INTO dataset_versions (version, base_version)"
+                    + " VALUES (?, ?);",
+                    list((versions or dict()).items()),
+                )
+                connection.executemany(
+                    "INSERT INTO dataset_changes (version, location_id, operation)"
+                    + " VALUES (?, ?, ?);",
+                    changes or list(),
+                )
+                connection.executemany(
+                    "INSERT INTO location_neighbors"
+                    + " (location_id, rank, neighbor_id, distance) VALUES (?, ?, ?, ?);",
+                    neighbors or list(),
+                )
+                connection.commit()
+                connection.execute("ANALYZE;")
+            finally:
+                connection.close()
+            # mkstempは所有者だけが読めるファイルを作るので、他のユーザーで動く
+            # Webサーバーからも読めるようにする。
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return path
+
+    def _fetchall(self, sql: str, parameters: tuple = ()) -> list:
+        """SQLを実行し、全ての行を返す。
+
+        Args:
+            sql (str): SQL文
+            parameters (tuple): SQLにプレースホルダを使用する場合の値を格納したリスト
+
+        Returns:
+            results (list of :obj:`sqlite3.Row`): 検索結果のリスト
+
+        """
+        kind = get_statement_kind(sql)
+        start = time.perf_counter()
+        try:
+            rows = self.__connection.execute(sql, parameters).fetchall()
+        except sqlite3.Error as e:
+            sql_errors.inc(kind=kind)
+            raise DataError(str(e))
+        finally:
+            sql_duration.observe(time.perf_counter() - start, kind=kind)
+        sql_rows_fetched.inc(len(rows))
+        return rows
+
+    def _get_objects(self, sql: str, parameters: tuple = ()) -> list:
+        """検索結果からAED設置場所データのリストを作成する。"""
+        factory = AEDInstallationLocationFactory()
+        for row in self._fetchall(sql, parameters):
+            factory.create(**dict(row))
+        return factory.items
+
+    def _iter_objects(
+        self, sql: str, parameters: tuple = ()
+    ) -> Iterator[AEDInstallationLocation]:
+        """SQLを実行し、検索結果を1行ずつAED設置場所データにして返す。"""
+        kind = get_statement_kind(sql)
+        start = time.perf_counter()
+        try:
+            cursor = self.__connection.execute(sql, parameters)
+        except sqlite3.Error as e:
+            sql_errors.inc(kind=kind)
+            raise DataError(str(e))
+        finally:
+            sql_duration.observe(time.perf_counter() - start, kind=kind)
+        rows = 0
+        try:
+            for row in cursor:
+                rows += 1
+                yield AEDInstallationLocation(**dict(row))
+        finally:
+            sql_rows_fetched.inc(rows)
+            cursor.close()
+
+    def get_all(self) -> list:
+        """AED設置場所全件データのリストを返す。"""
+        return self._get_objects(
+            "SELECT " + COLUMNS + " FROM locations ORDER BY location_id;"
+        )
+
+    def iter_all(self) -> Iterator[AEDInstallationLocation]:
+        """AED設置場所全件データを1件ずつ返す。"""
+        return self._iter_objects(
+            "SELECT " + COLUMNS + " FROM locations ORDER BY location_id;"
+        )
+
+    def find_by_location_id(self, location_id) -> list:
+        """AED設置場所連番から該当するAED設置場所データを返す。
+
+        Args:
+            location_id (int): AED設置場所連番
+
+        Returns
+            aed_installation_location (list of obj:`AEDInstallationLocation`):
+                AED設置場所データ
+
+        """
+        return self._get_objects(
+            "SELECT " + COLUMNS + " FROM locations WHERE location_id=?;",
+            (int(location_id),),
+        )
+
+    def find_by_location_ids(self, location_ids: list) -> list:
+        """複数のAED設置場所連番から該当するAED設置場所データを返す。
+
+        Args:
+            location_ids (list of int): AED設置場所連番のリスト
+
+        Returns
+            locations (list of obj:`AEDInstallationLocation`): AED設置場所
+                オブジェクトのリスト
+
+        """
+        # 件数によらず同じSQL文になるよう、連番のリストはJSONの配列で渡す。
+        return self._get_objects(
+            "SELECT "
+            + COLUMNS
+            + " FROM locations WHERE location_id IN (SELECT value FROM json_each(?))"
+            + " ORDER BY location_id;",
+            (json.dumps([int(location_id) for location_id in location_ids]),),
+        )
+
+    def find_by_location_name(self, location_name, page: int = 1) -> dict:
+        """指定したAED設置場所名を含むAED設置場所を検索する。
+
+        3文字以上のキーワードはFTS5のtrigram索引で絞り込み、それより短い場合は
+        全件を走査する。
+
+        Args:
+            location_name (int): AED設置場所名（キーワード）
+            page (int): 検索結果のページ数
+
+        Returns
+            results (dict): 検索結果の総件数と検索条件に合致するAED設置場所データ
+                オブジェクトのリスト、ページ分割した際の最大ページ数を要素に持つ辞書
+
+        """
+        location_name = str(location_name)
+        pattern = to_glob_pattern(location_name)
+        if TRIGRAM_LENGTH <= len(location_name):
+            condition = (
+                "location_id IN (SELECT rowid FROM location_names"
+                + " WHERE location_name GLOB ?)"
+            )
+        else:
+            condition = "location_name GLOB ?"
+        row = self._fetchall(
+            "SELECT count(*) AS count FROM locations WHERE " + condition + ";",
+            (pattern,),
+        )[0]
+        results_number = row["count"]
+
+        max_view_results_number = 10
+        max_page = max(1, -(-results_number // max_view_results_number))
+        try:
+            page = int(page)
+        except (TypeError, ValueError):
+            raise ServiceError("検索結果のページ指定に誤りがあります。")
+        if max_page < page:
+            raise ServiceError("指定したページ数が上限を超えています。")
+        results = self._get_objects(
+            "SELECT "
+            + COLUMNS
+            + " FROM locations WHERE "
+            + condition
+            + " ORDER BY location_id LIMIT ? OFFSET ?;",
+            (pattern, max_view_results_number, (page - 1) * max_view_results_number),
+        )
+        return {
+            "all_results_number": results_number,
+            "max_page": max_page,
+            "pagenated_results_body": results,
+        }
+
+    def get_area_names(self) -> list:
+        """AED設置場所の住所の町域一覧を返す。"""
+        rows = self._fetchall("SELECT DISTINCT area FROM locations ORDER BY area;")
+        return [row["area"] for row in rows]
+
+    def find_by_area_name(self, area_name) -> list:
+        """町域名からAED設置場所を検索する。
+
+        Args:
+            area_name (str): 町域名
+
+        Returns:
+            area_locations (list of obj:`AEDInstallationLocation`): 指定した町域の
+                AED設置場所オブジェクトのリスト
+
+        """
+        return self._get_objects(
+            "SELECT " + COLUMNS + " FROM locations WHERE area=? ORDER BY location_id;",
+            (str(area_name),),
+        )
+
+    def iter_by_area_name(self, area_name) -> Iterator[AEDInstallationLocation]:
+        """町域名から検索したAED設置場所データを1件ずつ返す。"""
+        return self._iter_objects(
+            "SELECT " + COLUMNS + " FROM locations WHERE area=? ORDER BY location_id;",
+            (str(area_name),),
+        )
+
+    def count_by_area_name(self, area_name) -> int:
+        """指定した町域のAED設置場所の件数を返す。"""
+        rows = self._fetchall(
+            "SELECT count(*) AS count FROM locations WHERE area=?;", (str(area_name),)
+        )
+        return rows[0]["count"]
+
+    @staticmethod
+    def _get_bounding_box_parameters(south, west, north, east) -> tuple:
+        """BOUNDING_BOX_SQLのプレースホルダに渡す値を返す。"""
+        south, west, north, east = (
+            float(value) for value in (south, west, north, east)
+        )
+        return (south, north, west, east, south, north, west, east)
+
+    def find_by_bounding_box(
+        self, south: float, west: float, north: float, east: float
+    ) -> list:
+        """緯度経度で指定した矩形の範囲内にあるAED設置場所を検索する。
+
+        Args:
+            south (float): 南端の緯度
+            west (float): 西端の経度
+            north (float): 北端の緯度
+            east (float): 東端の経度
+
+        Returns:
+            locations (list of obj:`AEDInstallationLocation`): 範囲内のAED設置場所
+                オブジェクトのリスト
+
+        """
+        return self._get_objects(
+            BOUNDING_BOX_SQL,
+            self._get_bounding_box_parameters(south, west, north, east),
+        )
+
+    def iter_by_bounding_box(
+        self, south: float, west: float, north: float, east: float
+    ) -> Iterator[AEDInstallationLocation]:
+        """緯度経度で指定した矩形の範囲内にあるAED設置場所を1件ずつ返す。"""
+        return self._iter_objects(
+            BOUNDING_BOX_SQL,
+            self._get_bounding_box_parameters(south, west, north, east),
+        )
+
+    def get_version_history(self) -> dict:
+        """データセットのバージョンごとに、変更履歴の比較元のバージョンを返す。"""
+        rows = self._fetchall("SELECT version, base_version FROM dataset_versions;")
+        return {row["version"]: row["base_version"] for row in rows}
+
+    def get_changed_location_ids(self, versions: list) -> list:
+        """指定したバージョンで追加、更新、削除されたAED設置場所連番を返す。"""
+        rows = self._fetchall(
+            "SELECT DISTINCT location_id FROM dataset_changes"
+            + " WHERE version IN (SELECT value FROM json_each(?))"
+            + " ORDER BY location_id;",
+            (json.dumps([int(version) for version in versions]),),
+        )
+        return [row["location_id"] for row in rows]
+
+    def get_neighbors(self, version: int, location_id: int) -> list:
+        """インポート時に求めた、AED設置場所から近い他のAED設置場所を返す。
+
+        ファイルには書き出したときのバージョンの結果だけを持つ。
+
+        Args:
+            version (int): データセットのバージョン
+            location_id (int): AED設置場所連番
+
+        Returns:
+            neighbors (list of tuples): 近い順のAED設置場所オブジェクトと距離
+                （メートル）のタプルのリスト
+
+        """
+        rows = self._fetchall(
+            "SELECT "
+            + ",".join("l." + column for column in COLUMNS.split(","))
+            + ",n.distance FROM location_neighbors n"
+            + " JOIN locations l ON l.location_id = n.neighbor_id"
+            + " WHERE n.location_id = ? ORDER BY n.rank;",
+            (int(location_id),),
+        )
+        neighbors = list()
+        for row in rows:
+            row = dict(row)
+            distance = row.pop("distance")
+            neighbors.append((AEDInstallationLocation(**row), distance))
+        return neighbors
+
+    def get_last_updated(self) -> Optional[datetime]:
+        """SQLiteファイルに記録したデータの最終更新日時を返す。"""
+        rows = self._fetchall("SELECT value FROM dataset WHERE key='last_updated';")
+        if len(rows) == 0:
+            return None
+        else:
+            return datetime.fromisoformat(rows[0]["value"])
@@ -0,0 +1,62 @@
+// AED設置場所名の入力中に、/api/autocompleteから入力候補を取得して表示する。
+var autocomplete = (function() {
+    const DELAY = 150;
+    var timer = null;
+    var lastQuery = null;
+
+    function showSuggestions(list, suggestions) {
+        while (list.firstChild) {
+            list.removeChild(list.firstChild);
+        }
+        for (var i = 0; i < suggestions.length; i++) {
+            var option = document.createElement("option");
+            option.value = suggestions[i].text;
+            list.appendChild(option);
+        }
+    };
+
+    function update(input, list) {
+        var query = input.value.trim();
+        if (query == lastQuery) {
+            return;
+        }
+        lastQuery = query;
+        if (query == "") {
+            showSuggestions(list, []);
+            return;
+        }
+        fetch("/api/autocomplete?q=" + encodeURIComponent(query))
+            .then(function(response) {
+                if (!response.ok) {
+                    throw new Error(response.statusText);
+                }
+                return response.json();
+            })
+            .then(function(result) {
+                // 応答を待つ間に入力が変わっていれば古い候補は表示しない。
+                if (result.query == lastQuery) {
+                    showSuggestions(list, result.suggestions);
+                }
+            })
+            .catch(function() {
+                showSuggestions(list, []);
+            });
+    };
+
+    function attach(input, list) {
+        // 1文字入力するたびに問い合わせないよう、入力が止まってから取得する。
+        input.addEventListener("input", function() {
+            clearTimeout(timer);
+            timer = setTimeout(function() {
+                update(input, list);
+            }, DELAY);
+        });
+    };
+
+    var input = document.getElementById("locationName");
+    var list = document.getElementById("locationNameSuggestions");
+    if (input && list) {
+        attach(input, list);
+    }
+    return {attach: attach};
+})();
@@ -0,0 +1,97 @@
+// 表示範囲の地図タイルごとにサーバー側でクラスタリングしたAED設置場所を取得して表示する
+function addClusterLayer(map) {
+    var tileSize = 256;
+    // 保持する地図タイルの数の上限。超えた場合は古いものから破棄する。
+    var maxCachedTiles = 512;
+    var layer = L.layerGroup().addTo(map);
+    var tileCache = {};
+    var cachedUrls = [];
+    var datasetVersion = null;
+    // update()を呼び出すたびに増やし、古い呼び出しの取得結果を表示しない
+    var generation = 0;
+
+    function showFeatures(featureCollection) {
+        featureCollection.features.forEach(function(feature) {
+            var latLng = [
+                feature.geometry.coordinates[1],
+                feature.geometry.coordinates[0]
+            ];
+            var count = feature.properties.count;
+            var marker = L.circleMarker(latLng, {
+                color: '#6c757d',
+                fillColor: '#6c757d',
+                fillOpacity: 0.5,
+                radius: count == 1 ? 6 : Math.min(8 + Math.log(count) * 4, 24)
+            });
+            if (count == 1) {
+                var link = document.createElement("a");
+                link.href = "/location/" + feature.properties.location_id;
+                link.textContent = feature.properties.location_name;
+                marker.bindPopup(link);
+            } else {
+                marker.bindTooltip(String(count) + "件");
+            }
+            layer.addLayer(marker);
+        });
+    };
+
+    function fetchTile(url) {
+        if (url in tileCache) {
+            return tileCache[url];
+        }
+        if (maxCachedTiles <= cachedUrls.length) {
+            delete tileCache[cachedUrls.shift()];
+        }
+        var promise = fetch(url).then(function(response) {
+            var version = response.headers.get("X-Dataset-Version");
+            if (version !== null && version !== datasetVersion) {
+                var updated = datasetVersion !== null;
+                datasetVersion = version;
+                if (updated) {
+                    // データセットが更新されたら古いバージョンのタイルを破棄し、
+                    // 表示中の範囲を取得し直す
+                    tileCache = {};
+                    cachedUrls = [];
+                    tileCache[url] = promise;
+                    cachedUrls.push(url);
+                    setTimeout(update, 0);
+                }
+            }
+            return response.json();
+        });
+        tileCache[url] = promise;
+        cachedUrls.push(url);
+        return promise;
+    };
+
+    function update() {
+        var current = ++generation;
+        var zoom = map.getZoom();
+        var bounds = map.getPixelBounds();
+        var minX = Math.floor(bounds.min.x / tileSize);
+        var maxX = Math.floor(bounds.max.x / tileSize);
+        var minY = Math.floor(bounds.min.y / tileSize);
+        var maxY = Math.floor(bounds.max.y / tileSize);
+        var tilesNumber = Math.pow(2, zoom);
+
+        layer.clearLayers();
+        for (var x = minX; x <= maxX; x++) {
+            for (var y = minY; y <= maxY; y++) {
+                if (x < 0 || y < 0 || tilesNumber <= x || tilesNumber <= y) {
+                    continue;
+                }
+                var url = "/tiles/" + zoom + "/" + x + "/" + y + ".json";
+                fetchTile(url).then(function(featureCollection) {
+                    // 取得中に地図を動かした場合は、新しい呼び出しが表示する
+                    if (current == generation) {
+                        showFeatures(featureCollection);
+                    }
+                });
+            }
+        }
+    };
+
+    map.on("moveend", update);
+    update();
+    return layer;
+};
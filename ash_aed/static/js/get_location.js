@@ -34,6 +34,10 @@ function getLocation() {
             var currentLongitude = position.coords.longitude;
             document.getElementById("currentLatitude").value = currentLatitude;
             document.getElementById("currentLongitude").value = currentLongitude;
+            // 手元のデータセットで近いAED設置場所をすぐに表示できるよう知らせる。
+            document.dispatchEvent(new CustomEvent("currentlocation", {
+                detail: {latitude: currentLatitude, longitude: currentLongitude}
+            }));
         };
 
         function geoError(error) {
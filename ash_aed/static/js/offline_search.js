@@ -0,0 +1,186 @@
+// 端末に保存したデータセットから、現在地に近いAED設置場所を求める。
+// データセットの形式はash_aed/bundle.pyのOfflineBundleを参照。
+var offlineSearch = (function() {
+    const EARTH_RADIUS = 6378137.00;
+    const RESULTS_LENGTH = 5;
+    var bundlePromise = null;
+
+    function decodeDeltas(deltas) {
+        var values = new Array(deltas.length);
+        var value = 0;
+        for (var i = 0; i < deltas.length; i++) {
+            value += deltas[i];
+            values[i] = value;
+        }
+        return values;
+    };
+
+    function decodeBundle(data) {
+        var locationIds = decodeDeltas(data.location_ids);
+        var latitudes = decodeDeltas(data.latitudes);
+        var longitudes = decodeDeltas(data.longitudes);
+        var locations = new Array(locationIds.length);
+        for (var i = 0; i < locationIds.length; i++) {
+            var location = {
+                location_id: locationIds[i],
+                latitude: latitudes[i] / data.scale,
+                longitude: longitudes[i] / data.scale
+            };
+            for (var field in data.fields) {
+                location[field] = data.strings[data.fields[field][i]];
+            }
+            locations[i] = location;
+        }
+        return {version: data.version, locations: locations};
+    };
+
+    function loadBundle() {
+        // マニフェストで現在のバージョンを確かめてから、バージョンを含むURLで
+        // データセットを取得する。オフラインの場合はService Workerが保存した
+        // ものを返す。
+        if (bundlePromise === null) {
+            bundlePromise = fetch("/offline/manifest.json")
+                .then(function(response) {
+                    if (!response.ok) {
+                        throw new Error(response.statusText);
+                    }
+                    return response.json();
+                })
+                .then(function(manifest) {
+                    return fetch(manifest.path);
+                })
+                .then(function(response) {
+                    if (!response.ok) {
+                        throw new Error(response.statusText);
+                    }
+                    return response.json();
+                })
+                .then(decodeBundle)
+                .catch(function(error) {
+                    bundlePromise = null;
+                    throw error;
+                });
+        }
+        return bundlePromise;
+    };
+
+    function toRadians(degree) {
+        return degree * Math.PI / 180;
+    };
+
+    function getDistance(latitude, longitude, location) {
+        // サーバーと同じく球面三角法の余弦定理で直線距離（メートル）を求める。
+        var startLatitude = toRadians(latitude);
+        var endLatitude = toRadians(location.latitude);
+        var cosine = Math.sin(startLatitude) * Math.sin(endLatitude)
+            + Math.cos(startLatitude) * Math.cos(endLatitude)
+            * Math.cos(toRadians(location.longitude) - toRadians(longitude));
+        return EARTH_RADIUS * Math.acos(Math.min(1, Math.max(-1, cosine)));
+    };
+
+    function getNearLocations(bundle, latitude, longitude) {
+        // 上位の件数だけを挿入ソートで保持する。
+        var nearest = [];
+        for (var i = 0; i < bundle.locations.length; i++) {
+            var location = bundle.locations[i];
+            var distance = getDistance(latitude, longitude, location);
+            if (nearest.length == RESULTS_LENGTH
+                    && nearest[RESULTS_LENGTH - 1].distance <= distance) {
+                continue;
+            }
+            var j = nearest.length;
+            while (0 < j && distance < nearest[j - 1].distance) {
+                j--;
+            }
+            nearest.splice(j, 0, {location: location, distance: distance});
+            if (RESULTS_LENGTH < nearest.length) {
+                nearest.pop();
+            }
+        }
+        return nearest.map(function(result, index) {
+            return {
+                order: index + 1,
+                location: result.location,
+                distance: (Math.round(result.distance / 10) / 100).toFixed(2)
+            };
+        });
+    };
+
+    function appendCell(row, content) {
+        var cell = document.createElement("td");
+        if (typeof content == "string") {
+            cell.textContent = content;
+        } else {
+            cell.appendChild(content);
+        }
+        row.appendChild(cell);
+    };
+
+    function showNearLocations(bundle, results) {
+        var body = document.getElementById("offlineResultsBody");
+        if (body === null) {
+            return;
+        }
+        while (body.firstChild) {
+            body.removeChild(body.firstChild);
+        }
+        results.forEach(function(result) {
+            var row = document.createElement("tr");
+            var link = document.createElement("a");
+            link.href = "/location/" + result.location.location_id;
+            link.title = result.location.location_name + "の詳細へ";
+            link.textContent = result.location.location_name;
+            appendCell(row, String(result.order));
+            appendCell(row, link);
+            appendCell(row, result.location.address);
+            appendCell(row, "約" + result.distance + "km");
+            body.appendChild(row);
+        });
+        document.getElementById("offlineVersion").textContent =
+            new Date(bundle.version * 1000).toLocaleString("ja-JP");
+        document.getElementById("offlineResults").style.display = "block";
+    };
+
+    function search(latitude, longitude) {
+        return loadBundle().then(function(bundle) {
+            var results = getNearLocations(bundle, latitude, longitude);
+            showNearLocations(bundle, results);
+            return results;
+        });
+    };
+
+    return {
+        decodeBundle: decodeBundle,
+        getNearLocations: getNearLocations,
+        loadBundle: loadBundle,
+        search: search
+    };
+})();
+
+if ("serviceWorker" in navigator) {
+    window.addEventListener("load", function() {
+        navigator.serviceWorker.register("/service_worker.js").then(function() {
+            return navigator.serviceWorker.ready;
+        }).then(function(registration) {
+            // オフラインでもこのページを表示できるよう、読み込んだ静的ファイルを
+            // 保存させる。
+            var urls = [];
+            document.querySelectorAll("script[src], link[rel=stylesheet][href]")
+                .forEach(function(element) {
+                    urls.push(element.getAttribute("src") || element.getAttribute("href"));
+                });
+            registration.active.postMessage({type: "cache", urls: urls});
+        }).catch(function() {});
+    });
+}
+
+document.addEventListener("currentlocation", function(event) {
+    // 取得できない場合はサーバーでの検索だけを使う。
+    offlineSearch.search(event.detail.latitude, event.detail.longitude)
+        .catch(function() {});
+}, false);
+
+document.addEventListener("DOMContentLoaded", function() {
+    // 位置情報の取得を待つ間にデータセットを読み込んでおく。
+    offlineSearch.loadBundle().catch(function() {});
+}, false);
@@ -0,0 +1,160 @@
+// 静的ファイルとオフライン検索用のデータセットを端末に保存し、通信できない
+// 場合でもトップページから近いAED設置場所を検索できるようにする。
+const CACHE_NAME = "ash-aed-v1";
+// 静的ファイルのURLには内容のハッシュが含まれるので、ページから受け取って保存する。
+const PRECACHE_URLS = ["/"];
+
+self.addEventListener("install", function(event) {
+    event.waitUntil(
+        caches.open(CACHE_NAME).then(function(cache) {
+            return cache.addAll(PRECACHE_URLS);
+        }).then(function() {
+            return self.skipWaiting();
+        })
+    );
+});
+
+self.addEventListener("activate", function(event) {
+    event.waitUntil(
+        caches.keys().then(function(names) {
+            return Promise.all(names.filter(function(name) {
+                return name != CACHE_NAME;
+            }).map(function(name) {
+                return caches.delete(name);
+            }));
+        }).then(function() {
+            return self.clients.claim();
+        })
+    );
+});
+
+self.addEventListener("message", function(event) {
+    // ページが読み込んだ静的ファイルを保存する。
+    if (event.data && event.data.type == "cache") {
+        var urls = event.data.urls.filter(function(url) {
+            return new URL(url, self.location.origin).pathname.indexOf("/static/") == 0;
+        });
+        event.waitUntil(
+            caches.open(CACHE_NAME).then(function(cache) {
+                return Promise.all(urls.map(function(url) {
+                    return cache.match(url).then(function(cached) {
+                        return cached || cache.add(url);
+                    });
+                }));
+            }).then(function() {
+                return pruneStaticFiles(urls);
+            })
+        );
+    }
+});
+
+function networkFirst(request, fallbackUrl) {
+    // 最新の内容を取得できればそれを保存し、できなければ保存したものを返す。
+    return fetch(request).then(function(response) {
+        if (response.ok) {
+            var copy = response.clone();
+            caches.open(CACHE_NAME).then(function(cache) {
+                cache.put(fallbackUrl || request, copy);
+            });
+        }
+        return response;
+    }).catch(function() {
+        return caches.match(fallbackUrl || request);
+    });
+};
+
+function cacheFirst(request) {
+    // 静的ファイルのURLには内容のハッシュ（対応表を書き出していない場合は
+    // 更新日時）が、データセットのURLにはバージョンが含まれ内容が変わらない
+    // ので、保存したものがあればそれを返す。
+    return caches.match(request).then(function(cached) {
+        if (cached) {
+            return cached;
+        }
+        return fetch(request).then(function(response) {
+            if (response.ok) {
+                var copy = response.clone();
+                caches.open(CACHE_NAME).then(function(cache) {
+                    cache.put(request, copy);
+                    if (request.url.indexOf("/offline/bundle.") != -1) {
+                        pruneBundles(request.url);
+                    }
+                });
+            }
+            return response;
+        }).catch(function() {
+            // オフラインの場合は更新日時の異なるものでも返す。内容のハッシュが
+            // 異なるものはファイル名が異なるので返せない。
+            return caches.match(request, {ignoreSearch: true});
+        });
+    });
+};
+
+function pruneBundles(currentUrl) {
+    // 新しいデータセットを保存したら古いバージョンを削除する。
+    caches.open(CACHE_NAME).then(function(cache) {
+        cache.keys().then(function(requests) {
+            requests.forEach(function(request) {
+                if (request.url.indexOf("/offline/bundle.") != -1
+                        && request.url != currentUrl) {
+                    cache.delete(request);
+                }
+            });
+        });
+    });
+};
+
+function getStaticFileName(url) {
+    // ハッシュや更新日時を除いた、静的ファイルの元のパスを返す。
+    return new URL(url, self.location.origin).pathname
+        .replace(/^\/static\/dist\//, "/static/")
+        .replace(/\.[0-9a-f]{12}(\.[^./]+)$/, "$1");
+};
+
+function pruneStaticFiles(urls) {
+    // ページが読み込んだ静的ファイルと同じファイルの古いハッシュや更新日時の
+    // ものを削除する。デプロイのたびに古いファイルが残り続けないようにする。
+    var currentUrls = urls.map(function(url) {
+        return new URL(url, self.location.origin).href;
+    });
+    var names = currentUrls.map(getStaticFileName);
+    return caches.open(CACHE_NAME).then(function(cache) {
+        return cache.keys().then(function(requests) {
+            return Promise.all(requests.filter(function(request) {
+                return new URL(request.url).pathname.indexOf("/static/") == 0
+                    && currentUrls.indexOf(request.url) == -1
+                    && names.indexOf(getStaticFileName(request.url)) != -1;
+            }).map(function(request) {
+                return cache.delete(request);
+            }));
+        });
+    });
+};
+
+self.addEventListener("fetch", function(event) {
+    var request = event.request;
+    if (request.method != "GET") {
+        return;
+    }
+    var url = new URL(request.url);
+    if (url.origin != self.location.origin) {
+        return;
+    }
+    if (request.mode == "navigate") {
+        // ページは最新のものを表示し、オフラインの場合は保存したトップページを返す。
+        if (url.pathname == "/") {
+            event.respondWith(networkFirst(request, "/"));
+        } else {
+            event.respondWith(
+                fetch(request).catch(function() {
+                    return caches.match("/");
+                })
+            );
+        }
+    } else if (url.pathname == "/offline/manifest.json") {
+        event.respondWith(networkFirst(request));
+    } else if (url.pathname.indexOf("/offline/bundle.") == 0
+            || url.pathname.indexOf("/static/") == 0) {
+        event.respondWith(cacheFirst(request));
+    }
+});
@@ -34,4 +34,5 @@ document.addEventListener("DOMContentLoaded", function() {
             .openPopup();
     }
 
+    addClusterLayer(map);
 }, false);
@@ -41,4 +41,6 @@ document.addEventListener("DOMContentLoaded", function() {
             .bindPopup(locationData["locationName" + currentReversedOrder])
             .openPopup();
     }
+
+    addClusterLayer(map);
 }, false);
@@ -0,0 +1,167 @@
+import math
+
+from ash_aed.errors import LocationError
+from ash_aed.models import AEDInstallationLocation
+
+
+class MapTile:
+    """
+    Webメルカトル図法の地図タイル（XYZ方式）を表し、タイル内のAED設置場所を
+    格子状にクラスタリングしたGeoJSONを作成する。
+
+    Attributes:
+        zoom (int): ズームレベル
+        x (int): タイルのX座標
+        y (int): タイルのY座標
+
+    """
+
+    # 1タイルあたりのピクセル数
+    TILE_SIZE = 256
+    # クラスタリングする格子の大きさ（ピクセル）。タイルの境界と一致させるため
+    # TILE_SIZEを割り切れる値にする。
+    GRID_SIZE = 64
+    # このズームレベルより大きい場合はクラスタリングせず個別の地点を返す
+    CLUSTER_MAX_ZOOM = 16
+    MAX_ZOOM = 20
+
+    def __init__(self, zoom: int, x: int, y: int):
+        """
+        Args:
+            zoom (int): ズームレベル
+            x (int): タイルのX座標
+            y (int): タイルのY座標
+
+        """
+        try:
+            zoom = int(zoom)
+            x = int(x)
+            y = int(y)
+        except (TypeError, ValueError):
+            raise LocationError("タイル座標は整数で指定してください。")
+        if zoom < 0 or self.MAX_ZOOM < zoom:
+            raise LocationError("ズームレベルに指定できない値が設定されています。")
+        tiles_number = 2**zoom
+        if x < 0 or tiles_number <= x or y < 0 or tiles_number <= y:
+            raise LocationError("タイル座標に指定できない値が設定されています。")
+        self.__zoom = zoom
+        self.__x = x
+        self.__y = y
+
+    @property
+    def zoom(self) -> int:
+        return self.__zoom
+
+    @property
+    def x(self) -> int:
+        return self.__x
+
+    @property
+    def y(self) -> int:
+        return self.__y
+
+    @property
+    def bounding_box(self) -> tuple:
+        """タイルの範囲を緯度経度で返す。
+
+        Returns:
+            bounding_box (tuple): 南端の緯度、西端の経度、北端の緯度、東端の経度の
+                タプル
+
+        """
+        tiles_number = 2**self.__zoom
+        west = self.__x / tiles_number * 360.0 - 180.0
+        east = (self.__x + 1) / tiles_number * 360.0 - 180.0
+        north = math.degrees(
+            math.atan(math.sinh(math.pi * (1 - 2 * self.__y / tiles_number)))
+        )
+        south = math.degrees(
+            math.atan(math.sinh(math.pi * (1 - 2 * (self.__y + 1) / tiles_number)))
+        )
+        return (south, west, north, east)
+
+    def _to_pixel(self, latitude: float, longitude: float) -> tuple:
+        """緯度経度をこのズームレベルでの世界座標（ピクセル）に変換する。
+
+        Args:
+            latitude (float): 緯度
+            longitude (float): 経度
+
+        Returns:
+            pixel (tuple): X座標とY座標のタプル
+
+        """
+        world_size = self.TILE_SIZE * 2**self.__zoom
+        sin_latitude = math.sin(math.radians(latitude))
+        pixel_x = (longitude + 180.0) / 360.0 * world_size
+        pixel_y = (
+            0.5 - math.log((1 + sin_latitude) / (1 - sin_latitude)) / (4 * math.pi)
+        ) * world_size
+        return (pixel_x, pixel_y)
+
+    def cluster(self, locations: list) -> dict:
+        """
+        AED設置場所を格子ごとにまとめ、GeoJSONのFeatureCollectionを返す。
+
+        Args:
+            locations (list of obj:`AEDInstallationLocation`): タイルの範囲内の
+                AED設置場所オブジェクトのリスト
+
+        Returns:
+            feature_collection (dict): 格子ごとの地点数と重心を持つGeoJSON。地点が
+                1件だけの格子はAED設置場所連番と名称も持つ。
+
+        """
+        grid_size = self.GRID_SIZE
+        if self.CLUSTER_MAX_ZOOM < self.__zoom:
+            # 十分に拡大されている場合は地点ごとに別の格子とする。
+            grid_size = None
+
+        clusters = dict()
+        for location in locations:
+            pixel_x, pixel_y = self._to_pixel(location.latitude, location.longitude)
+            # 境界上の地点が隣接するタイルと重複しないようにする。
+            if (
+                int(pixel_x // self.TILE_SIZE) != self.__x
+                or int(pixel_y // self.TILE_SIZE) != self.__y
+            ):
+                continue
+            if grid_size is None:
+                key = location.location_id
+            else:
+                key = (int(pixel_x // grid_size), int(pixel_y // grid_size))
+            clusters.setdefault(key, list()).append(location)
+
+        features = list()
+        for key in sorted(clusters.keys()):
+            features.append(self._to_feature(clusters[key]))
+        return {"type": "FeatureCollection", "features": features}
+
+    @staticmethod
+    def _to_feature(members: list) -> dict:
+        """格子に含まれるAED設置場所からGeoJSONのFeatureを作成する。
+
+        Args:
+            members (list of obj:`AEDInstallationLocation`): 格子に含まれる
+                AED設置場所オブジェクトのリスト
+
+        Returns:
+            feature (dict): 重心を座標に持つGeoJSONのFeature
+
+        """
+        count = len(members)
+        latitude = sum(member.latitude for member in members) / count
+        longitude = sum(member.longitude for member in members) / count
+        properties = {"count": count}
+        if count == 1:
+            member: AEDInstallationLocation = members[0]
+            properties["location_id"] = member.location_id
+            properties["location_name"] = member.location_name
+        return {
+            "type": "Feature",
+            "geometry": {
+                "type": "Point",
+                "coordinates": [round(longitude, 7), round(latitude, 7)],
+            },
+            "properties": properties,
+        }
@@ -1,13 +1,192 @@
+import functools
+import mimetypes
 import os
-
-from flask import Flask, escape, g, render_template, request, url_for
-
+import re
+import time
+import uuid
+
+from flask import (
+    Flask,
+    Response,
+    abort,
+    escape,
+    g,
+    jsonify,
+    make_response,
+    render_template,
+    request,
+    send_file,
+    stream_with_context,
+    url_for
+)
+from werkzeug.security import safe_join
+
+from ash_aed import metrics
+from ash_aed.assets import AssetManifest
+from ash_aed.autocomplete import MAX_LIMIT, AutocompleteIndexStore
+from ash_aed.bundle import OfflineBundle
+from ash_aed.cache import LRUCache
+from ash_aed.compression import (
+    ResponseCompressor,
+    etag_matches,
+    negotiate_encoding
+)
+from ash_aed.config import Config
+from ash_aed.dataset import dataset_version
 from ash_aed.db import DB
 from ash_aed.errors import LocationError, ServiceError
+from ash_aed.export import FIELDS, DatasetExport
+from ash_aed.listener import DatasetVersionListener
+from ash_aed.logs import correlation_id
 from ash_aed.models import CurrentLocation
-from ash_aed.services import AEDInstallationLocationService
+from ash_aed.profiling import RequestProfiler
+from ash_aed.services import (
+    AEDInstallationLocationService,
+    coverage_grid_store,
+    near_locations_cache,
+    shared_cache
+)
+from ash_aed.sqlite_services import SQLiteAEDInstallationLocationService
+from ash_aed.tiles import MapTile
 
 app = Flask(__name__)
+# 相関IDとして受け付けるリクエストヘッダーの値
+REQUEST_ID_PATTERN = re.compile(r"^[0-9A-Za-z._-]{1,128}$")
+# 計測を指示し、プロファイル結果の集計を取得するためのトークンのヘッダー
+PROFILE_HEADER = "X-Profile-Token"
+# ストリーミングで描画するテンプレートを何個の断片ごとにまとめて送るか
+STREAM_BUFFER_SIZE = 32
+# 同じキーを同時に外した場合は、1つのリクエストだけが値を求めて他は待つ。
+tile_cache = LRUCache(Config.TILE_CACHE_SIZE, Config.SINGLE_FLIGHT_TIMEOUT)
+coverage_cache = LRUCache(64, Config.SINGLE_FLIGHT_TIMEOUT)
+# 描画して圧縮したページ。データセットのバージョン、URL、圧縮形式ごとに保持する。
+page_cache = LRUCache(Config.PAGE_CACHE_SIZE, Config.SINGLE_FLIGHT_TIMEOUT)
+# 町域名の一覧。全てのページで使うのでデータセットのバージョンごとに保持する。
+area_names_cache = LRUCache(4, Config.SINGLE_FLIGHT_TIMEOUT)
+response_compressor = ResponseCompressor(
+    level=Config.COMPRESSION_LEVEL,
+    brotli_quality=Config.COMPRESSION_BROTLI_QUALITY,
+    min_size=Config.COMPRESSION_MIN_SIZE,
+)
+# 名称の入力候補の索引。データセットのバージョンが変わったら作り直す。
+autocomplete_index_store = AutocompleteIndexStore()
+# リクエストごとのプロファイル。出力先を指定しない場合は計測しない。
+request_profiler = RequestProfiler(
+    Config.PROFILE_DIR,
+    sample_rate=Config.PROFILE_SAMPLE_RATE,
+    token=Config.PROFILE_TOKEN,
+    max_files=Config.PROFILE_MAX_FILES,
+    collapsed=Config.PROFILE_COLLAPSED,
+)
+# ビルド時に書き出した静的ファイルの対応表。描画のたびにファイルを調べない。
+asset_manifest = AssetManifest.load(app.static_folder)
+
+
+def switch_dataset(version):
+    # 古いバージョンのキャッシュを破棄し、新しいバージョンの格子データを読み込む。
+    tile_cache.clear()
+    coverage_cache.clear()
+    page_cache.clear()
+    area_names_cache.clear()
+    coverage_grid_store.get(version)
+
+
+dataset_version.subscribe(switch_dataset)
+# インポートが通知するデータセットのバージョンを待ち受ける。
+dataset_listener = DatasetVersionListener(
+    Config.DATABASE_URL,
+    Config.DATASET_CHANNEL,
+    Config.DATASET_LISTENER_RECONNECT_INTERVAL,
+)
+metrics.register_cache("tiles", tile_cache)
+metrics.register_cache("coverage", coverage_cache)
+metrics.register_cache("pages", page_cache)
+metrics.register_cache("area_names", area_names_cache)
+metrics.register_cache("near_locations", near_locations_cache)
+metrics.register_cache("shared", shared_cache)
+
+
+if Config.DATASET_LISTENER and Config.STORAGE_BACKEND != "sqlite":
+    # SQLiteファイルを使う場合はPostgreSQLへ接続しないので待ち受けない。
+    # gunicornの--preloadではfork前に起動したスレッドがワーカーに引き継がれない
+    # ため、各ワーカーで最初のリクエストを受けた時に起動する。
+    app.before_request(dataset_listener.start)
+
+
+if Config.METRICS_DIR:
+    # 他のワーカーから合算できるよう、各ワーカーで一定間隔で値を書き出す。
+    # forkした後のワーカーで起動するため、最初のリクエストを受けた時に起動する。
+    app.before_request(metrics.registry.start)
+
+
+@app.before_request
+def start_profiler():
+    # 他の処理もなるべく含めて計測するよう、最初に開始して最後に終了する。
+    # 集計結果の取得は、集計の対象に含めない。
+    if (
+        request_profiler.enabled
+        and request.endpoint != "profile_summary"
+        and request_profiler.should_profile(request.headers.get(PROFILE_HEADER))
+    ):
+        g.profiler = request_profiler.start()
+
+
+@app.after_request
+def stop_profiler(response):
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        path = request_profiler.stop(profiler, request.endpoint or "unknown")
+        if path is not None:
+            response.headers["X-Profile-Id"] = os.path.basename(path)
+    return response
+
+
+@app.teardown_request
+def disable_profiler(error):
+    # 例外でafter_requestを通らなかった場合も計測を止める。
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.before_request
+def set_correlation_id():
+    # 上流のプロキシが付与したIDがあれば引き継ぎ、なければ新しく発行する。
+    request_id = request.headers.get("X-Request-ID", "")
+    if REQUEST_ID_PATTERN.match(request_id) is None:
+        request_id = uuid.uuid4().hex
+    g.correlation_id = request_id
+    g.correlation_id_token = correlation_id.set(request_id)
+
+
+@app.after_request
+def add_correlation_id_header(response):
+    if hasattr(g, "correlation_id"):
+        response.headers["X-Request-ID"] = g.correlation_id
+    return response
+
+
+@app.teardown_request
+def reset_correlation_id(error):
+    if hasattr(g, "correlation_id_token"):
+        correlation_id.reset(g.correlation_id_token)
+
+
+@app.after_request
+def record_request_metrics(response):
+    if hasattr(g, "request_started"):
+        metrics.request_duration.observe(
+            time.perf_counter() - g.request_started,
+            endpoint=request.endpoint or "unknown",
+            method=request.method,
+            status=str(response.status_code),
+        )
+    return response
 
 
 @app.after_request
@@ -19,7 +198,7 @@ def add_security_headers(response):
                     script-src 'self' code.jquery.com cdnjs.cloudflare.com \
                     stackpath.bootstrapcdn.com unpkg.com kit.fontawesome.com; \
                     img-src 'self' *.tile.openstreetmap.org unpkg.com data:; \
-                    connect-src ka-f.fontawesome.com; \
+                    connect-src 'self' ka-f.fontawesome.com; \
                     font-src ka-f.fontawesome.com;",
     )
     response.headers.add("X-Content-Type-Options", "nosniff")
@@ -28,6 +207,75 @@ def add_security_headers(response):
     return response
 
 
+@app.after_request
+def compress_response(response):
+    # 圧縮済みのページやファイル、圧縮して書き出すレスポンスはそのまま送る。
+    response_compressor.compress_response(
+        response, negotiate_encoding(request.accept_encodings)
+    )
+    if response.status_code == 200 and not response.is_streamed:
+        response.make_conditional(request)
+    return response
+
+
+def cached_page(view=None, key=None):
+    # 描画して圧縮したページをデータセットのバージョンごとに保持し、同じURLへの
+    # リクエストには描画も圧縮もせずに返す。keyを指定した場合はURLの代わりに
+    # その戻り値で区別し、Noneを返したリクエストは保持しない。
+    if view is None:
+        return functools.partial(cached_page, key=key)
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        page_name = request.full_path if key is None else key()
+        if page_name is None:
+            return view(*args, **kwargs)
+        encoding = negotiate_encoding(request.accept_encodings)
+        version = get_dataset_version()
+        page_key = (page_name, encoding)
+        cache_key = (version,) + page_key
+        cached = page_cache.get(cache_key)
+        if cached is not None:
+            body, headers = cached
+            return Response(body, headers=headers)
+
+        responses = list()
+
+        def render():
+            # 他のワーカーが描画したページがあればそれを使う。
+            page = shared_cache.get(version, "pages", page_key)
+            if page is not None:
+                page_cache.set(cache_key, page)
+                return page
+            response = make_response(view(*args, **kwargs))
+            response_compressor.compress_response(response, encoding)
+            responses.append(response)
+            if response.status_code != 200 or response.is_streamed:
+                return None
+            headers = [
+                (name, value)
+                for name, value in response.headers.items()
+                if name in ("Content-Type", "Content-Encoding", "ETag", "Vary")
+            ]
+            page = (response.get_data(), headers)
+            page_cache.set(cache_key, page)
+            shared_cache.set(version, "pages", page_key, page)
+            return page
+
+        # 同じページを同時に描画しないよう、1つのリクエストの描画を他は待つ。
+        cached, _ = page_cache.coalesce(cache_key, render)
+        if responses:
+            return responses[0]
+        if cached is None:
+            # 保存できないページだったので、このリクエストでも描画する。
+            render()
+            return responses[0]
+        body, headers = cached
+        return Response(body, headers=headers)
+
+    return wrapper
+
+
 @app.context_processor
 def override_url_for():
     return dict(url_for=dated_url_for)
@@ -37,11 +285,38 @@ def dated_url_for(endpoint, **values):
     if endpoint == "static":
         filename = values.get("filename", None)
         if filename:
-            file_path = os.path.join(app.root_path, endpoint, filename)
-            values["q"] = int(os.stat(file_path).st_mtime)
+            asset = asset_manifest.get(filename)
+            if asset is not None:
+                values["filename"] = asset
+            else:
+                # 対応表を書き出していない場合は更新日時で区別する。
+                file_path = os.path.join(app.root_path, endpoint, filename)
+                values["q"] = int(os.stat(file_path).st_mtime)
     return url_for(endpoint, **values)
 
 
+@app.route("/static/" + AssetManifest.DIST_DIRECTORY + "/<path:filename>")
+def static_asset(filename):
+    # ファイル名に内容のハッシュを含むので、1年間キャッシュさせる。圧縮した
+    # ファイルがあればそのまま送る。
+    dist_folder = os.path.join(app.static_folder, AssetManifest.DIST_DIRECTORY)
+    path = safe_join(dist_folder, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    path, encoding = AssetManifest.select_encoding(path, request.accept_encodings)
+    response = send_file(
+        path,
+        mimetype=mimetypes.guess_type(filename)[0],
+        download_name=os.path.basename(filename),
+        max_age=31536000,
+    )
+    response.content_encoding = encoding
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.vary.add("Accept-Encoding")
+    return response
+
+
 def connect_db():
     return DB()
 
@@ -52,23 +327,59 @@ def get_db():
     return g.postgres_db
 
 
+def get_service():
+    # SQLiteファイルを使う設定の場合はPostgreSQLへ接続しない。
+    if Config.STORAGE_BACKEND == "sqlite":
+        if not hasattr(g, "sqlite_service"):
+            g.sqlite_service = SQLiteAEDInstallationLocationService(Config.SQLITE_PATH)
+        return g.sqlite_service
+    return AEDInstallationLocationService(get_db())
+
+
+def stream_template(template_name, **context):
+    # 検索結果を読みながら描画し、描画した部分から順に送る。
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(STREAM_BUFFER_SIZE)
+    return Response(stream_with_context(stream), mimetype="text/html")
+
+
 def get_area_names():
     if not hasattr(g, "area_names"):
-        service = AEDInstallationLocationService(get_db())
-        g.area_names = service.get_area_names()
+        version = get_dataset_version()
+        g.area_names = area_names_cache.get_or_set(
+            version,
+            lambda: shared_cache.get_or_set(
+                version, "area_names", None, lambda: get_service().get_area_names()
+            ),
+        )
     return g.area_names
 
 
+def get_dataset_version():
+    if not hasattr(g, "dataset_version"):
+        version = dataset_version.version
+        if version is None or not dataset_listener.listening:
+            # 通知を待ち受けていない間は、リクエストごとに問い合わせる。
+            version = get_service().get_dataset_version()
+            dataset_version.publish(version)
+        g.dataset_version = version
+    return g.dataset_version
+
+
 @app.teardown_appcontext
 def close_db(error):
     if hasattr(g, "postgres_db"):
         g.postgres_db.close()
+    if hasattr(g, "sqlite_service"):
+        g.sqlite_service.close()
 
 
 @app.route("/")
+@cached_page
 def index():
     title = "トップページ"
-    service = AEDInstallationLocationService(get_db())
+    service = get_service()
     last_updated = service.get_last_updated().strftime("%Y/%m/%d %H:%M")
     return render_template(
         "index.html",
@@ -96,15 +407,21 @@ def search_by_gps():
         except (LocationError, ValueError):
             title = "検索条件に誤りがあります"
             error_message = "緯度経度が正しくありません。"
-            return render_template(
-                "error.html",
-                title=title,
-                area_names=get_area_names(),
-                error_message=error_message,
+            return (
+                render_template(
+                    "error.html",
+                    title=title,
+                    area_names=get_area_names(),
+                    error_message=error_message,
+                ),
+                400,
             )
 
-        service = AEDInstallationLocationService(get_db())
-        near_locations = service.get_near_locations(current_location)
+        service = get_service()
+        # 通知を待ち受けている間は、データベースにバージョンを問い合わせない。
+        near_locations = service.get_near_locations(
+            current_location, get_dataset_version()
+        )
         results_length = len(near_locations)
         return render_template(
             "search_by_gps.html",
@@ -118,6 +435,7 @@ def search_by_gps():
 
 
 @app.route("/location/<location_id>")
+@cached_page
 def location(location_id):
     location_id = escape(location_id)
     try:
@@ -125,62 +443,85 @@ def location(location_id):
     except ValueError:
         title = "検索条件に誤りがあります"
         error_message = "AED設置場所の連番が正しくありません。"
-        return render_template(
-            "error.html",
-            title=title,
-            area_names=get_area_names(),
-            error_message=error_message,
+        # 誤った検索条件のページはキャッシュに保持しない。
+        return (
+            render_template(
+                "error.html",
+                title=title,
+                area_names=get_area_names(),
+                error_message=error_message,
+            ),
+            400,
         )
 
-    service = AEDInstallationLocationService(get_db())
+    service = get_service()
     result = service.find_by_location_id(location_id)
     if len(result) == 0:
         title = "検索条件に誤りがあります"
         error_message = "そのようなAED設置場所連番はありません。"
-        return render_template(
-            "error.html",
-            title=title,
-            area_names=get_area_names(),
-            error_message=error_message,
+        # 誤った検索条件のページはキャッシュに保持しない。
+        return (
+            render_template(
+                "error.html",
+                title=title,
+                area_names=get_area_names(),
+                error_message=error_message,
+            ),
+            400,
         )
 
+    # 近いAED設置場所はインポート時に求めてあるので、連番で引くだけでよい。
+    neighbors = service.find_neighbors(location_id, get_dataset_version())
     title = "AED設置場所「" + result[0].location_name + "」の情報"
     return render_template(
         "location.html",
         title=title,
         area_names=get_area_names(),
         result=result[0],
+        neighbors=neighbors,
     )
 
 
 @app.route("/area/<area_name>")
 def area(area_name):
     area_name = escape(area_name)
-    service = AEDInstallationLocationService(get_db())
-    search_results = service.find_by_area_name(area_name)
-    results_length = len(search_results)
+    service = get_service()
+    results_length = service.count_by_area_name(area_name)
     if results_length == 0:
         title = "検索条件に誤りがあります"
         error_message = "地域の名称が正しくありません。"
-        return render_template(
-            "error.html",
-            title=title,
-            area_names=get_area_names(),
-            error_message=error_message,
+        return (
+            render_template(
+                "error.html",
+                title=title,
+                area_names=get_area_names(),
+                error_message=error_message,
+            ),
+            400,
         )
 
+    # 町域内の全件を一度に読み込まず、サーバー側のカーソルから読みながら描画する。
     title = "「" + area_name + "」のAED設置場所"
-    return render_template(
+    return stream_template(
         "area.html",
         title=title,
         area_names=get_area_names(),
         area_name=area_name,
-        search_results=search_results,
+        search_results=service.iter_by_area_name(area_name),
         results_length=results_length,
     )
 
 
+def get_search_page_key():
+    # 利用者が自由に指定する検索語やページごとに保持すると、他のページを
+    # キャッシュから追い出してしまうので、検索語のない1ページ目だけを保持する。
+    if request.args.get("location_name", "") or request.args.get("page", "1") != "1":
+        return None
+    return request.path
+
+
 @app.route("/find_by_location_name")
+@cached_page(key=get_search_page_key)
 def find_by_location_name():
     location_name = escape(request.args.get("location_name", ""))
     page = escape(request.args.get("page", 1))
@@ -189,24 +530,32 @@ def find_by_location_name():
     except ValueError:
         title = "検索条件に誤りがあります"
         error_message = "ページ数指定が正しくありません。"
-        return render_template(
-            "error.html",
-            title=title,
-            area_names=get_area_names(),
-            error_message=error_message,
+        # 誤った検索条件のページはキャッシュに保持しない。
+        return (
+            render_template(
+                "error.html",
+                title=title,
+                area_names=get_area_names(),
+                error_message=error_message,
+            ),
+            400,
         )
 
-    service = AEDInstallationLocationService(get_db())
+    service = get_service()
     try:
         search_results = service.find_by_location_name(location_name, page)
     except ServiceError as e:
         title = "検索条件に誤りがあります"
         error_message = e.message
-        return render_template(
-            "error.html",
-            title=title,
-            area_names=get_area_names(),
-            error_message=error_message,
+        # 誤った検索条件のページはキャッシュに保持しない。
+        return (
+            render_template(
+                "error.html",
+                title=title,
+                area_names=get_area_names(),
+                error_message=error_message,
+            ),
+            400,
         )
 
     title = "名称に「" + location_name + "」を含むのAED設置場所の検索結果"
@@ -224,10 +573,243 @@ def find_by_location_name():
     )
 
 
+@app.route("/tiles/<int:zoom>/<int:x>/<int:y>.json")
+def tiles(zoom, x, y):
+    try:
+        tile = MapTile(zoom=zoom, x=x, y=y)
+    except LocationError:
+        abort(404)
+
+    # クラスタリング結果はデータセットのバージョンとタイル座標ごとにキャッシュする。
+    version = get_dataset_version()
+    cache_key = (version, tile.zoom, tile.x, tile.y)
+    feature_collection = tile_cache.get_or_set(
+        cache_key,
+        lambda: tile.cluster(get_service().find_by_bounding_box(*tile.bounding_box)),
+    )
+    response = jsonify(feature_collection)
+    # ブラウザが保持するタイルを、データセットが更新されたら破棄できるようにする。
+    response.headers["X-Dataset-Version"] = str(version)
+    return response
+
+
+@app.route("/coverage.json")
+def coverage():
+    try:
+        distance = float(request.args.get("distance", 500))
+    except ValueError:
+        abort(400)
+
+    version = get_dataset_version()
+    grid = coverage_grid_store.get(version)
+    if grid is None:
+        abort(404)
+
+    # 最寄りのAED設置場所まで指定した距離より遠い格子をヒートマップ用に返す。
+    cache_key = (version, distance)
+    result = coverage_cache.get_or_set(
+        cache_key,
+        lambda: {
+            "version": grid.version,
+            "resolution": grid.resolution,
+            "distance": distance,
+            "cells": grid.get_uncovered_cells(distance),
+        },
+    )
+    return jsonify(result)
+
+
+@app.route("/export.<format>")
+def export(format):
+    if format not in DatasetExport.FORMATS:
+        abort(404)
+    try:
+        dataset_export = DatasetExport(
+            format,
+            area=request.args.get("area"),
+            bounding_box=request.args.get("bbox"),
+        )
+    except ServiceError:
+        abort(400)
+
+    # 内容はデータセットのバージョンと条件、圧縮の有無で決まるので、ETagが
+    # 一致すれば検索せずに304を返す。
+    encoding = "gzip" if "gzip" in request.accept_encodings else None
+    etag = dataset_export.get_etag(get_dataset_version(), encoding)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        chunks = dataset_export.generate(dataset_export.iter_locations(get_service()))
+        if encoding is not None:
+            chunks = DatasetExport.compress(chunks)
+        response = Response(
+            stream_with_context(chunks), content_type=dataset_export.mimetype
+        )
+        response.content_encoding = encoding
+        response.headers["Content-Disposition"] = (
+            "attachment; filename=" + dataset_export.filename
+        )
+    response.set_etag(etag)
+    response.vary.add("Accept-Encoding")
+    response.cache_control.no_cache = True
+    return response
+
+
+@app.route("/api/changes")
+def changes():
+    try:
+        since = int(request.args.get("since", 0))
+    except ValueError:
+        abort(400)
+
+    # 同じバージョンからの差分は同じ内容なので、ETagが一致すれば304を返す。
+    version = get_dataset_version()
+    etag = "changes-" + str(since) + "-" + str(version)
+    if etag_matches(request.if_none_match, etag):
+        response = Response(status=304)
+    else:
+        service = get_service()
+        result = service.get_changes(since, version=version)
+        full = result is None
+        if full:
+            # 差分をたどれないほど古いバージョンからは全件を返す。
+            result = {"version": version, "upserts": service.get_all(), "deletes": []}
+        response = jsonify(
+            {
+                "version": result["version"],
+                "since": since,
+                "full": full,
+                "fields": FIELDS,
+                "upserts": [
+                    [getattr(location, field) for field in FIELDS]
+                    for location in result["upserts"]
+                ],
+                "deletes": result["deletes"],
+            }
+        )
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+
+@app.route("/api/autocomplete")
+def autocomplete():
+    try:
+        limit = int(request.args.get("limit", Config.AUTOCOMPLETE_LIMIT))
+    except ValueError:
+        abort(400)
+    limit = max(1, min(limit, MAX_LIMIT))
+    query = request.args.get("q", "")
+
+    version = get_dataset_version()
+    index = autocomplete_index_store.get(version, get_service().get_all)
+    suggestions = index.search(query, limit)
+    for suggestion in suggestions:
+        if suggestion["kind"] == "area":
+            suggestion["url"] = url_for("area", area_name=suggestion["text"])
+        else:
+            suggestion["url"] = url_for(
+                "location", location_id=suggestion["location_id"]
+            )
+    response = jsonify({"query": query, "version": version, "suggestions": suggestions})
+    response.cache_control.public = True
+    response.cache_control.max_age = 60
+    return response
+
+
+@app.route("/offline/manifest.json")
+def offline_manifest():
+    path = os.path.join(Config.OFFLINE_BUNDLE_DIR, OfflineBundle.MANIFEST_NAME)
+    if not os.path.exists(path):
+        abort(404)
+    # データセットを入れ替えたことがすぐに分かるよう、毎回検証させる。
+    response = send_file(path, mimetype="application/json", max_age=0)
+    response.cache_control.no_cache = True
+    return response
+
+
+@app.route("/offline/bundle.<int:version>.json")
+def offline_bundle(version):
+    # ファイル名にバージョンを含むので内容は変わらない。圧縮済みのファイルが
+    # あればそのまま送る。
+    path = None
+    if "gzip" in request.accept_encodings:
+        path = OfflineBundle.get_path(Config.OFFLINE_BUNDLE_DIR, version, True)
+    encoding = "gzip" if path is not None else None
+    if path is None:
+        path = OfflineBundle.get_path(Config.OFFLINE_BUNDLE_DIR, version)
+    if path is None:
+        abort(404)
+    response = send_file(
+        path,
+        mimetype="application/json",
+        download_name="bundle." + str(version) + ".json",
+        max_age=31536000,
+    )
+    response.content_encoding = encoding
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+@app.route("/service_worker.js")
+def service_worker():
+    # サイト全体を制御できるよう、Service Workerはルートのパスから配信する。
+    response = send_file(
+        os.path.join(app.static_folder, "js", "service_worker.js"),
+        mimetype="application/javascript",
+        max_age=0,
+    )
+    response.cache_control.no_cache = True
+    return response
+
+
+@app.route("/cache_stats.json")
+def cache_stats():
+    return jsonify(
+        {
+            "tiles": tile_cache.stats,
+            "coverage": coverage_cache.stats,
+            "pages": page_cache.stats,
+            "area_names": area_names_cache.stats,
+            "near_locations": near_locations_cache.stats,
+            "shared": shared_cache.stats,
+        }
+    )
+
+
+@app.route("/profile_summary.json")
+def profile_summary():
+    # トークンを設定していない場合は、集計結果を公開しない。
+    if not request_profiler.enabled or not Config.PROFILE_TOKEN:
+        abort(404)
+    if not request_profiler.is_authorized(request.headers.get(PROFILE_HEADER)):
+        abort(403)
+    try:
+        limit = int(request.args.get("limit", 20))
+    except ValueError:
+        abort(400)
+    sort = request.args.get("sort", "cumulative")
+    if sort not in ("cumulative", "tottime"):
+        abort(400)
+    response = jsonify(request_profiler.summarize(max(1, min(limit, 200)), sort))
+    response.cache_control.no_store = True
+    return response
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
 @app.errorhandler(404)
 def not_found(error):
     title = "404 Page Not Found."
-    return render_template("404.html", title=title, area_names=get_area_names())
+    return (
+        render_template("404.html", title=title, area_names=get_area_names()),
+        404,
+    )
 
 
 if __name__ == "__main__":
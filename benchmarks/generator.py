@@ -0,0 +1,135 @@
+import hashlib
+import io
+
+import numpy as np
+import pandas as pd
+
+# 旭川市オープンデータのCSVと同じ列名
+CSV_COLUMNS = [
+    "地区",
+    "連番",
+    "設置事業所名",
+    "郵便番号",
+    "住所",
+    "電話番号",
+    "利用可能時間",
+    "ＡＥＤ設置場所",
+    "地図の緯度",
+    "地図の経度",
+]
+
+# 地点が集まる中心地（緯度、経度、標準偏差（度）、地区名）
+CLUSTER_CENTERS = [
+    (43.7706, 142.3650, 0.010, "一条通～十条通"),
+    (43.8026, 142.3820, 0.008, "末広"),
+    (43.7887, 142.3702, 0.006, "花咲"),
+    (43.7580, 142.3723, 0.005, "宮前"),
+    (43.7350, 142.4050, 0.012, "神楽"),
+    (43.7520, 142.4370, 0.010, "東光"),
+    (43.8200, 142.3450, 0.015, "春光"),
+    (43.7100, 142.3800, 0.012, "緑が丘"),
+]
+
+FACILITY_TYPES = [
+    "小学校",
+    "中学校",
+    "市民ホール",
+    "スポーツ公園",
+    "病院",
+    "郵便局",
+    "コンビニエンスストア",
+    "ホテル",
+    "公民館",
+    "保育園",
+]
+
+FLOORS = ["1階事務室", "1階玄関ホール", "2階職員室", "1階受付", "地下1階"]
+AVAILABLE_TIMES = ["", "午前9時～午後5時", "施設休館日を除く， 午前9時～午後10時"]
+
+
+class SyntheticOpenData:
+    """
+    旭川市オープンデータのAED設置事業所一覧と同じ形式の合成データを作成する。
+
+    同じ件数と乱数の種からは常に同じデータを作成する。地点は実際の設置場所と
+    同じように市街地の中心に集まるよう、複数の中心の周りに正規分布で配置する。
+
+    Attributes:
+        lists (list of dicts): OpenData.listsと同じ形式の辞書のリスト
+        checksum (str): CSVのSHA-256ハッシュ値
+
+    """
+
+    def __init__(self, size: int, seed: int = 0):
+        """
+        Args:
+            size (int): 作成する地点数
+            seed (int): 乱数の種
+
+        """
+        random = np.random.default_rng(seed)
+        # 2割は市域全体に一様に配置し、残りはいずれかの中心の周りに配置する。
+        centers = random.integers(0, len(CLUSTER_CENTERS), size)
+        uniform = random.random(size) < 0.2
+        latitudes = np.empty(size)
+        longitudes = np.empty(size)
+        for i, (latitude, longitude, scale, _) in enumerate(CLUSTER_CENTERS):
+            members = centers == i
+            latitudes[members] = random.normal(latitude, scale, members.sum())
+            longitudes[members] = random.normal(longitude, scale, members.sum())
+        latitudes[uniform] = random.uniform(43.60, 43.94, uniform.sum())
+        longitudes[uniform] = random.uniform(142.10, 142.70, uniform.sum())
+        facility_types = random.integers(0, len(FACILITY_TYPES), size)
+        floors = random.integers(0, len(FLOORS), size)
+        available_times = random.integers(0, len(AVAILABLE_TIMES), size)
+
+        self.__lists = list()
+        for i in range(size):
+            area = CLUSTER_CENTERS[centers[i]][3]
+            location_id = i + 1
+            self.__lists.append(
+                {
+                    "area": area,
+                    "location_id": location_id,
+                    "location_name": "旭川市立"
+                    + area
+                    + str(location_id)
+                    + FACILITY_TYPES[facility_types[i]],
+                    "postal_code": "070-" + str(location_id % 10000).zfill(4),
+                    "address": "北海道旭川市"
+                    + area
+                    + str(location_id % 10 + 1)
+                    + "条"
+                    + str(location_id % 20 + 1)
+                    + "丁目",
+                    "phone_number": "0166-"
+                    + str(location_id % 100).zfill(2)
+                    + "-"
+                    + str(location_id % 10000).zfill(4),
+                    "available_time": AVAILABLE_TIMES[available_times[i]],
+                    "installation_floor": FLOORS[floors[i]],
+                    "latitude": round(float(latitudes[i]), 7),
+                    "longitude": round(float(longitudes[i]), 7),
+                }
+            )
+        self.__csv_content = None
+
+    @property
+    def lists(self) -> list:
+        return self.__lists
+
+    @property
+    def csv_content(self) -> bytes:
+        """旭川市オープンデータと同じ列名、文字コード（cp932）のCSVを返す。"""
+        if self.__csv_content is None:
+            df = pd.DataFrame(
+                [list(row.values()) for row in self.__lists], columns=CSV_COLUMNS
+            )
+            buffer = io.BytesIO()
+            df.to_csv(buffer, index=False, encoding="cp932", lineterminator="\r\n")
+            self.__csv_content = buffer.getvalue()
+        return self.__csv_content
+
+    @property
+    def checksum(self) -> str:
+        return hashlib.sha256(self.csv_content).hexdigest()
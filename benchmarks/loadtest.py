@@ -0,0 +1,435 @@
+import argparse
+import json
+import math
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+import requests
+from requests import RequestException
+
+from ash_aed.db import DB
+from ash_aed.services import AEDInstallationLocationService
+from benchmarks.run_benchmarks import get_search_points
+
+DEFAULT_MIX = "search_by_gps=4,location=3,area=2,find_by_location_name=1"
+# 応答時間のヒストグラムの区切り（ミリ秒）
+HISTOGRAM_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+
+class RouteStats:
+    """
+    ルートごとの応答時間と応答の状態を集計する。
+
+    Attributes:
+        latencies (list of float): 応答時間（ミリ秒）のリスト
+        statuses (dict): HTTPステータスコードごとの件数
+        errors (int): 5xxの応答または通信エラーの件数
+
+    """
+
+    def __init__(self):
+        self.__latencies = list()
+        self.__statuses = dict()
+        self.__errors = 0
+        self.__lock = threading.Lock()
+
+    @property
+    def latencies(self) -> list:
+        return self.__latencies
+
+    @property
+    def statuses(self) -> dict:
+        return self.__statuses
+
+    @property
+    def errors(self) -> int:
+        return self.__errors
+
+    def add(self, latency: float, status: int = None) -> None:
+        """1件の応答を記録する。
+
+        Args:
+            latency (float): 応答時間（ミリ秒）
+            status (int): HTTPステータスコード。通信エラーの場合はNone
+
+        """
+        with self.__lock:
+            self.__latencies.append(latency)
+            key = "error" if status is None else str(status)
+            self.__statuses[key] = self.__statuses.get(key, 0) + 1
+            if status is None or 500 <= status:
+                self.__errors += 1
+
+    @staticmethod
+    def _percentile(sorted_values: list, percent: float) -> float:
+        """昇順に並べた値から百分位数を返す（最近接順位法）。
+
+        Args:
+            sorted_values (list of float): 昇順に並べた値のリスト
+            percent (float): 百分位（0〜100）
+
+        Returns:
+            value (float): 百分位数
+
+        """
+        if len(sorted_values) == 0:
+            return 0.0
+        rank = max(1, math.ceil(percent / 100 * len(sorted_values)))
+        return sorted_values[rank - 1]
+
+    def summary(self, elapsed: float) -> dict:
+        """集計結果を返す。
+
+        Args:
+            elapsed (float): 負荷をかけた時間（秒）
+
+        Returns:
+            summary (dict): 件数、スループット、エラー率、百分位数、ヒストグラムを
+                要素に持つ辞書
+
+        """
+        with self.__lock:
+            latencies = sorted(self.__latencies)
+            statuses = dict(self.__statuses)
+            errors = self.__errors
+        count = len(latencies)
+        histogram = dict()
+        lower = 0
+        for upper in HISTOGRAM_BUCKETS + [math.inf]:
+            label = "le_inf" if upper == math.inf else "le_" + str(upper)
+            histogram[label] = sum(1 for value in latencies if lower < value <= upper)
+            lower = upper
+        return {
+            "requests": count,
+            "throughput": round(count / elapsed, 3) if 0 < elapsed else 0.0,
+            "error_rate": round(errors / count, 6) if 0 < count else 0.0,
+            "statuses": statuses,
+            "latency_ms": {
+                "mean": round(sum(latencies) / count, 3) if 0 < count else 0.0,
+                "p50": round(self._percentile(latencies, 50), 3),
+                "p95": round(self._percentile(latencies, 95), 3),
+                "p99": round(self._percentile(latencies, 99), 3),
+                "max": round(latencies[-1], 3) if 0 < count else 0.0,
+            },
+            "histogram_ms": histogram,
+        }
+
+
+class RequestFactory:
+    """
+    トラフィックの比率に従って、ルートごとのリクエストの内容を作成する。
+
+    """
+
+    def __init__(self, mix: dict, seed: int = 0):
+        """
+        Args:
+            mix (dict): ルート名をキー、比率を値に持つ辞書
+            seed (int): 乱数の種
+
+        """
+        db = DB()
+        try:
+            service = AEDInstallationLocationService(db)
+            self.__area_names = service.get_area_names()
+            locations = service.get_all()
+        finally:
+            db.close()
+        self.__location_ids = [location.location_id for location in locations]
+        # 名称の先頭の数文字をキーワードにして部分一致検索を行う。
+        self.__location_names = [
+            location.location_name[:4] for location in locations[:100]
+        ]
+        self.__points = get_search_points(1000, seed=seed)
+        self.__routes = list(mix.keys())
+        self.__weights = list(mix.values())
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+
+    def create(self) -> tuple:
+        """次に送るリクエストを作成する。
+
+        Returns:
+            request (tuple): ルート名、HTTPメソッド、パス、フォームの内容のタプル
+
+        """
+        with self.__lock:
+            route = self.__random.choices(self.__routes, self.__weights)[0]
+            if route == "search_by_gps":
+                point = self.__random.choice(self.__points)
+                return (
+                    route,
+                    "POST",
+                    "/search_by_gps",
+                    {
+                        "current_latitude": str(point.latitude),
+                        "current_longitude": str(point.longitude),
+                    },
+                )
+            elif route == "location":
+                location_id = self.__random.choice(self.__location_ids)
+                return (route, "GET", "/location/" + str(location_id), None)
+            elif route == "area":
+                area_name = self.__random.choice(self.__area_names)
+                return (route, "GET", "/area/" + area_name, None)
+            elif route == "find_by_location_name":
+                location_name = self.__random.choice(self.__location_names)
+                return (
+                    route,
+                    "GET",
+                    "/find_by_location_name",
+                    {"location_name": location_name},
+                )
+            else:
+                # 上記以外のルート名はパスとしてそのまま送る。
+                return (route, "GET", route, None)
+
+
+def create_flask_sender():
+    """Flaskのテストクライアントでリクエストを送る関数を作成する。"""
+    from ash_aed.views import app
+
+    local = threading.local()
+
+    def send(method: str, path: str, data: dict) -> int:
+        if not hasattr(local, "client"):
+            local.client = app.test_client()
+        if method == "POST":
+            response = local.client.post(path, data=data)
+        else:
+            response = local.client.get(path, query_string=data)
+        return response.status_code
+
+    return send
+
+
+def create_http_sender(base_url: str):
+    """HTTPでリクエストを送る関数を作成する。"""
+    local = threading.local()
+
+    def send(method: str, path: str, data: dict) -> int:
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        if method == "POST":
+            response = local.session.post(base_url + path, data=data)
+        else:
+            response = local.session.get(base_url + path, params=data)
+        return response.status_code
+
+    return send
+
+
+def start_server(command: list, port: int) -> subprocess.Popen:
+    """サーバーを起動し、リクエストを受け付けるまで待つ。
+
+    Args:
+        command (list of str): サーバーを起動するコマンド
+        port (int): 待ち受けるポート番号
+
+    Returns:
+        process (obj:`subprocess.Popen`): サーバーのプロセス
+
+    """
+    process = subprocess.Popen(command)
+    for _ in range(100):
+        try:
+            requests.get("http://127.0.0.1:" + str(port) + "/", timeout=1)
+            return process
+        except RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(command[0] + "を起動できませんでした。")
+
+
+def start_gunicorn(port: int, workers: int) -> subprocess.Popen:
+    """gunicornでFlaskのアプリケーションを起動する。
+
+    Args:
+        port (int): 待ち受けるポート番号
+        workers (int): ワーカープロセスの数
+
+    Returns:
+        process (obj:`subprocess.Popen`): gunicornのプロセス
+
+    """
+    return start_server(
+        [
+            "gunicorn",
+            "run:app",
+            "--preload",
+            "--bind",
+            "127.0.0.1:" + str(port),
+            "--workers",
+            str(workers),
+        ],
+        port,
+    )
+
+
+def start_hypercorn(port: int, workers: int) -> subprocess.Popen:
+    """hypercornでASGIのアプリケーションを起動する。
+
+    Args:
+        port (int): 待ち受けるポート番号
+        workers (int): ワーカープロセスの数
+
+    Returns:
+        process (obj:`subprocess.Popen`): hypercornのプロセス
+
+    """
+    return start_server(
+        [
+            "hypercorn",
+            "run_asgi:app",
+            "--bind",
+            "127.0.0.1:" + str(port),
+            "--workers",
+            str(workers),
+        ],
+        port,
+    )
+
+
+def run(send, factory: RequestFactory, concurrency: int, duration: float) -> dict:
+    """指定した時間、並列にリクエストを送り続けて集計する。
+
+    Args:
+        send (callable): HTTPメソッド、パス、フォームの内容を引数に取り
+            HTTPステータスコードを返す関数
+        factory (obj:`RequestFactory`): リクエストの内容を作成するオブジェクト
+        concurrency (int): 並列に送るスレッドの数
+        duration (float): 負荷をかける時間（秒）
+
+    Returns:
+        results (dict): ルート名をキー、集計結果を値に持つ辞書
+
+    """
+    stats = dict()
+    total_stats = RouteStats()
+    stats_lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        while time.perf_counter() < deadline:
+            route, method, path, data = factory.create()
+            with stats_lock:
+                route_stats = stats.setdefault(route, RouteStats())
+            start = time.perf_counter()
+            try:
+                status = send(method, path, data)
+            except RequestException:
+                status = None
+            latency = (time.perf_counter() - start) * 1000
+            route_stats.add(latency, status)
+            total_stats.add(latency, status)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    results = dict()
+    for route, route_stats in stats.items():
+        results[route] = route_stats.summary(elapsed)
+    results["total"] = total_stats.summary(elapsed)
+    return results
+
+
+def parse_mix(mix: str) -> dict:
+    """「ルート名=比率」のカンマ区切りの文字列を辞書にする。"""
+    results = dict()
+    for item in mix.split(","):
+        route, weight = item.split("=")
+        results[route.strip()] = float(weight)
+    return results
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Flaskのルートに並列にリクエストを送り、応答時間とエラー率を計測する。"
+    )
+    parser.add_argument(
+        "--mix", default=DEFAULT_MIX, help="ルートごとのトラフィックの比率"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=8, help="並列に送るスレッドの数"
+    )
+    parser.add_argument(
+        "--duration", type=float, default=30, help="負荷をかける時間（秒）"
+    )
+    parser.add_argument(
+        "--url", help="計測するサーバーのURL（省略時はテストクライアント）"
+    )
+    parser.add_argument(
+        "--gunicorn",
+        action="store_true",
+        help="gunicornをローカルで起動して計測する",
+    )
+    parser.add_argument(
+        "--asgi",
+        action="store_true",
+        help="ASGIのアプリケーションをhypercornでローカルに起動して計測する",
+    )
+    parser.add_argument(
+        "--port", type=int, default=8765, help="gunicorn、hypercornのポート番号"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=2, help="gunicorn、hypercornのワーカー数"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="乱数の種")
+    parser.add_argument("--output", help="計測結果のJSONを書き出すファイル")
+    args = parser.parse_args(argv)
+
+    mix = parse_mix(args.mix)
+    factory = RequestFactory(mix, seed=args.seed)
+    process = None
+    if args.gunicorn or args.asgi:
+        if args.asgi:
+            process = start_hypercorn(args.port, args.workers)
+        else:
+            process = start_gunicorn(args.port, args.workers)
+        target = "http://127.0.0.1:" + str(args.port)
+        send = create_http_sender(target)
+    elif args.url:
+        target = args.url.rstrip("/")
+        send = create_http_sender(target)
+    else:
+        target = "flask-test-client"
+        send = create_flask_sender()
+
+    try:
+        routes = run(send, factory, args.concurrency, args.duration)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    results = {
+        "created_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "target": target,
+        "server": "hypercorn" if args.asgi else "gunicorn" if args.gunicorn else None,
+        "mix": mix,
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "routes": routes,
+    }
+    output = json.dumps(results, ensure_ascii=False, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
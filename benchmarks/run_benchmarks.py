@@ -0,0 +1,507 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from unittest.mock import Mock, patch
+
+import numpy as np
+
+import import_opendata
+from ash_aed.async_db import AsyncDB
+from ash_aed.async_services import AsyncAEDInstallationLocationService
+from ash_aed.autocomplete import AutocompleteIndex
+from ash_aed.config import Config
+from ash_aed.coverage import CoverageGrid, get_distances
+from ash_aed.db import DB
+from ash_aed.models import AEDInstallationLocationFactory, CurrentLocation
+from ash_aed.neighbors import get_nearest_neighbors
+from ash_aed.scraper import OpenData
+from ash_aed.services import (
+    AEDInstallationLocationService,
+    near_locations_cache
+)
+from ash_aed.sqlite_services import SQLiteAEDInstallationLocationService
+from benchmarks.generator import SyntheticOpenData
+
+DEFAULT_SCALES = "300,3000,30000"
+DEFAULT_THRESHOLD = 0.2
+
+# データベースを使わない計測
+MEMORY_CASES = [
+    "parse_csv",
+    "materialize",
+    "distance_scalar",
+    "distance_vectorized",
+    "coverage_grid",
+    "nearest_neighbors",
+    "autocomplete_build",
+    "autocomplete_search",
+    "sqlite_build",
+    "sqlite_search_gps",
+    "sqlite_search_name",
+    "sqlite_bounding_box",
+]
+# データベースの内容を合成データで置き換えて行う計測
+DATABASE_CASES = [
+    "import",
+    "search_gps",
+    "search_gps_async",
+    "search_name",
+    "pagination",
+    "queries_plain",
+    "queries_prepared",
+    "area",
+]
+
+
+def measure(function, repeat: int) -> dict:
+    """関数を繰り返し実行して経過時間を計測する。
+
+    Args:
+        function (callable): 計測する関数
+        repeat (int): 繰り返す回数
+
+    Returns:
+        result (dict): 経過時間（秒）の最小値、中央値と繰り返した回数を要素に
+            持つ辞書
+
+    """
+    timings = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "repeat": repeat,
+    }
+
+
+def get_search_points(number: int, seed: int = 1) -> list:
+    """検索に使う現在地を旭川市の市街地から決まった乱数で選ぶ。
+
+    Args:
+        number (int): 地点数
+        seed (int): 乱数の種
+
+    Returns:
+        points (list of obj:`CurrentLocation`): 現在地オブジェクトのリスト
+
+    """
+    random = np.random.default_rng(seed)
+    return [
+        CurrentLocation(random.uniform(43.72, 43.82), random.uniform(142.32, 142.44))
+        for _ in range(number)
+    ]
+
+
+def run_memory_cases(open_data: SyntheticOpenData, cases: list, repeat: int) -> dict:
+    """データベースを使わない計測を行う。
+
+    Args:
+        open_data (obj:`SyntheticOpenData`): 合成データ
+        cases (list of str): 計測する項目
+        repeat (int): 繰り返す回数
+
+    Returns:
+        results (dict): 項目名をキー、計測結果を値に持つ辞書
+
+    """
+    results = dict()
+    factory = AEDInstallationLocationFactory()
+    for row in open_data.lists:
+        factory.create(**row)
+    locations = factory.items
+    current_location = get_search_points(1)[0]
+
+    if "parse_csv" in cases:
+
+        def parse_csv():
+            with patch("ash_aed.scraper.requests") as mock_requests:
+                mock_requests.get.return_value = Mock(content=open_data.csv_content)
+                OpenData()
+
+        results["parse_csv"] = measure(parse_csv, repeat)
+
+    if "materialize" in cases:
+
+        def materialize():
+            factory = AEDInstallationLocationFactory()
+            for row in open_data.lists:
+                factory.create(**row)
+
+        results["materialize"] = measure(materialize, repeat)
+
+    if "distance_scalar" in cases:
+
+        def distance_scalar():
+            for location in locations:
+                current_location.get_distance_to(location)
+
+        results["distance_scalar"] = measure(distance_scalar, repeat)
+
+    if "distance_vectorized" in cases:
+        latitudes = np.array([location.latitude for location in locations])
+        longitudes = np.array([location.longitude for location in locations])
+
+        def distance_vectorized():
+            get_distances(
+                np.array([current_location.latitude]),
+                np.array([current_location.longitude]),
+                latitudes,
+                longitudes,
+            )
+
+        results["distance_vectorized"] = measure(distance_vectorized, repeat)
+
+    if "coverage_grid" in cases:
+
+        def coverage_grid():
+            CoverageGrid.build(
+                version=0,
+                locations=locations,
+                bounding_box=Config.COVERAGE_GRID_BOUNDING_BOX,
+                resolution=Config.COVERAGE_GRID_RESOLUTION,
+                candidates_number=Config.COVERAGE_GRID_CANDIDATES,
+                workers=Config.COVERAGE_GRID_WORKERS,
+            )
+
+        results["coverage_grid"] = measure(coverage_grid, repeat)
+
+    if "nearest_neighbors" in cases:
+        results["nearest_neighbors"] = measure(
+            lambda: get_nearest_neighbors(locations, Config.NEIGHBORS_COUNT), repeat
+        )
+
+    if "autocomplete_build" in cases:
+        results["autocomplete_build"] = measure(
+            lambda: AutocompleteIndex.build(0, locations), repeat
+        )
+
+    if "autocomplete_search" in cases:
+        index = AutocompleteIndex.build(0, locations)
+        queries = ("旭", "旭川市立", "公園", "1条", "該当なし")
+
+        def autocomplete_search():
+            for query in queries:
+                index.search(query, Config.AUTOCOMPLETE_LIMIT)
+
+        results["autocomplete_search"] = measure(autocomplete_search, repeat)
+
+    sqlite_cases = [case for case in cases if case.startswith("sqlite_")]
+    if sqlite_cases:
+        with tempfile.TemporaryDirectory() as directory:
+            results.update(
+                run_sqlite_cases(
+                    os.path.join(directory, "aed.sqlite3"),
+                    locations,
+                    sqlite_cases,
+                    repeat,
+                )
+            )
+
+    return results
+
+
+def run_sqlite_cases(path: str, locations: list, cases: list, repeat: int) -> dict:
+    """SQLiteファイルを作成し、データベースサーバーを使わずに検索する計測を行う。
+
+    Args:
+        path (str): 作成するSQLiteファイルのパス
+        locations (list of obj:`AEDInstallationLocation`): AED設置場所のリスト
+        cases (list of str): 計測する項目
+        repeat (int): 繰り返す回数
+
+    Returns:
+        results (dict): 項目名をキー、計測結果を値に持つ辞書
+
+    """
+    results = dict()
+    last_updated = datetime(2021, 4, 1).astimezone()
+
+    def build():
+        SQLiteAEDInstallationLocationService.build(path, locations, last_updated)
+
+    if "sqlite_build" in cases:
+        results["sqlite_build"] = measure(build, repeat)
+    else:
+        build()
+
+    service = SQLiteAEDInstallationLocationService(path)
+    try:
+        if "sqlite_search_gps" in cases:
+            points = get_search_points(10)
+
+            def search_gps():
+                # search_gpsと同じく、キャッシュが効かない場合の検索時間を計測する。
+                for point in points:
+                    near_locations_cache.clear()
+                    service.get_near_locations(point)
+
+            results["sqlite_search_gps"] = measure(search_gps, repeat)
+
+        if "sqlite_search_name" in cases:
+            results["sqlite_search_name"] = measure(
+                lambda: service.find_by_location_name("小学校"), repeat
+            )
+
+        if "sqlite_bounding_box" in cases:
+            results["sqlite_bounding_box"] = measure(
+                lambda: service.find_by_bounding_box(43.76, 142.35, 43.78, 142.37),
+                repeat,
+            )
+    finally:
+        service.close()
+    return results
+
+
+def run_database_cases(open_data: SyntheticOpenData, cases: list, repeat: int) -> dict:
+    """合成データをインポートしてデータベースを使う計測を行う。
+
+    Args:
+        open_data (obj:`SyntheticOpenData`): 合成データ
+        cases (list of str): 計測する項目
+        repeat (int): 繰り返す回数
+
+    Returns:
+        results (dict): 項目名をキー、計測結果を値に持つ辞書
+
+    """
+    results = dict()
+
+    # 格子データとSQLiteファイル、ブラウザ用のデータセットの作成は別に計測するので、
+    # インポートからは除く。
+    with patch("import_opendata.make_coverage_grid"), patch(
+        "import_opendata.make_sqlite_database"
+    ), patch("import_opendata.make_location_neighbors"), patch(
+        "import_opendata.make_offline_bundle"
+    ):
+        if "import" in cases:
+            results["import"] = measure(
+                lambda: import_opendata.import_opendata(open_data), repeat
+            )
+        else:
+            import_opendata.import_opendata(open_data)
+
+    db = DB()
+    try:
+        service = AEDInstallationLocationService(db)
+        points = get_search_points(10)
+
+        if "search_gps" in cases:
+
+            def search_gps():
+                # キャッシュが効かない場合の検索時間を計測する。
+                for point in points:
+                    near_locations_cache.clear()
+                    service.get_near_locations(point)
+
+            results["search_gps"] = measure(search_gps, repeat)
+
+        if "search_gps_async" in cases:
+            # search_gpsと同じ地点を、接続プールを使って並行に検索する。
+            results["search_gps_async"] = measure_async_search(points, repeat)
+
+        for case, prepared in (("queries_plain", False), ("queries_prepared", True)):
+            if case in cases:
+                # 固定のSELECT文をそのまま送る場合と、準備済みのSQL文を使う場合を
+                # 比べる。最初の1回で準備されるので、2回目以降は準備の時間を含まない。
+                query_service = AEDInstallationLocationService(db, prepared=prepared)
+                results[case] = measure(
+                    lambda: run_query_mix(query_service, open_data), repeat
+                )
+
+        if "search_name" in cases:
+            results["search_name"] = measure(
+                lambda: service.find_by_location_name("小学校"), repeat
+            )
+
+        if "pagination" in cases:
+            max_page = service.find_by_location_name("小学校")["max_page"]
+            results["pagination"] = measure(
+                lambda: service.find_by_location_name("小学校", page=max_page),
+                repeat,
+            )
+
+        if "area" in cases:
+            results["area"] = measure(
+                lambda: service.find_by_area_name("一条通～十条通"), repeat
+            )
+    finally:
+        db.close()
+
+    return results
+
+
+def run_query_mix(service: AEDInstallationLocationService, open_data) -> None:
+    """1件を返す固定のSELECT文を繰り返し実行する。
+
+    実行時間に対して解析と実行計画の作成の割合が大きい、主キーによる検索と
+    データセットのバージョンの取得を計測する。
+
+    Args:
+        service (obj:`AEDInstallationLocationService`): 計測するサービス
+        open_data (obj:`SyntheticOpenData`): 合成データ
+
+    """
+    for row in open_data.lists[:200]:
+        service.get_last_updated()
+        service.find_by_location_id(row["location_id"])
+
+
+def measure_async_search(points: list, repeat: int) -> dict:
+    """非同期版のサービスで複数地点の検索を並行に行う時間を計測する。
+
+    Args:
+        points (list of obj:`CurrentLocation`): 検索する現在地のリスト
+        repeat (int): 繰り返す回数
+
+    Returns:
+        result (dict): 経過時間（秒）の最小値、中央値と繰り返した回数を要素に
+            持つ辞書
+
+    """
+
+    async def run():
+        db = await AsyncDB.create(max_size=len(points))
+        try:
+            service = AsyncAEDInstallationLocationService(db)
+            timings = list()
+            for _ in range(repeat):
+                near_locations_cache.clear()
+                start = time.perf_counter()
+                await asyncio.gather(
+                    *(service.get_near_locations(point) for point in points)
+                )
+                timings.append(time.perf_counter() - start)
+            return timings
+        finally:
+            await db.close()
+
+    timings = asyncio.run(run())
+    return {
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "repeat": repeat,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """計測結果を基準の結果と比較し、遅くなった項目を返す。
+
+    Args:
+        results (dict): 計測結果
+        baseline (dict): 基準の計測結果
+        threshold (float): 許容する中央値の増加の割合
+
+    Returns:
+        regressions (list of dicts): 許容範囲を超えて遅くなった項目のリスト
+
+    """
+    regressions = list()
+    for name, result in results["results"].items():
+        if name not in baseline["results"]:
+            continue
+        baseline_median = baseline["results"][name]["median"]
+        if baseline_median <= 0:
+            continue
+        ratio = result["median"] / baseline_median
+        result["baseline_median"] = baseline_median
+        result["ratio"] = ratio
+        if 1 + threshold < ratio:
+            regressions.append({"name": name, "ratio": ratio})
+    return regressions
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="合成データで検索やインポートの処理時間を計測する。"
+    )
+    parser.add_argument(
+        "--scales",
+        default=DEFAULT_SCALES,
+        help="カンマ区切りの地点数（300〜1000000）",
+    )
+    parser.add_argument(
+        "--cases",
+        default=",".join(MEMORY_CASES + DATABASE_CASES),
+        help="カンマ区切りの計測項目（"
+        + ",".join(MEMORY_CASES + DATABASE_CASES)
+        + "）",
+    )
+    parser.add_argument(
+        "--database",
+        action="store_true",
+        help="データベースを使う計測も行う（DATABASE_URLの内容を合成データで置き換える）",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="繰り返す回数")
+    parser.add_argument("--seed", type=int, default=0, help="合成データの乱数の種")
+    parser.add_argument("--output", help="計測結果のJSONを書き出すファイル")
+    parser.add_argument("--baseline", help="比較する基準の計測結果のJSONファイル")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="基準より遅くなったと判定する中央値の増加の割合",
+    )
+    args = parser.parse_args(argv)
+
+    scales = [int(scale) for scale in args.scales.split(",")]
+    cases = args.cases.split(",")
+    unknown_cases = set(cases) - set(MEMORY_CASES + DATABASE_CASES)
+    if unknown_cases:
+        parser.error("不明な計測項目です: " + ",".join(sorted(unknown_cases)))
+    if not args.database:
+        cases = [case for case in cases if case in MEMORY_CASES]
+
+    results = {
+        "created_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "results": dict(),
+    }
+    for scale in scales:
+        open_data = SyntheticOpenData(scale, seed=args.seed)
+        case_results = run_memory_cases(open_data, cases, args.repeat)
+        if args.database:
+            case_results.update(run_database_cases(open_data, cases, args.repeat))
+        for case, result in case_results.items():
+            results["results"][case + "@" + str(scale)] = result
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        results["regressions"] = regressions
+        if regressions:
+            exit_code = 1
+
+    output = json.dumps(results, ensure_ascii=False, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    for regression in results.get("regressions", list()):
+        print(
+            "基準より遅くなりました: "
+            + regression["name"]
+            + "（"
+            + format(regression["ratio"], ".2f")
+            + "倍）",
+            file=sys.stderr,
+        )
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,5 @@
+DROP TABLE IF EXISTS aed_installation_locations_staging;
+DROP TABLE IF EXISTS aed_installation_locations_previous;
 DROP TABLE IF EXISTS aed_installation_locations;
 CREATE TABLE aed_installation_locations(
   id SERIAL NOT NULL,
@@ -14,3 +16,27 @@ CREATE TABLE aed_installation_locations(
   updated_at TIMESTAMPTZ NOT NULL
 );
 CREATE INDEX ON aed_installation_locations (area);
+CREATE INDEX ON aed_installation_locations (latitude, longitude);
+DROP TABLE IF EXISTS dataset_versions;
+CREATE TABLE dataset_versions(
+  version BIGINT NOT NULL PRIMARY KEY,
+  checksum TEXT NOT NULL,
+  imported_at TIMESTAMPTZ NOT NULL,
+  base_version BIGINT
+);
+DROP TABLE IF EXISTS dataset_changes;
+CREATE TABLE dataset_changes(
+  version BIGINT NOT NULL,
+  location_id integer NOT NULL,
+  operation CHAR(1) NOT NULL,
+  PRIMARY KEY (version, location_id)
+);
+DROP TABLE IF EXISTS location_neighbors;
+CREATE TABLE location_neighbors(
+  version BIGINT NOT NULL,
+  location_id integer NOT NULL,
+  rank smallint NOT NULL,
+  neighbor_id integer NOT NULL,
+  distance double precision NOT NULL,
+  PRIMARY KEY (version, location_id, rank)
+);
@@ -0,0 +1,11 @@
+from ash_aed.metrics import registry
+
+
+def on_starting(server):
+    # 前回起動した時のワーカーのメトリクスを合算しないよう削除する。
+    registry.clear()
+
+
+def worker_exit(server, worker):
+    # 終了するワーカーが最後に数えた値も合算されるよう書き出す。
+    registry.stop()
@@ -1,15 +1,39 @@
+import argparse
+from typing import Optional
+
+from ash_aed.config import Config
 from ash_aed.db import DB
 from ash_aed.errors import DatabaseError, DataError
 from ash_aed.logs import AppLog
 from ash_aed.models import AEDInstallationLocationFactory
+from ash_aed.neighbors import get_nearest_neighbors
 from ash_aed.scraper import OpenData
 from ash_aed.services import AEDInstallationLocationService
+from make_coverage_grid import make_coverage_grid
+from make_location_neighbors import make_location_neighbors
+from make_offline_bundle import make_offline_bundle
+from make_sqlite_database import make_sqlite_database
+from notify_dataset_version import notify_dataset_version
+
+
+def import_opendata(open_data: OpenData = None) -> Optional[int]:
+    """データベースに旭川市オープンデータのAED設置事業所一覧データを格納
+
+    稼働中のテーブルを止めないよう、ステージングテーブルへ登録して検証した後に
+    テーブル名の変更で入れ替える。
 
+    Args:
+        open_data (obj:`OpenData`): ダウンロード済みのオープンデータ。指定しない
+            場合はここでダウンロードする。
 
-def import_opendata():
-    """データベースに旭川市オープンデータのAED設置事業所一覧データを格納"""
+    Returns:
+        version (int): インポートしたデータセットのバージョン。失敗した場合は
+            Noneを返す。
 
-    open_data = OpenData()
+    """
+
+    if open_data is None:
+        open_data = OpenData()
     factory = AEDInstallationLocationFactory()
     for row in open_data.lists:
         factory.create(**row)
@@ -18,17 +42,114 @@ def import_opendata():
     logger = AppLog()
     try:
         service = AEDInstallationLocationService(db)
-        service.truncate()
+        service.create_staging_table()
+        staging_service = AEDInstallationLocationService(
+            db, table_name=service.staging_table_name
+        )
         for aed_installation_location in factory.items:
-            service.create(aed_installation_location)
+            if not staging_service.create(aed_installation_location):
+                raise DataError("ステージングテーブルへの登録に失敗しました。")
+        service.build_staging_indexes()
+        service.validate_staging(factory.items)
+        # 近いAED設置場所は入れ替える前にステージングテーブルから求めて記録する。
+        # 入れ替えた後に記録すると、その間に表示したAED設置場所のページが近い
+        # AED設置場所のないまま新しいバージョンでキャッシュされる。
+        service.store_neighbors(
+            staging_service.get_dataset_version(),
+            get_nearest_neighbors(staging_service.get_all(), Config.NEIGHBORS_COUNT),
+            keep_version=service.get_dataset_version(),
+        )
+        db.commit()
+
+        # 入れ替えは短いトランザクションで行い、すぐにコミットしてロックを解放する。
+        service.swap_staging()
+        db.commit()
+        logger.info(
+            "データベースへAED設置事業所一覧オープンデータをインポートしました。"
+        )
+
+        # バージョンと変更履歴の記録は入れ替えたテーブルを読むだけなので、ロックを
+        # 解放した後の別のトランザクションで行う。
+        try:
+            version = service.create_dataset_version(open_data.checksum)
+            service.record_changes(version)
+            db.commit()
+        except (DatabaseError, DataError) as e:
+            # 入れ替えは済んでいるので、記録できなくても配布するデータは作り直す。
+            db.rollback()
+            logger.error(e.message)
+            version = service.get_dataset_version()
+    except (DatabaseError, DataError) as e:
+        db.rollback()
+        logger.error(e.message)
+        return None
+    finally:
+        db.close()
+
+    # インポートしたデータから最寄りのAED設置場所の格子データを作り直し、Web
+    # サーバーへ配布するSQLiteファイルとブラウザ用のデータセットを書き出す。
+    # 全て書き出してから、Webサーバーへ新しいバージョンを通知する。
+    make_derived_files(with_neighbors=False)
+    return version
+
+
+def make_derived_files(with_neighbors: bool = True):
+    """
+    稼働中のテーブルから作るデータを作り直し、Webサーバーへ新しいバージョンを
+    通知する。
+
+    テーブルの入れ替えはコミット済みなので、どれかを作れなくても残りを作り、
+    必ず通知する。通知しないと、待ち受けているワーカーが古いバージョンのまま
+    になる。
+
+    Args:
+        with_neighbors (bool): 近いAED設置場所も求め直す場合はTrue。インポート
+            では入れ替える前に記録済みなのでFalseにする。
+
+    """
+
+    logger = AppLog()
+    makes = [make_coverage_grid, make_sqlite_database, make_offline_bundle]
+    if with_neighbors:
+        makes.insert(1, make_location_neighbors)
+    for make in makes:
+        try:
+            make()
+        except Exception as e:
+            logger.error(make.__name__ + "に失敗しました。" + repr(e))
+    notify_dataset_version()
+
+
+def rollback_opendata():
+    """直前のインポート前のAED設置事業所一覧データに戻す"""
+
+    db = DB()
+    logger = AppLog()
+    try:
+        service = AEDInstallationLocationService(db)
+        service.rollback_import()
         db.commit()
-        logger.info("データベースへAED設置事業所一覧オープンデータをインポートしました。")
     except (DatabaseError, DataError) as e:
         db.rollback()
         logger.error(e.message)
+        return
     finally:
         db.close()
 
+    make_derived_files()
+
 
 if __name__ == "__main__":
-    import_opendata()
+    parser = argparse.ArgumentParser(
+        description="旭川市オープンデータのAED設置事業所一覧データをインポートする。"
+    )
+    parser.add_argument(
+        "--rollback",
+        action="store_true",
+        help="直前のインポート前のデータに戻す",
+    )
+    args = parser.parse_args()
+    if args.rollback:
+        rollback_opendata()
+    else:
+        import_opendata()
@@ -0,0 +1,28 @@
+import os
+
+from ash_aed.assets import AssetManifest
+from ash_aed.logs import AppLog
+
+
+def make_assets(static_folder: str = None):
+    """静的ファイルを内容のハッシュを含むファイル名で圧縮したものとともに書き出す
+
+    Args:
+        static_folder (str): staticディレクトリのパス
+
+    """
+
+    if static_folder is None:
+        static_folder = os.path.join(os.path.dirname(__file__), "ash_aed", "static")
+    logger = AppLog()
+    try:
+        manifest = AssetManifest.build(static_folder)
+        logger.info(
+            "静的ファイルを書き出しました。" + "（" + str(len(manifest.assets)) + "件）"
+        )
+    except OSError as e:
+        logger.error(str(e))
+
+
+if __name__ == "__main__":
+    make_assets()
@@ -0,0 +1,46 @@
+from ash_aed.config import Config
+from ash_aed.coverage import CoverageGrid
+from ash_aed.db import DB
+from ash_aed.errors import DatabaseError, DataError, LocationError
+from ash_aed.logs import AppLog
+from ash_aed.services import AEDInstallationLocationService
+
+
+def make_coverage_grid():
+    """旭川市域の格子ごとに最寄りのAED設置場所を計算してファイルへ保存"""
+
+    logger = AppLog()
+    try:
+        db = DB()
+    except DatabaseError as e:
+        logger.error(e.message)
+        return
+    try:
+        service = AEDInstallationLocationService(db)
+        grid = CoverageGrid.build(
+            version=service.get_dataset_version(),
+            locations=service.get_all(),
+            bounding_box=Config.COVERAGE_GRID_BOUNDING_BOX,
+            resolution=Config.COVERAGE_GRID_RESOLUTION,
+            candidates_number=Config.COVERAGE_GRID_CANDIDATES,
+            workers=Config.COVERAGE_GRID_WORKERS,
+        )
+        grid.save(Config.COVERAGE_GRID_PATH)
+        logger.info(
+            "最寄りのAED設置場所の格子データを作成しました。"
+            + "（"
+            + str(grid.exact.shape[0])
+            + "×"
+            + str(grid.exact.shape[1])
+            + "）"
+        )
+    except (DatabaseError, DataError, LocationError) as e:
+        logger.error(e.message)
+    except OSError as e:
+        logger.error(str(e))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    make_coverage_grid()
@@ -0,0 +1,37 @@
+from ash_aed.config import Config
+from ash_aed.db import DB
+from ash_aed.errors import DatabaseError, DataError
+from ash_aed.logs import AppLog
+from ash_aed.neighbors import get_nearest_neighbors
+from ash_aed.services import AEDInstallationLocationService
+
+
+def make_location_neighbors(k: int = Config.NEIGHBORS_COUNT):
+    """AED設置場所ごとに近い他のAED設置場所を求めてデータベースへ保存
+
+    Args:
+        k (int): AED設置場所ごとに求める近いAED設置場所の件数
+
+    """
+
+    logger = AppLog()
+    try:
+        db = DB()
+    except DatabaseError as e:
+        logger.error(e.message)
+        return
+    try:
+        service = AEDInstallationLocationService(db)
+        service.store_neighbors(
+            service.get_dataset_version(), get_nearest_neighbors(service.get_all(), k)
+        )
+        db.commit()
+    except (DatabaseError, DataError) as e:
+        db.rollback()
+        logger.error(e.message)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    make_location_neighbors()
@@ -0,0 +1,42 @@
+from ash_aed.bundle import OfflineBundle
+from ash_aed.config import Config
+from ash_aed.db import DB
+from ash_aed.errors import DatabaseError, DataError
+from ash_aed.logs import AppLog
+from ash_aed.services import AEDInstallationLocationService
+
+
+def make_offline_bundle(directory: str = Config.OFFLINE_BUNDLE_DIR):
+    """ブラウザが手元で最寄りのAED設置場所を検索するためのデータセットを書き出す
+
+    Args:
+        directory (str): 書き出すディレクトリ
+
+    """
+
+    logger = AppLog()
+    try:
+        db = DB()
+    except DatabaseError as e:
+        logger.error(e.message)
+        return
+    try:
+        service = AEDInstallationLocationService(db)
+        bundle = OfflineBundle.build(service.get_dataset_version(), service.get_all())
+        bundle.save(directory)
+        logger.info(
+            "オフライン検索用のデータセットを書き出しました。"
+            + "（"
+            + str(bundle.data["count"])
+            + "件）"
+        )
+    except (DatabaseError, DataError) as e:
+        logger.error(e.message)
+    except OSError as e:
+        logger.error(str(e))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    make_offline_bundle()
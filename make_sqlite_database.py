@@ -0,0 +1,52 @@
+import sqlite3
+
+from ash_aed.config import Config
+from ash_aed.db import DB
+from ash_aed.errors import DatabaseError, DataError
+from ash_aed.logs import AppLog
+from ash_aed.services import AEDInstallationLocationService
+from ash_aed.sqlite_services import SQLiteAEDInstallationLocationService
+
+
+def make_sqlite_database(path: str = Config.SQLITE_PATH):
+    """Webアプリケーションが読み取り専用で検索に使うSQLiteファイルを書き出す
+
+    Args:
+        path (str): 書き出すSQLiteファイルのパス
+
+    """
+
+    logger = AppLog()
+    try:
+        db = DB()
+    except DatabaseError as e:
+        logger.error(e.message)
+        return
+    try:
+        service = AEDInstallationLocationService(db)
+        locations = service.get_all()
+        SQLiteAEDInstallationLocationService.build(
+            path,
+            locations,
+            service.get_last_updated(),
+            versions=service.get_version_history(),
+            changes=service.get_change_log(),
+            neighbors=service.get_neighbor_rows(service.get_dataset_version()),
+        )
+        logger.info(
+            "AED設置場所のSQLiteファイルを書き出しました。"
+            + "（"
+            + str(len(locations))
+            + "件）"
+        )
+    except (DatabaseError, DataError) as e:
+        logger.error(e.message)
+    except (OSError, sqlite3.Error) as e:
+        # FTS5のtrigramを使えない場合やディスクが一杯の場合など
+        logger.error(str(e))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    make_sqlite_database()
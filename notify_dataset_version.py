@@ -0,0 +1,37 @@
+from ash_aed.config import Config
+from ash_aed.db import DB
+from ash_aed.errors import DatabaseError, DataError
+from ash_aed.logs import AppLog
+from ash_aed.services import AEDInstallationLocationService
+
+
+def notify_dataset_version(channel: str = Config.DATASET_CHANNEL):
+    """現在のデータセットのバージョンを、待ち受けているWebサーバーへ通知する
+
+    格子データやSQLiteファイルを書き出した後に呼び出し、各ワーカーが新しい
+    バージョンへ切り替えた時に使えるようにしておく。
+
+    Args:
+        channel (str): 通知するチャンネル
+
+    """
+
+    logger = AppLog()
+    try:
+        db = DB()
+    except DatabaseError as e:
+        logger.error(e.message)
+        return
+    try:
+        service = AEDInstallationLocationService(db)
+        service.notify_dataset_version(service.get_dataset_version(), channel)
+        db.commit()
+    except (DatabaseError, DataError) as e:
+        db.rollback()
+        logger.error(e.message)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    notify_dataset_version()
@@ -0,0 +1,22 @@
+from ash_aed.config import Config
+from ash_aed.scheduler import RefreshScheduler
+from import_opendata import import_opendata
+
+
+def refresh_worker():
+    """オープンデータの更新を定期的に確認してインポートし続ける
+
+    インポートで作り直す格子データ、SQLiteファイル、ブラウザ用のデータセットは
+    このホストのディスクに書き出すので、Webサーバーとディスクを共有するホストで
+    実行する。
+
+    """
+
+    # アプリ内で確認しない設定の場合も、ワーカーとしては1時間ごとに確認する。
+    interval = Config.REFRESH_INTERVAL if 0 < Config.REFRESH_INTERVAL else 3600
+    scheduler = RefreshScheduler(import_opendata, interval, Config.REFRESH_JITTER)
+    scheduler.run_forever()
+
+
+if __name__ == "__main__":
+    refresh_worker()
@@ -1,4 +1,15 @@
+from ash_aed.config import Config
+from ash_aed.scheduler import RefreshScheduler
 from ash_aed.views import app
+from import_opendata import import_opendata
+
+if 0 < Config.REFRESH_INTERVAL:
+    scheduler = RefreshScheduler(
+        import_opendata, Config.REFRESH_INTERVAL, Config.REFRESH_JITTER
+    )
+    # gunicornの--preloadではfork前に起動したスレッドがワーカーに引き継がれない
+    # ため、各ワーカーで最初のリクエストを受けた時に起動する。
+    app.before_request(scheduler.start)
 
 if __name__ == "__main__":
     app.run()
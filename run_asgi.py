@@ -0,0 +1,4 @@
+from ash_aed.asgi import app
+
+if __name__ == "__main__":
+    app.run()
@@ -0,0 +1,103 @@
+import unittest
+from unittest.mock import patch
+
+from ash_aed import asgi, views
+from ash_aed.config import Config
+from ash_aed.db import DB
+from ash_aed.models import AEDInstallationLocationFactory
+from ash_aed.neighbors import get_nearest_neighbors
+from ash_aed.services import AEDInstallationLocationService
+from tests.test_services import test_data
+
+
+def get_routes(app):
+    return {
+        (rule.rule, method)
+        for rule in app.url_map.iter_rules()
+        for method in rule.methods - {"HEAD", "OPTIONS"}
+    }
+
+
+class TestRoutes(unittest.TestCase):
+    def test_routes(self):
+        # WSGIとASGIのどちらでも同じURLを提供する
+        self.assertEqual(get_routes(asgi.app), get_routes(views.app))
+
+
+class TestASGIApplication(unittest.IsolatedAsyncioTestCase):
+    @classmethod
+    def setUpClass(cls):
+        factory = AEDInstallationLocationFactory()
+        for row in test_data:
+            factory.create(**row)
+        cls.db = DB()
+        cls.service = AEDInstallationLocationService(cls.db)
+        cls.service.truncate()
+        for item in factory.items:
+            cls.service.create(item)
+        cls.service.store_neighbors(
+            cls.service.get_dataset_version(), get_nearest_neighbors(factory.items, 2)
+        )
+        cls.db.commit()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.db.close()
+
+    async def asyncSetUp(self):
+        self.test_app = asgi.app.test_app()
+        # 通知は待ち受けず、リクエストごとにバージョンを問い合わせる
+        with patch.object(Config, "DATASET_LISTENER", False):
+            await self.test_app.startup()
+        self.client = self.test_app.test_client()
+        self.views_client = views.app.test_client()
+
+    async def asyncTearDown(self):
+        await self.test_app.shutdown()
+
+    async def test_location(self):
+        # 近いAED設置場所も表示する
+        expect = self.views_client.get("/location/1").get_data(as_text=True)
+        response = await self.client.get("/location/1")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(await response.get_data(as_text=True), expect)
+        neighbor = self.service.find_neighbors(1)[0]["location"]
+        self.assertIn(neighbor.location_name, expect)
+
+    async def test_changes(self):
+        version = self.service.get_dataset_version()
+        expect = self.views_client.get("/api/changes?since=0").get_json()
+        response = await self.client.get("/api/changes?since=0")
+        self.assertEqual(await response.get_json(), expect)
+        self.assertEqual(response.headers["ETag"], '"changes-0-' + str(version) + '"')
+
+    async def test_autocomplete(self):
+        expect = self.views_client.get("/api/autocomplete?q=旭川").get_json()
+        response = await self.client.get(
+            "/api/autocomplete", query_string={"q": "旭川"}
+        )
+        self.assertEqual(await response.get_json(), expect)
+
+    async def test_export(self):
+        expect = self.views_client.get("/export.csv").get_data(as_text=True)
+        response = await self.client.get("/export.csv")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(await response.get_data(as_text=True), expect)
+        response = await self.client.get("/export.xml")
+        self.assertEqual(response.status_code, 404)
+
+    async def test_service_worker(self):
+        response = await self.client.get("/service_worker.js")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("no-cache", response.headers["Cache-Control"])
+
+    async def test_cache_stats(self):
+        response = await self.client.get("/cache_stats.json")
+        self.assertEqual(
+            set(await response.get_json()),
+            {"tiles", "coverage", "near_locations", "shared"},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import gzip
+import os
+import tempfile
+import unittest
+
+from werkzeug.datastructures import Accept
+
+from ash_aed.assets import AssetManifest
+
+
+class TestAssetManifest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.static_folder = self.directory.name
+        self.write("js/app.js", "console.log(1);")
+        self.write("css/app.css", "body { margin: 0; }")
+        self.write("images/logo.png", "png")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, filename, content):
+        path = os.path.join(self.static_folder, filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+
+    def test_build(self):
+        manifest = AssetManifest.build(self.static_folder)
+        self.assertEqual(sorted(manifest.assets), ["css/app.css", "js/app.js"])
+        asset = manifest.get("js/app.js")
+        self.assertRegex(asset, r"^dist/js/app\.[0-9a-f]{12}\.js$")
+        path = os.path.join(self.static_folder, asset)
+        with open(path + ".gz", "rb") as f:
+            self.assertEqual(gzip.decompress(f.read()), b"console.log(1);")
+        self.assertIsNone(manifest.get("images/logo.png"))
+
+        # 書き出した対応表を読み込める
+        self.assertEqual(AssetManifest.load(self.static_folder).assets, manifest.assets)
+
+    def test_build_removes_stale_files(self):
+        old_asset = AssetManifest.build(self.static_folder).get("js/app.js")
+        self.write("js/app.js", "console.log(2);")
+        new_asset = AssetManifest.build(self.static_folder).get("js/app.js")
+        self.assertNotEqual(old_asset, new_asset)
+        self.assertFalse(
+            os.path.exists(os.path.join(self.static_folder, old_asset + ".gz"))
+        )
+        self.assertTrue(os.path.exists(os.path.join(self.static_folder, new_asset)))
+
+    def test_load_missing_manifest(self):
+        self.assertEqual(AssetManifest.load(self.static_folder).assets, {})
+
+    def test_select_encoding(self):
+        manifest = AssetManifest.build(self.static_folder)
+        path = os.path.join(self.static_folder, manifest.get("js/app.js"))
+        self.assertEqual(
+            AssetManifest.select_encoding(path, Accept([("gzip", 1)])),
+            (path + ".gz", "gzip"),
+        )
+        self.assertEqual(AssetManifest.select_encoding(path, Accept()), (path, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from ash_aed.async_db import AsyncDB
+from ash_aed.async_services import AsyncAEDInstallationLocationService
+from ash_aed.db import DB
+from ash_aed.models import AEDInstallationLocationFactory, CurrentLocation
+from ash_aed.services import (
+    AEDInstallationLocationService,
+    near_locations_cache
+)
+from tests.test_services import test_data
+
+
+class TestAsyncAEDInstallationLocationService(unittest.IsolatedAsyncioTestCase):
+    @classmethod
+    def setUpClass(cls):
+        factory = AEDInstallationLocationFactory()
+        for row in test_data:
+            factory.create(**row)
+        cls.db = DB()
+        cls.service = AEDInstallationLocationService(cls.db)
+        cls.service.truncate()
+        for item in factory.items:
+            cls.service.create(item)
+        cls.db.commit()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.db.close()
+
+    async def asyncSetUp(self):
+        self.async_db = await AsyncDB.create(min_size=1, max_size=4)
+        self.async_service = AsyncAEDInstallationLocationService(self.async_db)
+
+    async def asyncTearDown(self):
+        await self.async_db.close()
+
+    def assertSameLocations(self, first, second):
+        self.assertEqual(
+            [location.__dict__ for location in first],
+            [location.__dict__ for location in second],
+        )
+
+    async def test_find_by_location_id(self):
+        self.assertSameLocations(
+            await self.async_service.find_by_location_id(9),
+            self.service.find_by_location_id(9),
+        )
+
+    async def test_find_by_location_name(self):
+        results = await self.async_service.find_by_location_name("旭川", 2)
+        expect = self.service.find_by_location_name("旭川", 2)
+        self.assertEqual(results["all_results_number"], expect["all_results_number"])
+        self.assertEqual(results["max_page"], expect["max_page"])
+        self.assertSameLocations(
+            results["pagenated_results_body"], expect["pagenated_results_body"]
+        )
+
+    async def test_find_by_area_name(self):
+        self.assertSameLocations(
+            await self.async_service.find_by_area_name("一条通〜十条通"),
+            self.service.find_by_area_name("一条通〜十条通"),
+        )
+
+    async def test_find_by_bounding_box(self):
+        bounding_box = (43.76, 142.35, 43.775, 142.365)
+        self.assertSameLocations(
+            await self.async_service.find_by_bounding_box(*bounding_box),
+            self.service.find_by_bounding_box(*bounding_box),
+        )
+
+    async def test_get_dataset_version(self):
+        self.assertEqual(
+            await self.async_service.get_dataset_version(),
+            self.service.get_dataset_version(),
+        )
+
+    async def test_get_near_locations(self):
+        current_location = CurrentLocation(43.77, 142.36)
+        near_locations_cache.clear()
+        expect = self.service.get_near_locations(current_location)
+        near_locations_cache.clear()
+        coalesced = near_locations_cache.stats["coalesced"]
+        # 複数の検索を並行に実行しても同期版と同じ結果になる
+        results = await asyncio.gather(
+            *(
+                self.async_service.get_near_locations(
+                    current_location, self.service.get_dataset_version()
+                )
+                for _ in range(4)
+            )
+        )
+        for result in results:
+            self.assertEqual(
+                [(item["order"], item["distance"]) for item in result],
+                [(item["order"], item["distance"]) for item in expect],
+            )
+            self.assertSameLocations(
+                [item["location"] for item in result],
+                [item["location"] for item in expect],
+            )
+        # 同じ区画の検索候補は1つのタスクだけが求める
+        self.assertEqual(near_locations_cache.stats["coalesced"] - coalesced, 3)
+        # バージョンを省略した場合はデータベースに問い合わせる
+        result = await self.async_service.get_near_locations(current_location)
+        self.assertSameLocations(
+            [item["location"] for item in result],
+            [item["location"] for item in expect],
+        )
+
+    async def test_get_near_locations_with_shared_cache(self):
+        current_location = CurrentLocation(43.77, 142.36)
+        version = self.service.get_dataset_version()
+        cell, _ = near_locations_cache.get_cell(
+            current_location.latitude, current_location.longitude
+        )
+        near_locations_cache.clear()
+        with patch("ash_aed.async_services.shared_cache") as mock_shared_cache:
+            mock_shared_cache.get.return_value = None
+            await self.async_service.get_near_locations(current_location, version)
+            # 求めた検索候補は他のワーカーと共有する
+            mock_shared_cache.get.assert_called_once_with(
+                version, "near_locations", cell
+            )
+            candidates = near_locations_cache.get(version, cell)
+            mock_shared_cache.set.assert_called_once_with(
+                version, "near_locations", cell, candidates
+            )
+
+            # 他のワーカーが求めた検索候補があればデータベースに問い合わせない
+            near_locations_cache.clear()
+            mock_shared_cache.get.return_value = candidates[:1]
+            result = await self.async_service.get_near_locations(
+                current_location, version
+            )
+            self.assertSameLocations([result[0]["location"]], candidates[:1])
+            self.assertEqual(near_locations_cache.get(version, cell), candidates[:1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+
+from ash_aed.autocomplete import (
+    AutocompleteIndex,
+    AutocompleteIndexStore,
+    normalize
+)
+from ash_aed.models import AEDInstallationLocationFactory
+from tests.test_services import test_data
+
+
+class TestAutocomplete(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        factory = AEDInstallationLocationFactory()
+        for row in test_data:
+            factory.create(**row)
+        cls.locations = factory.items
+        cls.index = AutocompleteIndex.build(1617235200, cls.locations)
+
+    def test_normalize(self):
+        self.assertEqual(normalize("ＡＢＣ　def"), "abcdef")
+        self.assertEqual(normalize("フィール旭川"), "ふぃーる旭川")
+        self.assertEqual(normalize(None), "")
+
+    def test_search_by_prefix(self):
+        suggestions = self.index.search("旭川", 3)
+        self.assertEqual(len(suggestions), 3)
+        for suggestion in suggestions:
+            self.assertTrue(suggestion["text"].startswith("旭川"))
+            self.assertEqual(suggestion["kind"], "location")
+
+    def test_search_by_infix(self):
+        # 名称の途中の語や、カタカナをひらがなで入力しても一致する
+        suggestions = self.index.search("春光", 10)
+        self.assertIn("旭川市立春光小学校", [s["text"] for s in suggestions])
+        suggestions = self.index.search("ふぃーる", 10)
+        self.assertEqual(suggestions[0]["text"], "フィール旭川")
+
+    def test_search_order(self):
+        # 先頭から一致するもの、町域名、短いものを先に返す
+        suggestions = self.index.search("末広", 10)
+        self.assertEqual(
+            suggestions[0], {"text": "末広", "kind": "area", "location_id": None}
+        )
+        self.assertTrue(all(s["kind"] == "address" for s in suggestions[1:]))
+
+    def test_search_many_matches(self):
+        # 途中から一致する候補が多くても、先頭から一致する候補を先に返す
+        suggestions = [
+            {"text": "あ" + "い" * (number + 1), "kind": "address", "location_id": 1}
+            for number in range(600)
+        ]
+        suggestions.append(
+            {"text": "あんしん病院", "kind": "location", "location_id": 2}
+        )
+        suggestions.append({"text": "まあ", "kind": "area", "location_id": None})
+        index = AutocompleteIndex(1, suggestions)
+        texts = [s["text"] for s in index.search("あ", 3)]
+        self.assertEqual(texts, ["あんしん病院", "あい", "あいい"])
+        # 先頭から一致する候補が足りない場合は途中から一致する候補で補う
+        texts = [s["text"] for s in index.search("あん", 3)]
+        self.assertEqual(texts, ["あんしん病院"])
+        texts = [s["text"] for s in index.search("まあ", 3)]
+        self.assertEqual(texts, ["まあ"])
+        texts = [s["text"] for s in index.search("いいい", 2)]
+        self.assertEqual(texts, ["あいいい", "あいいいい"])
+
+    def test_search_no_results(self):
+        self.assertEqual(self.index.search("", 10), [])
+        self.assertEqual(self.index.search("該当なし", 10), [])
+        self.assertEqual(self.index.search("旭川", 0), [])
+
+    def test_store(self):
+        store = AutocompleteIndexStore()
+        loads = list()
+
+        def loader():
+            loads.append(1)
+            return self.locations
+
+        index = store.get(1, loader)
+        self.assertIs(store.get(1, loader), index)
+        self.assertEqual(len(loads), 1)
+        # バージョンが変わったら作り直す
+        self.assertEqual(store.get(2, loader).version, 2)
+        self.assertEqual(len(loads), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import gzip
+import json
+import os
+import tempfile
+import unittest
+
+from ash_aed.bundle import OfflineBundle, decode_deltas, encode_deltas
+from ash_aed.models import AEDInstallationLocationFactory
+from tests.test_services import test_data
+
+
+class TestOfflineBundle(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        factory = AEDInstallationLocationFactory()
+        for row in test_data:
+            factory.create(**row)
+        cls.locations = factory.items
+        cls.bundle = OfflineBundle.build(1617235200, reversed(cls.locations))
+
+    def test_encode_deltas(self):
+        self.assertEqual(encode_deltas([1, 9, 34, 30]), [1, 8, 25, -4])
+        self.assertEqual(decode_deltas(encode_deltas([1, 9, 34, 30])), [1, 9, 34, 30])
+
+    def test_build(self):
+        data = self.bundle.data
+        self.assertEqual(data["version"], 1617235200)
+        self.assertEqual(data["count"], len(test_data))
+        # 重複する文字列は1回だけ持つ
+        self.assertEqual(len(data["strings"]), len(set(data["strings"])))
+        self.assertEqual(self.bundle.filename, "bundle.1617235200.json")
+
+    def test_decode(self):
+        rows = OfflineBundle.decode(json.loads(self.bundle.to_json()))
+        expected = sorted(self.locations, key=lambda location: location.location_id)
+        self.assertEqual(len(rows), len(expected))
+        # 緯度経度は小数点以下第7位に丸める
+        for row, location in zip(rows, expected):
+            self.assertEqual(row["location_id"], location.location_id)
+            self.assertEqual(row["location_name"], location.location_name)
+            self.assertEqual(row["address"], location.address)
+            self.assertAlmostEqual(row["latitude"], location.latitude, delta=1e-7)
+            self.assertAlmostEqual(row["longitude"], location.longitude, delta=1e-7)
+
+    def test_save(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for version in (100, 200, 300):
+                OfflineBundle(version, self.bundle.data).save(directory)
+            # 新しい方から2つのバージョンだけを残す
+            self.assertEqual(
+                sorted(os.listdir(directory)),
+                [
+                    "bundle.200.json",
+                    "bundle.200.json.gz",
+                    "bundle.300.json",
+                    "bundle.300.json.gz",
+                    "manifest.json",
+                ],
+            )
+            with open(os.path.join(directory, "manifest.json")) as f:
+                manifest = json.load(f)
+            self.assertEqual(manifest["version"], 300)
+            self.assertEqual(manifest["path"], "/offline/bundle.300.json")
+            path = OfflineBundle.get_path(directory, 300, gzipped=True)
+            with open(path, "rb") as f:
+                self.assertEqual(
+                    json.loads(gzip.decompress(f.read())), self.bundle.data
+                )
+            self.assertIsNone(OfflineBundle.get_path(directory, 100))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import threading
+import time
+import unittest
+
+from ash_aed.cache import LRUCache, NearLocationsCache
+
+
+class TestLRUCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = LRUCache(max_size=2)
+
+    def test_init(self):
+        with self.assertRaises(ValueError):
+            LRUCache(max_size=0)
+
+    def test_get(self):
+        self.cache.set("a", 1)
+        self.assertEqual(self.cache.get("a"), 1)
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.get("b", 0), 0)
+
+    def test_set(self):
+        self.cache.set("a", 1)
+        self.cache.set("b", 2)
+        # 最近使用したキーは残り、最も古いキーが削除される
+        self.cache.get("a")
+        self.cache.set("c", 3)
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.get("a"), 1)
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.get("c"), 3)
+
+    def test_clear(self):
+        self.cache.set("a", 1)
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+
+    def test_get_or_set(self):
+        calls = list()
+
+        def function():
+            calls.append(1)
+            time.sleep(0.1)
+            return "value"
+
+        # 同時にキャッシュを外しても値は1回だけ求める
+        results = list()
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(self.cache.get_or_set("a", function))
+            )
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ["value"] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.cache.get("a"), "value")
+        stats = self.cache.stats
+        self.assertEqual(stats["coalesced"] + stats["hits"], 5)
+        # Noneは保存しない
+        self.assertIsNone(self.cache.get_or_set("b", lambda: None))
+        self.assertEqual(len(self.cache), 1)
+
+    def test_stats(self):
+        self.cache.set("a", 1)
+        self.cache.set("b", 2)
+        self.cache.set("c", 3)
+        self.cache.get("a")
+        self.cache.get("c")
+        stats = self.cache.stats
+        self.assertEqual(stats["size"], 2)
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["evictions"], 1)
+
+
+class TestNearLocationsCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = NearLocationsCache(max_size=2, precision=10)
+
+    def test_init(self):
+        with self.assertRaises(ValueError):
+            NearLocationsCache(max_size=2, precision=0)
+
+    def test_get_cell(self):
+        cell, bounding_box = self.cache.get_cell(43.77082378, 142.3650193)
+        south, west, north, east = bounding_box
+        self.assertTrue(south <= 43.77082378 < north)
+        self.assertTrue(west <= 142.3650193 < east)
+        # 近い地点は同じ区画になり、区画の大きさ程度離れると別の区画になる
+        self.assertEqual(self.cache.get_cell(43.77082379, 142.3650194)[0], cell)
+        self.assertNotEqual(self.cache.get_cell(43.77102378, 142.3650193)[0], cell)
+
+    def test_get(self):
+        cell, bounding_box = self.cache.get_cell(43.77082378, 142.3650193)
+        self.cache.set(1, cell, ["a"])
+        self.assertEqual(self.cache.get(1, cell), ["a"])
+        # データセットのバージョンが異なる場合はヒットしない
+        self.assertIsNone(self.cache.get(2, cell))
+        self.assertEqual(self.cache.stats["hits"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import gzip
+import unittest
+
+import brotli
+from flask import Response
+from werkzeug.datastructures import ETags
+from werkzeug.http import parse_accept_header
+
+from ash_aed.compression import (
+    ResponseCompressor,
+    etag_matches,
+    get_variant_etag,
+    negotiate_encoding
+)
+
+
+class TestResponseCompressor(unittest.TestCase):
+    def setUp(self):
+        self.compressor = ResponseCompressor(level=6, brotli_quality=5, min_size=100)
+        self.body = "<p>旭川市AED設置場所検索</p>" * 50
+
+    def test_negotiate_encoding(self):
+        self.assertEqual(negotiate_encoding(parse_accept_header("gzip, br")), "br")
+        self.assertEqual(
+            negotiate_encoding(parse_accept_header("gzip, br;q=0")), "gzip"
+        )
+        self.assertIsNone(negotiate_encoding(parse_accept_header("identity")))
+
+    def test_etag_matches(self):
+        etag = get_variant_etag("abc", "gzip")
+        self.assertEqual(etag, "abc-gzip")
+        self.assertTrue(etag_matches(ETags(["abc-gzip"]), "abc"))
+        self.assertTrue(etag_matches(ETags(["abc"]), "abc"))
+        self.assertFalse(etag_matches(ETags(["abd-gzip"]), "abc"))
+
+    def test_compress_response(self):
+        response = Response(self.body, mimetype="text/html")
+        self.assertTrue(self.compressor.compress_response(response, "gzip"))
+        self.assertEqual(response.content_encoding, "gzip")
+        self.assertEqual(gzip.decompress(response.get_data()).decode(), self.body)
+        self.assertIn("Accept-Encoding", response.vary)
+        gzip_etag, _ = response.get_etag()
+
+        response = Response(self.body, mimetype="text/html")
+        self.assertTrue(self.compressor.compress_response(response, "br"))
+        self.assertEqual(brotli.decompress(response.get_data()).decode(), self.body)
+        br_etag, _ = response.get_etag()
+
+        # 圧縮しない場合も同じ内容からETagを付ける
+        response = Response(self.body, mimetype="text/html")
+        self.assertFalse(self.compressor.compress_response(response, None))
+        etag, _ = response.get_etag()
+        self.assertEqual(gzip_etag, etag + "-gzip")
+        self.assertEqual(br_etag, etag + "-br")
+
+    def test_skip_response(self):
+        # 小さなレスポンス、対象外のMIMEタイプ、圧縮済みのレスポンスはそのまま送る
+        response = Response("<p></p>", mimetype="text/html")
+        self.assertFalse(self.compressor.compress_response(response, "gzip"))
+        response = Response(self.body, mimetype="text/csv")
+        self.assertFalse(self.compressor.compress_response(response, "gzip"))
+        response = Response(self.body, mimetype="application/json")
+        response.content_encoding = "gzip"
+        self.assertFalse(self.compressor.compress_response(response, "br"))
+        response = Response(self.body, status=404, mimetype="text/html")
+        self.assertFalse(self.compressor.compress_response(response, "gzip"))
+
+    def test_compress_streamed_response(self):
+        chunks = ["<p>" + str(i) + "</p>" for i in range(100)]
+        for encoding, decompress in (
+            ("gzip", gzip.decompress),
+            ("br", brotli.decompress),
+        ):
+            response = Response(iter(chunks), mimetype="text/html")
+            self.assertTrue(self.compressor.compress_response(response, encoding))
+            self.assertTrue(response.is_streamed)
+            self.assertEqual(decompress(response.get_data()).decode(), "".join(chunks))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from ash_aed.coverage import CoverageGrid, CoverageGridStore, get_distances
+from ash_aed.errors import LocationError
+from ash_aed.models import AEDInstallationLocationFactory, CurrentLocation
+
+bounding_box = (43.74, 142.33, 43.82, 142.41)
+
+
+def create_locations(number):
+    random = np.random.default_rng(0)
+    factory = AEDInstallationLocationFactory()
+    for i in range(number):
+        factory.create(
+            area="テスト",
+            location_id=i + 1,
+            location_name="テスト" + str(i + 1),
+            postal_code="",
+            address="",
+            phone_number="",
+            available_time="",
+            installation_floor="",
+            latitude=random.uniform(bounding_box[0], bounding_box[2]),
+            longitude=random.uniform(bounding_box[1], bounding_box[3]),
+        )
+    return factory.items
+
+
+class TestGetDistances(unittest.TestCase):
+    def test_get_distances(self):
+        locations = create_locations(3)
+        current_location = CurrentLocation(latitude=43.77, longitude=142.36)
+        distances = get_distances(
+            np.array([current_location.latitude]),
+            np.array([current_location.longitude]),
+            np.array([location.latitude for location in locations]),
+            np.array([location.longitude for location in locations]),
+        )
+        for i, location in enumerate(locations):
+            self.assertAlmostEqual(
+                distances[0, i], current_location.get_distance_to(location), places=2
+            )
+
+
+class TestCoverageGrid(unittest.TestCase):
+    @classmethod
+    def setUpClass(self):
+        self.locations = create_locations(200)
+        self.grid = CoverageGrid.build(
+            version=1,
+            locations=self.locations,
+            bounding_box=bounding_box,
+            resolution=200,
+            candidates_number=16,
+            workers=2,
+        )
+
+    def test_build(self):
+        with self.assertRaises(LocationError):
+            CoverageGrid.build(1, [], bounding_box, 200)
+        with self.assertRaises(LocationError):
+            CoverageGrid.build(1, self.locations, bounding_box, 0)
+        self.assertEqual(self.grid.candidates.shape[2], 16)
+        self.assertTrue(self.grid.exact.any())
+
+    def test_lookup(self):
+        # 格子の範囲外は候補を返さない
+        self.assertIsNone(self.grid.lookup(43.0, 142.0))
+
+        # 候補には全件から計算した上位5件が必ず含まれる
+        random = np.random.default_rng(1)
+        checked = 0
+        for _ in range(200):
+            latitude = random.uniform(bounding_box[0], bounding_box[2])
+            longitude = random.uniform(bounding_box[1], bounding_box[3])
+            location_ids = self.grid.lookup(latitude, longitude)
+            if location_ids is None:
+                continue
+            checked += 1
+            current_location = CurrentLocation(latitude, longitude)
+            expect = sorted(
+                self.locations, key=lambda x: current_location.get_distance_to(x)
+            )[:5]
+            for location in expect:
+                self.assertIn(location.location_id, location_ids)
+        self.assertLess(0, checked)
+
+    def test_get_uncovered_cells(self):
+        self.assertEqual(self.grid.get_uncovered_cells(100000), [])
+        cells = self.grid.get_uncovered_cells(300)
+        for latitude, longitude, distance in cells:
+            self.assertLess(300, distance + 1)
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "coverage_grid.npz")
+            self.grid.save(path)
+            grid = CoverageGrid.load(path)
+            self.assertEqual(grid.version, 1)
+            self.assertEqual(grid.bounding_box, bounding_box)
+            np.testing.assert_array_equal(grid.candidates, self.grid.candidates)
+
+            store = CoverageGridStore(path)
+            self.assertEqual(store.get(1).version, 1)
+            self.assertIsNone(store.get(2))
+
+            # 新しいバージョンのファイルが後から書き出されたら読み込み直す
+            grid = CoverageGrid.build(
+                version=2,
+                locations=self.locations,
+                bounding_box=bounding_box,
+                resolution=200,
+                candidates_number=16,
+                workers=2,
+            )
+            grid.save(path)
+            os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1000000000))
+            self.assertEqual(store.get(2).version, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+
+from ash_aed.dataset import DatasetVersion
+
+
+class TestDatasetVersion(unittest.TestCase):
+    def setUp(self):
+        self.dataset_version = DatasetVersion()
+        self.published = list()
+        self.dataset_version.subscribe(self.published.append)
+
+    def test_publish(self):
+        self.assertIsNone(self.dataset_version.version)
+        self.assertTrue(self.dataset_version.publish(1))
+        # 同じバージョンでは登録された処理を呼び出さない
+        self.assertFalse(self.dataset_version.publish(1))
+        self.assertTrue(self.dataset_version.publish(2))
+        self.assertEqual(self.dataset_version.version, 2)
+        self.assertEqual(self.published, [1, 2])
+
+    def test_publish_error(self):
+        def raise_error(version):
+            raise RuntimeError("Dummy Error.")
+
+        dataset_version = DatasetVersion()
+        dataset_version.subscribe(raise_error)
+        dataset_version.subscribe(self.published.append)
+        # 1つの処理が失敗しても他の処理は呼び出される
+        self.assertTrue(dataset_version.publish(1))
+        self.assertEqual(self.published, [1])
+
+
+if __name__ == "__main__":
+    unittest.main()
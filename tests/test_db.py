@@ -0,0 +1,73 @@
+import unittest
+
+from ash_aed.db import DB, close_pool
+from ash_aed.errors import DataError
+
+
+class TestDB(unittest.TestCase):
+    def setUp(self):
+        close_pool()
+
+    def tearDown(self):
+        close_pool()
+
+    def get_backend_pid(self, db):
+        cursor = db.cursor()
+        cursor.execute("SELECT pg_backend_pid();")
+        return cursor.fetchone()[0]
+
+    def test_pool(self):
+        # 返却した接続は次に借りた時に使い回される
+        db = DB()
+        backend_pid = self.get_backend_pid(db)
+        db.close()
+        db = DB()
+        self.assertEqual(self.get_backend_pid(db), backend_pid)
+        # 同時に借りた場合は別の接続になる
+        other_db = DB()
+        self.assertNotEqual(self.get_backend_pid(other_db), backend_pid)
+        other_db.close()
+        db.close()
+        # 何度閉じても構わない
+        db.close()
+
+    def test_close(self):
+        db = DB()
+        cursor = db.cursor()
+        cursor.execute("CREATE TEMPORARY TABLE test_close (id integer);")
+        # コミットしていない変更は返却時にロールバックされる
+        db.close()
+        db = DB()
+        cursor = db.cursor()
+        cursor.execute("SELECT to_regclass('pg_temp.test_close') IS NULL;")
+        self.assertTrue(cursor.fetchone()[0])
+        db.close()
+
+    def test_advisory_lock(self):
+        db = DB()
+        self.assertTrue(db.try_advisory_lock(1))
+        # 解放し忘れたロックは返却時に解放される
+        db.close()
+        other_db = DB()
+        db = DB()
+        self.assertTrue(db.try_advisory_lock(1))
+        db.advisory_unlock(1)
+        db.close()
+        other_db.close()
+
+    def test_prepare(self):
+        db = DB()
+        db.prepare("test_prepare", "integer", "SELECT $1 + 1")
+        # 同じ接続では二度準備しない
+        db.prepare("test_prepare", "integer", "SELECT $1 + 1")
+        cursor = db.cursor()
+        cursor.execute("EXECUTE test_prepare (%s);", (1,))
+        self.assertEqual(cursor.fetchone()[0], 2)
+        # 準備できない場合は他の処理と同じ例外にする
+        with self.assertRaises(DataError):
+            db.prepare("test_prepare_error", "integer", "SELECT $1 FROM no_such_table")
+        db.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import csv
+import gzip
+import io
+import json
+import unittest
+
+from ash_aed.errors import ServiceError
+from ash_aed.export import FIELDS, DatasetExport
+from ash_aed.models import AEDInstallationLocationFactory
+from tests.test_services import test_data
+
+
+class TestDatasetExport(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        factory = AEDInstallationLocationFactory()
+        for row in test_data:
+            factory.create(**row)
+        cls.locations = factory.items
+
+    def test_invalid_conditions(self):
+        with self.assertRaises(ServiceError):
+            DatasetExport("xml")
+        with self.assertRaises(ServiceError):
+            DatasetExport("csv", bounding_box="43.7,142.3")
+        with self.assertRaises(ServiceError):
+            DatasetExport("csv", bounding_box="43.8,142.3,43.7,142.4")
+
+    def test_generate_geojson(self):
+        dataset_export = DatasetExport("geojson")
+        dataset_export.CHUNK_ROWS = 3
+        chunks = list(dataset_export.generate(iter(self.locations)))
+        # 見出し、3件ずつの塊、末尾に分けて返す
+        self.assertEqual(len(chunks), 2 + -(-len(self.locations) // 3))
+        feature_collection = json.loads("".join(chunks))
+        self.assertEqual(feature_collection["type"], "FeatureCollection")
+        feature = feature_collection["features"][0]
+        self.assertEqual(feature["geometry"]["coordinates"], [142.3631408, 43.7703945])
+        self.assertEqual(feature["properties"]["location_name"], "旭川市教育委員会")
+        self.assertEqual(len(feature_collection["features"]), len(self.locations))
+
+    def test_generate_empty_geojson(self):
+        chunks = DatasetExport("geojson").generate(iter([]))
+        self.assertEqual(json.loads("".join(chunks))["features"], [])
+
+    def test_generate_csv(self):
+        chunks = DatasetExport("csv").generate(iter(self.locations))
+        rows = list(csv.reader(io.StringIO("".join(chunks))))
+        self.assertEqual(tuple(rows[0]), FIELDS)
+        self.assertEqual(len(rows), len(self.locations) + 1)
+        self.assertEqual(rows[1][FIELDS.index("location_id")], "1")
+
+    def test_generate_ndjson(self):
+        chunks = DatasetExport("ndjson").generate(iter(self.locations))
+        lines = "".join(chunks).splitlines()
+        self.assertEqual(
+            [json.loads(line)["location_id"] for line in lines],
+            [location.location_id for location in self.locations],
+        )
+
+    def test_compress(self):
+        dataset_export = DatasetExport("ndjson")
+        body = "".join(dataset_export.generate(iter(self.locations)))
+        compressed = b"".join(
+            DatasetExport.compress(dataset_export.generate(iter(self.locations)))
+        )
+        self.assertEqual(gzip.decompress(compressed).decode("utf-8"), body)
+
+    def test_get_etag(self):
+        dataset_export = DatasetExport("csv", area="末広")
+        etag = dataset_export.get_etag(1)
+        self.assertEqual(etag, DatasetExport("csv", area="末広").get_etag(1))
+        self.assertNotEqual(etag, dataset_export.get_etag(2))
+        self.assertNotEqual(etag, dataset_export.get_etag(1, "gzip"))
+        self.assertNotEqual(etag, DatasetExport("ndjson", area="末広").get_etag(1))
+        self.assertNotEqual(etag, DatasetExport("csv").get_etag(1))
+
+    def test_iter_locations(self):
+        class Service:
+            def iter_all(service):
+                return iter(self.locations)
+
+            def iter_by_area_name(service, area_name):
+                return (
+                    location
+                    for location in self.locations
+                    if location.area == area_name
+                )
+
+            def iter_by_bounding_box(service, south, west, north, east):
+                return iter(
+                    [
+                        location
+                        for location in self.locations
+                        if south <= location.latitude <= north
+                        and west <= location.longitude <= east
+                    ]
+                )
+
+        service = Service()
+        self.assertEqual(
+            len(list(DatasetExport("csv").iter_locations(service))), len(self.locations)
+        )
+        bounding_box = "43.76,142.35,43.775,142.365"
+        self.assertEqual(
+            [
+                location.location_id
+                for location in DatasetExport(
+                    "csv", bounding_box=bounding_box
+                ).iter_locations(service)
+            ],
+            [1, 9, 34],
+        )
+        # 町域と範囲の両方を指定した場合は両方の条件に合うものを返す
+        self.assertEqual(
+            [
+                location.location_id
+                for location in DatasetExport(
+                    "csv", area="末広", bounding_box=bounding_box
+                ).iter_locations(service)
+            ],
+            [],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import sqlite3
+import unittest
+from unittest.mock import patch
+
+import import_opendata
+
+
+class TestMakeDerivedFiles(unittest.TestCase):
+    @patch("import_opendata.notify_dataset_version")
+    @patch("import_opendata.make_offline_bundle")
+    @patch("import_opendata.make_sqlite_database")
+    @patch("import_opendata.make_location_neighbors")
+    @patch("import_opendata.make_coverage_grid")
+    def test_make_derived_files(
+        self, mock_grid, mock_neighbors, mock_sqlite, mock_bundle, mock_notify
+    ):
+        # どれかを作れなくても残りを作り、必ず通知する
+        mock_grid.__name__ = "make_coverage_grid"
+        mock_grid.side_effect = OSError("disk full")
+        mock_sqlite.__name__ = "make_sqlite_database"
+        mock_sqlite.side_effect = sqlite3.OperationalError("no such tokenizer")
+        with self.assertLogs("ash_aed_log", level="ERROR"):
+            import_opendata.make_derived_files()
+        mock_neighbors.assert_called_once()
+        mock_bundle.assert_called_once()
+        mock_notify.assert_called_once()
+
+    @patch("import_opendata.notify_dataset_version")
+    @patch("import_opendata.make_offline_bundle")
+    @patch("import_opendata.make_sqlite_database")
+    @patch("import_opendata.make_location_neighbors")
+    @patch("import_opendata.make_coverage_grid")
+    def test_make_derived_files_without_neighbors(
+        self, mock_grid, mock_neighbors, mock_sqlite, mock_bundle, mock_notify
+    ):
+        # インポートでは入れ替える前に記録済みなので求め直さない
+        import_opendata.make_derived_files(with_neighbors=False)
+        mock_neighbors.assert_not_called()
+        mock_grid.assert_called_once()
+        mock_sqlite.assert_called_once()
+        mock_bundle.assert_called_once()
+        mock_notify.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import threading
+import unittest
+from unittest.mock import patch
+
+from ash_aed.config import Config
+from ash_aed.dataset import DatasetVersion
+from ash_aed.db import DB
+from ash_aed.listener import DatasetVersionListener
+from ash_aed.services import AEDInstallationLocationService
+
+
+class TestDatasetVersionListener(unittest.TestCase):
+    def setUp(self):
+        self.dataset_version = DatasetVersion()
+        patcher = patch("ash_aed.listener.dataset_version", self.dataset_version)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.listener = DatasetVersionListener(
+            Config.DATABASE_URL, "ash_aed_test_dataset", reconnect_interval=0.1
+        )
+
+    def test_handle(self):
+        self.assertEqual(self.listener.handle("1617235200"), 1617235200)
+        self.assertEqual(self.dataset_version.version, 1617235200)
+        # 正しくない通知は無視する
+        self.assertIsNone(self.listener.handle("abc"))
+        self.assertEqual(self.dataset_version.version, 1617235200)
+
+    def test_listen(self):
+        received = threading.Event()
+        versions = list()
+
+        def on_version(version):
+            versions.append(version)
+            received.set()
+
+        self.dataset_version.subscribe(on_version)
+        self.assertFalse(self.listener.listening)
+        self.listener.start()
+        self.addCleanup(self.listener.stop)
+        # 待ち受けを始めた時に現在のバージョンを公開する
+        self.assertTrue(received.wait(10))
+        self.assertTrue(self.listener.listening)
+
+        received.clear()
+        db = DB()
+        try:
+            service = AEDInstallationLocationService(db)
+            service.notify_dataset_version(versions[0] + 1, self.listener.channel)
+            db.commit()
+        finally:
+            db.close()
+        self.assertTrue(received.wait(10))
+        self.assertEqual(versions[-1], versions[0] + 1)
+
+        self.listener.stop()
+        self.assertFalse(self.listener.listening)
+
+
+if __name__ == "__main__":
+    unittest.main()
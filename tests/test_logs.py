@@ -0,0 +1,55 @@
+import io
+import json
+import logging
+import unittest
+
+from ash_aed.logs import (
+    LOGGER_NAME,
+    AppLog,
+    configure_logging,
+    correlation_id,
+    shutdown_logging
+)
+
+
+class TestAppLog(unittest.TestCase):
+    def setUp(self):
+        shutdown_logging()
+        self.stream = io.StringIO()
+        configure_logging(self.stream)
+
+    def tearDown(self):
+        shutdown_logging()
+
+    def get_logs(self):
+        # キューに残ったログを出力させてから読み込む
+        shutdown_logging()
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_configure_once(self):
+        for _ in range(3):
+            AppLog()
+        self.assertEqual(len(logging.getLogger(LOGGER_NAME).handlers), 1)
+
+    def test_json(self):
+        AppLog().info("テスト")
+        logs = self.get_logs()
+        self.assertEqual(len(logs), 1)
+        self.assertEqual(logs[0]["level"], "INFO")
+        self.assertEqual(logs[0]["message"], "テスト")
+        self.assertIsNone(logs[0]["correlation_id"])
+
+    def test_correlation_id(self):
+        token = correlation_id.set("abc123")
+        try:
+            AppLog().error("エラー")
+        finally:
+            correlation_id.reset(token)
+        AppLog().error("エラー")
+        logs = self.get_logs()
+        self.assertEqual(logs[0]["correlation_id"], "abc123")
+        self.assertIsNone(logs[1]["correlation_id"])
+
+
+if __name__ == "__main__":
+    unittest.main()
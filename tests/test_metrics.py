@@ -0,0 +1,101 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from ash_aed.metrics import Registry, get_statement_kind
+
+
+class TestRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_counter(self):
+        counter = self.registry.counter("test_total", "テスト")
+        counter.inc(kind="a")
+        counter.inc(2, kind="a")
+        counter.inc(kind="b")
+        text = self.registry.render()
+        self.assertIn("# TYPE test_total counter", text)
+        self.assertIn('test_total{kind="a"} 3', text)
+        self.assertIn('test_total{kind="b"} 1', text)
+        # 同じ名前で登録すると登録済みのものを返す
+        self.assertIs(self.registry.counter("test_total", "テスト"), counter)
+
+    def test_histogram(self):
+        histogram = self.registry.histogram("test_seconds", "テスト", (0.1, 1.0))
+        histogram.observe(0.05, endpoint="index")
+        histogram.observe(0.5, endpoint="index")
+        histogram.observe(5, endpoint="index")
+        text = self.registry.render()
+        self.assertIn('test_seconds_bucket{endpoint="index",le="0.1"} 1', text)
+        self.assertIn('test_seconds_bucket{endpoint="index",le="1"} 2', text)
+        self.assertIn('test_seconds_bucket{endpoint="index",le="+Inf"} 3', text)
+        self.assertIn('test_seconds_sum{endpoint="index"} 5.55', text)
+        self.assertIn('test_seconds_count{endpoint="index"} 3', text)
+
+    def test_escape(self):
+        gauge = self.registry.gauge("test_gauge", "テスト")
+        gauge.set(1, name='a"b\\c')
+        self.assertIn('test_gauge{name="a\\"b\\\\c"} 1', self.registry.render())
+
+    def test_collector(self):
+        gauge = self.registry.gauge("test_gauge", "テスト")
+        self.registry.add_collector(lambda: gauge.set(7))
+        self.assertIn("test_gauge 7", self.registry.render())
+
+    def test_merge(self):
+        with tempfile.TemporaryDirectory() as directory:
+            registry = Registry(directory)
+            counter = registry.counter("test_total", "テスト")
+            gauge = registry.gauge("test_gauge", "テスト")
+            counter.inc(2)
+            gauge.set(1)
+            # 他のワーカーが書き出した値を模擬する。終了したプロセスのゲージは
+            # 合算せず、カウンターは合算する。
+            other = Registry(directory)
+            other.counter("test_total", "テスト").inc(3)
+            other.gauge("test_gauge", "テスト").set(5)
+            snapshot = '{"pid": %d, "metrics": %s}'
+            for pid in (os.getppid(), 2**22 + 1):
+                with open(
+                    os.path.join(directory, "metrics_" + str(pid) + ".json"), "w"
+                ) as f:
+                    f.write(snapshot % (pid, json.dumps(other.snapshot())))
+            merged = registry.merge()
+            self.assertEqual(merged["test_total"]["samples"]["[]"], 8)
+            self.assertEqual(merged["test_gauge"]["samples"]["[]"], 6)
+
+            registry.clear()
+            self.assertEqual(os.listdir(directory), [])
+
+    def test_start(self):
+        with tempfile.TemporaryDirectory() as directory:
+            registry = Registry(directory, flush_interval=0.05)
+            registry.counter("test_total", "テスト").inc()
+            registry.start()
+            # 何度呼び出してもスレッドは1つだけ起動する
+            registry.start()
+            path = os.path.join(directory, "metrics_" + str(os.getpid()) + ".json")
+            for _ in range(100):
+                if os.path.exists(path):
+                    break
+                time.sleep(0.01)
+            self.assertTrue(os.path.exists(path))
+            registry.counter("test_total", "テスト").inc()
+            # 停止する時に最後の値を書き出す
+            registry.stop()
+            with open(path) as f:
+                data = json.load(f)
+            self.assertEqual(data["metrics"]["test_total"]["samples"]["[]"], 2)
+
+    def test_get_statement_kind(self):
+        self.assertEqual(get_statement_kind("  select 1;"), "SELECT")
+        self.assertEqual(get_statement_kind("\nINSERT INTO t VALUES (1)"), "INSERT")
+        self.assertEqual(get_statement_kind("ANALYZE;"), "ANALYZE")
+        self.assertEqual(get_statement_kind(""), "UNKNOWN")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+
+from ash_aed.models import AEDInstallationLocationFactory, CurrentLocation
+from ash_aed.neighbors import get_nearest_neighbors
+from tests.test_services import test_data
+
+
+class TestNearestNeighbors(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        factory = AEDInstallationLocationFactory()
+        for row in test_data:
+            factory.create(**row)
+        cls.locations = factory.items
+
+    def test_get_nearest_neighbors(self):
+        # 行をまとめる数によらず、1件ずつ距離を計算した結果と一致する
+        for chunk_size in (1, 4, None):
+            neighbors = get_nearest_neighbors(self.locations, 3, chunk_size)
+            self.assertEqual(len(neighbors), len(self.locations) * 3)
+            for location in self.locations:
+                current_location = CurrentLocation(
+                    latitude=location.latitude, longitude=location.longitude
+                )
+                expected = sorted(
+                    (current_location.get_distance_to(other), other.location_id)
+                    for other in self.locations
+                    if other.location_id != location.location_id
+                )[:3]
+                rows = [row for row in neighbors if row[0] == location.location_id]
+                self.assertEqual([row[1] for row in rows], [1, 2, 3])
+                self.assertEqual(
+                    [row[2] for row in rows],
+                    [location_id for _, location_id in expected],
+                )
+                for row, (distance, _) in zip(rows, expected):
+                    self.assertAlmostEqual(row[3], distance, places=2)
+
+    def test_get_nearest_neighbors_few_locations(self):
+        self.assertEqual(get_nearest_neighbors(self.locations[:1], 5), [])
+        neighbors = get_nearest_neighbors(self.locations[:2], 5)
+        self.assertEqual(
+            [(row[0], row[1], row[2]) for row in neighbors],
+            [
+                (self.locations[0].location_id, 1, self.locations[1].location_id),
+                (self.locations[1].location_id, 1, self.locations[0].location_id),
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
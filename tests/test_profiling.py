@@ -0,0 +1,98 @@
+import os
+import pstats
+import tempfile
+import unittest
+
+from ash_aed.profiling import RequestProfiler, get_collapsed_stacks
+
+
+def fibonacci(n):
+    return n if n < 2 else fibonacci(n - 1) + fibonacci(n - 2)
+
+
+def work():
+    return sum(fibonacci(15) for _ in range(3))
+
+
+class TestRequestProfiler(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def profile(self, profiler, name="index"):
+        profile = profiler.start()
+        work()
+        return profiler.stop(profile, name)
+
+    def test_should_profile(self):
+        # 出力先を指定しない場合は計測しない
+        profiler = RequestProfiler(None, sample_rate=1.0, token="secret")
+        self.assertFalse(profiler.enabled)
+        self.assertFalse(profiler.should_profile("secret"))
+
+        profiler = RequestProfiler(self.directory, token="secret")
+        self.assertTrue(profiler.should_profile("secret"))
+        self.assertFalse(profiler.should_profile("wrong"))
+        self.assertFalse(profiler.should_profile(None))
+
+        profiler = RequestProfiler(self.directory, sample_rate=1.0)
+        self.assertTrue(profiler.should_profile(None))
+        # トークンを設定していない場合は、どの値も一致しない
+        self.assertFalse(profiler.is_authorized(""))
+
+    def test_stop(self):
+        profiler = RequestProfiler(self.directory, collapsed=True)
+        path = self.profile(profiler, "location/<id>")
+        self.assertTrue(os.path.basename(path).endswith(".prof"))
+        self.assertIn("-location__id_-", os.path.basename(path))
+        stats = pstats.Stats(path)
+        self.assertIn("fibonacci", [name for _, _, name in stats.stats])
+        with open(path[: -len(".prof")] + ".collapsed") as f:
+            lines = f.read().splitlines()
+        self.assertTrue(any("(work);" in line for line in lines))
+
+    def test_remove_old_files(self):
+        profiler = RequestProfiler(self.directory, max_files=2, collapsed=True)
+        paths = list()
+        for age in (20, 10, 0):
+            paths.append(self.profile(profiler))
+            # 古い順に削除する
+            mtime = os.path.getmtime(paths[-1]) - age
+            os.utime(paths[-1], (mtime, mtime))
+        self.assertEqual(profiler.get_files(), paths[1:])
+        self.assertFalse(os.path.exists(paths[0][: -len(".prof")] + ".collapsed"))
+
+    def test_summarize(self):
+        profiler = RequestProfiler(self.directory)
+        self.assertEqual(profiler.summarize()["requests"], 0)
+        self.profile(profiler)
+        self.profile(profiler)
+        summary = profiler.summarize(limit=3, sort="tottime")
+        self.assertEqual(summary["requests"], 2)
+        self.assertEqual(len(summary["functions"]), 3)
+        # 自身の時間が最も長いのは再帰呼び出しする関数
+        function = summary["functions"][0]
+        self.assertIn("(fibonacci)", function["function"])
+        self.assertEqual(function["primitive_calls"], 6)
+        self.assertLessEqual(function["tottime"], function["cumtime"])
+
+
+class TestCollapsedStacks(unittest.TestCase):
+    def test_get_collapsed_stacks(self):
+        profiler = RequestProfiler(None)
+        profile = profiler.start()
+        work()
+        profile.disable()
+        lines = get_collapsed_stacks(pstats.Stats(profile))
+        self.assertTrue(lines)
+        for line in lines:
+            stack, microseconds = line.rsplit(" ", 1)
+            self.assertLess(0, int(microseconds))
+            self.assertTrue(stack)
+        # 再帰呼び出しは同じ経路に重ねない
+        self.assertFalse(any(line.count("(fibonacci)") > 1 for line in lines))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+from concurrent.futures import Future
+from unittest.mock import Mock, patch
+
+from ash_aed.scheduler import RefreshScheduler
+
+
+class TestRefreshScheduler(unittest.TestCase):
+    def setUp(self):
+        self.import_function = Mock(return_value=2)
+        self.scheduler = RefreshScheduler(self.import_function, 60, jitter=0.5)
+
+    def test_get_wait_seconds(self):
+        for _ in range(100):
+            seconds = self.scheduler._get_wait_seconds()
+            self.assertTrue(30 <= seconds <= 90)
+
+    @patch("ash_aed.scheduler.dataset_version")
+    @patch("ash_aed.scheduler.AEDInstallationLocationService")
+    @patch("ash_aed.scheduler.OpenData")
+    @patch("ash_aed.scheduler.DB")
+    def test_refresh(self, mock_db, mock_open_data, mock_service, mock_version):
+        mock_open_data.return_value = Mock(checksum="new")
+        mock_service.return_value.get_last_checksum.return_value = "old"
+        mock_service.return_value.get_dataset_version.return_value = 2
+
+        # ロックを取得できた場合は更新があればインポートする
+        mock_db.return_value.try_advisory_lock.return_value = True
+        self.assertEqual(self.scheduler.refresh(), 2)
+        self.import_function.assert_called_once_with(mock_open_data.return_value)
+        mock_db.return_value.advisory_unlock.assert_called_once()
+        mock_version.publish.assert_called_with(2)
+
+        # 更新がない場合はインポートしない
+        self.import_function.reset_mock()
+        mock_service.return_value.get_last_checksum.return_value = "new"
+        self.scheduler.refresh()
+        self.import_function.assert_not_called()
+
+        # ロックを取得できない場合はインポートせずにバージョンだけ公開する
+        mock_service.return_value.get_last_checksum.return_value = "old"
+        mock_db.return_value.try_advisory_lock.return_value = False
+        self.assertEqual(self.scheduler.refresh(), 2)
+        self.import_function.assert_not_called()
+
+    @patch("ash_aed.scheduler.dataset_version")
+    @patch("ash_aed.scheduler.AEDInstallationLocationService")
+    @patch("ash_aed.scheduler.OpenData")
+    @patch("ash_aed.scheduler.DB")
+    def test_refresh_failure(self, mock_db, mock_open_data, mock_service, mock_version):
+        # 想定外の例外でもロックを解放し、例外を外へ出さない
+        mock_db.return_value.try_advisory_lock.return_value = True
+        mock_open_data.side_effect = UnicodeDecodeError("cp932", b"", 0, 1, "")
+        with self.assertLogs("ash_aed_log", level="ERROR"):
+            self.assertIsNone(self.scheduler.refresh())
+        mock_db.return_value.advisory_unlock.assert_called_once()
+        mock_db.return_value.close.assert_called_once()
+        mock_version.publish.assert_not_called()
+
+    def test_log_failure(self):
+        future = Future()
+        future.set_exception(RuntimeError("failed"))
+        with self.assertLogs("ash_aed_log", level="ERROR"):
+            self.scheduler._log_failure(future)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,3 +1,4 @@
+import hashlib
 import unittest
 from unittest.mock import Mock, patch
 
@@ -54,6 +55,10 @@ class TestOpenData(unittest.TestCase):
         ]
         open_data = OpenData()
         self.assertEqual(open_data.lists, expect)
+        self.assertEqual(
+            open_data.checksum,
+            hashlib.sha256(csv_content.encode("cp932")).hexdigest(),
+        )
 
         mock_requests.get.side_effect = Timeout("Dummy Error.")
         with self.assertRaises(ScrapeError):
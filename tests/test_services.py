@@ -1,13 +1,21 @@
+import threading
 import unittest
+from unittest import mock
 
+from ash_aed.config import Config
 from ash_aed.db import DB
-from ash_aed.errors import ServiceError
+from ash_aed.errors import DataError, ServiceError
 from ash_aed.models import (
     AEDInstallationLocation,
     AEDInstallationLocationFactory,
     CurrentLocation
 )
-from ash_aed.services import AEDInstallationLocationService
+from ash_aed.neighbors import get_nearest_neighbors
+from ash_aed.services import (
+    AEDInstallationLocationService,
+    near_locations_cache,
+    to_numbered_placeholders
+)
 
 test_data = [
     {
@@ -167,6 +175,213 @@ class TestAEDInstallationLocationService(unittest.TestCase):
             self.assertTrue(self.service.create(item))
         self.db.commit()
 
+    def test_swap_staging(self):
+        self.service.create_staging_table()
+        staging_service = AEDInstallationLocationService(
+            self.db, table_name=self.service.staging_table_name
+        )
+        for item in self.factory.items:
+            self.assertTrue(staging_service.create(item))
+        self.service.build_staging_indexes()
+        self.service.validate_staging(self.factory.items)
+        # 登録したデータと件数が一致しない場合
+        with self.assertRaises(DataError):
+            self.service.validate_staging(self.factory.items[1:])
+        self.db.commit()
+
+        self.service.swap_staging()
+        self.db.commit()
+        self.assertEqual(len(self.service.get_all()), len(self.factory.items))
+
+        # 入れ替え前のテーブルに戻せる
+        self.service.rollback_import()
+        self.db.commit()
+        self.assertEqual(len(self.service.get_all()), len(self.factory.items))
+
+    def test_swap_staging_with_readers(self):
+        self.service.create_staging_table()
+        staging_service = AEDInstallationLocationService(
+            self.db, table_name=self.service.staging_table_name
+        )
+        for item in self.factory.items:
+            self.assertTrue(staging_service.create(item))
+        self.db.commit()
+
+        # 検索中のトランザクションがロックを保持している間は入れ替えない
+        reader = DB()
+        self.addCleanup(reader.close)
+        reader.cursor().execute("SELECT count(*) FROM aed_installation_locations;")
+        with mock.patch.object(Config, "SWAP_LOCK_RETRIES", 2):
+            with self.assertRaises(DataError):
+                self.service.swap_staging()
+        self.db.rollback()
+
+        # 検索が終わるまで、短い間隔でやり直して入れ替える
+        timer = threading.Timer(0.2, reader.commit)
+        timer.start()
+        self.service.swap_staging()
+        self.db.commit()
+        timer.join()
+        self.assertEqual(len(self.service.get_all()), len(self.factory.items))
+        self.service.rollback_import()
+        self.db.commit()
+
+    def test_record_changes(self):
+        since = self.service.get_dataset_version()
+        self.service.create_staging_table()
+        staging_service = AEDInstallationLocationService(
+            self.db, table_name=self.service.staging_table_name
+        )
+        # 1件目を削除し、2件目の名称を変更する
+        modified = dict(test_data[1], location_name="フィール旭川（変更）")
+        items = [AEDInstallationLocation(**modified)] + self.factory.items[2:]
+        for item in items:
+            self.assertTrue(staging_service.create(item))
+        # 入れ替え前と同じ秒に登録してもバージョンが変わるようにする
+        self.db.cursor().execute(
+            "UPDATE "
+            + self.service.staging_table_name
+            + " SET updated_at = now() + interval '1 day';"
+        )
+        self.db.commit()
+        self.service.swap_staging()
+        # 入れ替えをコミットしてロックを解放してから記録する
+        self.db.commit()
+        version = self.service.create_dataset_version("checksum")
+        self.assertEqual(self.service.record_changes(version), 2)
+        self.db.commit()
+
+        try:
+            changes = self.service.get_changes(since)
+            self.assertEqual(changes["version"], version)
+            self.assertEqual(
+                [location.location_id for location in changes["upserts"]], [9]
+            )
+            self.assertEqual(
+                changes["upserts"][0].location_name, "フィール旭川（変更）"
+            )
+            self.assertEqual(changes["deletes"], [1])
+            self.assertIn((version, 1, "D"), self.service.get_change_log())
+            self.assertIn((version, 9, "U"), self.service.get_change_log())
+
+            # 最新のバージョンからの差分はない
+            changes = self.service.get_changes(version)
+            self.assertEqual((changes["upserts"], changes["deletes"]), ([], []))
+            # たどれないバージョンからはNoneを返す
+            self.assertIsNone(self.service.get_changes(since - 1))
+            self.assertIsNone(self.service.get_changes(since, max_versions=0))
+        finally:
+            self.service.rollback_import()
+            self.db.commit()
+        self.assertEqual(self.service.get_dataset_version(), since)
+
+    def test_store_neighbors(self):
+        version = self.service.get_dataset_version()
+        neighbors = get_nearest_neighbors(self.factory.items, 2)
+        self.assertEqual(
+            self.service.store_neighbors(version, neighbors), len(neighbors)
+        )
+        self.db.commit()
+        self.assertEqual(self.service.get_neighbor_rows(version), neighbors)
+
+        results = self.service.find_neighbors(1)
+        self.assertEqual(
+            [result["location"].location_id for result in results], [34, 9]
+        )
+        self.assertEqual([result["order"] for result in results], [1, 2])
+        self.assertEqual(results[0]["distance"], 0.58)
+        # 記録していないバージョンでは返さない
+        self.assertEqual(self.service.find_neighbors(1, version - 1), [])
+
+        # 入れ替え前のステージングテーブルの分は、稼働中のバージョンを残して記録する
+        self.service.store_neighbors(version + 1, neighbors[:1], keep_version=version)
+        self.db.commit()
+        self.assertEqual(self.service.get_neighbor_rows(version), neighbors)
+        self.assertEqual(self.service.get_neighbor_rows(version + 1), neighbors[:1])
+        self.service.store_neighbors(version, neighbors)
+        self.db.commit()
+        self.assertEqual(self.service.get_neighbor_rows(version + 1), [])
+
+    def test_swap_staging_with_prepared_statements(self):
+        service = AEDInstallationLocationService(self.db, prepared=True)
+        self.assertEqual(len(service.find_by_location_id(1)), 1)
+        service.create_staging_table()
+        staging_service = AEDInstallationLocationService(
+            self.db, table_name=service.staging_table_name
+        )
+        for item in self.factory.items[1:]:
+            self.assertTrue(staging_service.create(item))
+        service.build_staging_indexes()
+        self.db.commit()
+
+        service.swap_staging()
+        self.db.commit()
+        # 準備済みのSQL文は入れ替え後のテーブルを参照する
+        self.assertEqual(service.find_by_location_id(1), [])
+
+        service.rollback_import()
+        self.db.commit()
+        self.assertEqual(len(service.find_by_location_id(1)), 1)
+
+    def test_prepared_statements(self):
+        prepared_service = AEDInstallationLocationService(self.db, prepared=True)
+        plain_service = AEDInstallationLocationService(self.db, prepared=False)
+        for method, args in [
+            ("get_all", ()),
+            ("find_by_location_id", (9,)),
+            ("find_by_location_ids", ([448, 9, 1],)),
+            ("find_by_area_name", ("一条通〜十条通",)),
+            ("find_by_bounding_box", (43.76, 142.35, 43.775, 142.365)),
+        ]:
+            self.assertEqual(
+                [
+                    location.location_id
+                    for location in getattr(prepared_service, method)(*args)
+                ],
+                [
+                    location.location_id
+                    for location in getattr(plain_service, method)(*args)
+                ],
+            )
+        for page in (1, 2):
+            prepared_results = prepared_service.find_by_location_name("旭川", page)
+            plain_results = plain_service.find_by_location_name("旭川", page)
+            self.assertEqual(
+                prepared_results["all_results_number"],
+                plain_results["all_results_number"],
+            )
+            self.assertEqual(
+                [
+                    location.location_id
+                    for location in prepared_results["pagenated_results_body"]
+                ],
+                [
+                    location.location_id
+                    for location in plain_results["pagenated_results_body"]
+                ],
+            )
+        self.assertEqual(
+            prepared_service.get_area_names(), plain_service.get_area_names()
+        )
+        self.assertEqual(
+            prepared_service.get_last_updated(), plain_service.get_last_updated()
+        )
+
+        # 接続ごとに一度だけ準備される
+        cursor = self.db.cursor()
+        cursor.execute(
+            "SELECT count(*) FROM pg_prepared_statements WHERE name = %s;",
+            ("aed_installation_locations_find_by_location_id",),
+        )
+        self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_to_numbered_placeholders(self):
+        self.assertEqual(
+            to_numbered_placeholders("SELECT * FROM t WHERE a=%s AND b LIKE %s;"),
+            "SELECT * FROM t WHERE a=$1 AND b LIKE $2;",
+        )
+        self.assertEqual(to_numbered_placeholders("SELECT '100%%';"), "SELECT '100%';")
+
     def test_get_all(self):
         for item in self.service.get_all():
             self.assertTrue(isinstance(item, AEDInstallationLocation))
@@ -209,6 +424,11 @@ class TestAEDInstallationLocationService(unittest.TestCase):
         with self.assertRaises(ServiceError):
             self.service.find_by_location_name(location_name="旭川", page=3)
 
+    def test_find_by_location_ids(self):
+        locations = self.service.find_by_location_ids([448, 9, 1])
+        location_ids = [location.location_id for location in locations]
+        self.assertEqual(location_ids, [1, 9, 448])
+
     def test_get_area_names(self):
         expect = ["一条通〜十条通", "花咲", "宮前", "末広"]
         self.assertEqual(self.service.get_area_names(), expect)
@@ -217,6 +437,49 @@ class TestAEDInstallationLocationService(unittest.TestCase):
         area_locations = self.service.find_by_area_name("一条通〜十条通")
         self.assertEqual(area_locations[0].location_name, "旭川市教育委員会")
 
+    def test_iter_all(self):
+        locations = self.service.iter_all()
+        self.assertFalse(isinstance(locations, list))
+        self.assertEqual(
+            [location.location_id for location in locations],
+            [location.location_id for location in self.service.get_all()],
+        )
+
+    def test_iter_by_area_name(self):
+        location_ids = [
+            location.location_id
+            for location in self.service.iter_by_area_name("一条通〜十条通")
+        ]
+        self.assertEqual(
+            location_ids,
+            [
+                location.location_id
+                for location in self.service.find_by_area_name("一条通〜十条通")
+            ],
+        )
+        self.assertEqual(
+            self.service.count_by_area_name("一条通〜十条通"), len(location_ids)
+        )
+        self.assertEqual(self.service.count_by_area_name("存在しない町域"), 0)
+
+    def test_iter_abandoned(self):
+        # 途中で読むのをやめてもサーバー側のカーソルを閉じて次の検索ができる
+        locations = self.service.iter_all()
+        next(locations)
+        locations.close()
+        self.assertEqual(self.service.find_by_location_id(9)[0].location_id, 9)
+
+    def test_find_by_bounding_box(self):
+        locations = self.service.find_by_bounding_box(
+            south=43.76, west=142.35, north=43.775, east=142.365
+        )
+        location_ids = [location.location_id for location in locations]
+        self.assertEqual(location_ids, [1, 9, 34])
+        locations = self.service.iter_by_bounding_box(
+            south=43.76, west=142.35, north=43.775, east=142.365
+        )
+        self.assertEqual([location.location_id for location in locations], [1, 9, 34])
+
     def test_get_near_locations(self):
         near_locations = self.service.get_near_locations(self.current_location)
         # 一番近い避難場所
@@ -232,6 +495,44 @@ class TestAEDInstallationLocationService(unittest.TestCase):
         self.assertEqual(near_locations[-1]["location"].location_name, "旭川地方法務局")
         self.assertEqual(near_locations[-1]["distance"], 1.54)
 
+    def test_get_near_locations_cache(self):
+        near_locations = self.service.get_near_locations(self.current_location)
+        hits = near_locations_cache.stats["hits"]
+        # 同じ区画内の地点からの検索はキャッシュした候補を並べ替えて返す
+        current_location = CurrentLocation(
+            latitude=43.77082379, longitude=142.3650194
+        )
+        cached_near_locations = self.service.get_near_locations(current_location)
+        self.assertEqual(near_locations_cache.stats["hits"], hits + 1)
+        self.assertEqual(
+            [result["location"].location_id for result in near_locations],
+            [result["location"].location_id for result in cached_near_locations],
+        )
+
+    def test_get_near_locations_with_version(self):
+        expect = self.service.get_near_locations(self.current_location)
+        version = self.service.get_dataset_version()
+        # バージョンを渡した場合はデータベースに問い合わせない
+        with mock.patch.object(
+            AEDInstallationLocationService,
+            "get_dataset_version",
+            side_effect=AssertionError,
+        ):
+            near_locations = self.service.get_near_locations(
+                self.current_location, version
+            )
+            self.service.get_changes(version, version=version)
+        self.assertEqual(
+            [result["location"].location_id for result in near_locations],
+            [result["location"].location_id for result in expect],
+        )
+
+    def test_get_dataset_version(self):
+        last_updated = self.service.get_last_updated()
+        self.assertEqual(
+            self.service.get_dataset_version(), int(last_updated.timestamp())
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,254 @@
+import multiprocessing
+import os
+import socketserver
+import tempfile
+import threading
+import time
+import unittest
+
+from ash_aed.models import AEDInstallationLocationFactory
+from ash_aed.shared_cache import (
+    COMPRESSED,
+    LocalCacheBackend,
+    RedisCacheBackend,
+    SharedCache,
+    create_shared_cache,
+    dumps,
+    loads
+)
+from tests.test_services import test_data
+
+
+class RESPHandler(socketserver.StreamRequestHandler):
+    """テスト用のRedis互換サーバーで、1つの接続のコマンドを処理する。"""
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        arguments = list()
+        for _ in range(int(line[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            arguments.append(self.rfile.read(length + 2)[:-2])
+        return arguments
+
+    def handle(self):
+        server = self.server
+        authenticated = server.password is None
+        while True:
+            arguments = self.read_command()
+            if arguments is None:
+                return
+            command = arguments[0].upper()
+            server.commands.append(command)
+            if command == b"AUTH":
+                authenticated = arguments[1].decode() == server.password
+                reply = b"+OK\r\n" if authenticated else b"-ERR invalid password\r\n"
+            elif not authenticated:
+                reply = b"-NOAUTH Authentication required.\r\n"
+            elif command == b"SELECT":
+                reply = b"+OK\r\n"
+            elif command == b"GET":
+                with server.lock:
+                    value, expires = server.items.get(arguments[1], (None, 0))
+                if value is None or expires <= time.time():
+                    reply = b"$-1\r\n"
+                else:
+                    reply = b"$" + str(len(value)).encode() + b"\r\n" + value + b"\r\n"
+            elif command == b"SET":
+                expires = time.time() + int(arguments[4]) / 1000
+                with server.lock:
+                    server.items[arguments[1]] = (arguments[2], expires)
+                reply = b"+OK\r\n"
+            elif command == b"DEL":
+                with server.lock:
+                    deleted = server.items.pop(arguments[1], None) is not None
+                reply = b":" + (b"1" if deleted else b"0") + b"\r\n"
+            elif command == b"DBSIZE":
+                reply = b":" + str(len(server.items)).encode() + b"\r\n"
+            else:
+                reply = b"-ERR unknown command\r\n"
+            self.wfile.write(reply)
+
+
+class RESPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, password=None):
+        socketserver.ThreadingTCPServer.__init__(self, ("127.0.0.1", 0), RESPHandler)
+        self.password = password
+        self.items = dict()
+        self.commands = list()
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        if self.password is None:
+            return "redis://" + host + ":" + str(port) + "/1"
+        return "redis://:" + self.password + "@" + host + ":" + str(port) + "/1"
+
+
+def write_in_child(path):
+    backend = LocalCacheBackend(path)
+    backend.set("child", b"written by child", 60)
+
+
+class TestSerialization(unittest.TestCase):
+    def test_dumps(self):
+        value = (b"\x00\xff", [("Content-Type", "text/html")], {"a": 1.5, "b": None})
+        self.assertEqual(loads(dumps(value)), value)
+        self.assertEqual(
+            loads(dumps([True, False, -1, "旭川"])), [True, False, -1, "旭川"]
+        )
+        # 大きなデータは圧縮する
+        data = dumps(["旭川市"] * 1000)
+        self.assertEqual(data[:1], COMPRESSED)
+        self.assertEqual(loads(data), ["旭川市"] * 1000)
+        with self.assertRaises(TypeError):
+            dumps(object())
+        with self.assertRaises(ValueError):
+            loads(b"\x00?")
+
+    def test_dumps_locations(self):
+        factory = AEDInstallationLocationFactory()
+        for row in test_data:
+            factory.create(**row)
+        locations = loads(dumps(factory.items))
+        self.assertEqual(len(locations), len(factory.items))
+        for location, expected in zip(locations, factory.items):
+            self.assertEqual(location.location_id, expected.location_id)
+            self.assertEqual(location.location_name, expected.location_name)
+            self.assertEqual(location.latitude, expected.latitude)
+            self.assertEqual(location.longitude, expected.longitude)
+
+
+class TestLocalCacheBackend(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "cache.sqlite3")
+        self.backend = LocalCacheBackend(self.path, max_entries=2)
+
+    def test_get(self):
+        self.backend.set("a", b"1", 60)
+        self.assertEqual(self.backend.get("a"), b"1")
+        self.assertIsNone(self.backend.get("b"))
+        self.backend.delete("a")
+        self.assertIsNone(self.backend.get("a"))
+
+    def test_ttl(self):
+        self.backend.set("a", b"1", 0.05)
+        time.sleep(0.1)
+        self.assertIsNone(self.backend.get("a"))
+
+    def test_purge(self):
+        self.backend.set("a", b"1", 0.01)
+        for key in ("b", "c", "d"):
+            self.backend.set(key, b"1", 60)
+        time.sleep(0.05)
+        self.backend.purge()
+        # 期限切れのデータと、上限を超えた期限の近いデータを削除する
+        self.assertEqual(self.backend.count(), 2)
+
+    def test_shared_between_processes(self):
+        process = multiprocessing.get_context("fork").Process(
+            target=write_in_child, args=(self.path,)
+        )
+        process.start()
+        process.join()
+        self.assertEqual(self.backend.get("child"), b"written by child")
+
+
+class TestRedisCacheBackend(unittest.TestCase):
+    def setUp(self):
+        self.server = RESPServer(password="secret")
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.backend = RedisCacheBackend(self.server.url)
+
+    def test_get(self):
+        self.backend.set("a", b"\r\n\x00", 60)
+        self.assertEqual(self.backend.get("a"), b"\r\n\x00")
+        self.assertIsNone(self.backend.get("b"))
+        self.assertEqual(self.backend.count(), 1)
+        self.backend.delete("a")
+        self.assertIsNone(self.backend.get("a"))
+        # 接続時に認証してデータベースを選ぶ
+        self.assertEqual(self.server.commands[:2], [b"AUTH", b"SELECT"])
+
+    def test_ttl(self):
+        self.backend.set("a", b"1", 0.05)
+        time.sleep(0.1)
+        self.assertIsNone(self.backend.get("a"))
+
+    def test_error(self):
+        backend = RedisCacheBackend(self.server.url.replace("secret", "wrong"))
+        with self.assertRaises(ConnectionError):
+            backend.get("a")
+        with self.assertRaises(ValueError):
+            RedisCacheBackend("http://localhost")
+
+
+class TestSharedCache(unittest.TestCase):
+    def setUp(self):
+        self.server = RESPServer()
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.cache = create_shared_cache(self.server.url, ttl=60)
+
+    def test_get(self):
+        self.cache.set(1, "pages", ("/", "br"), (b"body", [("ETag", '"a"')]))
+        self.assertEqual(
+            self.cache.get(1, "pages", ("/", "br")), (b"body", [("ETag", '"a"')])
+        )
+        # データセットのバージョンごとに別のキーになる
+        self.assertIsNone(self.cache.get(2, "pages", ("/", "br")))
+        self.assertIsNone(self.cache.get(1, "pages", ("/", "gzip")))
+        stats = self.cache.stats
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+        # 統計情報を取得しても保存先には問い合わせない
+        self.assertNotIn("size", stats)
+        self.assertNotIn(b"DBSIZE", self.server.commands)
+        self.assertEqual(self.cache.backend.count(), 1)
+
+    def test_get_or_set(self):
+        calls = list()
+
+        def function():
+            calls.append(1)
+            return ["末広", "春光"]
+
+        self.assertEqual(
+            self.cache.get_or_set(1, "area_names", None, function), ["末広", "春光"]
+        )
+        # 別のワーカーの共有キャッシュからも同じ値を取得できる
+        other = create_shared_cache(self.server.url)
+        self.assertEqual(
+            other.get_or_set(1, "area_names", None, function), ["末広", "春光"]
+        )
+        self.assertEqual(len(calls), 1)
+
+    def test_unavailable(self):
+        self.server.shutdown()
+        self.server.server_close()
+        cache = SharedCache(RedisCacheBackend(self.server.url))
+        # 接続できない場合はキャッシュにないものとして扱う
+        self.assertIsNone(cache.get(1, "pages", "/"))
+        cache.set(1, "pages", "/", b"body")
+        self.assertEqual(cache.stats["errors"], 2)
+
+    def test_disabled(self):
+        cache = create_shared_cache("")
+        self.assertFalse(cache.enabled)
+        cache.set(1, "pages", "/", b"body")
+        self.assertIsNone(cache.get(1, "pages", "/"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,174 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from ash_aed.singleflight import AsyncSingleFlight, SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+    def run_threads(self, number, target):
+        threads = [threading.Thread(target=target) for _ in range(number)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_do(self):
+        value, shared = SingleFlight().do("a", lambda: 1)
+        self.assertEqual(value, 1)
+        self.assertFalse(shared)
+
+    def test_coalesce(self):
+        flights = SingleFlight()
+        calls = list()
+        results = list()
+        started = threading.Event()
+
+        def function():
+            calls.append(1)
+            started.set()
+            time.sleep(0.2)
+            return "value"
+
+        def request():
+            results.append(flights.do("a", function))
+
+        leader = threading.Thread(target=request)
+        leader.start()
+        started.wait()
+        # 実行中の処理がある間に要求したスレッドは結果を待って共有する
+        self.run_threads(4, request)
+        leader.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), [("value", False)] + [("value", True)] * 4)
+        self.assertEqual(flights.stats["shared"], 4)
+        self.assertEqual(flights.stats["in_flight"], 0)
+        # 結果は保持しないので、次の要求では改めて実行する
+        flights.do("a", function)
+        self.assertEqual(len(calls), 2)
+
+    def test_error(self):
+        flights = SingleFlight()
+        errors = list()
+        started = threading.Event()
+
+        def function():
+            started.set()
+            time.sleep(0.2)
+            raise ValueError("error")
+
+        def request():
+            try:
+                flights.do("a", function)
+            except ValueError as e:
+                errors.append(e)
+
+        leader = threading.Thread(target=request)
+        leader.start()
+        started.wait()
+        self.run_threads(3, request)
+        leader.join()
+        # 待っていたスレッドでも同じ例外が発生する
+        self.assertEqual(len(errors), 4)
+        self.assertEqual(flights.do("a", lambda: 1), (1, False))
+
+    def test_timeout(self):
+        flights = SingleFlight(timeout=0.05)
+        started = threading.Event()
+        finish = threading.Event()
+
+        def function():
+            started.set()
+            finish.wait()
+            return "slow"
+
+        leader = threading.Thread(target=lambda: flights.do("a", function))
+        leader.start()
+        started.wait()
+        # 待ちきれない場合は自分で実行する
+        self.assertEqual(flights.do("a", lambda: "own"), ("own", False))
+        self.assertEqual(flights.stats["timeouts"], 1)
+        finish.set()
+        leader.join()
+
+
+class TestAsyncSingleFlight(unittest.IsolatedAsyncioTestCase):
+    async def test_coalesce(self):
+        flights = AsyncSingleFlight()
+        calls = list()
+
+        async def function():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "value"
+
+        # 実行中の処理がある間に要求したタスクは結果を待って共有する
+        results = await asyncio.gather(*(flights.do("a", function) for _ in range(5)))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [("value", False)] + [("value", True)] * 4)
+        self.assertEqual(flights.stats["shared"], 4)
+        self.assertEqual(flights.stats["in_flight"], 0)
+        # 結果は保持しないので、次の要求では改めて実行する
+        await flights.do("a", function)
+        self.assertEqual(len(calls), 2)
+
+    async def test_error(self):
+        flights = AsyncSingleFlight()
+
+        async def function():
+            await asyncio.sleep(0.05)
+            raise ValueError("error")
+
+        # 待っていたタスクでも同じ例外が発生する
+        results = await asyncio.gather(
+            *(flights.do("a", function) for _ in range(4)), return_exceptions=True
+        )
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+
+        async def one():
+            return 1
+
+        self.assertEqual(await flights.do("a", one), (1, False))
+
+    async def test_timeout(self):
+        flights = AsyncSingleFlight(timeout=0.05)
+        finish = asyncio.Event()
+
+        async def slow():
+            await finish.wait()
+            return "slow"
+
+        async def own():
+            return "own"
+
+        leader = asyncio.create_task(flights.do("a", slow))
+        await asyncio.sleep(0)
+        # 待ちきれない場合は自分で実行する
+        self.assertEqual(await flights.do("a", own), ("own", False))
+        self.assertEqual(flights.stats["timeouts"], 1)
+        finish.set()
+        self.assertEqual(await leader, ("slow", False))
+
+    async def test_cancel(self):
+        flights = AsyncSingleFlight()
+
+        async def slow():
+            await asyncio.sleep(10)
+
+        async def own():
+            return "own"
+
+        leader = asyncio.create_task(flights.do("a", slow))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flights.do("a", own))
+        await asyncio.sleep(0)
+        # 実行していたタスクが取り消されても、待っていたタスクは自分で実行する
+        leader.cancel()
+        self.assertEqual(await follower, ("own", False))
+        with self.assertRaises(asyncio.CancelledError):
+            await leader
+
+
+if __name__ == "__main__":
+    unittest.main()
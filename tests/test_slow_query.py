@@ -0,0 +1,91 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from ash_aed.db import DB
+from ash_aed.services import AEDInstallationLocationService
+from ash_aed.slow_query import SlowQueryLog
+
+
+class TestSlowQueryLog(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "slow_queries.log")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_should_capture(self):
+        slow_query_log = SlowQueryLog(threshold=0.1, sample_rate=1.0, path=self.path)
+        self.assertFalse(slow_query_log.should_capture(0.05))
+        self.assertTrue(slow_query_log.should_capture(0.1))
+        # 閾値が0またはログファイルの指定がない場合は記録しない
+        self.assertFalse(SlowQueryLog(0, path=self.path).should_capture(1))
+        self.assertFalse(SlowQueryLog(0.1, path=None).should_capture(1))
+        # 記録する割合が0の場合は記録しない
+        self.assertFalse(
+            SlowQueryLog(0.1, sample_rate=0, path=self.path).should_capture(1)
+        )
+
+    def test_redact_parameters(self):
+        slow_query_log = SlowQueryLog(threshold=0.1, path=self.path)
+        self.assertEqual(
+            slow_query_log.redact_parameters(("旭川", 1, None, [1, 2])),
+            ["<str>", "<int>", None, ["<int>", "<int>"]],
+        )
+        self.assertIsNone(slow_query_log.redact_parameters(None))
+        slow_query_log = SlowQueryLog(threshold=0.1, path=self.path, redact=False)
+        self.assertEqual(slow_query_log.redact_parameters(("旭川", 1)), ["旭川", 1])
+
+    def test_capture(self):
+        slow_query_log = SlowQueryLog(threshold=1e-9, sample_rate=1.0, path=self.path)
+        db = DB()
+        try:
+            service = AEDInstallationLocationService(db)
+            with patch("ash_aed.services.slow_query_log", slow_query_log):
+                results = service.find_by_location_id(1)
+                service.get_last_updated()
+            # 実行計画の取得が元の検索結果に影響しない
+            self.assertEqual(len(results), 1)
+        finally:
+            db.close()
+
+        with open(self.path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(len(records), 2)
+        record = records[0]
+        self.assertEqual(record["kind"], "SELECT")
+        self.assertEqual(record["parameters"], ["<str>"])
+        self.assertIn(
+            "EXECUTE aed_installation_locations_find_by_location_id",
+            record["statement"],
+        )
+        self.assertTrue(
+            any("Buffers" in line or "Scan" in line for line in record["plan"])
+        )
+
+    def test_capture_without_explain(self):
+        slow_query_log = SlowQueryLog(threshold=1e-9, sample_rate=1.0, path=self.path)
+        db = DB()
+        try:
+            record = slow_query_log.capture(
+                db.cursor().connection, "UPDATE", "UPDATE x SET y = 1;", None, 1.0
+            )
+            # SELECT文以外は再実行しないため実行計画を取得しない
+            self.assertIsNone(record["plan"])
+            # 実行計画を取得できないSQL文でもトランザクションは続けられる
+            record = slow_query_log.capture(
+                db.cursor().connection, "SELECT", "SELECT * FROM nothing;", None, 1.0
+            )
+            self.assertIsNone(record["plan"])
+            cursor = db.cursor()
+            cursor.execute("SELECT 1;")
+            self.assertEqual(cursor.fetchone()[0], 1)
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,219 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from ash_aed.errors import DatabaseError, ServiceError
+from ash_aed.models import AEDInstallationLocationFactory, CurrentLocation
+from ash_aed.neighbors import get_nearest_neighbors
+from ash_aed.services import near_locations_cache
+from ash_aed.sqlite_services import (
+    SQLiteAEDInstallationLocationService,
+    to_glob_pattern
+)
+from tests.test_services import test_data
+
+
+class TestSQLiteAEDInstallationLocationService(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        factory = AEDInstallationLocationFactory()
+        for row in test_data:
+            factory.create(**row)
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.directory.name, "aed.sqlite3")
+        cls.last_updated = datetime(
+            2021, 4, 1, 9, 0, tzinfo=timezone(timedelta(hours=9))
+        )
+        SQLiteAEDInstallationLocationService.build(
+            cls.path,
+            factory.items,
+            cls.last_updated,
+            neighbors=get_nearest_neighbors(factory.items, 2),
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def setUp(self):
+        self.service = SQLiteAEDInstallationLocationService(self.path)
+
+    def tearDown(self):
+        self.service.close()
+
+    def test_open_missing_file(self):
+        with self.assertRaises(DatabaseError):
+            SQLiteAEDInstallationLocationService(
+                os.path.join(self.directory.name, "missing.sqlite3")
+            )
+
+    def test_get_all(self):
+        locations = self.service.get_all()
+        self.assertEqual(len(locations), len(test_data))
+        self.assertEqual(locations[0].location_name, "旭川市教育委員会")
+        self.assertEqual(locations[0].latitude, 43.7703945)
+
+    def test_find_by_location_id(self):
+        location = self.service.find_by_location_id(9)
+        self.assertEqual(location[0].location_name, "フィール旭川")
+        self.assertEqual(self.service.find_by_location_id(2), [])
+
+    def test_find_by_location_ids(self):
+        locations = self.service.find_by_location_ids([448, 9, 1])
+        location_ids = [location.location_id for location in locations]
+        self.assertEqual(location_ids, [1, 9, 448])
+
+    def test_find_by_location_name(self):
+        # 3文字以上はFTS5の索引、それより短い場合は全件の走査で同じ結果になる
+        results = self.service.find_by_location_name("旭川")
+        self.assertEqual(len(results["pagenated_results_body"]), 10)
+        self.assertEqual(results["all_results_number"], 11)
+        self.assertEqual(results["max_page"], 2)
+
+        results = self.service.find_by_location_name(location_name="旭川", page=2)
+        self.assertEqual(
+            results["pagenated_results_body"][0].location_name,
+            "旭川市障害者福祉センター「おぴった」",
+        )
+
+        results = self.service.find_by_location_name("旭川市立")
+        self.assertEqual(
+            [location.location_name for location in results["pagenated_results_body"]],
+            ["旭川市立春光小学校", "旭川市立六合中学校"],
+        )
+
+        # GLOBの特殊文字はそのまま検索する
+        results = self.service.find_by_location_name("旭川*")
+        self.assertEqual(results["all_results_number"], 0)
+
+        with self.assertRaises(ServiceError):
+            self.service.find_by_location_name(location_name="旭川", page=3)
+
+    def test_to_glob_pattern(self):
+        self.assertEqual(to_glob_pattern("旭川"), "*旭川*")
+        self.assertEqual(to_glob_pattern("a*b?[c"), "*a[*]b[?][[]c*")
+
+    def test_get_area_names(self):
+        self.assertEqual(
+            sorted(self.service.get_area_names()),
+            sorted(set(row["area"] for row in test_data)),
+        )
+
+    def test_find_by_area_name(self):
+        area_locations = self.service.find_by_area_name("一条通〜十条通")
+        self.assertEqual(area_locations[0].location_name, "旭川市教育委員会")
+
+    def test_iter_by_area_name(self):
+        locations = self.service.iter_by_area_name("末広")
+        self.assertFalse(isinstance(locations, list))
+        self.assertEqual([location.location_id for location in locations], [187, 195])
+        self.assertEqual(self.service.count_by_area_name("末広"), 2)
+        self.assertEqual(
+            len(list(self.service.iter_all())), len(self.service.get_all())
+        )
+
+    def test_find_by_bounding_box(self):
+        locations = self.service.find_by_bounding_box(
+            south=43.76, west=142.35, north=43.775, east=142.365
+        )
+        location_ids = [location.location_id for location in locations]
+        self.assertEqual(location_ids, [1, 9, 34])
+
+        locations = self.service.iter_by_bounding_box(
+            south=43.76, west=142.35, north=43.775, east=142.365
+        )
+        self.assertEqual([location.location_id for location in locations], [1, 9, 34])
+
+        # 境界上の地点も範囲に含まれる
+        locations = self.service.find_by_bounding_box(
+            south=43.7703945, west=142.3631408, north=43.7703945, east=142.3631408
+        )
+        self.assertEqual([location.location_id for location in locations], [1])
+
+    def test_get_near_locations(self):
+        near_locations_cache.clear()
+        near_locations = self.service.get_near_locations(
+            CurrentLocation(latitude=43.77082378, longitude=142.3650193)
+        )
+        self.assertEqual(
+            near_locations[0]["location"].location_name, "旭川市教育委員会"
+        )
+        self.assertEqual(near_locations[0]["distance"], 0.16)
+        self.assertEqual(near_locations[-1]["order"], 5)
+        self.assertEqual(near_locations[-1]["location"].location_name, "旭川地方法務局")
+        self.assertEqual(near_locations[-1]["distance"], 1.54)
+
+    def test_find_neighbors(self):
+        results = self.service.find_neighbors(1)
+        self.assertEqual(
+            [result["location"].location_id for result in results], [34, 9]
+        )
+        self.assertEqual(results[0]["distance"], 0.58)
+        self.assertEqual(self.service.find_neighbors(2), [])
+
+    def test_get_dataset_version(self):
+        self.assertEqual(self.service.get_last_updated(), self.last_updated)
+        self.assertEqual(
+            self.service.get_dataset_version(), int(self.last_updated.timestamp())
+        )
+
+    def test_get_changes(self):
+        path = os.path.join(self.directory.name, "changes.sqlite3")
+        factory = AEDInstallationLocationFactory()
+        for row in test_data:
+            factory.create(**row)
+        version = int(self.last_updated.timestamp())
+        SQLiteAEDInstallationLocationService.build(
+            path,
+            factory.items,
+            self.last_updated,
+            versions={version: version - 10, version - 10: version - 20},
+            changes=[(version, 9, "U"), (version, 2, "D"), (version - 10, 1, "I")],
+        )
+        service = SQLiteAEDInstallationLocationService(path)
+        try:
+            changes = service.get_changes(version - 10)
+            self.assertEqual(
+                [location.location_id for location in changes["upserts"]], [9]
+            )
+            self.assertEqual(changes["deletes"], [2])
+            changes = service.get_changes(version - 20)
+            self.assertEqual(
+                [location.location_id for location in changes["upserts"]], [1, 9]
+            )
+            self.assertIsNone(service.get_changes(version - 30))
+        finally:
+            service.close()
+        # 変更履歴を持たないファイルでは差分を返せない
+        self.assertIsNone(self.service.get_changes(0))
+
+    def test_build_replaces_file(self):
+        # 開いている接続は置き換え前のファイルを読み続ける
+        path = os.path.join(self.directory.name, "replace.sqlite3")
+        factory = AEDInstallationLocationFactory()
+        for row in test_data[:2]:
+            factory.create(**row)
+        SQLiteAEDInstallationLocationService.build(path, factory.items, None)
+        service = SQLiteAEDInstallationLocationService(path)
+        SQLiteAEDInstallationLocationService.build(
+            path, factory.items[:1], self.last_updated
+        )
+        try:
+            self.assertEqual(len(service.get_all()), 2)
+            self.assertEqual(service.get_dataset_version(), 0)
+        finally:
+            service.close()
+        service = SQLiteAEDInstallationLocationService(path)
+        try:
+            self.assertEqual(len(service.get_all()), 1)
+        finally:
+            service.close()
+        self.assertEqual(os.listdir(self.directory.name).count("replace.sqlite3"), 1)
+        self.assertFalse(
+            [name for name in os.listdir(self.directory.name) if name.endswith(".tmp")]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
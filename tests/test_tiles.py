@@ -0,0 +1,98 @@
+import unittest
+
+from ash_aed.errors import LocationError
+from ash_aed.models import AEDInstallationLocationFactory
+from ash_aed.tiles import MapTile
+
+test_data = [
+    {
+        "area": "一条通〜十条通",
+        "location_id": 1,
+        "location_name": "旭川市教育委員会",
+        "postal_code": "070-0036",
+        "address": "北海道旭川市6条通8丁目セントラル旭川ビル6階",
+        "phone_number": "0166-25-7534",
+        "available_time": "",
+        "installation_floor": "6階教育政策課",
+        "latitude": 43.7703945,
+        "longitude": 142.3631408,
+    },
+    {
+        "area": "一条通〜十条通",
+        "location_id": 9,
+        "location_name": "フィール旭川",
+        "postal_code": "070-0031",
+        "address": "北海道旭川市1条通8丁目",
+        "phone_number": "0166-25-5443",
+        "available_time": "",
+        "installation_floor": "7階国際交流スペース内",
+        "latitude": 43.76572279,
+        "longitude": 142.3597048,
+    },
+    {
+        "area": "末広",
+        "location_id": 187,
+        "location_name": "旭川市立春光小学校",
+        "postal_code": "071-8131",
+        "address": "北海道旭川市末広1条1丁目",
+        "phone_number": "0166-51-5288",
+        "available_time": "",
+        "installation_floor": "1階(体育教官室前)廊下",
+        "latitude": 43.80256755,
+        "longitude": 142.3819691,
+    },
+]
+
+
+class TestMapTile(unittest.TestCase):
+    def setUp(self):
+        factory = AEDInstallationLocationFactory()
+        for row in test_data:
+            factory.create(**row)
+        self.locations = factory.items
+
+    def test_init(self):
+        with self.assertRaises(LocationError):
+            MapTile(zoom="hoge", x=0, y=0)
+        with self.assertRaises(LocationError):
+            MapTile(zoom=21, x=0, y=0)
+        with self.assertRaises(LocationError):
+            MapTile(zoom=1, x=2, y=0)
+
+    def test_bounding_box(self):
+        south, west, north, east = MapTile(zoom=0, x=0, y=0).bounding_box
+        self.assertAlmostEqual(south, -85.0511288, places=6)
+        self.assertAlmostEqual(west, -180.0)
+        self.assertAlmostEqual(north, 85.0511288, places=6)
+        self.assertAlmostEqual(east, 180.0)
+
+    def test_cluster(self):
+        # 旭川市中心部を含むズームレベル10のタイルでは近い地点が同じ格子にまとまる
+        tile = MapTile(zoom=10, x=916, y=373)
+        south, west, north, east = tile.bounding_box
+        for location in self.locations:
+            self.assertTrue(south <= location.latitude <= north)
+            self.assertTrue(west <= location.longitude <= east)
+        features = tile.cluster(self.locations)["features"]
+        self.assertEqual(len(features), 2)
+        self.assertEqual(features[0]["properties"]["count"], 1)
+        self.assertEqual(features[0]["properties"]["location_id"], 187)
+        self.assertEqual(features[1]["properties"]["count"], 2)
+
+        # 十分に拡大するとタイル内の地点だけが個別に返される
+        tile = MapTile(zoom=17, x=117368, y=47776)
+        features = tile.cluster(self.locations)["features"]
+        self.assertEqual(len(features), 1)
+        self.assertEqual(features[0]["properties"]["location_id"], 1)
+
+    def test_cluster_single_location(self):
+        tile = MapTile(zoom=0, x=0, y=0)
+        features = tile.cluster(self.locations[:1])["features"]
+        self.assertEqual(features[0]["properties"]["location_id"], 1)
+        self.assertEqual(
+            features[0]["geometry"]["coordinates"], [142.3631408, 43.7703945]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()